@@ -2,6 +2,7 @@ from minio import Minio
 from dotenv import load_dotenv
 import os
 import json
+import urllib3
 
 # 加载.env文件
 load_dotenv()
@@ -14,6 +15,26 @@ minio_client = Minio(
     secure=False
 )
 
+def create_minio_client(max_pool_size: int = 10) -> Minio:
+    """
+    创建单独的MinIO客户端，max_pool_size为urllib3连接池的最大连接数
+
+    共享客户端的连接池为minio默认的10个连接，多线程并发读写时连接数超过该值的请求结束后连接会被丢弃重建，
+    并发较高的场景（如批量上传瓦片）应使用连接池不小于并发数的单独客户端。超时和重试与minio的默认设置相同
+    """
+    http_client = urllib3.PoolManager(
+        timeout=urllib3.Timeout(connect=300, read=300),
+        maxsize=max_pool_size,
+        retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+    )
+    return Minio(
+        f"{os.getenv('MINIO_HOST')}:{os.getenv('MINIO_PORT')}",
+        access_key=os.getenv('MINIO_USERNAME'),
+        secret_key=os.getenv('MINIO_PASSWORD'),
+        secure=False,
+        http_client=http_client
+    )
+
 # 定义存储桶名称
 SOURCE_BUCKET_NAME = "sourece-files"  # 源文件存储桶
 CONVERTED_BUCKET_NAME = "converted-files"  # 转换后文件存储桶
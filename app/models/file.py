@@ -50,6 +50,7 @@ class FileMetadata(BaseModel):
     is_public: bool = False
     upload_date: datetime
     file_size: int
+    content_hash: Optional[str] = None  # 文件内容的SHA-256，用于复用相同文件的转换结果
     preview_image: Optional[str] = None
     share_info: Optional[FileShare] = None
     conversion: Optional[FileConversion] = None
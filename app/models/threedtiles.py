@@ -1,6 +1,7 @@
+import math
 from datetime import datetime
 from typing import Optional, List
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from .user import PyObjectId
 
 class ThreeDTilesBase(BaseModel):
@@ -21,9 +22,16 @@ class ThreeDTilesInDB(ThreeDTilesBase):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     original_filename: Optional[str] = None
     file_size: Optional[int] = None
-    longitude: Optional[float] = None
-    latitude: Optional[float] = None
-    height: Optional[float] = None
+    longitude: Optional[float] = None  # 原点经度（度）
+    latitude: Optional[float] = None  # 原点纬度（度）
+    height: Optional[float] = None  # 原点椭球高（米）
+    bbox: Optional[List[float]] = None  # 地理范围[西, 南, 东, 北]（度），跨越180度经线时西大于东
+    footprint: Optional[dict] = None  # 地理范围的GeoJSON面
+    min_height: Optional[float] = None  # 最低椭球高（米）
+    max_height: Optional[float] = None  # 最高椭球高（米）
+    storage: Optional[str] = None  # 存储方式：archive为整个.3tz压缩包保存为单个对象，为空时为解压后的目录
+    revision: Optional[int] = None  # 增量更新的版本号，0为入库时的初始版本
+    statistics: Optional[dict] = None  # tileset.json的统计信息：瓦片数、各层级的瓦片数和几何误差范围、内容类型等
 
     model_config = {
         "populate_by_name": True,
@@ -40,6 +48,22 @@ class ThreeDTilesUpdate(BaseModel):
     latitude: Optional[float] = None
     height: Optional[float] = None
 
+class TilesetFrustumQuery(BaseModel):
+    """视锥体空间查询参数，坐标均为ECEF（米）"""
+    planes: List[List[float]] = Field(..., min_length=1, max_length=6)  # 视锥体平面[nx, ny, nz, d]，法向量指向视锥体内部
+    camera_position: Optional[List[float]] = Field(None, min_length=3, max_length=3)  # 相机位置，为空时不按屏幕空间误差选择层级
+    max_screen_space_error: float = Field(16.0, gt=0)  # 最大屏幕空间误差（像素）
+    fov: float = Field(math.pi / 3, gt=0, lt=math.pi)  # 垂直视场角（弧度）
+    screen_height: int = Field(1080, gt=0)  # 屏幕高度（像素）
+    limit: Optional[int] = Field(None, ge=1)  # 最多返回的瓦片数
+
+    @field_validator("planes")
+    @classmethod
+    def validate_planes(cls, planes: List[List[float]]) -> List[List[float]]:
+        if any(len(plane) != 4 for plane in planes):
+            raise ValueError("视锥体平面必须为[nx, ny, nz, d]")
+        return planes
+
 class ProcessStatus(BaseModel):
     process_id: str
     status: str
@@ -47,6 +71,8 @@ class ProcessStatus(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     tile_id: Optional[str] = None
+    uploaded_files: Optional[int] = None  # 上传阶段已上传的文件数
+    total_files: Optional[int] = None  # 上传阶段需要上传的文件总数
 
     model_config = {
         "populate_by_name": True,
@@ -0,0 +1,22 @@
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field, field_validator
+
+class TileSeedingCreate(BaseModel):
+    """瓦片缓存预热任务参数"""
+    target_type: Literal["wmts", "threedtiles", "scene"]  # 预热对象：WMTS图层、3DTiles瓦片集或场景的关注区域
+    target_id: str  # 图层ID、瓦片集ID或场景ID
+    min_zoom: Optional[int] = Field(None, ge=0, le=30)  # WMTS最低级别，为空时使用图层的最低级别
+    max_zoom: Optional[int] = Field(None, ge=0, le=30)  # WMTS最高级别，为空时使用图层的最高级别
+    bbox: Optional[List[float]] = Field(None, min_length=4, max_length=4)  # 地理范围[西, 南, 东, 北]（度），为空时预热整个图层
+    geometric_error: Optional[float] = Field(None, ge=0)  # 3DTiles目标几何误差，几何误差不大于该值的瓦片不再细化
+    radius: Optional[float] = Field(None, gt=0)  # 场景关注区域的半径（米），以场景原点为中心
+
+    @field_validator("bbox")
+    @classmethod
+    def validate_bbox(cls, bbox: Optional[List[float]]) -> Optional[List[float]]:
+        if bbox is None:
+            return bbox
+        west, south, east, north = bbox
+        if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90):
+            raise ValueError("bbox必须为[西, 南, 东, 北]（度），且南不大于北")
+        return bbox
@@ -27,6 +27,7 @@ class WMTSInDB(WMTSBase):
     # For file-based WMTS (tpkx)
     minio_path: Optional[str] = None        # MinIO path for extracted tiles
     tile_url_template: Optional[str] = None  # Template URL for accessing tiles
+    storage: Optional[str] = None  # 瓦片存储方式：bundle为紧凑型缓存bundle文件，mbtiles为MBTiles文件，为空时为单个瓦片对象
     
     # For URL-based WMTS services
     service_url: Optional[str] = None
@@ -68,6 +69,8 @@ class WMTSProcessStatus(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     wmts_id: Optional[str] = None
+    uploaded_files: Optional[int] = None  # 上传阶段已上传的文件数
+    total_files: Optional[int] = None  # 上传阶段需要上传的文件总数
 
     model_config = {
         "populate_by_name": True,
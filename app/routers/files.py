@@ -15,7 +15,9 @@ from app.models.user import UserInDB
 from app.models.file import FileMetadata, FileShare, ConversionStatus, FileConversion
 from app.auth.utils import get_current_active_user, db
 from app.core.minio_client import minio_client, SOURCE_BUCKET_NAME, CONVERTED_BUCKET_NAME, PUBLIC_MODEL_BUCKET_NAME, PREVIEW_BUCKET_NAME
-from app.tasks.task_manager import TaskManager, TaskType
+from app.tasks import task_manager
+from app.tasks.task_manager import TaskType, TaskPriority
+from app.services.conversion_cache import ConversionCacheService, compute_content_hash
 from app.utils.mongo_init import get_mongo_url
 
 # 加载 .env 文件
@@ -146,6 +148,7 @@ async def upload_file(
             "file_path": file_path,
             "upload_date": datetime.now(),
             "file_size": len(file_data),
+            "content_hash": compute_content_hash(file_data),
             "user_id": current_user.id,
             "username": current_user.username,
             "is_public": False,
@@ -236,6 +239,9 @@ async def delete_file(
     if file_info["user_id"] != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="没有权限删除此文件")
     
+    # 释放对共享转换结果的引用，没有其他文件引用时才删除转换结果
+    await ConversionCacheService(db).release(file_id)
+    
     # 删除文件
     await db.files.delete_one({"_id": ObjectId(file_id)})
     return {"message": "文件删除成功"}
@@ -412,6 +418,7 @@ async def get_converted_download_url(
 async def convert_file(
     file_id: str,
     output_format: Optional[str] = Form(None),
+    priority: Optional[TaskPriority] = Form(None),
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """
@@ -419,6 +426,7 @@ async def convert_file(
     
     - **file_id**: 文件ID
     - **output_format**: 输出格式（可选，默认为配置中的默认格式）
+    - **priority**: 任务优先级（可选，默认为interactive）
     - **current_user**: 当前登录用户
     """
     print(f"转换文件请求: file_id={file_id}, output_format={output_format}, user={current_user.username}")
@@ -467,21 +475,54 @@ async def convert_file(
         # 确定输出格式
         output_format = output_format or CONVERTER_CONFIG.get("default_output_format", "GLTF")
         print(f"使用输出格式: {output_format}")
+        input_format = os.path.splitext(file_metadata["file_path"])[1][1:].upper()
+        
+        # 内容相同、转换参数和转换程序版本也相同的文件已经转换过时，直接复用转换结果
+        conversion_cache = ConversionCacheService(db)
+        content_hash = await conversion_cache.get_content_hash(file_metadata)
+        cache_key = conversion_cache.build_cache_key(content_hash, input_format, output_format)
+        await conversion_cache.release(file_id, keep_key=cache_key)
+        cache_entry = await conversion_cache.link(cache_key, file_id)
+        if cache_entry:
+            print(f"命中转换缓存: {cache_key}")
+            conversion = FileConversion(
+                status=ConversionStatus.COMPLETED,
+                input_format=input_format,
+                output_format=output_format,
+                input_file_path=file_path,
+                output_file_path=cache_entry["output_file_path"],
+                progress=100,
+                created_at=datetime.now(),
+                updated_at=datetime.now()
+            )
+            await db.files.update_one(
+                {"_id": ObjectId(file_id)},
+                {"$set": {"conversion": conversion.model_dump()}}
+            )
+            return {
+                "message": "已复用相同文件的转换结果",
+                "task_id": None,
+                "status": "completed",
+                "progress": 100,
+                "cached": True,
+                "output_file_path": cache_entry["output_file_path"]
+            }
         
         # 创建转换任务
-        task_manager = TaskManager()
         task = await task_manager.create_task(
             task_type=TaskType.FILE_CONVERSION,
             user_id=str(current_user.id),
             file_id=file_id,
             input_file_path=file_path,
-            output_format=output_format
+            output_format=output_format,
+            result={"cache_key": cache_key},
+            priority=priority
         )
         
         # 更新文件元数据中的转换信息
         conversion = FileConversion(
             status=ConversionStatus.PENDING,
-            input_format=os.path.splitext(file_metadata["file_path"])[1][1:].upper(),
+            input_format=input_format,
             output_format=output_format,
             input_file_path=file_path,
             task_id=task.task_id,
@@ -495,10 +536,6 @@ async def convert_file(
             {"$set": {"conversion": conversion.model_dump()}}
         )
         
-        # 启动任务管理器（如果尚未启动）
-        if not task_manager.is_running:
-            await task_manager.start()
-        
         return {
             "message": "文件转换任务已创建",
             "task_id": task.task_id,
@@ -530,7 +567,6 @@ async def get_conversion_status(
     
     try:
         # 获取任务
-        task_manager = TaskManager()
         task = await task_manager.get_task(task_id)
         
         if not task:
@@ -1,23 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, WebSocket
+from fastapi.responses import StreamingResponse
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from bson import ObjectId
 from enum import Enum
+import asyncio
+import base64
 import json
+import os
 
 from app.models.user import UserInDB
-from app.auth.utils import get_current_active_user, db
-from app.tasks.task_manager import TaskManager, TaskType, TaskStatus, ConversionStep
+from app.auth.utils import get_current_active_user, get_current_user, oauth2_scheme, db
+from app.tasks import task_manager
+from app.tasks.task_manager import TaskType, TaskStatus, ConversionStep, FINISHED_TASK_STATUSES
+from app.tasks.task_events import parse_event_id
 from app.services.threedtiles_service import ThreeDTilesService
+from app.services.object_cleanup import ObjectCleanupService
+from app.services.tile_seeding import TileSeedingService
+from app.models.tile_seeding import TileSeedingCreate
 
 router = APIRouter(
     tags=["任务管理"]
 )
 
+# 任务列表每页默认和最多返回的任务数
+TASK_LIST_DEFAULT_LIMIT = 50
+TASK_LIST_MAX_LIMIT = 200
+
+# 一个推送连接最多订阅的任务数量
+TASK_EVENT_MAX_TASKS = int(os.getenv("TASK_EVENT_MAX_TASKS", "100"))
+# 推送连接没有事件时发送心跳的间隔（秒），避免代理断开空闲连接
+TASK_EVENT_HEARTBEAT_INTERVAL = float(os.getenv("TASK_EVENT_HEARTBEAT_INTERVAL", "15"))
+
 class TaskTypeQuery(str, Enum):
     """任务类型查询枚举，用于URL查询参数"""
     FILE_CONVERSION = "file_conversion"  
     THREEDTILES_PROCESSING = "threedtiles_processing"
+    WMTS_PROCESSING = "wmts_processing"
+    PREFIX_DELETION = "prefix_deletion"
+    TILE_SEEDING = "tile_seeding"
 
 class TaskStatusQuery(str, Enum):
     """任务状态查询枚举，用于URL查询参数"""
@@ -25,6 +46,7 @@ class TaskStatusQuery(str, Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 # 添加一个工具函数来处理ObjectId
 def handle_object_id(obj: Dict[str, Any]) -> Dict[str, Any]:
@@ -43,17 +65,93 @@ def handle_object_id(obj: Dict[str, Any]) -> Dict[str, Any]:
                            for item in value]
     return obj
 
-@router.get("/list", response_model=List[dict])
+async def get_queue_position(task) -> Optional[int]:
+    """
+    获取排队中任务的预计排队位置（1表示下一个执行），其他状态或等待重试的任务返回None
+    """
+    if task.status != TaskStatus.PENDING:
+        return None
+    positions = await task_manager.get_queue_positions(task.task_type)
+    return positions.get(task.task_id)
+
+async def build_task_status(task) -> Dict[str, Any]:
+    """构建任务状态信息，供状态查询接口和推送连接的初始快照使用"""
+    result = {
+        "task_id": task.task_id,
+        "status": task.status,
+        "progress": task.progress,
+        "current_step": task.current_step,
+        "error_message": task.error_message,
+        "priority": task.priority,
+        "queue_position": await get_queue_position(task),
+    }
+    
+    # 添加结果数据，如果有的话
+    if task.result:
+        result["result"] = handle_object_id(task.result)
+        
+        # 对于threedtiles任务，添加额外的处理信息
+        if task.task_type == TaskType.THREEDTILES_PROCESSING:
+            result["process_status"] = {
+                "status": task.status,
+                "message": task.error_message or "",
+            }
+            
+            # 如果任务完成且包含tile_id，添加到状态中
+            if task.status == TaskStatus.COMPLETED and task.result.get("tile_id"):
+                result["process_status"]["tile_id"] = str(task.result["tile_id"])
+                
+            # 添加资源名称，如果有的话
+            if task.result.get("filename"):
+                result["resource_name"] = task.result["filename"]
+    
+    return result
+
+def encode_task_cursor(task: Dict[str, Any]) -> str:
+    """将一页最后一个任务的排序键编码为下一页的游标"""
+    payload = json.dumps({"created_at": task.get("created_at"), "task_id": task.get("task_id")})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_task_cursor(cursor: str) -> Dict[str, Any]:
+    """解析分页游标，返回游标之后（更早创建）的任务的查询条件"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        created_at, task_id = payload["created_at"], payload["task_id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "task_id": {"$lt": task_id}},
+    ]}
+
+def to_local_isoformat(value: datetime) -> str:
+    """将查询参数中的时间转换为任务时间字段使用的格式（本地时间、无时区的ISO字符串）"""
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat()
+
+@router.get("/list", response_model=dict)
 async def list_tasks(
     status: Optional[TaskStatusQuery] = None,
     task_type: Optional[TaskTypeQuery] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(TASK_LIST_DEFAULT_LIMIT, ge=1, le=TASK_LIST_MAX_LIMIT),
+    archived: bool = False,
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """
-    获取当前用户的所有任务
+    分页获取当前用户的任务，按创建时间倒序排列，排队中的任务包含预计排队位置queue_position
+    
+    返回 {"items": [...], "next_cursor": ...}，next_cursor为空表示没有更多任务
     
     - **status**: 可选的状态过滤
     - **task_type**: 可选的任务类型过滤
+    - **created_after**/**created_before**: 可选的创建时间范围
+    - **cursor**: 上一页返回的next_cursor
+    - **limit**: 每页任务数
+    - **archived**: 为true时查询已归档的历史任务
     - **current_user**: 当前登录用户
     """
     try:
@@ -65,8 +163,28 @@ async def list_tasks(
         if task_type:
             query["task_type"] = task_type
         
-        tasks_cursor = db.tasks.find(query)
+        created_range = {}
+        if created_after:
+            created_range["$gte"] = to_local_isoformat(created_after)
+        if created_before:
+            created_range["$lt"] = to_local_isoformat(created_before)
+        if created_range:
+            query["created_at"] = created_range
+        
+        if cursor:
+            query = {"$and": [query, decode_task_cursor(cursor)]}
+        
+        # 按(user_id, created_at, task_id)索引排序，多取一条用于判断是否还有下一页
+        collection = db.tasks_archive if archived else db.tasks
+        tasks_cursor = collection.find(query).sort([("created_at", -1), ("task_id", -1)]).limit(limit + 1)
         tasks = await tasks_cursor.to_list(length=None)
+        next_cursor = encode_task_cursor(tasks[limit - 1]) if len(tasks) > limit else None
+        tasks = tasks[:limit]
+        
+        # 排队中的任务附带预计排队位置，每种任务类型只读取一次队列
+        queue_positions = {}
+        for pending_type in {task.get("task_type") for task in tasks if task.get("status") == TaskStatus.PENDING}:
+            queue_positions.update(await task_manager.get_queue_positions(pending_type))
         
         # 格式化日期时间字段并处理ObjectId
         for task in tasks:
@@ -78,6 +196,8 @@ async def list_tasks(
                 task["created_at"] = task["created_at"].isoformat()
             if "updated_at" in task and isinstance(task["updated_at"], datetime):
                 task["updated_at"] = task["updated_at"].isoformat()
+            
+            task["queue_position"] = queue_positions.get(task.get("task_id"))
                 
             # 如果是threedtiles任务，添加额外的处理信息
             if task.get("task_type") == TaskType.THREEDTILES_PROCESSING and task.get("result"):
@@ -95,13 +215,336 @@ async def list_tasks(
                 if task.get("status") == TaskStatus.COMPLETED and task["result"].get("tile_id"):
                     task["process_status"]["tile_id"] = task["result"]["tile_id"]
         
-        return tasks
+        return {"items": tasks, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         print(f"获取任务列表失败: {str(e)}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"获取任务列表失败: {str(e)}")
 
+@router.get("/workers", response_model=dict)
+async def get_worker_stats(
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    获取各任务类型工作池的占用情况（仅管理员）
+    
+    返回每种任务类型的最大并发数、正在执行的任务数、空闲名额和排队任务数
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="没有权限查看工作池状态")
+    
+    return await task_manager.get_worker_stats()
+
+@router.get("/dead-letter", response_model=List[dict])
+async def list_dead_letters(
+    task_type: Optional[TaskTypeQuery] = None,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    获取死信队列中的任务（仅管理员）
+    
+    重试次数用完或遇到不可重试错误而失败的任务，包含失败原因、已重试次数和失败时间
+    
+    - **task_type**: 可选的任务类型过滤
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="没有权限查看死信队列")
+    
+    try:
+        return await task_manager.list_dead_letters(task_type)
+    except Exception as e:
+        print(f"获取死信队列失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取死信队列失败: {str(e)}")
+
+@router.post("/dead-letter/replay", response_model=dict)
+async def replay_dead_letters(
+    task_type: Optional[TaskTypeQuery] = None,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    重新执行死信队列中的所有任务（仅管理员），例如存储服务故障恢复后批量重放
+    
+    - **task_type**: 可选，只重放指定类型的任务
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="没有权限重放死信任务")
+    
+    try:
+        replayed = []
+        for item in await task_manager.list_dead_letters(task_type):
+            if await task_manager.replay_dead_letter(item["task_id"]):
+                replayed.append(item["task_id"])
+        return {"message": f"已重新入队{len(replayed)}个任务", "task_ids": replayed}
+    except Exception as e:
+        print(f"重放死信任务失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"重放死信任务失败: {str(e)}")
+
+@router.post("/dead-letter/{task_id}/replay", response_model=dict)
+async def replay_dead_letter(
+    task_id: str,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    重新执行死信队列中的单个任务（仅管理员），重试次数清零
+    
+    - **task_id**: 任务ID
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="没有权限重放死信任务")
+    
+    try:
+        task = await task_manager.replay_dead_letter(task_id)
+    except Exception as e:
+        print(f"重放死信任务失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"重放死信任务失败: {str(e)}")
+    
+    if not task:
+        raise HTTPException(status_code=404, detail="死信队列中没有该任务")
+    return {"message": "任务已重新入队", "task_id": task_id, "status": task.status}
+
+@router.post("/prefix-deletion/reconcile", response_model=dict)
+async def reconcile_prefix_deletions(
+    dry_run: bool = True,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    对账存储桶与资源记录（仅管理员）
+    
+    查找删除任务丢失或失败的已标记删除记录，以及没有对应记录的遗留目录，
+    dry_run为false时为它们创建前缀删除任务
+    
+    - **dry_run**: 只返回对账结果，不创建删除任务
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="没有权限执行对账")
+    
+    try:
+        report = await ObjectCleanupService(db).reconcile(str(current_user.id), dry_run=dry_run)
+    except Exception as e:
+        print(f"对账失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"对账失败: {str(e)}")
+    
+    report["dry_run"] = dry_run
+    return report
+
+@router.post("/tile-seeding", response_model=dict)
+async def create_tile_seeding_task(
+    request: TileSeedingCreate,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    创建瓦片缓存预热任务
+    
+    预热WMTS图层指定级别和地理范围内的瓦片、3DTiles瓦片集与地理范围相交的瓦片内容，
+    或场景原点周围（radius米）绑定的WMTS图层瓦片。任务以批量优先级按速率限制执行，
+    进度和统计信息（total_tiles、processed_tiles等）通过任务状态接口查询
+    
+    - **target_type**: wmts、threedtiles或scene
+    - **target_id**: 图层ID、瓦片集ID或场景ID
+    """
+    request_data = request.model_dump()
+    # 提交前检查预热对象和瓦片数，参数无效时直接返回错误
+    plan = await TileSeedingService(db).plan(request_data)
+    if plan.total_tiles == 0:
+        raise HTTPException(status_code=400, detail="预热范围内没有瓦片")
+    
+    try:
+        task = await task_manager.create_task(
+            task_type=TaskType.TILE_SEEDING,
+            user_id=str(current_user.id),
+            file_id=request.target_id,
+            input_file_path=f"{request.target_type}/{request.target_id}",
+            output_format="",
+            result={**request_data, "total_tiles": plan.total_tiles}
+        )
+    except Exception as e:
+        print(f"创建瓦片缓存预热任务失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"创建瓦片缓存预热任务失败: {str(e)}")
+    
+    return {"task_id": task.task_id, "status": task.status, "total_tiles": plan.total_tiles}
+
+async def get_event_stream_user(token: Optional[str]) -> UserInDB:
+    """验证推送连接的访问令牌（EventSource和WebSocket无法设置Authorization请求头时通过查询参数传递）"""
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    current_user = await get_current_user(token)
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
+
+async def authorize_task_ids(task_ids: List[str], current_user: UserInDB) -> List[str]:
+    """检查推送连接订阅的任务是否存在且属于当前用户，返回去重后的任务ID"""
+    task_ids = list(dict.fromkeys(task_id.strip() for task_id in task_ids if task_id.strip()))
+    if not task_ids:
+        raise HTTPException(status_code=400, detail="请指定要订阅的任务ID")
+    if len(task_ids) > TASK_EVENT_MAX_TASKS:
+        raise HTTPException(status_code=400, detail=f"一个连接最多订阅{TASK_EVENT_MAX_TASKS}个任务")
+    for task_id in task_ids:
+        task = await task_manager.get_task(task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail=f"任务不存在: {task_id}")
+        if task.user_id != str(current_user.id) and current_user.role != "admin":
+            raise HTTPException(status_code=403, detail=f"没有权限查看此任务: {task_id}")
+    return task_ids
+
+async def iter_task_events(task_ids: List[str], last_event_id: Optional[str]):
+    """
+    生成订阅任务的事件：先补发断线期间的事件（无法补发时发送当前状态快照），
+    再推送实时增量。所有订阅的任务结束后生成end事件并停止；
+    本地积压过多时生成resync事件，客户端应带上次事件ID重新连接
+
+    生成 (事件ID, 事件类型, 数据) 三元组，事件ID为None表示心跳
+    """
+    events = task_manager.events
+    subscription = await events.subscribe(task_ids)
+    try:
+        finished = set()
+        if last_event_id and await events.can_resume(last_event_id):
+            last_sent = last_event_id
+            for event in await events.replay(set(task_ids), last_event_id):
+                last_sent = event["id"]
+                if event["event"] == "deleted" or event["data"].get("status") in FINISHED_TASK_STATUSES:
+                    finished.add(event["task_id"])
+                yield event["id"], event["event"], {"task_id": event["task_id"], **event["data"]}
+            # 断线前已经结束的任务不会再有事件
+            for task_id in task_ids:
+                task = await task_manager.get_task(task_id)
+                if not task or task.status in FINISHED_TASK_STATUSES:
+                    finished.add(task_id)
+        else:
+            last_sent = await events.get_last_event_id()
+            for task_id in task_ids:
+                task = await task_manager.get_task(task_id)
+                if not task:
+                    finished.add(task_id)
+                    yield last_sent, "deleted", {"task_id": task_id}
+                    continue
+                if task.status in FINISHED_TASK_STATUSES:
+                    finished.add(task_id)
+                yield last_sent, "snapshot", handle_object_id(await build_task_status(task))
+        
+        while len(finished) < len(task_ids):
+            if subscription.overflowed:
+                yield last_sent, "resync", {}
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=TASK_EVENT_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield None, "heartbeat", {}
+                continue
+            # 补发和快照已经包含的事件不再重复推送
+            if parse_event_id(event["id"]) <= parse_event_id(last_sent):
+                continue
+            last_sent = event["id"]
+            if event["event"] == "deleted" or event["data"].get("status") in FINISHED_TASK_STATUSES:
+                finished.add(event["task_id"])
+            yield event["id"], event["event"], {"task_id": event["task_id"], **event["data"]}
+        yield last_sent, "end", {}
+    finally:
+        events.unsubscribe(subscription)
+
+@router.get("/events")
+async def stream_task_events(
+    task_ids: List[str] = Query(..., description="要订阅的任务ID，可重复传入或以逗号分隔"),
+    token: Optional[str] = Query(None, description="访问令牌，EventSource无法设置请求头时使用"),
+    last_event_id: Optional[str] = Query(None, description="上次收到的事件ID，用于断线后继续推送"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    header_token: Optional[str] = Depends(oauth2_scheme)
+):
+    """
+    以Server-Sent Events推送任务状态变化，替代轮询状态接口
+    
+    一个连接可以同时订阅多个任务。连接建立后先为每个任务发送一条snapshot事件（当前状态），
+    之后只推送发生变化的字段（update事件），任务被删除时发送deleted事件，
+    所有订阅的任务结束后发送end事件，客户端收到后应关闭连接。
+    断线重连时浏览器会自动带上Last-Event-ID，服务端补发断线期间的事件；
+    事件已过期无法补发时重新发送snapshot。收到resync事件时客户端应重新连接
+    
+    - **task_ids**: 任务ID列表
+    - **token**: 可选的访问令牌（也可使用Authorization请求头）
+    - **last_event_id**: 可选的上次事件ID（也可使用Last-Event-ID请求头）
+    """
+    current_user = await get_event_stream_user(token or header_token)
+    task_ids = await authorize_task_ids(
+        [task_id for value in task_ids for task_id in value.split(",")], current_user
+    )
+    
+    async def event_source():
+        yield "retry: 3000\n\n"
+        async for event_id, event, data in iter_task_events(task_ids, last_event_id_header or last_event_id):
+            if event_id is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/ws")
+async def task_events_websocket(websocket: WebSocket, token: Optional[str] = Query(None)):
+    """
+    以WebSocket推送任务状态变化（需要uvicorn安装WebSocket支持）
+    
+    连接后客户端发送 {"task_ids": [...], "last_event_id": "可选"} 订阅任务，
+    之后可以随时发送新的订阅消息替换订阅的任务。服务端推送
+    {"id": 事件ID, "event": 事件类型, "data": {...}}，事件类型与SSE接口相同，
+    end 事件之后连接保持打开，可以继续订阅其他任务
+    
+    - **token**: 访问令牌
+    """
+    try:
+        current_user = await get_event_stream_user(token)
+    except HTTPException:
+        await websocket.close(code=4401)
+        return
+    await websocket.accept()
+    
+    subscription_messages: asyncio.Queue = asyncio.Queue()
+    
+    async def receive_messages():
+        while True:
+            await subscription_messages.put(await websocket.receive_json())
+    
+    async def push_events(message: Dict[str, Any]):
+        try:
+            task_ids = await authorize_task_ids(message.get("task_ids") or [], current_user)
+        except HTTPException as e:
+            await websocket.send_json({"id": None, "event": "error", "data": {"detail": e.detail}})
+            return
+        async for event_id, event, data in iter_task_events(task_ids, message.get("last_event_id")):
+            if event_id is None:
+                await websocket.send_json({"id": None, "event": "heartbeat", "data": {}})
+                continue
+            await websocket.send_json(
+                json.loads(json.dumps({"id": event_id, "event": event, "data": data}, default=str))
+            )
+    
+    receiver = asyncio.create_task(receive_messages())
+    pusher: Optional[asyncio.Task] = None
+    try:
+        while True:
+            next_message = asyncio.create_task(subscription_messages.get())
+            await asyncio.wait({next_message, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                next_message.cancel()
+                break
+            # 新的订阅替换之前的订阅
+            if pusher:
+                pusher.cancel()
+                await asyncio.gather(pusher, return_exceptions=True)
+            pusher = asyncio.create_task(push_events(next_message.result()))
+    finally:
+        for background_task in (receiver, pusher):
+            if background_task:
+                background_task.cancel()
+        await asyncio.gather(*(t for t in (receiver, pusher) if t), return_exceptions=True)
+
 @router.get("/{task_id}", response_model=dict)
 async def get_task(
     task_id: str,
@@ -115,7 +558,6 @@ async def get_task(
     """
     try:
         # 获取任务
-        task_manager = TaskManager()
         task = await task_manager.get_task(task_id)
         
         if not task:
@@ -126,6 +568,7 @@ async def get_task(
             raise HTTPException(status_code=403, detail="没有权限查看此任务")
         
         task_dict = task.to_dict()
+        task_dict["queue_position"] = await get_queue_position(task)
         
         # 处理ObjectId
         task_dict = handle_object_id(task_dict)
@@ -153,6 +596,47 @@ async def get_task(
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"获取任务失败: {str(e)}")
 
+@router.post("/{task_id}/cancel", response_model=dict)
+async def cancel_task(
+    task_id: str,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    取消任务
+    
+    排队中的任务会立即取消；执行中的任务会停止转换进程或在下一个文件边界停止上传，
+    并清理已写入的部分数据，完成后状态变为cancelled
+    
+    - **task_id**: 任务ID
+    - **current_user**: 当前登录用户
+    """
+    try:
+        # 获取任务
+        task = await task_manager.get_task(task_id)
+        
+        if not task:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        
+        # 检查权限
+        if task.user_id != str(current_user.id) and current_user.role != "admin":
+            raise HTTPException(status_code=403, detail="没有权限取消此任务")
+        
+        if task.status in FINISHED_TASK_STATUSES:
+            raise HTTPException(status_code=400, detail="任务已结束，无法取消")
+        
+        task = await task_manager.cancel_task(task_id)
+        
+        if task.status == TaskStatus.CANCELLED:
+            return {"message": "任务已取消", "task_id": task_id, "status": task.status}
+        return {"message": "已请求取消任务，正在停止处理", "task_id": task_id, "status": task.status}
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        print(f"取消任务失败: {str(e)}")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"取消任务失败: {str(e)}")
+
 @router.delete("/{task_id}", response_model=dict)
 async def delete_task(
     task_id: str,
@@ -166,7 +650,6 @@ async def delete_task(
     """
     try:
         # 获取任务
-        task_manager = TaskManager()
         task = await task_manager.get_task(task_id)
         
         if not task:
@@ -176,6 +659,10 @@ async def delete_task(
         if task.user_id != str(current_user.id) and current_user.role != "admin":
             raise HTTPException(status_code=403, detail="没有权限删除此任务")
         
+        # 未结束的任务先取消，停止正在运行的处理并清理部分数据
+        if task.status not in FINISHED_TASK_STATUSES:
+            await task_manager.cancel_task(task_id)
+        
         # 删除任务
         deleted = await task_manager.delete_task(task_id)
         
@@ -202,7 +689,6 @@ async def get_task_status(
     """
     try:
         # 获取任务
-        task_manager = TaskManager()
         task = await task_manager.get_task(task_id)
         
         if not task:
@@ -212,34 +698,7 @@ async def get_task_status(
         if task.user_id != str(current_user.id) and current_user.role != "admin":
             raise HTTPException(status_code=403, detail="没有权限查看此任务")
         
-        result = {
-            "task_id": task.task_id,
-            "status": task.status,
-            "progress": task.progress,
-            "current_step": task.current_step,
-            "error_message": task.error_message,
-        }
-        
-        # 添加结果数据，如果有的话
-        if task.result:
-            result["result"] = handle_object_id(task.result)
-            
-            # 对于threedtiles任务，添加额外的处理信息
-            if task.task_type == TaskType.THREEDTILES_PROCESSING:
-                result["process_status"] = {
-                    "status": task.status,
-                    "message": task.error_message or "",
-                }
-                
-                # 如果任务完成且包含tile_id，添加到状态中
-                if task.status == TaskStatus.COMPLETED and task.result.get("tile_id"):
-                    result["process_status"]["tile_id"] = str(task.result["tile_id"])
-                    
-                # 添加资源名称，如果有的话
-                if task.result.get("filename"):
-                    result["resource_name"] = task.result["filename"]
-        
-        return result
+        return await build_task_status(task)
     except Exception as e:
         import traceback
         print(f"获取任务状态失败: {str(e)}")
@@ -1,5 +1,5 @@
-from typing import List
-from fastapi import APIRouter, Depends, File, UploadFile, Form, Query, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, File, UploadFile, Form, Query, HTTPException, Request, status
 from fastapi.responses import JSONResponse
 from pydantic import parse_obj_as
 import json
@@ -8,10 +8,17 @@ from datetime import timedelta
 
 from app.db.mongo_db import get_database
 from app.services.threedtiles_service import ThreeDTilesService
-from app.models.threedtiles import ThreeDTilesCreate, ThreeDTilesInDB, ThreeDTilesUpdate, ProcessStatus
+from app.services.tile_archive import (
+    TileArchiveService,
+    get_archive_object_name,
+    get_archive_tile_cache_key
+)
+from app.services.tile_cache import TileCacheService, build_tile_response, normalize_tile_path
+from app.services.tileset_revision import TilesetManifestService
+from app.models.threedtiles import ThreeDTilesCreate, ThreeDTilesInDB, ThreeDTilesUpdate, ProcessStatus, TilesetFrustumQuery
 from app.core.minio_client import minio_client, THREEDTILES_BUCKET_NAME
 from app.tasks import task_manager
-from app.tasks.task_manager import TaskType, TaskStatus, ConversionStep
+from app.tasks.task_manager import TaskType, TaskStatus, ConversionStep, TaskPriority
 from app.auth.utils import get_current_active_user
 
 router = APIRouter(
@@ -65,12 +72,14 @@ async def process_uploaded_file(
     metadata: str = Form(None),
     tags: str = Form(None),
     is_public: bool = Form(True),
+    priority: TaskPriority = Form(None),
     db = Depends(get_database),
     current_user = Depends(get_current_active_user)
 ):
     """
     处理已上传到MinIO的文件，进行解压和数据库记录创建
     现在使用任务队列处理，不会阻塞API响应
+    priority 为任务优先级，默认为batch
     """
     # 解析元数据和标签
     metadata_dict = {}
@@ -116,16 +125,7 @@ async def process_uploaded_file(
         object_name = f"{object_id}/{filename}"
         minio_client.stat_object(THREEDTILES_BUCKET_NAME, object_name)
         
-        # 创建任务
-        task = await task_manager.create_task(
-            task_type=TaskType.THREEDTILES_PROCESSING,
-            user_id=str(current_user.id),
-            file_id=object_id,
-            input_file_path=object_name,
-            output_format="3DTILES"
-        )
-        
-        # 添加额外信息到任务结果中
+        # 任务处理所需的额外信息，随任务一起入队
         task_result = {
             "object_id": object_id,
             "filename": filename,
@@ -133,32 +133,19 @@ async def process_uploaded_file(
         }
         
         # 打印日志: 查看task_result内容
-        print(f"[DEBUG] 更新任务的task_result: {task_result}")
+        print(f"[DEBUG] 创建任务的task_result: {task_result}")
         
-        updated_task = await task_manager.update_task(
-            task_id=task.task_id,
-            result=task_result
+        # 创建任务
+        task = await task_manager.create_task(
+            task_type=TaskType.THREEDTILES_PROCESSING,
+            user_id=str(current_user.id),
+            file_id=object_id,
+            input_file_path=object_name,
+            output_format="3DTILES",
+            result=task_result,
+            priority=priority
         )
         
-        # 打印日志: 查看更新后的任务
-        print(f"[DEBUG] 更新后的任务result: {updated_task.result if updated_task else 'None'}")
-        
-        # 重要：更新任务后，我们需要将更新后的完整任务重新添加到队列
-        # 这确保队列中任务包含最新的完整数据
-        if updated_task:
-            try:
-                # 更新后再次添加到队列，确保队列中的任务数据是最新的
-                task_dict = updated_task.to_dict()
-                task_data = json.dumps(task_dict)
-                
-                # 清理并重新添加到队列
-                task_manager.redis.redis_client.lrem(task_manager.task_queue_key, 0, json.dumps(task.to_dict()))
-                task_manager.redis.redis_client.rpush(task_manager.task_queue_key, task_data)
-                print(f"[DEBUG] 已将更新后的任务重新添加到队列，task_id: {task.task_id}")
-            except Exception as e:
-                print(f"[ERROR] 重新添加任务到队列失败: {str(e)}")
-                # 任务仍在Redis和MongoDB中，处理器会找到它
-        
         return {
             "status": "processing",
             "message": "已加入任务队列，请在任务列表中查看进度",
@@ -173,6 +160,62 @@ async def process_uploaded_file(
             detail=f"处理文件失败: {str(e)}"
         )
 
+@router.post("/{tile_id}/update", response_model=dict)
+async def update_tileset_files(
+    tile_id: str,
+    object_id: str = Form(...),
+    filename: str = Form(...),
+    priority: TaskPriority = Form(None),
+    db = Depends(get_database),
+    current_user = Depends(get_current_active_user)
+):
+    """
+    用已上传到MinIO的新压缩包增量更新瓦片集（上传方式与/process相同）
+    
+    只上传新增或内容变化的文件并删除已移除的文件，tile_id保持不变；
+    上传完成后记录一次性切换到新版本的tileset.json，处理过程中客户端仍访问完整的旧版本
+    """
+    tile = await ThreeDTilesService(db).get_threedtiles(tile_id)
+    if tile.get("storage") == "archive":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="以.3tz压缩包形式保存的瓦片集不支持增量更新"
+        )
+    if not filename.endswith(('.zip', '.3tz')):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="文件必须是.zip或.3tz格式"
+        )
+    
+    object_name = f"{object_id}/{filename}"
+    try:
+        minio_client.stat_object(THREEDTILES_BUCKET_NAME, object_name)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"MinIO中未找到文件: {str(e)}"
+        )
+    
+    task = await task_manager.create_task(
+        task_type=TaskType.THREEDTILES_PROCESSING,
+        user_id=str(current_user.id),
+        file_id=object_id,
+        input_file_path=object_name,
+        output_format="3DTILES",
+        result={
+            "object_id": object_id,
+            "filename": filename,
+            "update_tile_id": tile_id
+        },
+        priority=priority
+    )
+    return {
+        "status": "processing",
+        "message": "已加入任务队列，请在任务列表中查看进度",
+        "process_id": task.task_id,
+        "task_id": task.task_id
+    }
+
 @router.get("/process-status/{process_id}", response_model=ProcessStatus)
 async def get_process_status(
     process_id: str,
@@ -195,6 +238,8 @@ async def get_process_status(
                 status_value = "completed"
             elif task.status == TaskStatus.FAILED:
                 status_value = "failed"
+            elif task.status == TaskStatus.CANCELLED:
+                status_value = "cancelled"
                 
             message = task.error_message or f"当前步骤: {task.current_step}, 进度: {task.progress}%"
             
@@ -289,6 +334,124 @@ async def create_threedtiles(
     threedtiles_service = ThreeDTilesService(db)
     return await threedtiles_service.create_threedtiles(file, threedtiles_data)
 
+@router.get("/{tile_id}/tiles/{path:path}")
+async def get_tile(
+    tile_id: str,
+    path: str,
+    request: Request
+):
+    """
+    读取解压后保存的瓦片集中的tileset.json或瓦片文件
+    
+    经过进程内LRU和磁盘两级缓存，支持ETag/If-None-Match(304)和Range请求；
+    客户端接受gzip时返回上传时预压缩的版本
+    """
+    path = normalize_tile_path(path)
+    tile = await TileCacheService().get_object_tile(
+        THREEDTILES_BUCKET_NAME,
+        f"{tile_id}/{path}",
+        request.headers.get("accept-encoding"),
+        "range" in request.headers
+    )
+    return build_tile_response(request, tile, path)
+
+@router.get("/{tile_id}/archive/{path:path}")
+async def get_archive_tile(
+    tile_id: str,
+    path: str,
+    request: Request
+):
+    """
+    从以.3tz压缩包形式保存的瓦片集中读取tileset.json或瓦片文件
+    
+    压缩包的中央目录只解析一次并缓存，每个文件只读取压缩包中对应的字节范围，
+    读取的文件同样经过瓦片缓存
+    """
+    path = normalize_tile_path(path)
+    tile = await TileCacheService().get_tile(
+        get_archive_tile_cache_key(tile_id, path),
+        lambda: TileArchiveService().load_tile(get_archive_object_name(tile_id), path),
+        "range" in request.headers
+    )
+    return build_tile_response(request, tile, path)
+
+@router.get("/{tile_id}/revisions/{revision}/{path:path}")
+async def get_revision_tile(
+    tile_id: str,
+    revision: int,
+    path: str,
+    request: Request
+):
+    """
+    读取增量更新后的瓦片集版本中的tileset.json或瓦片文件
+    
+    按该版本的清单找到文件所在的对象（未变化的文件沿用旧版本的对象），
+    缓存、ETag、Range和gzip的处理与/tiles相同
+    """
+    path = normalize_tile_path(path)
+    object_name = await TilesetManifestService().resolve_object_name(tile_id, revision, path)
+    tile = await TileCacheService().get_object_tile(
+        THREEDTILES_BUCKET_NAME,
+        object_name,
+        request.headers.get("accept-encoding"),
+        "range" in request.headers
+    )
+    return build_tile_response(request, tile, path)
+
+@router.get("/{tile_id}/tiles-query", response_model=dict)
+async def query_tiles_by_bbox(
+    tile_id: str,
+    bbox: str = Query(..., description="地理范围：西,南,东,北（度），西大于东表示跨越180度经线"),
+    min_height: Optional[float] = Query(None, description="最低椭球高（米）"),
+    max_height: Optional[float] = Query(None, description="最高椭球高（米）"),
+    geometric_error: Optional[float] = Query(None, ge=0, description="目标几何误差，几何误差不大于该值的瓦片不再细化"),
+    limit: Optional[int] = Query(None, ge=1),
+    db = Depends(get_database)
+):
+    """
+    查询瓦片集中与地理范围相交的瓦片
+    
+    使用入库时生成的空间索引，不需要下载和遍历整个tileset.json；
+    返回各瓦片的层级、几何误差、范围和内容地址，REPLACE方式细化的父瓦片不返回
+    """
+    try:
+        bbox_values = [float(value) for value in bbox.split(",")]
+    except ValueError:
+        bbox_values = []
+    if len(bbox_values) != 4 or bbox_values[1] > bbox_values[3]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="bbox必须为 西,南,东,北 格式，且南不大于北"
+        )
+    threedtiles_service = ThreeDTilesService(db)
+    return await threedtiles_service.query_tiles(
+        tile_id,
+        bbox=bbox_values,
+        min_height=min_height,
+        max_height=max_height,
+        geometric_error=geometric_error,
+        **({"limit": limit} if limit else {})
+    )
+
+@router.post("/{tile_id}/frustum-query", response_model=dict)
+async def query_tiles_by_frustum(
+    tile_id: str,
+    query: TilesetFrustumQuery,
+    db = Depends(get_database)
+):
+    """
+    查询瓦片集中与视锥体相交的瓦片
+    
+    指定相机位置时按屏幕空间误差选择细化层级（与客户端的瓦片调度一致），
+    可用于服务端预取和按需下载
+    """
+    threedtiles_service = ThreeDTilesService(db)
+    return await threedtiles_service.query_tiles(
+        tile_id,
+        frustum=query.model_dump(),
+        **({"limit": query.limit} if query.limit else {})
+    )
+
 @router.get("/{tile_id}", response_model=ThreeDTilesInDB)
 async def get_threedtiles(
     tile_id: str,
@@ -369,18 +532,35 @@ async def update_threedtiles(
     threedtiles_service = ThreeDTilesService(db)
     return await threedtiles_service.update_threedtiles(tile_id, update_data)
 
+@router.post("/{tile_id}/location/refresh", response_model=ThreeDTilesInDB)
+async def refresh_threedtiles_location(
+    tile_id: str,
+    db = Depends(get_database),
+    current_user = Depends(get_current_active_user)
+):
+    """
+    重新计算3DTiles模型的原点坐标和地理范围
+    
+    遍历tileset.json中所有瓦片的包围体（region/box/sphere，逐级累乘transform），
+    更新原点经纬度、椭球高、地理范围（bbox/footprint）和高度范围
+    """
+    threedtiles_service = ThreeDTilesService(db)
+    return await threedtiles_service.refresh_location(tile_id)
+
 @router.delete("/{tile_id}")
 async def delete_threedtiles(
     tile_id: str,
-    db = Depends(get_database)
+    db = Depends(get_database),
+    current_user = Depends(get_current_active_user)
 ):
     """
     删除3DTiles模型
+    
+    模型立即从列表中移除，MinIO中的文件由后台任务批量删除，返回的task_id可在任务列表中查看删除进度
     """
     threedtiles_service = ThreeDTilesService(db)
-    result = await threedtiles_service.delete_threedtiles(tile_id)
-    if result:
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content={"detail": f"成功删除ID为{tile_id}的3DTiles模型"}
-        ) 
\ No newline at end of file
+    task_id = await threedtiles_service.delete_threedtiles(tile_id, str(current_user.id))
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"detail": f"成功删除ID为{tile_id}的3DTiles模型", "task_id": task_id}
+    )
@@ -1,17 +1,19 @@
-from typing import List
-from fastapi import APIRouter, Depends, File, UploadFile, Form, Query, HTTPException, status
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from fastapi import APIRouter, Depends, File, UploadFile, Form, Query, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
 from pydantic import parse_obj_as
 import json
 import uuid
 from datetime import datetime, timedelta
 
 from app.db.mongo_db import get_database
-from app.services.wmts_service import WMTSService, WMTS_BUCKET_NAME
+from app.services.wmts_service import WMTSService, WMTS_BUCKET_NAME, get_layer_tile_loader
+from app.services.tile_cache import TileCacheService, build_tile_response, normalize_tile_path
+from app.services.wmts_capabilities import WMTSCapabilitiesService, get_service_base_url, render_exception_report
 from app.models.wmts import WMTSCreate, WMTSInDB, WMTSUpdate, WMTSProcessStatus
 from app.core.minio_client import minio_client
 from app.tasks import task_manager
-from app.tasks.task_manager import TaskType, TaskStatus, ConversionStep
+from app.tasks.task_manager import TaskType, TaskStatus, ConversionStep, TaskPriority
 from app.auth.utils import get_current_active_user
 
 def convert_objectid_to_str(obj):
@@ -92,12 +94,14 @@ async def process_uploaded_file(
     metadata: str = Form(None),
     tags: str = Form(None),
     is_public: bool = Form(True),
+    priority: TaskPriority = Form(None),
     db = Depends(get_database),
     current_user = Depends(get_current_active_user)
 ):
     """
     处理已上传到MinIO的tpkx文件，进行解压和数据库记录创建
     使用任务队列处理，不会阻塞API响应
+    priority 为任务优先级，默认为batch
     """
     # 解析元数据和标签
     metadata_dict = {}
@@ -143,43 +147,26 @@ async def process_uploaded_file(
         object_name = f"{object_id}/{filename}"
         minio_client.stat_object(WMTS_BUCKET_NAME, object_name)
         
-        # 创建任务 (使用新的WMTS任务类型)
-        task = await task_manager.create_task(
-            task_type=TaskType.WMTS_PROCESSING,
-            user_id=str(current_user.id),
-            file_id=object_id,
-            input_file_path=object_name,
-            output_format="WMTS"
-        )
-        
-        # 添加额外信息到任务结果中
+        # 任务处理所需的额外信息，随任务一起入队
         task_result = {
             "object_id": object_id,
             "filename": filename,
             "wmts_data": wmts_data.model_dump()
         }
         
-        print(f"[DEBUG] 更新任务的task_result: {task_result}")
+        print(f"[DEBUG] 创建任务的task_result: {task_result}")
         
-        updated_task = await task_manager.update_task(
-            task_id=task.task_id,
-            result=task_result
+        # 创建任务 (使用新的WMTS任务类型)
+        task = await task_manager.create_task(
+            task_type=TaskType.WMTS_PROCESSING,
+            user_id=str(current_user.id),
+            file_id=object_id,
+            input_file_path=object_name,
+            output_format="WMTS",
+            result=task_result,
+            priority=priority
         )
         
-        print(f"[DEBUG] 更新后的任务result: {updated_task.result if updated_task else 'None'}")
-        
-        # 重新添加到队列确保数据最新
-        if updated_task:
-            try:
-                task_dict = updated_task.to_dict()
-                task_data = json.dumps(task_dict)
-                
-                task_manager.redis.redis_client.lrem(task_manager.task_queue_key, 0, json.dumps(task.to_dict()))
-                task_manager.redis.redis_client.rpush(task_manager.task_queue_key, task_data)
-                print(f"[DEBUG] 已将更新后的任务重新添加到队列，task_id: {task.task_id}")
-            except Exception as e:
-                print(f"[ERROR] 重新添加任务到队列失败: {str(e)}")
-        
         return {
             "status": "processing",
             "message": "已加入任务队列，请在任务列表中查看进度",
@@ -246,6 +233,8 @@ async def get_process_status(
                 status_value = "completed"
             elif task.status == TaskStatus.FAILED:
                 status_value = "failed"
+            elif task.status == TaskStatus.CANCELLED:
+                status_value = "cancelled"
                 
             message = task.error_message or f"当前步骤: {task.current_step}, 进度: {task.progress}%"
             
@@ -298,6 +287,150 @@ async def get_wmts_list(
             detail=f"获取WMTS列表失败: {str(e)}"
         )
 
+async def load_layer_tile(wmts_id: str, storage: Optional[str], z: int, x: int, y: int, accept_encoding: Optional[str] = None):
+    """按图层的瓦片存储方式读取 z/x/y 瓦片（经过瓦片缓存），REST和KVP方式的请求共用"""
+    if storage in ("bundle", "mbtiles"):
+        key, loader = get_layer_tile_loader(wmts_id, storage, z, x, y)
+        return await TileCacheService().get_tile(key, loader)
+    return await TileCacheService().get_object_tile(
+        WMTS_BUCKET_NAME,
+        f"{wmts_id}/{z}/{x}/{y}.png",
+        accept_encoding
+    )
+
+def parse_tile_row(y: str) -> int:
+    """解析 {y}.png 形式的瓦片行号，扩展名只用于兼容客户端"""
+    row = y.split(".", 1)[0]
+    if not row.isdigit():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="瓦片行列号无效")
+    return int(row)
+
+def capabilities_response(document: str) -> Response:
+    return Response(content=document, media_type="application/xml", headers={"Cache-Control": "public, no-cache"})
+
+def ows_exception_response(code: str, message: str, locator: Optional[str] = None, status_code: int = status.HTTP_400_BAD_REQUEST) -> Response:
+    return Response(
+        content=render_exception_report(code, message, locator),
+        status_code=status_code,
+        media_type="application/xml"
+    )
+
+@router.get("/WMTSCapabilities.xml")
+async def get_capabilities(
+    request: Request,
+    db = Depends(get_database)
+):
+    """
+    全部文件类型图层的WMTS GetCapabilities文档（RESTful方式）
+    
+    瓦片矩阵集按tpk/tpkx中的LOD分辨率、比例尺和瓦片原点生成，文档缓存在Redis中，图层变化时失效
+    """
+    document = await WMTSCapabilitiesService(db).get_capabilities(get_service_base_url(request))
+    return capabilities_response(document)
+
+@router.get("/service")
+async def wmts_kvp_service(
+    request: Request,
+    db = Depends(get_database)
+):
+    """
+    WMTS的KVP接口：/wmts/service?SERVICE=WMTS&REQUEST=GetCapabilities 或
+    REQUEST=GetTile&LAYER=..&TILEMATRIX=..&TILEROW=..&TILECOL=..（参数名不区分大小写）
+    
+    GetTile与RESTful瓦片地址读取相同的瓦片存储和缓存
+    """
+    params = {key.lower(): value for key, value in request.query_params.items()}
+    if params.get("service", "WMTS").upper() != "WMTS":
+        return ows_exception_response("InvalidParameterValue", "SERVICE必须为WMTS", "service")
+    operation = params.get("request")
+    if not operation:
+        return ows_exception_response("MissingParameterValue", "缺少REQUEST参数", "request")
+    capabilities_service = WMTSCapabilitiesService(db)
+    
+    if operation.lower() == "getcapabilities":
+        document = await capabilities_service.get_capabilities(get_service_base_url(request))
+        return capabilities_response(document)
+    if operation.lower() != "gettile":
+        return ows_exception_response("OperationNotSupported", f"不支持的操作: {operation}", "request")
+    
+    for name in ("layer", "tilematrix", "tilerow", "tilecol"):
+        if not params.get(name):
+            return ows_exception_response("MissingParameterValue", f"缺少{name.upper()}参数", name)
+    try:
+        z, x, y = int(params["tilematrix"]), int(params["tilecol"]), int(params["tilerow"])
+    except ValueError:
+        return ows_exception_response("InvalidParameterValue", "TILEMATRIX、TILEROW和TILECOL必须为整数", "tilematrix")
+    try:
+        layer = await capabilities_service.get_tile_layer(params["layer"])
+    except HTTPException:
+        return ows_exception_response("InvalidParameterValue", f"图层不存在: {params['layer']}", "layer")
+    tile = await load_layer_tile(params["layer"], layer["storage"], z, x, y, request.headers.get("accept-encoding"))
+    return build_tile_response(request, tile, f"{z}/{x}/{y}")
+
+@router.get("/{wmts_id}/WMTSCapabilities.xml")
+async def get_layer_capabilities(
+    wmts_id: str,
+    request: Request,
+    db = Depends(get_database)
+):
+    """单个WMTS图层的GetCapabilities文档"""
+    document = await WMTSCapabilitiesService(db).get_capabilities(get_service_base_url(request), wmts_id)
+    return capabilities_response(document)
+
+@router.get("/{wmts_id}/tiles/{path:path}")
+async def get_tile(
+    wmts_id: str,
+    path: str,
+    request: Request
+):
+    """
+    读取文件类型WMTS图层的瓦片，如 /wmts/{wmts_id}/tiles/{z}/{x}/{y}.png
+    
+    经过进程内LRU和磁盘两级缓存，支持ETag/If-None-Match(304)和Range请求
+    """
+    path = normalize_tile_path(path)
+    tile = await TileCacheService().get_object_tile(
+        WMTS_BUCKET_NAME,
+        f"{wmts_id}/{path}",
+        request.headers.get("accept-encoding"),
+        "range" in request.headers
+    )
+    return build_tile_response(request, tile, path)
+
+@router.get("/{wmts_id}/bundles/{z}/{x}/{y}")
+async def get_bundle_tile(
+    wmts_id: str,
+    z: int,
+    x: int,
+    y: str,
+    request: Request
+):
+    """
+    读取以紧凑型缓存bundle保存的WMTS图层的瓦片，如 /wmts/{wmts_id}/bundles/{z}/{x}/{y}.png
+    
+    每个bundle的偏移表只读取一次并缓存，每个瓦片只读取bundle中对应的字节范围，
+    读取的瓦片同样经过瓦片缓存。y后的扩展名只用于兼容客户端，实际格式按瓦片内容确定
+    """
+    tile = await load_layer_tile(wmts_id, "bundle", z, x, parse_tile_row(y))
+    return build_tile_response(request, tile, f"{z}/{x}/{y}")
+
+@router.get("/{wmts_id}/mbtiles/{z}/{x}/{y}")
+async def get_mbtiles_tile(
+    wmts_id: str,
+    z: int,
+    x: int,
+    y: str,
+    request: Request
+):
+    """
+    读取以MBTiles文件保存的WMTS图层的瓦片，如 /wmts/{wmts_id}/mbtiles/{z}/{x}/{y}.png
+    
+    MBTiles文件第一次访问时下载到本地，之后每个瓦片通过只读连接池执行一次索引查询，
+    读取的瓦片同样经过瓦片缓存。y后的扩展名只用于兼容客户端，实际格式按瓦片内容确定
+    """
+    tile = await load_layer_tile(wmts_id, "mbtiles", z, x, parse_tile_row(y))
+    return build_tile_response(request, tile, f"{z}/{x}/{y}")
+
 @router.get("/{wmts_id}", response_model=WMTSInDB)
 async def get_wmts_by_id(
     wmts_id: str,
@@ -364,16 +497,15 @@ async def delete_wmts(
 ):
     """
     删除WMTS图层
+    
+    文件类型的图层返回后台删除任务的task_id，瓦片在后台批量删除，可在任务列表中查看删除进度
     """
     try:
         wmts_service = WMTSService(db)
-        success = await wmts_service.delete_wmts(wmts_id)
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="未找到指定的WMTS图层"
-            )
-        return {"status": "success", "message": "WMTS图层已删除"}
+        task_id = await wmts_service.delete_wmts(wmts_id, str(current_user.id))
+        return {"status": "success", "message": "WMTS图层已删除", "task_id": task_id}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from minio.error import S3Error
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.core.minio_client import minio_client, SOURCE_BUCKET_NAME, CONVERTED_BUCKET_NAME
+from app.tasks.file_converter import FileConverter
+
+# 计算源文件哈希时每次从MinIO读取的字节数
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+def compute_content_hash(data: bytes) -> str:
+    """计算文件内容的SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+class ConversionCacheService:
+    """
+    按内容寻址的转换结果缓存
+
+    缓存键由源文件内容的SHA-256、输入/输出格式和转换程序版本计算得到。
+    内容相同的文件再次转换时直接关联已有的转换结果和元数据记录，不再重新转换。
+    每条缓存记录保存引用它的文件ID列表，最后一个引用释放时才删除转换结果
+    """
+
+    def __init__(self, db: Any):
+        self.db = db
+        self.collection = db.conversion_cache
+
+    @staticmethod
+    def build_cache_key(content_hash: str, input_format: str, output_format: str) -> str:
+        """根据内容哈希、转换参数和转换程序版本生成缓存键"""
+        parts = [
+            content_hash,
+            (input_format or "").upper(),
+            (output_format or "").upper(),
+            FileConverter.get_converter_version(),
+        ]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _hash_source_object(object_name: str) -> str:
+        """分块读取MinIO中的源文件并计算SHA-256"""
+        digest = hashlib.sha256()
+        response = minio_client.get_object(SOURCE_BUCKET_NAME, object_name)
+        try:
+            for chunk in response.stream(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        finally:
+            response.close()
+            response.release_conn()
+        return digest.hexdigest()
+
+    async def get_content_hash(self, file_metadata: Dict) -> str:
+        """获取文件的内容哈希，上传时未记录哈希的旧文件从MinIO读取计算后保存"""
+        content_hash = file_metadata.get("content_hash")
+        if content_hash:
+            return content_hash
+        content_hash = await asyncio.to_thread(self._hash_source_object, file_metadata["file_path"])
+        await self.db.files.update_one(
+            {"_id": file_metadata["_id"]},
+            {"$set": {"content_hash": content_hash}}
+        )
+        return content_hash
+
+    async def link(self, cache_key: str, file_id: str) -> Optional[Dict]:
+        """
+        缓存命中时将文件关联到已有的转换结果并返回缓存记录，未命中时返回None
+
+        转换结果对象已不存在（例如被手动删除）的记录会被丢弃并视为未命中
+        """
+        entry = await self.collection.find_one({"_id": cache_key})
+        if not entry:
+            return None
+        try:
+            await asyncio.to_thread(minio_client.stat_object, CONVERTED_BUCKET_NAME, entry["output_file_path"])
+        except S3Error as e:
+            if e.code not in ("NoSuchKey", "NoSuchObject"):
+                raise
+            print(f"转换缓存 {cache_key} 的结果已不存在，丢弃缓存记录")
+            await self.collection.delete_one({"_id": cache_key})
+            return None
+
+        entry = await self.collection.find_one_and_update(
+            {"_id": cache_key},
+            {"$addToSet": {"file_ids": file_id}, "$set": {"updated_at": datetime.now()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if entry:
+            await self._copy_metadata(entry.get("metadata_file_id"), file_id)
+        return entry
+
+    async def register(self, cache_key: str, file_id: str, output_file_path: str) -> str:
+        """
+        转换完成后登记转换结果，返回文件应使用的转换结果路径
+
+        相同内容的文件同时转换时先完成的结果会被保留，后完成的任务删除自己上传的重复对象
+        并改用已登记的结果
+        """
+        now = datetime.now()
+        update = {
+            "$setOnInsert": {
+                "output_file_path": output_file_path,
+                "metadata_file_id": file_id,
+                "created_at": now,
+            },
+            "$addToSet": {"file_ids": file_id},
+            "$set": {"updated_at": now},
+        }
+        try:
+            entry = await self.collection.find_one_and_update(
+                {"_id": cache_key}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # 并发插入同一缓存键时重试一次，此时记录已存在
+            entry = await self.collection.find_one_and_update(
+                {"_id": cache_key}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+
+        if entry["output_file_path"] != output_file_path:
+            print(f"转换缓存 {cache_key} 已有结果，删除重复的转换结果: {output_file_path}")
+            await self._remove_output(output_file_path)
+        return entry["output_file_path"]
+
+    async def release(self, file_id: str, keep_key: Optional[str] = None):
+        """
+        释放文件对转换结果的引用，引用全部释放后删除缓存记录和转换结果对象
+
+        keep_key 指定的缓存记录保留引用（重新转换时只释放旧的转换结果）
+        """
+        entries = await self.collection.find({"file_ids": file_id}, {"_id": 1}).to_list(length=None)
+        for entry in entries:
+            if entry["_id"] == keep_key:
+                continue
+            updated = await self.collection.find_one_and_update(
+                {"_id": entry["_id"]},
+                {"$pull": {"file_ids": file_id}, "$set": {"updated_at": datetime.now()}},
+                return_document=ReturnDocument.AFTER
+            )
+            if not updated:
+                continue
+            if updated["file_ids"]:
+                # 元数据来源文件被删除后改用仍在引用的文件作为来源
+                if updated.get("metadata_file_id") == file_id:
+                    await self.collection.update_one(
+                        {"_id": entry["_id"], "metadata_file_id": file_id},
+                        {"$set": {"metadata_file_id": updated["file_ids"][0]}}
+                    )
+                continue
+            # 只删除仍然没有引用的记录，避免与同时发生的关联操作冲突
+            deleted = await self.collection.delete_one({"_id": entry["_id"], "file_ids": {"$size": 0}})
+            if deleted.deleted_count:
+                await self._remove_output(updated["output_file_path"])
+
+    async def _copy_metadata(self, source_file_id: Optional[str], file_id: str):
+        """将转换时解析出的元数据记录复制给新关联的文件"""
+        if not source_file_id or source_file_id == file_id:
+            return
+        records = await self.db.metadata.find({"file_id": source_file_id}, {"_id": 0}).to_list(length=None)
+        await self.db.metadata.delete_many({"file_id": file_id})
+        if records:
+            for record in records:
+                record["file_id"] = file_id
+            await self.db.metadata.insert_many(records)
+
+    async def _remove_output(self, output_file_path: str):
+        """删除转换结果对象"""
+        try:
+            await asyncio.to_thread(minio_client.remove_object, CONVERTED_BUCKET_NAME, output_file_path)
+        except S3Error as e:
+            print(f"删除转换结果失败: {output_file_path}, 错误: {str(e)}")
@@ -0,0 +1,306 @@
+import asyncio
+import hashlib
+import os
+import queue
+import re
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from minio.error import S3Error
+
+from app.core.minio_client import minio_client
+from app.services.tile_bundle import detect_tile_content_type
+from app.services.tile_cache import CachedTile, make_strong_etag
+from app.tasks.task_manager import raise_if_cancelled
+
+# 本地保存从MinIO下载的MBTiles文件的目录（留空使用系统临时目录）
+WMTS_MBTILES_CACHE_DIR = os.getenv("WMTS_MBTILES_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "virtualsite-mbtiles")
+# 同时打开的MBTiles文件数，以及每个文件的最大连接数
+WMTS_MBTILES_OPEN_FILES = int(os.getenv("WMTS_MBTILES_OPEN_FILES", "32"))
+WMTS_MBTILES_POOL_SIZE = int(os.getenv("WMTS_MBTILES_POOL_SIZE", "8"))
+# 每个连接内存映射的最大字节数
+WMTS_MBTILES_MMAP_BYTES = int(os.getenv("WMTS_MBTILES_MMAP_BYTES", str(256 * 1024 * 1024)))
+
+# MBTiles文件在图层目录下的对象名
+MBTILES_OBJECT_NAME = "tiles.mbtiles"
+MBTILES_CONTENT_TYPE = "application/vnd.sqlite3"
+# 生成MBTiles时每个事务写入的瓦片数
+MBTILES_WRITE_BATCH_SIZE = 1000
+
+# 解压后目录中的单个瓦片文件：{z}/{x}/{y}.png，或Esri松散型缓存 L{z}/R{行号}/C{列号}.png（行列号为十六进制）
+XYZ_TILE_PATTERN = re.compile(r"^(?:.*/)?(\d+)/(\d+)/(\d+)\.(?:png|jpe?g|webp)$", re.IGNORECASE)
+EXPLODED_TILE_PATTERN = re.compile(r"^(?:.*/)?L(\d+)/R([0-9a-fA-F]+)/C([0-9a-fA-F]+)\.(?:png|jpe?g|webp)$")
+
+# 按瓦片内容去重的存储结构（与mbutil等工具生成的结构相同），tiles视图供其他MBTiles工具读取
+MBTILES_SCHEMA = """
+CREATE TABLE metadata (name TEXT, value TEXT);
+CREATE UNIQUE INDEX metadata_index ON metadata (name);
+CREATE TABLE map (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_id TEXT);
+CREATE UNIQUE INDEX map_index ON map (zoom_level, tile_column, tile_row);
+CREATE TABLE images (tile_data BLOB, tile_id TEXT);
+CREATE UNIQUE INDEX images_id ON images (tile_id);
+CREATE VIEW tiles AS
+    SELECT map.zoom_level AS zoom_level, map.tile_column AS tile_column, map.tile_row AS tile_row,
+           images.tile_data AS tile_data
+    FROM map JOIN images ON images.tile_id = map.tile_id;
+"""
+
+# 按 z/x/y 读取一个瓦片：map的唯一索引定位瓦片，images的唯一索引定位内容
+MBTILES_TILE_QUERY = (
+    "SELECT images.tile_id, images.tile_data FROM map JOIN images ON images.tile_id = map.tile_id "
+    "WHERE map.zoom_level = ? AND map.tile_column = ? AND map.tile_row = ?"
+)
+
+def get_mbtiles_object_name(layer_id: str) -> str:
+    """图层的MBTiles文件在WMTS存储桶中的对象名"""
+    return f"{layer_id}/{MBTILES_OBJECT_NAME}"
+
+def to_tms_row(z: int, y: int) -> int:
+    """XYZ的行号（原点在左上角）转换为MBTiles使用的TMS行号（原点在左下角），两者互为逆运算"""
+    return (1 << z) - 1 - y
+
+def find_directory_tiles(local_dir: str) -> Iterator[Tuple[int, int, int, str]]:
+    """遍历解压后目录中的单个瓦片文件，返回(z, x, y, 文件路径)，y为XYZ行号"""
+    for root, dirs, files in os.walk(local_dir):
+        for file in files:
+            file_path = os.path.join(root, file)
+            relative_path = os.path.relpath(file_path, local_dir).replace(os.sep, "/")
+            match = XYZ_TILE_PATTERN.match(relative_path)
+            if match:
+                z, x, y = (int(value) for value in match.groups())
+                yield z, x, y, file_path
+                continue
+            match = EXPLODED_TILE_PATTERN.match(relative_path)
+            if match:
+                yield int(match.group(1)), int(match.group(3), 16), int(match.group(2), 16), file_path
+
+def build_mbtiles(
+    local_dirs: List[str],
+    output_path: str,
+    metadata: dict,
+    cancel_event: Optional[threading.Event] = None
+) -> int:
+    """
+    将解压后目录（及生成的概览瓦片目录）中的单个瓦片文件写入MBTiles文件，内容相同的瓦片（如空白海域）只保存一份，
+    返回写入的瓦片数，目录中没有可识别的瓦片时返回0（不生成文件）
+    """
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    connection = sqlite3.connect(output_path)
+    tile_count = 0
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(MBTILES_SCHEMA)
+        tiles = (tile for local_dir in local_dirs for tile in find_directory_tiles(local_dir))
+        for z, x, y, file_path in tiles:
+            if tile_count % MBTILES_WRITE_BATCH_SIZE == 0:
+                raise_if_cancelled(cancel_event)
+                connection.commit()
+            with open(file_path, "rb") as f:
+                data = f.read()
+            tile_id = hashlib.sha1(data).hexdigest()
+            connection.execute("INSERT OR IGNORE INTO images (tile_data, tile_id) VALUES (?, ?)", (sqlite3.Binary(data), tile_id))
+            connection.execute(
+                "INSERT OR REPLACE INTO map (zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)",
+                (z, x, to_tms_row(z, y), tile_id)
+            )
+            tile_count += 1
+        connection.executemany(
+            "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+            _get_mbtiles_metadata(metadata)
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    if tile_count == 0:
+        os.remove(output_path)
+        return 0
+    # 压缩删除和替换留下的空闲页，MBTiles上传后只读
+    connection = sqlite3.connect(output_path)
+    try:
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+    return tile_count
+
+def _get_mbtiles_metadata(metadata: dict) -> list:
+    """MBTiles规范中的metadata表内容"""
+    items = [
+        ("name", str(metadata.get("layer_name") or "WMTS Layer")),
+        ("format", "jpg" if metadata.get("format") == "image/jpeg" else "png"),
+        ("minzoom", str(metadata.get("min_zoom", 0))),
+        ("maxzoom", str(metadata.get("max_zoom", 18))),
+        ("type", "baselayer"),
+    ]
+    bounds = metadata.get("bounds")
+    if bounds:
+        items.append(("bounds", f"{bounds['west']},{bounds['south']},{bounds['east']},{bounds['north']}"))
+    return items
+
+class MBTilesConnectionPool:
+    """
+    一个本地MBTiles文件的只读连接池
+
+    连接以immutable只读方式打开并启用内存映射，读取时不加锁、不检查文件变化；
+    每个连接同一时间只由一个线程使用，空闲连接最多保留WMTS_MBTILES_POOL_SIZE个
+    """
+
+    def __init__(self, path: str, etag: str, size: int = WMTS_MBTILES_POOL_SIZE):
+        self.path = path
+        self.etag = etag
+        self.closed = False
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=size)
+
+    def read_tile(self, z: int, x: int, y: int) -> Optional[CachedTile]:
+        """读取一个瓦片（y为XYZ行号），瓦片不存在时返回None"""
+        connection = self._acquire()
+        try:
+            row = connection.execute(MBTILES_TILE_QUERY, (z, x, to_tms_row(z, y))).fetchone()
+        finally:
+            self._release(connection)
+        if row is None:
+            return None
+        tile_id, content = row[0], bytes(row[1])
+        return CachedTile(content, make_strong_etag(f"{self.etag.strip(chr(34))}-{tile_id}"), detect_tile_content_type(content))
+
+    def close(self):
+        """关闭空闲连接，正在使用的连接在归还时关闭"""
+        self.closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        connection.execute(f"PRAGMA mmap_size = {WMTS_MBTILES_MMAP_BYTES}")
+        return connection
+
+    def _release(self, connection: sqlite3.Connection):
+        if self.closed:
+            connection.close()
+            return
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+class MBTilesService:
+    """
+    从MBTiles文件提供WMTS图层的 z/x/y 瓦片
+
+    图层的所有瓦片保存为MinIO中的一个MBTiles对象，移动或删除图层只需要操作一个对象。
+    第一次访问时下载到本地目录，之后每个瓦片通过连接池执行一次索引查询读取；
+    打开的文件按LRU最多保留WMTS_MBTILES_OPEN_FILES个，淘汰时关闭连接但保留本地文件
+    """
+
+    # 进程内的连接池（LRU）和按对象名的下载锁，避免同一文件被并发下载多次
+    _pools: "OrderedDict[str, MBTilesConnectionPool]" = OrderedDict()
+    _locks: Dict[str, asyncio.Lock] = {}
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+
+    @staticmethod
+    def get_tile_cache_key(bucket_name: str, layer_id: str, z: int, x: int, y: int) -> str:
+        """MBTiles中瓦片在瓦片缓存中的键，以图层目录开头，删除图层时随图层目录一起失效"""
+        return f"{bucket_name}/{layer_id}/{MBTILES_OBJECT_NAME}/{z}/{x}/{y}"
+
+    def upload(self, layer_id: str, local_path: str) -> None:
+        """上传生成的MBTiles文件（在线程池中调用）"""
+        minio_client.fput_object(
+            self.bucket_name,
+            get_mbtiles_object_name(layer_id),
+            local_path,
+            content_type=MBTILES_CONTENT_TYPE
+        )
+
+    async def get_pool(self, object_name: str) -> MBTilesConnectionPool:
+        """获取MBTiles文件的连接池，本地没有文件时从MinIO下载，对象不存在时返回404"""
+        pool = self._get_cached_pool(object_name)
+        if pool:
+            return pool
+
+        lock = self._locks.setdefault(object_name, asyncio.Lock())
+        async with lock:
+            pool = self._get_cached_pool(object_name)
+            if pool:
+                return pool
+            try:
+                pool = await asyncio.to_thread(self._open_pool, object_name)
+            except S3Error as e:
+                if e.code in ("NoSuchKey", "NoSuchBucket"):
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="图层的MBTiles文件不存在")
+                raise
+            self._pools[object_name] = pool
+            while len(self._pools) > WMTS_MBTILES_OPEN_FILES:
+                self._pools.popitem(last=False)[1].close()
+        self._locks.pop(object_name, None)
+        return pool
+
+    async def load_tile(self, layer_id: str, z: int, x: int, y: int) -> CachedTile:
+        """读取图层中的一个瓦片，瓦片不存在时返回404"""
+        if z < 0 or x < 0 or y < 0 or z > 30 or x >= (1 << z) or y >= (1 << z):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="瓦片行列号无效")
+        pool = await self.get_pool(get_mbtiles_object_name(layer_id))
+        tile = await asyncio.to_thread(pool.read_tile, z, x, y)
+        if tile is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"瓦片不存在: {z}/{x}/{y}")
+        return tile
+
+    def invalidate(self, layer_id: str):
+        """关闭图层的连接池并删除本地文件（图层被删除时调用）"""
+        object_name = get_mbtiles_object_name(layer_id)
+        pool = self._pools.pop(object_name, None)
+        if pool:
+            pool.close()
+        for path in (self._local_path(object_name), f"{self._local_path(object_name)}.etag"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _open_pool(self, object_name: str) -> MBTilesConnectionPool:
+        """下载MBTiles文件（本地已有相同etag的文件时直接使用）并创建连接池"""
+        local_path = self._local_path(object_name)
+        etag_path = f"{local_path}.etag"
+        etag = minio_client.stat_object(self.bucket_name, object_name).etag or ""
+        try:
+            with open(etag_path, "r") as f:
+                downloaded = os.path.exists(local_path) and f.read() == etag
+        except OSError:
+            downloaded = False
+        if not downloaded:
+            os.makedirs(WMTS_MBTILES_CACHE_DIR, exist_ok=True)
+            # 先下载到临时文件再原子替换，其他进程不会读到不完整的文件
+            fd, temp_path = tempfile.mkstemp(dir=WMTS_MBTILES_CACHE_DIR, suffix=".tmp")
+            os.close(fd)
+            try:
+                minio_client.fget_object(self.bucket_name, object_name, temp_path)
+                os.replace(temp_path, local_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            with open(etag_path, "w") as f:
+                f.write(etag)
+        return MBTilesConnectionPool(local_path, etag)
+
+    def _get_cached_pool(self, object_name: str) -> Optional[MBTilesConnectionPool]:
+        pool = self._pools.get(object_name)
+        if pool:
+            self._pools.move_to_end(object_name)
+        return pool
+
+    @staticmethod
+    def _local_path(object_name: str) -> str:
+        return os.path.join(WMTS_MBTILES_CACHE_DIR, f"{hashlib.sha256(object_name.encode('utf-8')).hexdigest()}.mbtiles")
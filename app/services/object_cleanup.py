@@ -0,0 +1,211 @@
+import asyncio
+import os
+import threading
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from minio.deleteobjects import DeleteObject
+
+from app.core.minio_client import minio_client, THREEDTILES_BUCKET_NAME
+from app.tasks import task_manager
+from app.tasks.task_manager import Task, TaskType, TaskStatus, raise_if_cancelled
+
+# 每次批量删除请求最多包含的对象数（S3 DeleteObjects接口的上限）
+OBJECT_DELETE_BATCH_SIZE = min(1000, int(os.getenv("OBJECT_DELETE_BATCH_SIZE", "1000")))
+# 删除过程中写入任务进度的间隔（秒）
+OBJECT_DELETE_PROGRESS_INTERVAL = float(os.getenv("OBJECT_DELETE_PROGRESS_INTERVAL", "2"))
+
+# 查询未被标记删除的记录（已标记删除的记录等待后台任务删除对象后再物理删除）
+LIVE_RECORD_FILTER = {"deleted_at": None}
+
+class ObjectDeletionError(Exception):
+    """批量删除对象时部分对象删除失败"""
+    pass
+
+def get_prefix_stores() -> List[Dict[str, str]]:
+    """需要对账的资源集合及其存储桶，资源ID即存储桶中的顶层目录名"""
+    from app.services.wmts_service import WMTS_BUCKET_NAME
+    return [
+        {"collection": "threedtiles", "bucket": THREEDTILES_BUCKET_NAME},
+        {"collection": "wmts_layers", "bucket": WMTS_BUCKET_NAME},
+    ]
+
+class PrefixDeleter:
+    """
+    按前缀批量删除MinIO对象
+
+    先统计前缀下的对象数，再按OBJECT_DELETE_BATCH_SIZE个对象一批调用批量删除接口，
+    删除进度记录在deleted_objects/total_objects中。cancel_event被设置后在下一批之前停止
+    """
+
+    def __init__(self, bucket_name: str, prefix: str, cancel_event: Optional[threading.Event] = None):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.cancel_event = cancel_event
+        self.total_objects = 0
+        self.deleted_objects = 0
+
+    @property
+    def progress(self) -> int:
+        """删除进度百分比"""
+        if not self.total_objects:
+            return 0
+        return min(100, int(self.deleted_objects * 100 / self.total_objects))
+
+    def delete(self) -> int:
+        """删除前缀下的所有对象，返回删除的对象数"""
+        self.total_objects = sum(
+            1 for _ in minio_client.list_objects(self.bucket_name, prefix=self.prefix, recursive=True)
+        )
+        batch = []
+        for obj in minio_client.list_objects(self.bucket_name, prefix=self.prefix, recursive=True):
+            batch.append(DeleteObject(obj.object_name))
+            if len(batch) >= OBJECT_DELETE_BATCH_SIZE:
+                self._delete_batch(batch)
+                batch = []
+        if batch:
+            self._delete_batch(batch)
+        return self.deleted_objects
+
+    async def run(self, on_progress: Optional[Callable[["PrefixDeleter"], Awaitable[Any]]] = None) -> int:
+        """在线程中执行删除，执行期间每隔OBJECT_DELETE_PROGRESS_INTERVAL秒调用一次on_progress"""
+        future = asyncio.ensure_future(asyncio.to_thread(self.delete))
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=OBJECT_DELETE_PROGRESS_INTERVAL)
+            if on_progress:
+                try:
+                    await on_progress(self)
+                except Exception as e:
+                    print(f"[WARN] 写入删除进度失败: {str(e)}")
+            if done:
+                return future.result()
+
+    def _delete_batch(self, batch: List[DeleteObject]):
+        """批量删除一批对象，任一对象删除失败时抛出ObjectDeletionError"""
+        raise_if_cancelled(self.cancel_event)
+        errors = list(minio_client.remove_objects(self.bucket_name, batch))
+        if errors:
+            raise ObjectDeletionError(
+                f"{len(errors)}个对象删除失败，例如 {errors[0].name}: {errors[0].message}"
+            )
+        self.deleted_objects += len(batch)
+
+def remove_prefix(bucket_name: str, prefix: str) -> int:
+    """同步批量删除前缀下的所有对象（用于处理失败后清理已上传的部分文件），返回删除的对象数"""
+    return PrefixDeleter(bucket_name, prefix).delete()
+
+class ObjectCleanupService:
+    """
+    资源删除与对账
+
+    删除资源时先给数据库记录打上删除标记（deleted_at），API立即返回，
+    再由后台的前缀删除任务批量删除存储桶中的对象，完成后物理删除记录。
+    对账时查找删除任务丢失或失败的标记记录，以及没有对应记录的遗留目录，重新创建删除任务
+    """
+
+    def __init__(self, db: Any):
+        self.db = db
+
+    async def schedule_deletion(
+        self,
+        collection_name: str,
+        record_id: str,
+        bucket_name: str,
+        user_id: str,
+        resource_name: Optional[str] = None
+    ) -> Optional[Task]:
+        """
+        标记记录为已删除并创建删除其对象的后台任务，返回任务；记录不存在或已在删除中时返回None
+        """
+        record = await self.db[collection_name].find_one_and_update(
+            {"_id": ObjectId(record_id), **LIVE_RECORD_FILTER},
+            {"$set": {"deleted_at": datetime.utcnow()}}
+        )
+        if not record:
+            return None
+        return await self._create_deletion_task(
+            bucket_name, record_id, user_id, collection_name, resource_name or record.get("name")
+        )
+
+    async def _create_deletion_task(
+        self,
+        bucket_name: str,
+        record_id: str,
+        user_id: str,
+        collection_name: Optional[str] = None,
+        resource_name: Optional[str] = None
+    ) -> Task:
+        """创建删除资源目录的后台任务，提供collection_name时任务完成后物理删除对应的标记记录"""
+        result = {"bucket": bucket_name, "prefix": f"{record_id}/", "record_id": record_id}
+        if collection_name:
+            result["collection"] = collection_name
+        if resource_name:
+            result["resource_name"] = resource_name
+        task = await task_manager.create_task(
+            task_type=TaskType.PREFIX_DELETION,
+            user_id=user_id,
+            file_id=record_id,
+            input_file_path=f"{bucket_name}/{record_id}/",
+            output_format="",
+            result=result
+        )
+        if collection_name:
+            await self.db[collection_name].update_one(
+                {"_id": ObjectId(record_id)},
+                {"$set": {"deletion_task_id": task.task_id}}
+            )
+        return task
+
+    async def reconcile(self, user_id: str, dry_run: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        对账：查找删除中断的标记记录和没有对应记录的遗留目录，dry_run为False时为它们创建删除任务
+
+        遗留目录只考虑以ObjectId命名的顶层目录（资源ID），上传暂存目录使用UUID命名，不会被误删
+        """
+        report = {"tombstoned": [], "orphaned_prefixes": []}
+        for store in get_prefix_stores():
+            collection = self.db[store["collection"]]
+
+            # 删除任务丢失、失败或被取消的标记记录
+            async for record in collection.find({"deleted_at": {"$ne": None}}):
+                task_id = record.get("deletion_task_id")
+                task = await task_manager.get_task(task_id) if task_id else None
+                if task and task.status in (TaskStatus.PENDING, TaskStatus.PROCESSING):
+                    continue
+                record_id = str(record["_id"])
+                item = {"collection": store["collection"], "bucket": store["bucket"], "record_id": record_id}
+                if not dry_run:
+                    task = await self._create_deletion_task(
+                        store["bucket"], record_id, user_id, store["collection"], record.get("name")
+                    )
+                    item["task_id"] = task.task_id
+                report["tombstoned"].append(item)
+
+            # 没有对应记录的遗留目录
+            prefixes = await asyncio.to_thread(self._list_resource_prefixes, store["bucket"])
+            for record_id in prefixes:
+                if await collection.find_one({"_id": ObjectId(record_id)}, {"_id": 1}):
+                    continue
+                item = {"collection": store["collection"], "bucket": store["bucket"], "record_id": record_id}
+                if not dry_run:
+                    task = await self._create_deletion_task(store["bucket"], record_id, user_id)
+                    item["task_id"] = task.task_id
+                report["orphaned_prefixes"].append(item)
+        return report
+
+    @staticmethod
+    def _list_resource_prefixes(bucket_name: str) -> List[str]:
+        """列出存储桶中以ObjectId命名的顶层目录"""
+        prefixes = []
+        for obj in minio_client.list_objects(bucket_name, recursive=False):
+            if not obj.is_dir:
+                continue
+            name = obj.object_name.rstrip("/")
+            try:
+                ObjectId(name)
+            except (InvalidId, TypeError):
+                continue
+            prefixes.append(name)
+        return prefixes
@@ -3,17 +3,46 @@ import uuid
 import zipfile
 import shutil
 import tempfile
-import json
+import io
 import asyncio
+import threading
 import concurrent.futures
-from typing import List, Optional, Any, Tuple
+from typing import List, Optional, Any, Tuple, Callable, BinaryIO, Dict
 from datetime import datetime
 from fastapi import UploadFile, HTTPException, status
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
+from minio.commonconfig import ComposeSource
+from minio import Minio
 
 from app.core.minio_client import minio_client, THREEDTILES_BUCKET_NAME
 from app.models.threedtiles import ThreeDTilesCreate, ThreeDTilesInDB, ThreeDTilesUpdate, ProcessStatus
+from app.tasks.task_manager import TaskCancelledError, raise_if_cancelled, is_retryable_error
+from app.utils.minio_reader import MinioRangeReader
+from app.services.tile_uploader import TileUploader, tile_upload_client
+from app.services.object_cleanup import ObjectCleanupService, LIVE_RECORD_FILTER, remove_prefix
+from app.utils.geodesy import bbox_to_polygon
+from app.services.tile_archive import (
+    TileArchiveService,
+    find_tileset_prefix,
+    get_tile_relative_path,
+    get_archive_object_name,
+    get_archive_tileset_url,
+    get_tileset_url,
+    is_servable_archive,
+    get_archive_tile_cache_key
+)
+from app.services.tile_cache import TileCacheService
+from app.services.tileset_index import TilesetIndex, TilesetIndexService, TilesetIndexWriter, TILESET_QUERY_MAX_RESULTS
+from app.services.tileset_analyzer import TilesetAnalysis, TilesetTooComplexError, analyze_tileset
+from app.services.tileset_revision import (
+    TilesetManifestService,
+    get_directory_fingerprints,
+    get_manifest_object_name,
+    get_revision_prefix,
+    get_revision_tileset_url,
+    get_zip_entry_fingerprint,
+)
 
 # 创建线程池执行器
 thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=10)
@@ -32,9 +61,17 @@ class ThreeDTilesService:
             lambda: func(*args, **kwargs)
         )
         
-    async def create_process_status(self, process_id: str, status: str, message: str, tile_id: str = None) -> ProcessStatus:
+    async def create_process_status(
+        self,
+        process_id: str,
+        status: str,
+        message: str,
+        tile_id: str = None,
+        uploaded_files: Optional[int] = None,
+        total_files: Optional[int] = None
+    ) -> ProcessStatus:
         """
-        创建或更新处理状态记录
+        创建或更新处理状态记录，上传阶段同时记录已上传文件数和文件总数
         """
         now = datetime.utcnow()
         status_data = {
@@ -46,6 +83,10 @@ class ThreeDTilesService:
         
         if tile_id:
             status_data["tile_id"] = tile_id
+        if uploaded_files is not None:
+            status_data["uploaded_files"] = uploaded_files
+        if total_files is not None:
+            status_data["total_files"] = total_files
             
         # 检查是否已存在
         existing = await self.process_status_collection.find_one({"process_id": process_id})
@@ -71,11 +112,28 @@ class ThreeDTilesService:
             return None
         return ProcessStatus(**status_data)
     
-    async def process_minio_file_async(self, object_id: str, filename: str, threedtiles_data: ThreeDTilesCreate, process_id: str) -> dict:
+    async def process_minio_file_async(
+        self,
+        object_id: str,
+        filename: str,
+        threedtiles_data: ThreeDTilesCreate,
+        process_id: str,
+        cancel_event: Optional[threading.Event] = None,
+        work_dir: Optional[str] = None
+    ) -> dict:
         """
         异步处理已上传到MinIO的文件
         此方法会在后台执行，不会阻塞API响应
         
+        压缩包不下载到本地：通过范围读取解析中央目录，再将每个条目解压后直接流式写入
+        THREEDTILES_BUCKET_NAME下的tile_id目录，本地磁盘占用与压缩包大小无关，
+        内存占用也只与读取块和上传分片大小有关。
+        
+        cancel_event被设置后，上传会在下一个文件边界停止，
+        已上传到MinIO的文件和已创建的记录会被清理。
+        流式处理没有本地中间产物，work_dir仅为与其他处理器保持一致的接口而保留；
+        失败结果中的retryable表示错误是否为可重试的瞬时错误
+        
         Returns:
             dict: 包含处理结果的字典，包含tile_id和其他相关信息
         """
@@ -84,23 +142,31 @@ class ThreeDTilesService:
             await self.create_process_status(
                 process_id=process_id,
                 status="processing",
-                message="正在从MinIO下载文件"
+                message="正在检查MinIO中的文件"
             )
             
             # 检查文件是否存在于MinIO
+            object_name = f"{object_id}/{filename}"
             try:
-                await self.run_in_threadpool(
+                source_stat = await self.run_in_threadpool(
                     minio_client.stat_object,
                     THREEDTILES_BUCKET_NAME, 
-                    f"{object_id}/{filename}"
+                    object_name
                 )
+                file_size = source_stat.size
             except Exception as e:
                 await self.create_process_status(
                     process_id=process_id,
                     status="failed",
                     message=f"MinIO中未找到文件: {str(e)}"
                 )
-                return {"status": "failed", "message": f"MinIO中未找到文件: {str(e)}"}
+                return {
+                    "status": "failed",
+                    "message": f"MinIO中未找到文件: {str(e)}",
+                    "retryable": is_retryable_error(e)
+                }
+            
+            raise_if_cancelled(cancel_event)
             
             # 创建数据库记录获取ID
             threedtiles_dict = threedtiles_data.model_dump()
@@ -116,104 +182,81 @@ class ThreeDTilesService:
             await self.create_process_status(
                 process_id=process_id,
                 status="processing",
-                message="正在解压文件",
+                message="正在读取压缩包目录",
                 tile_id=tile_id
             )
             
-            # 创建临时目录
-            temp_dir = tempfile.mkdtemp()
+            zip_file = None
             try:
-                # 从MinIO下载文件到临时目录
-                temp_file_path = os.path.join(temp_dir, filename)
-                object_name = f"{object_id}/{filename}"
-                
+                # 通过范围读取打开MinIO中的压缩包，只读取中央目录，不下载整个文件
                 try:
-                    # 在线程池中执行下载操作
-                    await self.run_in_threadpool(
-                        minio_client.fget_object,
-                        THREEDTILES_BUCKET_NAME, 
+                    zip_file = await self.run_in_threadpool(
+                        self._open_minio_zip,
                         object_name,
-                        temp_file_path
-                    )
-                    
-                    # 获取文件大小
-                    file_size = await self.run_in_threadpool(
-                        os.path.getsize,
-                        temp_file_path
+                        file_size
                     )
                 except Exception as e:
-                    # 如果下载失败，删除记录
+                    # 如果读取失败，删除记录
                     await self.collection.delete_one({"_id": ObjectId(tile_id)})
                     await self.create_process_status(
                         process_id=process_id,
                         status="failed",
-                        message=f"从MinIO下载文件失败: {str(e)}"
+                        message=f"读取压缩包失败: {str(e)}"
                     )
-                    return {"status": "failed", "message": f"从MinIO下载文件失败: {str(e)}"}
+                    return {
+                        "status": "failed",
+                        "message": f"读取压缩包失败: {str(e)}",
+                        "retryable": is_retryable_error(e)
+                    }
                 
-                # 解压文件到临时目录下的特定文件夹
-                extract_dir = os.path.join(temp_dir, tile_id)
-                await self.run_in_threadpool(
-                    os.makedirs,
-                    extract_dir, 
-                    exist_ok=True
+                # 在压缩包目录中查找tileset.json，所在目录作为瓦片集的根目录
+                root_prefix = await self.run_in_threadpool(
+                    self._find_tileset_prefix,
+                    zip_file.namelist()
                 )
+                if root_prefix is None:
+                    # 删除已创建的MongoDB记录
+                    await self.collection.delete_one({"_id": ObjectId(tile_id)})
+                    await self.create_process_status(
+                        process_id=process_id,
+                        status="failed",
+                        message="上传的文件中未找到tileset.json"
+                    )
+                    return {"status": "failed", "message": "上传的文件中未找到tileset.json"}
                 
+                raise_if_cancelled(cancel_event)
+                
+                # 流式分析压缩包中的tileset.json：提取原点坐标和地理范围、统计瓦片信息并生成空间索引，
+                # 瓦片数或层级深度超过上限时拒绝入库
+                upload_entries = self._get_zip_upload_entries(zip_file, root_prefix)
                 try:
-                    # 在线程池中执行解压操作
-                    await self.run_in_threadpool(
-                        self._extract_zip_file,
-                        temp_file_path, 
-                        extract_dir
+                    analysis = await self.run_in_threadpool(
+                        self._analyze_zip_tileset,
+                        zip_file,
+                        root_prefix,
+                        upload_entries
                     )
-                except Exception as e:
-                    # 如果解压失败，删除记录
+                except TilesetTooComplexError as e:
                     await self.collection.delete_one({"_id": ObjectId(tile_id)})
                     await self.create_process_status(
                         process_id=process_id,
                         status="failed",
-                        message=f"解压文件失败: {str(e)}"
+                        message=f"tileset.json过于复杂: {str(e)}"
                     )
-                    return {"status": "failed", "message": f"解压文件失败: {str(e)}"}
+                    return {"status": "failed", "message": f"tileset.json过于复杂: {str(e)}"}
+                location = self._get_tileset_fields(analysis)
                 
-                # 更新状态
-                await self.create_process_status(
-                    process_id=process_id,
-                    status="processing",
-                    message="正在验证文件结构",
-                    tile_id=tile_id
-                )
-                
-                # 验证解压后的文件中是否包含tileset.json
-                tileset_path = os.path.join(extract_dir, "tileset.json")
-                tileset_exists = await self.run_in_threadpool(
-                    os.path.exists,
-                    tileset_path
-                )
-                
-                if not tileset_exists:
-                    # 如果根目录没有，尝试查找子目录
-                    tileset_path, found = await self.run_in_threadpool(
-                        self._find_and_move_tileset,
-                        extract_dir
+                # .3tz压缩包不解压，整体保存到瓦片集目录中，由后端通过范围读取直接提供瓦片
+                if filename.lower().endswith(".3tz") and is_servable_archive(zip_file):
+                    return await self._store_tileset_archive(
+                        process_id,
+                        tile_id,
+                        object_name,
+                        file_size,
+                        location,
+                        analysis.index if analysis else None
                     )
                     
-                    if not found:
-                        # 删除已创建的MongoDB记录
-                        await self.collection.delete_one({"_id": ObjectId(tile_id)})
-                        await self.create_process_status(
-                            process_id=process_id,
-                            status="failed",
-                            message="上传的文件中未找到tileset.json"
-                        )
-                        return {"status": "failed", "message": "上传的文件中未找到tileset.json"}
-                
-                # 从tileset.json中提取原点经纬度坐标
-                longitude, latitude, height = await self.run_in_threadpool(
-                    self._extract_coordinates_from_tileset,
-                    tileset_path
-                )
-                    
                 # 更新状态
                 await self.create_process_status(
                     process_id=process_id,
@@ -222,15 +265,30 @@ class ThreeDTilesService:
                     tile_id=tile_id
                 )
                 
-                # 将解压后的文件上传到MinIO
-                uploaded_files = await self.run_in_threadpool(
-                    self._upload_files_to_minio,
-                    extract_dir,
-                    tile_id
-                )
+                # 将压缩包中的文件并发地流式写入MinIO，每个上传线程使用各自的范围读取器
+                async def report_upload_progress(uploader: TileUploader):
+                    await self.create_process_status(
+                        process_id=process_id,
+                        status="processing",
+                        message=f"正在上传处理后的文件到MinIO ({uploader.uploaded_files}/{uploader.total_files})",
+                        tile_id=tile_id,
+                        uploaded_files=uploader.uploaded_files,
+                        total_files=uploader.total_files
+                    )
                 
-                if not uploaded_files:
-                    # 如果上传失败
+                try:
+                    uploader = TileUploader(THREEDTILES_BUCKET_NAME, tile_id, cancel_event)
+                    await uploader.run(
+                        uploader.upload_zip_entries,
+                        lambda: self._open_minio_zip(object_name, file_size, tile_upload_client),
+                        upload_entries,
+                        on_progress=report_upload_progress
+                    )
+                except TaskCancelledError:
+                    raise
+                except Exception as e:
+                    # 如果上传失败，清理已上传的部分文件
+                    print(f"上传文件到MinIO失败: {str(e)}")
                     await self.run_in_threadpool(
                         self._clean_minio_files,
                         tile_id
@@ -239,9 +297,22 @@ class ThreeDTilesService:
                     await self.create_process_status(
                         process_id=process_id,
                         status="failed",
-                        message="上传文件到MinIO失败"
+                        message=f"上传文件到MinIO失败: {str(e)}"
                     )
-                    return {"status": "failed", "message": "上传文件到MinIO失败"}
+                    return {
+                        "status": "failed",
+                        "message": f"上传文件到MinIO失败: {str(e)}",
+                        "retryable": is_retryable_error(e)
+                    }
+                
+                raise_if_cancelled(cancel_event)
+                
+                # 生成并保存瓦片集的空间索引和文件清单（增量更新时与新版本比较）
+                await TilesetIndexService().try_save_index(tile_id, analysis.index if analysis else None)
+                await TilesetManifestService().try_save_initial_manifest(
+                    tile_id,
+                    {path: get_zip_entry_fingerprint(member) for member, path in upload_entries}
+                )
                 
                 # 删除原始上传的ZIP文件
                 try:
@@ -253,8 +324,8 @@ class ThreeDTilesService:
                 except Exception as e:
                     print(f"删除原始ZIP文件失败 (非致命错误): {str(e)}")
                 
-                # 构建tileset.json的URL - 使用相对路径而不是硬编码的域名
-                tileset_url = f"/{THREEDTILES_BUCKET_NAME}/{tile_id}/tileset.json"
+                # 构建tileset.json的URL - 使用相对路径，通过后端的瓦片缓存代理访问
+                tileset_url = get_tileset_url(tile_id)
                 minio_path = f"{THREEDTILES_BUCKET_NAME}/{tile_id}"
                 
                 # 更新数据库记录
@@ -262,9 +333,8 @@ class ThreeDTilesService:
                     "tileset_url": tileset_url,
                     "minio_path": minio_path,
                     "file_size": file_size,
-                    "longitude": longitude,
-                    "latitude": latitude,
-                    "height": height
+                    "revision": 0,
+                    **location
                 }
                 
                 await self.collection.update_one(
@@ -287,22 +357,30 @@ class ThreeDTilesService:
                     "tileset_url": tileset_url,
                     "minio_path": minio_path,
                     "file_size": file_size,
-                    "longitude": longitude,
-                    "latitude": latitude,
-                    "height": height
+                    "longitude": location["longitude"],
+                    "latitude": location["latitude"],
+                    "height": location["height"]
                 }
                 
             finally:
-                # 清理临时目录
-                try:
-                    await self.run_in_threadpool(
-                        shutil.rmtree,
-                        temp_dir,
-                        ignore_errors=True
-                    )
-                except:
-                    pass
+                if zip_file is not None:
+                    zip_file.close()
                 
+        except TaskCancelledError as e:
+            # 任务被取消，清理已上传的部分文件和已创建的记录，保留原始上传文件
+            print(f"[INFO] 3DTiles处理已取消: {process_id}")
+            if 'tile_id' in locals():
+                await self.run_in_threadpool(
+                    self._clean_minio_files,
+                    tile_id
+                )
+                await self.collection.delete_one({"_id": ObjectId(tile_id)})
+            await self.create_process_status(
+                process_id=process_id,
+                status="cancelled",
+                message=str(e)
+            )
+            return {"status": "cancelled", "message": str(e)}
         except Exception as e:
             # 处理过程中出现未知异常
             error_message = f"处理过程中出现错误: {str(e)}"
@@ -322,47 +400,132 @@ class ThreeDTilesService:
                     await self.collection.delete_one({"_id": ObjectId(tile_id)})
                 except:
                     pass
-            return {"status": "failed", "message": error_message}
+            return {"status": "failed", "message": error_message, "retryable": is_retryable_error(e)}
             
-    # 辅助方法，用于在线程池中执行的操作
-    def _extract_zip_file(self, zip_path, extract_dir):
-        """解压ZIP文件到指定目录"""
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
-            
-    def _find_and_move_tileset(self, extract_dir):
-        """查找tileset.json文件并移动内容到根目录"""
-        # 如果根目录没有，尝试查找子目录
-        for root, dirs, files in os.walk(extract_dir):
-            for file in files:
-                if file == "tileset.json":
-                    tileset_path = os.path.join(root, file)
-                    # 如果tileset.json在子目录中，将所有文件移动到父目录
-                    if root != extract_dir:
-                        for item in os.listdir(root):
-                            shutil.move(os.path.join(root, item), extract_dir)
-                    return os.path.join(extract_dir, "tileset.json"), True
-        return None, False
+    async def _store_tileset_archive(
+        self,
+        process_id: str,
+        tile_id: str,
+        object_name: str,
+        file_size: int,
+        location: dict,
+        index_writer: Optional[TilesetIndexWriter]
+    ) -> dict:
+        """
+        将上传的.3tz压缩包通过服务端复制移动到tile_id目录下，作为单个对象保存，
+        瓦片由TileArchiveService按需从压缩包中读取，不再逐个上传
+        """
+        await self.create_process_status(
+            process_id=process_id,
+            status="processing",
+            message="正在保存瓦片集压缩包",
+            tile_id=tile_id
+        )
+        archive_object = get_archive_object_name(tile_id)
+        try:
+            await self.run_in_threadpool(
+                minio_client.compose_object,
+                THREEDTILES_BUCKET_NAME,
+                archive_object,
+                [ComposeSource(THREEDTILES_BUCKET_NAME, object_name)]
+            )
+        except Exception as e:
+            print(f"保存瓦片集压缩包失败: {str(e)}")
+            await self.run_in_threadpool(
+                self._clean_minio_files,
+                tile_id
+            )
+            await self.collection.delete_one({"_id": ObjectId(tile_id)})
+            await self.create_process_status(
+                process_id=process_id,
+                status="failed",
+                message=f"保存瓦片集压缩包失败: {str(e)}"
+            )
+            return {
+                "status": "failed",
+                "message": f"保存瓦片集压缩包失败: {str(e)}",
+                "retryable": is_retryable_error(e)
+            }
         
-    def _upload_files_to_minio(self, extract_dir, tile_id):
-        """将文件上传到MinIO"""
+        # 保存瓦片集的空间索引
+        await TilesetIndexService().try_save_index(tile_id, index_writer)
+        
+        # 删除原始上传的文件
         try:
-            for root, dirs, files in os.walk(extract_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    # 确保使用tile_id作为目录前缀
-                    object_name = f"{tile_id}/{os.path.relpath(file_path, extract_dir)}"
-                    
-                    # 上传文件到MinIO
-                    minio_client.fput_object(
-                        THREEDTILES_BUCKET_NAME, 
-                        object_name, 
-                        file_path
-                    )
-            return True
+            await self.run_in_threadpool(
+                minio_client.remove_object,
+                THREEDTILES_BUCKET_NAME,
+                object_name
+            )
         except Exception as e:
-            print(f"上传文件到MinIO失败: {str(e)}")
-            return False
+            print(f"删除原始3TZ文件失败 (非致命错误): {str(e)}")
+        
+        tileset_url = get_archive_tileset_url(tile_id)
+        minio_path = f"{THREEDTILES_BUCKET_NAME}/{archive_object}"
+        await self.collection.update_one(
+            {"_id": ObjectId(tile_id)},
+            {"$set": {
+                "tileset_url": tileset_url,
+                "minio_path": minio_path,
+                "file_size": file_size,
+                "storage": "archive",
+                **location
+            }}
+        )
+        
+        await self.create_process_status(
+            process_id=process_id,
+            status="completed",
+            message="处理完成",
+            tile_id=tile_id
+        )
+        return {
+            "status": "completed",
+            "tile_id": tile_id,
+            "tileset_url": tileset_url,
+            "minio_path": minio_path,
+            "file_size": file_size,
+            "longitude": location["longitude"],
+            "latitude": location["latitude"],
+            "height": location["height"]
+        }
+    
+    # 辅助方法，用于在线程池中执行的操作
+    def _open_minio_zip(self, object_name: str, file_size: int, client: Minio = minio_client) -> zipfile.ZipFile:
+        """
+        通过范围读取打开MinIO中的ZIP文件，只读取文件末尾的中央目录
+
+        在上传线程中读取条目时传入上传客户端（tile_upload_client），范围读取与上传共用其连接池
+        """
+        reader = MinioRangeReader(client, THREEDTILES_BUCKET_NAME, object_name, size=file_size)
+        return zipfile.ZipFile(reader, 'r')
+    
+    def _find_tileset_prefix(self, names: List[str]) -> Optional[str]:
+        """
+        在压缩包条目中查找层级最浅的tileset.json，返回其所在目录（以/结尾，根目录为空字符串），
+        未找到时返回None
+        """
+        return find_tileset_prefix(names)
+    
+    def _get_tile_object_path(self, name: str, root_prefix: str) -> Optional[str]:
+        """
+        计算压缩包条目在瓦片集目录中的相对路径：tileset.json所在目录的内容放到根目录，
+        其他条目保持原有路径；绝对路径或包含..的条目返回None
+        """
+        return get_tile_relative_path(name, root_prefix)
+    
+    def _get_zip_upload_entries(self, zip_file: zipfile.ZipFile, root_prefix: str) -> List[Tuple[zipfile.ZipInfo, str]]:
+        """获取需要上传的压缩包条目及其在瓦片集目录中的相对路径，跳过目录和不安全的条目"""
+        entries = []
+        for member in zip_file.infolist():
+            if member.is_dir():
+                continue
+            relative_path = self._get_tile_object_path(member.filename, root_prefix)
+            if not relative_path:
+                print(f"[WARN] 跳过不安全的压缩包条目: {member.filename}")
+                continue
+            entries.append((member, relative_path))
+        return entries
     
     async def process_minio_file(self, object_id: str, filename: str, threedtiles_data: ThreeDTilesCreate) -> ThreeDTilesInDB:
         """
@@ -451,34 +614,44 @@ class ThreeDTilesService:
                         detail="上传的文件中未找到tileset.json"
                     )
             
-            # 从tileset.json中提取原点经纬度坐标
-            longitude, latitude, height = self._extract_coordinates_from_tileset(tileset_path)
+            # 流式分析tileset.json：提取原点坐标和地理范围、统计瓦片信息并生成空间索引
+            try:
+                analysis = await self.run_in_threadpool(
+                    self._analyze_directory_tileset,
+                    extract_dir
+                )
+            except TilesetTooComplexError as e:
+                await self.collection.delete_one({"_id": ObjectId(tile_id)})
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"tileset.json过于复杂: {str(e)}"
+                )
+            location = self._get_tileset_fields(analysis)
                 
-            # 将解压后的文件上传到MinIO
-            for root, dirs, files in os.walk(extract_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    # 确保使用tile_id作为目录前缀，而不是原始的object_id
-                    object_name = f"{tile_id}/{os.path.relpath(file_path, extract_dir)}"
-                    
-                    # 上传文件到MinIO
-                    try:
-                        minio_client.fput_object(
-                            THREEDTILES_BUCKET_NAME, 
-                            object_name, 
-                            file_path
-                        )
-                    except Exception as e:
-                        # 如果上传失败，尝试删除已上传的文件
-                        try:
-                            self._clean_minio_files(tile_id)
-                            await self.collection.delete_one({"_id": ObjectId(tile_id)})
-                        except:
-                            pass
-                        raise HTTPException(
-                            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=f"上传文件到MinIO失败: {str(e)}"
-                        )
+            # 将解压后的文件并发上传到MinIO
+            try:
+                await self.run_in_threadpool(
+                    TileUploader(THREEDTILES_BUCKET_NAME, tile_id).upload_directory,
+                    extract_dir
+                )
+            except Exception as e:
+                # 如果上传失败，尝试删除已上传的文件
+                try:
+                    self._clean_minio_files(tile_id)
+                    await self.collection.delete_one({"_id": ObjectId(tile_id)})
+                except:
+                    pass
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"上传文件到MinIO失败: {str(e)}"
+                )
+            
+            # 生成并保存瓦片集的空间索引和文件清单
+            await TilesetIndexService().try_save_index(tile_id, analysis.index if analysis else None)
+            await TilesetManifestService().try_save_initial_manifest(
+                tile_id,
+                await self.run_in_threadpool(get_directory_fingerprints, extract_dir)
+            )
             
             # 删除原始上传的ZIP文件
             try:
@@ -486,8 +659,8 @@ class ThreeDTilesService:
             except Exception as e:
                 print(f"删除原始ZIP文件失败 (非致命错误): {str(e)}")
             
-            # 构建tileset.json的URL - 使用相对路径而不是硬编码的域名
-            tileset_url = f"/{THREEDTILES_BUCKET_NAME}/{tile_id}/tileset.json"
+            # 构建tileset.json的URL - 使用相对路径，通过后端的瓦片缓存代理访问
+            tileset_url = get_tileset_url(tile_id)
             minio_path = f"{THREEDTILES_BUCKET_NAME}/{tile_id}"
             
             # 更新数据库记录
@@ -497,9 +670,8 @@ class ThreeDTilesService:
                     "tileset_url": tileset_url,
                     "minio_path": minio_path,
                     "file_size": file_size,
-                    "longitude": longitude,
-                    "latitude": latitude,
-                    "height": height
+                    "revision": 0,
+                    **location
                 }}
             )
             
@@ -589,36 +761,47 @@ class ThreeDTilesService:
                         detail="上传的文件中未找到tileset.json"
                     )
             
-            # 从tileset.json中提取原点经纬度坐标
-            longitude, latitude, height = self._extract_coordinates_from_tileset(tileset_path)
+            # 流式分析tileset.json：提取原点坐标和地理范围、统计瓦片信息并生成空间索引
+            try:
+                analysis = await self.run_in_threadpool(
+                    self._analyze_directory_tileset,
+                    extract_dir
+                )
+            except TilesetTooComplexError as e:
+                await self.collection.delete_one({"_id": ObjectId(tile_id)})
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"tileset.json过于复杂: {str(e)}"
+                )
+            location = self._get_tileset_fields(analysis)
                 
-            # 将解压后的文件上传到MinIO
-            for root, dirs, files in os.walk(extract_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    object_name = f"{tile_id}/{os.path.relpath(file_path, extract_dir)}"
-                    
-                    # 流式上传文件到MinIO
-                    try:
-                        minio_client.fput_object(
-                            THREEDTILES_BUCKET_NAME, 
-                            object_name, 
-                            file_path
-                        )
-                    except Exception as e:
-                        # 如果上传失败，尝试删除已上传的文件
-                        try:
-                            self._clean_minio_files(tile_id)
-                            await self.collection.delete_one({"_id": ObjectId(tile_id)})
-                        except:
-                            pass
-                        raise HTTPException(
-                            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=f"上传文件到MinIO失败: {str(e)}"
-                        )
-            
-            # 构建tileset.json的URL - 使用相对路径而不是硬编码的域名
-            tileset_url = f"/{THREEDTILES_BUCKET_NAME}/{tile_id}/tileset.json"
+            # 将解压后的文件并发上传到MinIO
+            try:
+                await self.run_in_threadpool(
+                    TileUploader(THREEDTILES_BUCKET_NAME, tile_id).upload_directory,
+                    extract_dir
+                )
+            except Exception as e:
+                # 如果上传失败，尝试删除已上传的文件
+                try:
+                    self._clean_minio_files(tile_id)
+                    await self.collection.delete_one({"_id": ObjectId(tile_id)})
+                except:
+                    pass
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"上传文件到MinIO失败: {str(e)}"
+                )
+            
+            # 生成并保存瓦片集的空间索引和文件清单
+            await TilesetIndexService().try_save_index(tile_id, analysis.index if analysis else None)
+            await TilesetManifestService().try_save_initial_manifest(
+                tile_id,
+                await self.run_in_threadpool(get_directory_fingerprints, extract_dir)
+            )
+            
+            # 构建tileset.json的URL - 使用相对路径，通过后端的瓦片缓存代理访问
+            tileset_url = get_tileset_url(tile_id)
             minio_path = f"{THREEDTILES_BUCKET_NAME}/{tile_id}"
             
             # 更新数据库记录
@@ -628,9 +811,8 @@ class ThreeDTilesService:
                     "tileset_url": tileset_url,
                     "minio_path": minio_path,
                     "file_size": file_size,
-                    "longitude": longitude,
-                    "latitude": latitude,
-                    "height": height
+                    "revision": 0,
+                    **location
                 }}
             )
             
@@ -639,66 +821,86 @@ class ThreeDTilesService:
             return threedtiles_db
     
     def _clean_minio_files(self, tile_id: str) -> None:
-        """清理已上传的文件"""
+        """批量清理已上传的文件，清理失败留下的目录由对账任务删除"""
         try:
-            objects = minio_client.list_objects(THREEDTILES_BUCKET_NAME, prefix=f"{tile_id}/", recursive=True)
-            for obj in objects:
-                minio_client.remove_object(THREEDTILES_BUCKET_NAME, obj.object_name)
+            remove_prefix(THREEDTILES_BUCKET_NAME, f"{tile_id}/")
         except Exception as e:
             # 记录错误但不抛出异常
             print(f"清理MinIO文件失败: {str(e)}")
     
-    def _extract_coordinates_from_tileset(self, tileset_path: str) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    def _analyze_tileset_stream(
+        self,
+        open_stream: Callable[[], BinaryIO],
+        file_sizes: Optional[Dict[str, int]] = None
+    ) -> Optional[TilesetAnalysis]:
         """
-        从tileset.json中提取原点经纬度坐标
-        返回经度、纬度和高度
+        流式分析tileset.json（在线程池中调用）。瓦片数或层级深度超过上限时抛出TilesetTooComplexError，
+        其他读取或解析错误时返回None，此时位置和统计信息留空
         """
         try:
-            with open(tileset_path, 'r') as f:
-                tileset_data = json.load(f)
-                
-            # 尝试获取根瓦片的变换矩阵
-            root_transform = None
-            if 'root' in tileset_data and 'transform' in tileset_data['root']:
-                root_transform = tileset_data['root']['transform']
-            elif 'asset' in tileset_data and 'gltfUpAxis' in tileset_data['asset']:
-                # 可能需要其他方式获取坐标
-                pass
-                
-            if root_transform:
-                # 3D Tiles中，transform是一个4x4矩阵，按行存储
-                # 典型的ECEF坐标系中，最后一行的前三个值对应XYZ位置
-                x, y, z = root_transform[12], root_transform[13], root_transform[14]
-                
-                # 转换ECEF坐标到经纬度（此处为近似转换，实际项目中应使用专业库如pyproj进行转换）
-                # 这里仅作为示例，实际应用中请使用更精确的坐标转换方法
-                import math
-                a = 6378137.0  # WGS84椭球体长半轴
-                e2 = 0.00669438  # WGS84椭球体偏心率平方
-                
-                p = math.sqrt(x*x + y*y)
-                theta = math.atan2(z*a, p*(1-e2))
-                
-                longitude = math.atan2(y, x)
-                latitude = math.atan2(
-                    z + e2*(1-e2)/(1-e2*math.sin(theta)**2)*a*math.sin(theta)**3,
-                    p - e2*a*math.cos(theta)**3
-                )
-                
-                # 转换为度
-                longitude = math.degrees(longitude)
-                latitude = math.degrees(latitude)
-                height = p/math.cos(latitude) - a
-                
-                return longitude, latitude, height
-                
+            with open_stream() as stream:
+                return analyze_tileset(stream, file_sizes)
+        except TilesetTooComplexError:
+            raise
         except Exception as e:
-            print(f"提取坐标时出错: {e}")
-            
-        return None, None, None
+            print(f"分析tileset.json时出错: {e}")
+            return None
+    
+    def _analyze_zip_tileset(
+        self,
+        zip_file: zipfile.ZipFile,
+        root_prefix: str,
+        entries: List[Tuple[zipfile.ZipInfo, str]]
+    ) -> Optional[TilesetAnalysis]:
+        """流式分析压缩包中的tileset.json，内容文件大小取自中央目录"""
+        return self._analyze_tileset_stream(
+            lambda: zip_file.open(f"{root_prefix}tileset.json"),
+            {path: member.file_size for member, path in entries}
+        )
+    
+    def _analyze_directory_tileset(self, local_dir: str) -> Optional[TilesetAnalysis]:
+        """流式分析本地瓦片集目录中的tileset.json"""
+        file_sizes = {}
+        for root, dirs, files in os.walk(local_dir):
+            for file in files:
+                file_path = os.path.join(root, file)
+                file_sizes[os.path.relpath(file_path, local_dir).replace(os.sep, "/")] = os.path.getsize(file_path)
+        return self._analyze_tileset_stream(
+            lambda: open(os.path.join(local_dir, "tileset.json"), "rb"),
+            file_sizes
+        )
+    
+    def _get_tileset_fields(self, analysis: Optional[TilesetAnalysis]) -> dict:
+        """
+        根据tileset.json的分析结果生成写入数据库记录的字段：
+        longitude/latitude/height（原点）、bbox（[西, 南, 东, 北]）、footprint（GeoJSON面）、
+        min_height/max_height（椭球高范围）和statistics（瓦片统计信息），无法确定的字段为None
+        """
+        fields = {
+            "longitude": None,
+            "latitude": None,
+            "height": None,
+            "bbox": None,
+            "footprint": None,
+            "min_height": None,
+            "max_height": None,
+            "statistics": analysis.statistics if analysis else None
+        }
+        extent = analysis.extent if analysis else None
+        if not extent:
+            return fields
+        
+        if extent["origin"]:
+            fields["longitude"], fields["latitude"], fields["height"] = extent["origin"]
+        if extent["bbox"]:
+            fields["bbox"] = extent["bbox"]
+            fields["footprint"] = bbox_to_polygon(extent["bbox"])
+        fields["min_height"] = extent["min_height"]
+        fields["max_height"] = extent["max_height"]
+        return fields
     
     async def get_threedtiles(self, tile_id: str) -> dict:
-        tile = await self.collection.find_one({"_id": ObjectId(tile_id)})
+        tile = await self.collection.find_one({"_id": ObjectId(tile_id), **LIVE_RECORD_FILTER})
         if not tile:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -708,7 +910,7 @@ class ThreeDTilesService:
     
     async def get_all_threedtiles(self, skip: int = 0, limit: int = 100) -> list:
         tiles = []
-        cursor = self.collection.find().skip(skip).limit(limit)
+        cursor = self.collection.find(LIVE_RECORD_FILTER).skip(skip).limit(limit)
         async for document in cursor:
             tiles.append(document)
         return tiles
@@ -717,7 +919,7 @@ class ThreeDTilesService:
         """
         更新3DTiles模型信息
         """
-        tile = await self.collection.find_one({"_id": ObjectId(tile_id)})
+        tile = await self.collection.find_one({"_id": ObjectId(tile_id), **LIVE_RECORD_FILTER})
         if not tile:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -734,34 +936,317 @@ class ThreeDTilesService:
         
         return await self.get_threedtiles(tile_id)
     
-    async def delete_threedtiles(self, tile_id: str) -> bool:
+    async def update_tileset_async(
+        self,
+        tile_id: str,
+        object_id: str,
+        filename: str,
+        process_id: str,
+        cancel_event: Optional[threading.Event] = None
+    ) -> dict:
         """
-        删除3DTiles模型
+        用新上传的压缩包增量更新已有的瓦片集，tile_id和tileset地址的前缀保持不变
+
+        按中央目录中的CRC32和大小计算每个条目的指纹，与当前版本的清单比较，
+        只上传新增或内容变化的文件（到新版本的目录中），未变化的文件沿用原来的对象。
+        上传完成后保存新版本的清单，再通过一次条件更新将记录切换到新版本的tileset.json，
+        切换之前客户端始终访问完整的旧版本；切换后删除旧版本中已删除或已被替换的文件。
+        失败或取消时删除新版本已上传的文件，旧版本不受影响
         """
-        tile = await self.collection.find_one({"_id": ObjectId(tile_id)})
+        tile = await self.collection.find_one({"_id": ObjectId(tile_id), **LIVE_RECORD_FILTER})
         if not tile:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"ID为{tile_id}的3DTiles模型不存在"
+            return {"status": "failed", "message": f"ID为{tile_id}的3DTiles模型不存在"}
+        if tile.get("storage") == "archive":
+            return {"status": "failed", "message": "以.3tz压缩包形式保存的瓦片集不支持增量更新"}
+        
+        object_name = f"{object_id}/{filename}"
+        base_revision = tile.get("revision") or 0
+        new_revision = base_revision + 1
+        manifest_service = TilesetManifestService()
+        zip_file = None
+        uploaded = False
+        try:
+            await self.create_process_status(
+                process_id=process_id,
+                status="processing",
+                message="正在比较瓦片集文件",
+                tile_id=tile_id
             )
+            source_stat = await self.run_in_threadpool(
+                minio_client.stat_object,
+                THREEDTILES_BUCKET_NAME,
+                object_name
+            )
+            file_size = source_stat.size
+            zip_file = await self.run_in_threadpool(self._open_minio_zip, object_name, file_size)
+            root_prefix = self._find_tileset_prefix(zip_file.namelist())
+            if root_prefix is None:
+                await self.create_process_status(
+                    process_id=process_id,
+                    status="failed",
+                    message="上传的文件中未找到tileset.json",
+                    tile_id=tile_id
+                )
+                return {"status": "failed", "message": "上传的文件中未找到tileset.json"}
+            
+            upload_entries = self._get_zip_upload_entries(zip_file, root_prefix)
+            fingerprints = {path: get_zip_entry_fingerprint(member) for member, path in upload_entries}
+            base_manifest = await manifest_service.get_base_manifest(tile_id, base_revision)
+            new_manifest = base_manifest.next_revision(fingerprints)
+            changed_paths = set(base_manifest.get_changed_paths(fingerprints))
+            changed_entries = [(member, path) for member, path in upload_entries if path in changed_paths]
+            obsolete_objects = base_manifest.get_obsolete_objects(tile_id, new_manifest)
+            print(
+                f"[INFO] 瓦片集{tile_id}增量更新: 共{len(upload_entries)}个文件，"
+                f"上传{len(changed_entries)}个，删除{len(obsolete_objects)}个对象"
+            )
+            
+            analysis = await self.run_in_threadpool(
+                self._analyze_zip_tileset,
+                zip_file,
+                root_prefix,
+                upload_entries
+            )
+            location = self._get_tileset_fields(analysis)
+            raise_if_cancelled(cancel_event)
+            
+            # 新增或修改的文件上传到新版本的目录中，不影响正在访问旧版本的客户端
+            async def report_upload_progress(uploader: TileUploader):
+                await self.create_process_status(
+                    process_id=process_id,
+                    status="processing",
+                    message=f"正在上传变化的文件 ({uploader.uploaded_files}/{uploader.total_files})",
+                    tile_id=tile_id,
+                    uploaded_files=uploader.uploaded_files,
+                    total_files=uploader.total_files
+                )
+            
+            uploaded = True
+            uploader = TileUploader(THREEDTILES_BUCKET_NAME, get_revision_prefix(tile_id, new_revision), cancel_event)
+            await uploader.run(
+                uploader.upload_zip_entries,
+                lambda: self._open_minio_zip(object_name, file_size, tile_upload_client),
+                changed_entries,
+                on_progress=report_upload_progress
+            )
+            await self.run_in_threadpool(manifest_service.save_manifest, tile_id, new_manifest)
+            raise_if_cancelled(cancel_event)
+            
+            # 条件更新：只有记录仍指向基准版本时才切换，避免并发的更新互相覆盖
+            result = await self.collection.update_one(
+                {"_id": ObjectId(tile_id), "revision": tile.get("revision"), **LIVE_RECORD_FILTER},
+                {"$set": {
+                    "tileset_url": get_revision_tileset_url(tile_id, new_revision),
+                    "revision": new_revision,
+                    "file_size": file_size,
+                    "original_filename": filename,
+                    "updated_at": datetime.utcnow(),
+                    **location
+                }}
+            )
+            if result.matched_count == 0:
+                raise ValueError("瓦片集已被删除或同时被其他任务更新")
+        except Exception as e:
+            if uploaded:
+                await self.run_in_threadpool(self._clean_revision_files, tile_id, new_revision)
+            if isinstance(e, TaskCancelledError):
+                print(f"[INFO] 瓦片集增量更新已取消: {process_id}")
+                await self.create_process_status(process_id=process_id, status="cancelled", message=str(e), tile_id=tile_id)
+                return {"status": "cancelled", "message": str(e)}
+            error_message = f"增量更新失败: {str(e)}"
+            print(f"[ERROR] {error_message}")
+            await self.create_process_status(process_id=process_id, status="failed", message=error_message, tile_id=tile_id)
+            return {"status": "failed", "message": error_message, "retryable": is_retryable_error(e)}
+        finally:
+            if zip_file is not None:
+                zip_file.close()
         
-        # 删除MinIO中的所有相关文件
+        # 已切换到新版本：保存新的空间索引，删除不再被引用的旧文件、旧版本清单和上传的压缩包
+        await TilesetIndexService().try_save_index(tile_id, analysis.index if analysis else None)
+        TilesetIndexService().invalidate(tile_id)
+        try:
+            await self.run_in_threadpool(
+                manifest_service.remove_objects,
+                obsolete_objects + [get_manifest_object_name(tile_id, base_revision), object_name]
+            )
+        except Exception as e:
+            print(f"删除旧版本文件失败 (非致命错误): {str(e)}")
+        tile_cache = TileCacheService()
+        for obsolete_object in obsolete_objects:
+            tile_cache.invalidate_prefix(f"{THREEDTILES_BUCKET_NAME}/{obsolete_object}")
+        manifest_service.invalidate(tile_id)
+        
+        await self.create_process_status(
+            process_id=process_id,
+            status="completed",
+            message="增量更新完成",
+            tile_id=tile_id
+        )
+        return {
+            "status": "completed",
+            "tile_id": tile_id,
+            "tileset_url": get_revision_tileset_url(tile_id, new_revision),
+            "revision": new_revision,
+            "total_files": len(upload_entries),
+            "uploaded_files": len(changed_entries),
+            "deleted_objects": len(obsolete_objects)
+        }
+    
+    def _clean_revision_files(self, tile_id: str, revision: int) -> None:
+        """删除增量更新失败的版本已上传的文件和清单"""
         try:
-            objects = minio_client.list_objects(THREEDTILES_BUCKET_NAME, prefix=f"{tile_id}/", recursive=True)
-            for obj in objects:
-                minio_client.remove_object(THREEDTILES_BUCKET_NAME, obj.object_name)
+            remove_prefix(THREEDTILES_BUCKET_NAME, f"{get_revision_prefix(tile_id, revision)}/")
+            minio_client.remove_object(THREEDTILES_BUCKET_NAME, get_manifest_object_name(tile_id, revision))
         except Exception as e:
+            print(f"清理增量更新文件失败: {str(e)}")
+    
+    async def refresh_location(self, tile_id: str) -> dict:
+        """
+        重新分析已上传的tileset.json，更新模型的原点坐标、地理范围和统计信息，并重新生成空间索引
+        """
+        tile = await self.get_threedtiles(tile_id)
+        analysis = await self._analyze_stored_tileset(tile)
+        fields = self._get_tileset_fields(analysis)
+        # 同时重新生成空间索引
+        if analysis is not None:
+            try:
+                await self.run_in_threadpool(TilesetIndexService().save_index, tile_id, analysis.index)
+            except Exception as e:
+                print(f"[WARN] 生成瓦片集空间索引失败: {str(e)}")
+            finally:
+                analysis.index.close()
+        await self.collection.update_one(
+            {"_id": ObjectId(tile_id)},
+            {"$set": {**fields, "updated_at": datetime.utcnow()}}
+        )
+        TilesetIndexService().invalidate(tile_id)
+        return await self.get_threedtiles(tile_id)
+    
+    async def _analyze_stored_tileset(self, tile: dict) -> Optional[TilesetAnalysis]:
+        """
+        流式分析已上传的瓦片集的tileset.json（解压后的目录或.3tz压缩包），
+        读取失败时返回400，瓦片数或层级深度超过上限时返回422
+        """
+        tile_id = str(tile["_id"])
+        try:
+            if tile.get("storage") == "archive":
+                archive_object = get_archive_object_name(tile_id)
+                archive_service = TileArchiveService()
+                content = await archive_service.read_file(archive_object, "tileset.json")
+                index = await archive_service.get_index(archive_object)
+                file_sizes = {path: entry[2] for path, entry in index.entries.items()}
+                open_stream = lambda: io.BytesIO(content)
+            else:
+                object_name = f"{tile_id}/tileset.json"
+                revision = tile.get("revision") or 0
+                manifest_service = TilesetManifestService()
+                if revision:
+                    object_name = await manifest_service.resolve_object_name(tile_id, revision, "tileset.json")
+                file_sizes = await manifest_service.get_file_sizes(tile_id, revision)
+                open_stream = lambda: MinioRangeReader(minio_client, THREEDTILES_BUCKET_NAME, object_name)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"读取tileset.json失败: {str(e)}"
+            )
+        try:
+            analysis = await self.run_in_threadpool(self._analyze_tileset_stream, open_stream, file_sizes)
+        except TilesetTooComplexError as e:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"删除MinIO文件失败: {str(e)}"
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"tileset.json过于复杂: {str(e)}"
             )
-        
-        # 删除MongoDB记录
-        delete_result = await self.collection.delete_one({"_id": ObjectId(tile_id)})
-        if delete_result.deleted_count == 0:
+        if analysis is None:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="删除数据库记录失败"
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="读取tileset.json失败"
             )
-            
-        return True 
\ No newline at end of file
+        return analysis
+    
+    async def _build_stored_index(self, tile: dict) -> TilesetIndexWriter:
+        """为没有保存空间索引的旧瓦片集重新生成索引"""
+        analysis = await self._analyze_stored_tileset(tile)
+        return analysis.index
+    
+    async def get_index(self, tile: dict) -> TilesetIndex:
+        """获取瓦片集的空间索引，没有保存索引的旧瓦片集重新生成"""
+        return await TilesetIndexService().get_index(
+            str(tile["_id"]),
+            str(tile.get("updated_at") or ""),
+            lambda: self._build_stored_index(tile)
+        )
+    
+    async def query_tiles(
+        self,
+        tile_id: str,
+        bbox: Optional[List[float]] = None,
+        min_height: Optional[float] = None,
+        max_height: Optional[float] = None,
+        geometric_error: Optional[float] = None,
+        frustum: Optional[dict] = None,
+        limit: int = TILESET_QUERY_MAX_RESULTS
+    ) -> dict:
+        """
+        按地理范围或视锥体查询瓦片集中相交的瓦片，返回瓦片的内容地址
+
+        bbox为[西, 南, 东, 北]（度，西大于东表示跨越180度经线）；frustum为TilesetFrustumQuery的内容。
+        外部tileset（内容为.json的瓦片）原样返回，不继续展开
+        """
+        tile = await self.get_threedtiles(tile_id)
+        index = await self.get_index(tile)
+        if not index.is_georeferenced:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="瓦片集未进行地理配准，无法进行空间查询"
+            )
+        limit = min(limit, TILESET_QUERY_MAX_RESULTS)
+        if frustum is not None:
+            selected, truncated = await self.run_in_threadpool(
+                index.query_frustum,
+                frustum["planes"],
+                frustum.get("camera_position"),
+                frustum["max_screen_space_error"],
+                frustum["fov"],
+                frustum["screen_height"],
+                limit
+            )
+        else:
+            selected, truncated = await self.run_in_threadpool(
+                index.query_bbox,
+                bbox,
+                min_height,
+                max_height,
+                geometric_error,
+                limit
+            )
+        return {
+            "tile_id": tile_id,
+            "total": len(selected),
+            "truncated": truncated,
+            "tiles": index.describe(selected, tile["tileset_url"])
+        }
+    
+    async def delete_threedtiles(self, tile_id: str, user_id: str) -> str:
+        """
+        删除3DTiles模型
+
+        记录立即标记为已删除（不再出现在列表中），MinIO中的文件由后台任务批量删除，
+        删除完成后物理删除记录。返回删除任务ID
+        """
+        task = await ObjectCleanupService(self.db).schedule_deletion(
+            "threedtiles", tile_id, THREEDTILES_BUCKET_NAME, user_id
+        )
+        if not task:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"ID为{tile_id}的3DTiles模型不存在"
+            )
+        # 丢弃瓦片缓存，以压缩包形式保存的瓦片集同时丢弃压缩包索引缓存
+        TileCacheService().invalidate_prefix(f"{THREEDTILES_BUCKET_NAME}/{tile_id}/")
+        TileCacheService().invalidate_prefix(get_archive_tile_cache_key(tile_id, ""))
+        await TileArchiveService().invalidate(get_archive_object_name(tile_id))
+        TilesetIndexService().invalidate(tile_id)
+        TilesetManifestService().invalidate(tile_id)
+        return task.task_id
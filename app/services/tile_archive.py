@@ -0,0 +1,337 @@
+import asyncio
+import json
+import os
+import posixpath
+import struct
+import zipfile
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional
+
+from fastapi import HTTPException, status
+from minio.error import S3Error
+
+from app.core.minio_client import minio_client, THREEDTILES_BUCKET_NAME
+from app.services.tile_cache import (
+    TILE_CACHE_MAX_ITEM_BYTES,
+    CachedTile,
+    make_strong_etag,
+    normalize_tile_path,
+    stream_object
+)
+from app.services.tile_uploader import get_tile_content_type
+from app.utils.minio_reader import MinioRangeReader
+from app.utils.redis import redis_service
+
+# 本进程内缓存的压缩包索引数量
+TILE_ARCHIVE_INDEX_CACHE_SIZE = int(os.getenv("TILE_ARCHIVE_INDEX_CACHE_SIZE", "64"))
+# 压缩包索引在Redis中的缓存时间（秒），0表示不使用Redis缓存
+TILE_ARCHIVE_INDEX_TTL = int(os.getenv("TILE_ARCHIVE_INDEX_TTL", "86400"))
+
+# 以压缩包形式保存的瓦片集在tile_id目录下的对象名
+TILE_ARCHIVE_OBJECT_NAME = "tileset.3tz"
+TILE_ARCHIVE_INDEX_KEY_PREFIX = "tile_archive_index:"
+
+# 可以直接从压缩包读取的压缩方式
+TILE_ARCHIVE_COMPRESSION_TYPES = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+# ZIP本地文件头：固定30字节，文件名长度和扩展字段长度位于第26、28字节
+ZIP_LOCAL_HEADER_SIZE = 30
+ZIP_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+def find_tileset_prefix(names: List[str]) -> Optional[str]:
+    """
+    在压缩包条目中查找层级最浅的tileset.json，返回其所在目录（以/结尾，根目录为空字符串），
+    未找到时返回None
+    """
+    prefixes = []
+    for name in names:
+        normalized = name.replace("\\", "/")
+        if posixpath.basename(normalized) == "tileset.json":
+            prefixes.append(normalized[:-len("tileset.json")])
+    if not prefixes:
+        return None
+    return min(prefixes, key=lambda prefix: (prefix.count("/"), prefix))
+
+def get_tile_relative_path(name: str, root_prefix: str) -> Optional[str]:
+    """
+    计算压缩包条目在瓦片集目录中的相对路径：tileset.json所在目录的内容放到根目录，
+    其他条目保持原有路径；绝对路径或包含..的条目返回None
+    """
+    normalized = posixpath.normpath(name.replace("\\", "/"))
+    if normalized.startswith("/") or normalized == ".." or normalized.startswith("../"):
+        return None
+    if root_prefix and normalized.startswith(root_prefix):
+        normalized = normalized[len(root_prefix):]
+    return normalized
+
+def get_archive_object_name(tile_id: str) -> str:
+    """瓦片集压缩包在THREEDTILES_BUCKET_NAME中的对象名"""
+    return f"{tile_id}/{TILE_ARCHIVE_OBJECT_NAME}"
+
+def get_tileset_url(tile_id: str) -> str:
+    """解压后保存的瓦片集的tileset.json地址（由后端的瓦片缓存代理提供）"""
+    return f"/3dtiles/{tile_id}/tiles/tileset.json"
+
+def get_archive_tileset_url(tile_id: str) -> str:
+    """以压缩包形式保存的瓦片集的tileset.json地址（由后端读取压缩包提供）"""
+    return f"/3dtiles/{tile_id}/archive/tileset.json"
+
+def get_archive_tile_cache_key(tile_id: str, path: str) -> str:
+    """压缩包中文件在瓦片缓存中的键"""
+    return f"archive:{THREEDTILES_BUCKET_NAME}/{get_archive_object_name(tile_id)}/{path}"
+
+def is_servable_archive(zip_file: zipfile.ZipFile) -> bool:
+    """压缩包中的文件是否都可以直接通过范围读取提供（只支持不压缩和deflate）"""
+    return all(
+        member.compress_type in TILE_ARCHIVE_COMPRESSION_TYPES
+        for member in zip_file.infolist()
+        if not member.is_dir()
+    )
+
+class TileArchiveIndex:
+    """
+    瓦片集压缩包的中央目录索引
+
+    entries为 相对路径 -> [本地文件头偏移, 压缩后大小, 原始大小, 压缩方式, 预计的本地文件头长度]，
+    预计的本地文件头长度按中央目录中的文件名和扩展字段计算，读取时与实际文件头不一致则重新读取。
+    etag为压缩包对象的etag，用于生成各条目的ETag
+    """
+
+    def __init__(self, object_name: str, entries: Dict[str, list], etag: str = ""):
+        self.object_name = object_name
+        self.entries = entries
+        self.etag = etag
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"object_name": self.object_name, "etag": self.etag, "entries": self.entries},
+            separators=(",", ":")
+        )
+
+    @classmethod
+    def from_json(cls, data: str) -> "TileArchiveIndex":
+        payload = json.loads(data)
+        return cls(payload["object_name"], payload["entries"], payload.get("etag", ""))
+
+    def get_entry_etag(self, path: str) -> str:
+        """条目的强ETag：压缩包etag加条目在压缩包中的偏移，压缩包不变时条目内容不变"""
+        return make_strong_etag(f"{self.etag.strip(chr(34))}-{self.entries[path][0]:x}")
+
+    @classmethod
+    def build(cls, bucket_name: str, object_name: str) -> "TileArchiveIndex":
+        """通过范围读取解析压缩包的中央目录，生成索引"""
+        stat = minio_client.stat_object(bucket_name, object_name)
+        reader = MinioRangeReader(minio_client, bucket_name, object_name, size=stat.size)
+        with zipfile.ZipFile(reader, "r") as zip_file:
+            root_prefix = find_tileset_prefix(zip_file.namelist())
+            if root_prefix is None:
+                raise ValueError("压缩包中未找到tileset.json")
+            entries = {}
+            for member in zip_file.infolist():
+                if member.is_dir():
+                    continue
+                relative_path = get_tile_relative_path(member.filename, root_prefix)
+                if not relative_path:
+                    continue
+                encoding = "utf-8" if member.flag_bits & 0x800 else "cp437"
+                try:
+                    name_length = len(member.orig_filename.encode(encoding))
+                except UnicodeEncodeError:
+                    name_length = len(member.orig_filename.encode("utf-8"))
+                entries[relative_path] = [
+                    member.header_offset,
+                    member.compress_size,
+                    member.file_size,
+                    member.compress_type,
+                    ZIP_LOCAL_HEADER_SIZE + name_length + len(member.extra),
+                ]
+        return cls(object_name, entries, stat.etag or "")
+
+    def read(self, bucket_name: str, path: str) -> bytes:
+        """读取并解压一个条目，只请求该条目所在的字节范围"""
+        entry = self.entries.get(path)
+        if entry is None:
+            raise KeyError(path)
+        header_offset, compress_size, file_size, compress_type, header_size = entry
+
+        data = _read_range(bucket_name, self.object_name, header_offset, header_size + compress_size)
+        if data[:4] != ZIP_LOCAL_HEADER_SIGNATURE:
+            raise ValueError(f"压缩包条目的本地文件头无效: {path}")
+        name_length, extra_length = struct.unpack("<HH", data[26:30])
+        actual_header_size = ZIP_LOCAL_HEADER_SIZE + name_length + extra_length
+        if actual_header_size == header_size:
+            payload = data[header_size:]
+        else:
+            # 本地文件头的扩展字段与中央目录不一致，按实际长度重新读取数据
+            payload = _read_range(bucket_name, self.object_name, header_offset + actual_header_size, compress_size)
+            entry[4] = actual_header_size
+
+        if compress_type == zipfile.ZIP_STORED:
+            return payload
+        if compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(payload, -zlib.MAX_WBITS, file_size or zlib.DEF_BUF_SIZE)
+        raise ValueError(f"不支持的压缩方式: {compress_type}")
+
+    def stream(self, bucket_name: str, path: str, offset: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        """
+        流式读取一个条目中从offset开始的length个字节（None为到末尾），依次产生字节块，不在内存中缓冲整个条目
+
+        不压缩的条目只请求对应范围；deflate压缩的条目不能从中间开始解压，从头解压并跳过offset之前的内容
+        """
+        entry = self.entries.get(path)
+        if entry is None:
+            raise KeyError(path)
+        header_offset, compress_size, file_size, compress_type, _ = entry
+        end = file_size if length is None else min(file_size, offset + length)
+        if offset >= end:
+            return
+        header = _read_range(bucket_name, self.object_name, header_offset, ZIP_LOCAL_HEADER_SIZE)
+        if header[:4] != ZIP_LOCAL_HEADER_SIGNATURE:
+            raise ValueError(f"压缩包条目的本地文件头无效: {path}")
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        data_offset = header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length
+
+        if compress_type == zipfile.ZIP_STORED:
+            yield from stream_object(bucket_name, self.object_name, data_offset + offset, end - offset)
+            return
+        if compress_type != zipfile.ZIP_DEFLATED:
+            raise ValueError(f"不支持的压缩方式: {compress_type}")
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        chunks = stream_object(bucket_name, self.object_name, data_offset, compress_size)
+        position = 0
+        try:
+            for chunk in chunks:
+                data = decompressor.decompress(chunk)
+                start, stop = max(offset - position, 0), min(end - position, len(data))
+                position += len(data)
+                if start < stop:
+                    yield data[start:stop]
+                if position >= end:
+                    return
+            data = decompressor.flush()
+            start, stop = max(offset - position, 0), min(end - position, len(data))
+            if start < stop:
+                yield data[start:stop]
+        finally:
+            chunks.close()
+
+def _read_range(bucket_name: str, object_name: str, offset: int, length: int) -> bytes:
+    """读取对象中的一段字节"""
+    if length <= 0:
+        return b""
+    response = minio_client.get_object(bucket_name, object_name, offset=offset, length=length)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+class TileArchiveService:
+    """
+    直接从MinIO中的瓦片集压缩包（.3tz）提供tileset.json和瓦片文件
+
+    压缩包的中央目录只解析一次，索引缓存在本进程内存和Redis中，
+    之后每个文件只通过一次范围读取获取所需的字节
+    """
+
+    # 进程内的索引缓存（LRU）和按对象名的构建锁，避免同一压缩包被并发解析多次
+    _indexes: "OrderedDict[str, TileArchiveIndex]" = OrderedDict()
+    _locks: Dict[str, asyncio.Lock] = {}
+
+    def __init__(self, bucket_name: str = THREEDTILES_BUCKET_NAME):
+        self.bucket_name = bucket_name
+
+    async def get_index(self, object_name: str) -> TileArchiveIndex:
+        """获取压缩包索引，依次查找本进程缓存、Redis缓存，都没有时解析中央目录"""
+        index = self._get_cached_index(object_name)
+        if index:
+            return index
+
+        lock = self._locks.setdefault(object_name, asyncio.Lock())
+        async with lock:
+            index = self._get_cached_index(object_name)
+            if index:
+                return index
+
+            redis_key = f"{TILE_ARCHIVE_INDEX_KEY_PREFIX}{self.bucket_name}:{object_name}"
+            cached = None
+            if TILE_ARCHIVE_INDEX_TTL > 0:
+                try:
+                    cached = await redis_service.async_redis_client.get(redis_key)
+                except Exception as e:
+                    print(f"[WARN] 读取压缩包索引缓存失败: {str(e)}")
+            if cached:
+                index = TileArchiveIndex.from_json(cached)
+            else:
+                index = await asyncio.to_thread(TileArchiveIndex.build, self.bucket_name, object_name)
+                if TILE_ARCHIVE_INDEX_TTL > 0:
+                    try:
+                        await redis_service.async_redis_client.set(redis_key, index.to_json(), ex=TILE_ARCHIVE_INDEX_TTL)
+                    except Exception as e:
+                        print(f"[WARN] 写入压缩包索引缓存失败: {str(e)}")
+
+            self._indexes[object_name] = index
+            while len(self._indexes) > TILE_ARCHIVE_INDEX_CACHE_SIZE:
+                self._indexes.popitem(last=False)
+        self._locks.pop(object_name, None)
+        return index
+
+    async def read_file(self, object_name: str, path: str) -> bytes:
+        """读取压缩包中的一个文件（完整读入内存），压缩包或文件不存在时返回404"""
+        return (await self.load_tile(object_name, path, max_content_bytes=None)).content
+
+    async def load_tile(
+        self,
+        object_name: str,
+        path: str,
+        max_content_bytes: Optional[int] = TILE_CACHE_MAX_ITEM_BYTES
+    ) -> CachedTile:
+        """
+        读取压缩包中的一个文件及其ETag，压缩包或文件不存在时返回404
+
+        文件超过max_content_bytes（None为不限制）时不读取内容，返回按需流式读取的CachedTile
+        """
+        path = normalize_tile_path(path)
+        try:
+            index = await self.get_index(object_name)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket"):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="瓦片集压缩包不存在")
+            raise
+        try:
+            file_size = index.entries[path][2]
+            if max_content_bytes is not None and file_size > max_content_bytes:
+                return CachedTile(
+                    None,
+                    index.get_entry_etag(path),
+                    get_tile_content_type(path),
+                    length=file_size,
+                    opener=lambda offset, length: index.stream(self.bucket_name, path, offset, length)
+                )
+            content = await asyncio.to_thread(index.read, self.bucket_name, path)
+            return CachedTile(content, index.get_entry_etag(path), get_tile_content_type(path))
+        except KeyError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"压缩包中不存在文件: {path}")
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket"):
+                # 压缩包已被删除，丢弃过期的索引
+                await self.invalidate(object_name)
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="瓦片集压缩包不存在")
+            raise
+
+    async def invalidate(self, object_name: str):
+        """删除压缩包的索引缓存（压缩包被删除或替换时调用）"""
+        self._indexes.pop(object_name, None)
+        try:
+            await redis_service.async_redis_client.delete(
+                f"{TILE_ARCHIVE_INDEX_KEY_PREFIX}{self.bucket_name}:{object_name}"
+            )
+        except Exception as e:
+            print(f"[WARN] 删除压缩包索引缓存失败: {str(e)}")
+
+    def _get_cached_index(self, object_name: str) -> Optional[TileArchiveIndex]:
+        index = self._indexes.get(object_name)
+        if index:
+            self._indexes.move_to_end(object_name)
+        return index
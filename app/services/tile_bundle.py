@@ -0,0 +1,251 @@
+import asyncio
+import os
+import re
+import struct
+import zipfile
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from minio.error import S3Error
+
+from app.core.minio_client import minio_client
+from app.services.tile_cache import CachedTile, make_strong_etag
+
+# 本进程内缓存的bundle索引数量（每个索引128KB）
+TILE_BUNDLE_INDEX_CACHE_SIZE = int(os.getenv("TILE_BUNDLE_INDEX_CACHE_SIZE", "256"))
+
+# bundle文件在图层目录下的子目录，按 L{级别}/R{行}C{列}.bundle 统一命名（行列为十六进制）
+TILE_BUNDLE_DIR = "bundles"
+
+# Esri紧凑型缓存V2：每个bundle包含128×128个瓦片，64字节文件头之后是每个瓦片8字节的索引，
+# 索引的低40位为瓦片数据的偏移，高24位为瓦片大小
+BUNDLE_DIMENSION = 128
+BUNDLE_HEADER_SIZE = 64
+BUNDLE_INDEX_ENTRY_SIZE = 8
+BUNDLE_INDEX_SIZE = BUNDLE_DIMENSION * BUNDLE_DIMENSION * BUNDLE_INDEX_ENTRY_SIZE
+BUNDLE_VERSION = 3
+BUNDLE_OFFSET_MASK = (1 << 40) - 1
+BUNDLE_SIZE_SHIFT = 40
+
+# 压缩包中bundle文件的路径，如 tile/L05/R0080C0100.bundle 或 v101/Layers/_alllayers/L05/R0080C0100.bundle
+BUNDLE_PATH_PATTERN = re.compile(r"^(.*?)L(\d+)/R([0-9a-fA-F]+)C([0-9a-fA-F]+)\.bundle$")
+
+# 根据内容识别瓦片的图片格式
+TILE_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+)
+
+def get_bundle_relative_path(level: int, row: int, column: int) -> str:
+    """bundle文件在图层目录中的相对路径，row和column为bundle左上角瓦片的行列号"""
+    return f"{TILE_BUNDLE_DIR}/L{level:02d}/R{row:04x}C{column:04x}.bundle"
+
+def find_bundle_entries(zip_file: zipfile.ZipFile) -> List[Tuple[zipfile.ZipInfo, str]]:
+    """
+    查找tpkx压缩包中的紧凑型缓存V2 bundle文件，返回(条目, 统一命名后的相对路径)列表
+
+    多个目录中都有bundle时只使用层级最浅的一个；没有bundle或为需要.bundlx索引文件的V1格式时返回空列表
+    """
+    bundles: Dict[str, List[Tuple[zipfile.ZipInfo, str]]] = {}
+    for member in zip_file.infolist():
+        name = member.filename.replace("\\", "/")
+        if name.lower().endswith(".bundlx"):
+            print(f"[WARN] tpkx中的瓦片为紧凑型缓存V1格式，不支持直接读取bundle: {name}")
+            return []
+        match = BUNDLE_PATH_PATTERN.match(name)
+        if not match or member.is_dir():
+            continue
+        prefix, level, row, column = match.groups()
+        relative_path = get_bundle_relative_path(int(level), int(row, 16), int(column, 16))
+        bundles.setdefault(prefix, []).append((member, relative_path))
+    if not bundles:
+        return []
+    prefix = min(bundles, key=lambda prefix: (prefix.count("/"), prefix))
+    return bundles[prefix]
+
+def detect_tile_content_type(content: bytes) -> str:
+    """根据文件头识别瓦片的Content-Type（bundle中不记录瓦片格式，MIXED格式的缓存中PNG和JPEG混合存放）"""
+    for signature, content_type in TILE_IMAGE_SIGNATURES:
+        if content.startswith(signature):
+            return content_type
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+def write_bundle(path: str, tiles: Dict[Tuple[int, int], bytes]):
+    """
+    写入紧凑型缓存V2 bundle文件，tiles为 (bundle内的行, 列) -> 瓦片内容。
+    每个瓦片数据前有4字节的长度，与ArcGIS生成的bundle相同
+    """
+    index = bytearray(BUNDLE_INDEX_SIZE)
+    max_size = 0
+    with open(path, "wb") as f:
+        f.write(bytes(BUNDLE_HEADER_SIZE + BUNDLE_INDEX_SIZE))
+        offset = BUNDLE_HEADER_SIZE + BUNDLE_INDEX_SIZE
+        for (row, column), content in sorted(tiles.items()):
+            f.write(struct.pack("<I", len(content)))
+            f.write(content)
+            offset += 4
+            struct.pack_into(
+                "<Q", index, (row * BUNDLE_DIMENSION + column) * BUNDLE_INDEX_ENTRY_SIZE,
+                offset | (len(content) << BUNDLE_SIZE_SHIFT)
+            )
+            offset += len(content)
+            max_size = max(max_size, len(content))
+        # 文件头：版本、记录数、最大记录大小、偏移字节数、空闲空间、文件大小、用户头偏移、用户头大小及固定的兼容字段
+        header = struct.pack(
+            "<4iqqqi5i",
+            BUNDLE_VERSION, BUNDLE_DIMENSION * BUNDLE_DIMENSION, max_size, 5, 0, offset,
+            40, 20 + BUNDLE_INDEX_SIZE, 3, 16, BUNDLE_DIMENSION * BUNDLE_DIMENSION, 5, BUNDLE_INDEX_SIZE
+        )
+        f.seek(0)
+        f.write(header)
+        f.write(index)
+
+class TileBundleIndex:
+    """
+    一个bundle文件的瓦片偏移表
+
+    data为文件头之后的128×128个索引项，为None表示bundle不存在（该范围内没有瓦片），
+    用于缓存不存在的结果，避免空白区域的请求重复访问MinIO。etag为bundle对象的etag，用于生成各瓦片的ETag
+    """
+
+    def __init__(self, object_name: str, data: Optional[bytes], etag: str = ""):
+        self.object_name = object_name
+        self.data = data
+        self.etag = etag
+
+    @classmethod
+    def build(cls, bucket_name: str, object_name: str) -> "TileBundleIndex":
+        """通过一次范围读取获取bundle的文件头和偏移表"""
+        try:
+            response = minio_client.get_object(
+                bucket_name, object_name, offset=0, length=BUNDLE_HEADER_SIZE + BUNDLE_INDEX_SIZE
+            )
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                return cls(object_name, None)
+            raise
+        try:
+            data = response.read()
+            etag = response.headers.get("ETag") or ""
+        finally:
+            response.close()
+            response.release_conn()
+        return cls.parse(object_name, data, etag)
+
+    @classmethod
+    def parse(cls, object_name: str, data: bytes, etag: str = "") -> "TileBundleIndex":
+        """解析bundle开头的文件头和偏移表（至少BUNDLE_HEADER_SIZE + BUNDLE_INDEX_SIZE字节）"""
+        if len(data) < BUNDLE_HEADER_SIZE + BUNDLE_INDEX_SIZE:
+            raise ValueError(f"bundle文件不完整: {object_name}")
+        version = struct.unpack_from("<i", data, 0)[0]
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"不支持的bundle版本{version}: {object_name}")
+        return cls(object_name, data[BUNDLE_HEADER_SIZE:BUNDLE_HEADER_SIZE + BUNDLE_INDEX_SIZE], etag)
+
+    def iter_tiles(self) -> Iterator[Tuple[int, int]]:
+        """bundle中存在的瓦片在bundle内的(行, 列)"""
+        if self.data is None:
+            return
+        for position, value in enumerate(struct.iter_unpack("<Q", self.data)):
+            if value[0] >> BUNDLE_SIZE_SHIFT:
+                yield divmod(position, BUNDLE_DIMENSION)
+
+    def get_entry(self, row: int, column: int) -> Tuple[int, int]:
+        """瓦片在bundle中的(偏移, 大小)，row和column为瓦片在bundle内的行列号，大小为0表示瓦片不存在"""
+        if self.data is None:
+            return 0, 0
+        value = struct.unpack_from(
+            "<Q", self.data, (row * BUNDLE_DIMENSION + column) * BUNDLE_INDEX_ENTRY_SIZE
+        )[0]
+        return value & BUNDLE_OFFSET_MASK, value >> BUNDLE_SIZE_SHIFT
+
+    def get_entry_etag(self, offset: int) -> str:
+        """瓦片的强ETag：bundle的etag加瓦片在bundle中的偏移，bundle不变时瓦片内容不变"""
+        return make_strong_etag(f"{self.etag.strip(chr(34))}-{offset:x}")
+
+    def read(self, bucket_name: str, row: int, column: int) -> Optional[CachedTile]:
+        """读取一个瓦片，只请求该瓦片所在的字节范围，瓦片不存在时返回None"""
+        offset, size = self.get_entry(row, column)
+        if size == 0:
+            return None
+        response = minio_client.get_object(bucket_name, self.object_name, offset=offset, length=size)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+        return CachedTile(content, self.get_entry_etag(offset), detect_tile_content_type(content))
+
+class TileBundleService:
+    """
+    直接从MinIO中的紧凑型缓存bundle文件提供 z/x/y 瓦片
+
+    tpkx入库时只上传bundle文件（每个包含最多16384个瓦片），不拆分为单个瓦片对象。
+    每个bundle的偏移表只读取一次并缓存在本进程内，之后每个瓦片只通过一次范围读取获取
+    """
+
+    # 进程内的索引缓存（LRU）和按对象名的构建锁，避免同一bundle被并发读取多次
+    _indexes: "OrderedDict[str, TileBundleIndex]" = OrderedDict()
+    _locks: Dict[str, asyncio.Lock] = {}
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+
+    @staticmethod
+    def get_tile_cache_key(bucket_name: str, layer_id: str, z: int, x: int, y: int) -> str:
+        """bundle中瓦片在瓦片缓存中的键，以图层目录开头，删除图层时随图层目录一起失效"""
+        return f"{bucket_name}/{layer_id}/{TILE_BUNDLE_DIR}/{z}/{x}/{y}"
+
+    async def get_index(self, object_name: str) -> TileBundleIndex:
+        """获取bundle的偏移表，依次查找本进程缓存，未命中时读取bundle文件头"""
+        index = self._get_cached_index(object_name)
+        if index:
+            return index
+
+        lock = self._locks.setdefault(object_name, asyncio.Lock())
+        async with lock:
+            index = self._get_cached_index(object_name)
+            if index:
+                return index
+            index = await asyncio.to_thread(TileBundleIndex.build, self.bucket_name, object_name)
+            self._indexes[object_name] = index
+            while len(self._indexes) > TILE_BUNDLE_INDEX_CACHE_SIZE:
+                self._indexes.popitem(last=False)
+        self._locks.pop(object_name, None)
+        return index
+
+    async def load_tile(self, layer_id: str, z: int, x: int, y: int) -> CachedTile:
+        """读取图层中的一个瓦片，瓦片不存在时返回404"""
+        if z < 0 or x < 0 or y < 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="瓦片行列号无效")
+        bundle_row = y - y % BUNDLE_DIMENSION
+        bundle_column = x - x % BUNDLE_DIMENSION
+        object_name = f"{layer_id}/{get_bundle_relative_path(z, bundle_row, bundle_column)}"
+        index = await self.get_index(object_name)
+        try:
+            tile = await asyncio.to_thread(index.read, self.bucket_name, y - bundle_row, x - bundle_column)
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                # bundle已被删除，丢弃过期的索引
+                self._indexes.pop(object_name, None)
+                tile = None
+            else:
+                raise
+        if tile is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"瓦片不存在: {z}/{x}/{y}")
+        return tile
+
+    def invalidate_prefix(self, prefix: str):
+        """丢弃对象名以prefix开头的bundle索引（图层被删除时调用）"""
+        for object_name in [name for name in self._indexes if name.startswith(prefix)]:
+            self._indexes.pop(object_name, None)
+
+    def _get_cached_index(self, object_name: str) -> Optional[TileBundleIndex]:
+        index = self._indexes.get(object_name)
+        if index:
+            self._indexes.move_to_end(object_name)
+        return index
@@ -0,0 +1,642 @@
+import asyncio
+import hashlib
+import json
+import os
+import posixpath
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from minio.error import S3Error
+
+from app.core.minio_client import minio_client
+from app.services.tile_uploader import get_tile_content_type, is_precompressible, TILE_GZIP_SUFFIX
+
+# 进程内热点瓦片缓存的总字节数，0表示不使用内存缓存
+TILE_CACHE_MEMORY_BYTES = int(os.getenv("TILE_CACHE_MEMORY_BYTES", str(256 * 1024 * 1024)))
+# 单个瓦片进入内存缓存的最大字节数，更大的瓦片不读入内存，从磁盘缓存文件或MinIO流式发送
+TILE_CACHE_MAX_ITEM_BYTES = int(os.getenv("TILE_CACHE_MAX_ITEM_BYTES", str(8 * 1024 * 1024)))
+# 磁盘缓存目录和总字节数，留空使用系统临时目录，0表示不使用磁盘缓存
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "virtualsite-tile-cache")
+TILE_CACHE_DISK_BYTES = int(os.getenv("TILE_CACHE_DISK_BYTES", str(5 * 1024 * 1024 * 1024)))
+# 瓦片响应的Cache-Control：瓦片集目录按上传生成的ID区分版本，瓦片内容不会变化，可长期缓存；
+# tileset.json等描述文件可能被增量更新，需要客户端每次使用ETag重新验证
+TILE_CACHE_CONTROL_IMMUTABLE = os.getenv("TILE_CACHE_CONTROL_IMMUTABLE", "public, max-age=31536000, immutable")
+TILE_CACHE_CONTROL_REVALIDATE = os.getenv("TILE_CACHE_CONTROL_REVALIDATE", "public, no-cache")
+
+# 需要重新验证的描述文件扩展名
+TILE_REVALIDATE_EXTENSIONS = (".json", ".xml")
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# 流式读取和发送的块大小
+TILE_STREAM_CHUNK_BYTES = 1024 * 1024
+
+# 按需打开瓦片数据流：opener(offset, length)返回依次产生字节块的迭代器，length为None时读到末尾
+TileStreamOpener = Callable[[int, Optional[int]], Iterator[bytes]]
+
+class CachedTile:
+    """
+    瓦片内容及其ETag（带引号的强ETag）、Content-Type和Content-Encoding（预压缩版本为gzip）
+
+    内容为以下三种形式之一：content为内存中的内容（可进入内存缓存）；path为磁盘缓存中的内容文件，直接发送文件；
+    opener为按需打开的数据流（超过TILE_CACHE_MAX_ITEM_BYTES且未写入磁盘缓存的MinIO对象或压缩包条目），
+    此时length为内容的字节数。
+    etag为空表示该瓦片（预压缩版本）不存在，用于缓存不存在的结果，避免重复请求MinIO
+    """
+
+    __slots__ = ("content", "etag", "content_type", "content_encoding", "length", "path", "opener")
+
+    def __init__(
+        self,
+        content: Optional[bytes],
+        etag: str,
+        content_type: str,
+        content_encoding: Optional[str] = None,
+        length: int = 0,
+        path: Optional[str] = None,
+        opener: Optional[TileStreamOpener] = None
+    ):
+        self.content = content
+        self.etag = etag
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.length = len(content) if content is not None else length
+        self.path = path
+        self.opener = opener
+
+    @property
+    def exists(self) -> bool:
+        return bool(self.etag)
+
+    @property
+    def size(self) -> int:
+        return self.length
+
+def make_strong_etag(value: str) -> str:
+    """将MinIO对象的etag等值转换为带引号的强ETag"""
+    value = (value or "").strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    return f'"{value.strip(chr(34))}"'
+
+class MemoryTileCache:
+    """按总字节数限制的LRU内存缓存"""
+
+    def __init__(self, max_bytes: int, max_item_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.total_bytes = 0
+        self._items: "OrderedDict[str, CachedTile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedTile]:
+        with self._lock:
+            tile = self._items.get(key)
+            if tile is not None:
+                self._items.move_to_end(key)
+            return tile
+
+    def put(self, key: str, tile: CachedTile):
+        if self.max_bytes <= 0 or tile.content is None or tile.size > min(self.max_item_bytes, self.max_bytes):
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous.size
+            self._items[key] = tile
+            self.total_bytes += tile.size
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.total_bytes -= evicted.size
+
+    def contains(self, key: str) -> bool:
+        """是否已缓存（不改变LRU顺序）"""
+        with self._lock:
+            return key in self._items
+
+    def invalidate_prefix(self, prefix: str):
+        with self._lock:
+            for key in [key for key in self._items if key.startswith(prefix)]:
+                self.total_bytes -= self._items.pop(key).size
+
+class DiskTileCache:
+    """
+    按总字节数限制的LRU磁盘缓存
+
+    每个瓦片保存为内容文件（文件名为缓存键的SHA-256）和加.json后缀的头文件（缓存键、ETag、Content-Type等），
+    内容文件可直接作为响应发送。写入时先写临时文件再原子替换，头文件在内容之后写入，有头文件即表示内容完整。
+    启动后首次使用时扫描目录，按修改时间恢复LRU顺序
+    """
+
+    HEADER_SUFFIX = ".json"
+
+    def __init__(self, directory: str, max_bytes: int, max_content_bytes: int = TILE_CACHE_MAX_ITEM_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # 读取时内容不超过该大小的瓦片读入内存，更大的返回内容文件路径
+        self.max_content_bytes = max_content_bytes
+        self.total_bytes = 0
+        self._files: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()  # 文件名 -> (缓存键, 字节数)
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> Optional[CachedTile]:
+        self._ensure_loaded()
+        if not self.enabled:
+            return None
+        filename = self._filename(key)
+        with self._lock:
+            if filename not in self._files:
+                return None
+            self._files.move_to_end(filename)
+        path = os.path.join(self.directory, filename)
+        try:
+            with open(path + self.HEADER_SUFFIX, "rb") as f:
+                header = json.loads(f.read())
+            length = os.path.getsize(path)
+            content = None
+            if length <= self.max_content_bytes:
+                with open(path, "rb") as f:
+                    content = f.read()
+        except (OSError, ValueError):
+            # 文件被其他进程淘汰或已损坏
+            self._forget(filename)
+            return None
+        if header.get("key") != key:
+            return None
+        return CachedTile(
+            content,
+            header["etag"],
+            header["content_type"],
+            header.get("content_encoding"),
+            length=length,
+            path=None if content is not None else path
+        )
+
+    def contains(self, key: str) -> bool:
+        """是否已缓存（不读取文件，不改变LRU顺序）"""
+        self._ensure_loaded()
+        if not self.enabled:
+            return False
+        with self._lock:
+            return self._filename(key) in self._files
+
+    def put(self, key: str, tile: CachedTile) -> Optional[str]:
+        """
+        写入瓦片，返回内容文件的路径，未写入时返回None
+
+        内存中的内容直接写入；数据流形式的瓦片边读边写，不在内存中缓冲；已是缓存文件的瓦片不再写入
+        """
+        self._ensure_loaded()
+        if not self.enabled or tile.size > self.max_bytes or (tile.content is None and tile.opener is None):
+            return None
+        filename = self._filename(key)
+        header = json.dumps({
+            "key": key,
+            "etag": tile.etag,
+            "content_type": tile.content_type,
+            "content_encoding": tile.content_encoding
+        }).encode("utf-8")
+        path = os.path.join(self.directory, filename)
+        try:
+            # 先删除旧的头文件，替换内容期间其他读取不会得到不一致的头和内容
+            self._remove_file(filename + self.HEADER_SUFFIX)
+            self._write_file(path, lambda f: self._write_content(f, tile))
+            self._write_file(path + self.HEADER_SUFFIX, lambda f: f.write(header))
+        except OSError as e:
+            print(f"[WARN] 写入瓦片磁盘缓存失败: {str(e)}")
+            return None
+        size = len(header) + tile.size
+        evicted = []
+        with self._lock:
+            previous = self._files.pop(filename, None)
+            if previous is not None:
+                self.total_bytes -= previous[1]
+            self._files[filename] = (key, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and self._files:
+                evicted_name, (_, evicted_size) = self._files.popitem(last=False)
+                self.total_bytes -= evicted_size
+                evicted.append(evicted_name)
+        for evicted_name in evicted:
+            self._remove_entry(evicted_name)
+        return path if filename not in evicted else None
+
+    def invalidate_prefix(self, prefix: str):
+        self._ensure_loaded()
+        if not self.enabled:
+            return
+        with self._lock:
+            filenames = [name for name, (key, _) in self._files.items() if key.startswith(prefix)]
+        for filename in filenames:
+            self._forget(filename)
+            self._remove_entry(filename)
+
+    def _write_file(self, path: str, write: Callable):
+        """写入临时文件后原子替换，失败时删除临时文件"""
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    @staticmethod
+    def _write_content(f, tile: CachedTile):
+        if tile.content is not None:
+            f.write(tile.content)
+            return
+        for chunk in tile.opener(0, None):
+            f.write(chunk)
+
+    def _ensure_loaded(self):
+        """首次使用时创建目录并扫描已有的缓存文件"""
+        if self._loaded or self.max_bytes <= 0:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                scanned = list(os.scandir(self.directory))
+            except OSError as e:
+                # 缓存目录不可用时关闭磁盘缓存，只使用内存缓存
+                print(f"[WARN] 瓦片磁盘缓存目录不可用，已关闭磁盘缓存: {str(e)}")
+                self.max_bytes = 0
+                self._loaded = True
+                return
+            headers, contents = {}, {}
+            for entry in scanned:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(".tmp"):
+                    self._remove_file(entry.name)
+                elif entry.name.endswith(self.HEADER_SUFFIX):
+                    headers[entry.name[:-len(self.HEADER_SUFFIX)]] = entry
+                else:
+                    contents[entry.name] = entry
+            entries = []
+            for filename, content_entry in contents.items():
+                header_entry = headers.pop(filename, None)
+                if header_entry is None:
+                    # 头文件未写完的内容文件，或头和内容保存在同一文件中的旧格式缓存
+                    self._remove_file(filename)
+                    continue
+                try:
+                    with open(header_entry.path, "rb") as f:
+                        key = json.loads(f.read())["key"]
+                    header_stat = header_entry.stat()
+                    size = header_stat.st_size + content_entry.stat().st_size
+                except (OSError, ValueError, KeyError):
+                    self._remove_entry(filename)
+                    continue
+                entries.append((header_stat.st_mtime, filename, key, size))
+            for filename in headers:
+                self._remove_file(filename + self.HEADER_SUFFIX)
+            for _, filename, key, size in sorted(entries):
+                self._files[filename] = (key, size)
+                self.total_bytes += size
+            self._loaded = True
+
+    def _forget(self, filename: str):
+        with self._lock:
+            previous = self._files.pop(filename, None)
+            if previous is not None:
+                self.total_bytes -= previous[1]
+
+    def _remove_entry(self, filename: str):
+        """删除头文件和内容文件（正在发送的内容文件在已打开时不受影响）"""
+        self._remove_file(filename + self.HEADER_SUFFIX)
+        self._remove_file(filename)
+
+    def _remove_file(self, filename: str):
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _filename(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+class TileCacheService:
+    """
+    瓦片缓存代理
+
+    依次查找进程内LRU、磁盘缓存，都未命中时从MinIO（或压缩包）读取并写入两级缓存；
+    同一瓦片的并发未命中只读取一次。超过TILE_CACHE_MAX_ITEM_BYTES的瓦片不读入内存，
+    边读边写入磁盘缓存后发送缓存文件，磁盘缓存未启用或Range请求时直接从MinIO按范围流式发送。
+    响应支持强ETag、If-None-Match/304和单段Range请求
+    """
+
+    memory_cache = MemoryTileCache(TILE_CACHE_MEMORY_BYTES, TILE_CACHE_MAX_ITEM_BYTES)
+    disk_cache = DiskTileCache(TILE_CACHE_DIR, TILE_CACHE_DISK_BYTES)
+    _inflight: Dict[str, asyncio.Future] = {}
+
+    async def get_tile(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[CachedTile]],
+        range_request: bool = False
+    ) -> CachedTile:
+        """
+        按缓存键获取瓦片，未命中时调用loader读取
+
+        读取在单独的任务中执行，所有请求（包括发起读取的请求）通过shield等待，
+        某个客户端断开连接（请求被取消）不会中断其他请求共用的读取。
+        range_request为True（Range请求）时，loader返回的数据流形式的大文件不为此完整下载到磁盘缓存
+        """
+        tile = self.memory_cache.get(key)
+        if tile is not None:
+            return tile
+
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._load_tile(key, loader, not range_request))
+            self._inflight[key] = inflight
+            inflight.add_done_callback(lambda future: self._finish_load(key, future))
+        return await asyncio.shield(inflight)
+
+    async def _load_tile(self, key: str, loader: Callable[[], Awaitable[CachedTile]], cache_stream: bool = True) -> CachedTile:
+        """依次从磁盘缓存和loader读取瓦片，并写入两级缓存，cache_stream为False时数据流形式的瓦片不写入磁盘缓存"""
+        tile = await asyncio.to_thread(self.disk_cache.get, key)
+        if tile is None:
+            tile = await loader()
+            if tile.opener is None or cache_stream:
+                tile = await asyncio.to_thread(self._store_on_disk, key, tile)
+        self.memory_cache.put(key, tile)
+        return tile
+
+    def _store_on_disk(self, key: str, tile: CachedTile) -> CachedTile:
+        """写入磁盘缓存；数据流形式的瓦片写入后改为发送缓存文件，未能写入时仍按数据流发送"""
+        path = self.disk_cache.put(key, tile)
+        if tile.opener is not None and path:
+            return CachedTile(None, tile.etag, tile.content_type, tile.content_encoding, length=tile.size, path=path)
+        return tile
+
+    def _finish_load(self, key: str, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # 等待的请求都已取消时避免"exception was never retrieved"警告
+        if not future.cancelled():
+            future.exception()
+
+    async def get_object_tile(
+        self,
+        bucket_name: str,
+        object_name: str,
+        accept_encoding: Optional[str] = None,
+        range_request: bool = False
+    ) -> CachedTile:
+        """
+        获取MinIO对象形式的瓦片，对象不存在时返回404
+
+        客户端接受gzip且瓦片属于预压缩类型时，优先返回上传时保存的gzip版本（原对象名.gz），
+        没有压缩版本时返回原文件
+        """
+        if accept_encoding and is_precompressible(object_name) and accepts_encoding(accept_encoding, "gzip"):
+            variant_name = f"{object_name}{TILE_GZIP_SUFFIX}"
+            variant = await self.get_tile(
+                f"{bucket_name}/{variant_name}",
+                lambda: asyncio.to_thread(self._load_object, bucket_name, variant_name, "gzip"),
+                range_request
+            )
+            if variant.exists:
+                return variant
+        return await self.get_tile(
+            f"{bucket_name}/{object_name}",
+            lambda: asyncio.to_thread(self._load_object, bucket_name, object_name),
+            range_request
+        )
+
+    async def warm_tile(self, key: str, loader: Callable[[], Awaitable[CachedTile]]) -> bool:
+        """
+        预热缓存：瓦片不在缓存中时调用loader读取，返回是否读取了瓦片
+
+        读取的瓦片只写入磁盘缓存，不占用进程内LRU，避免批量预热挤出正在访问的热点瓦片；
+        磁盘缓存未启用时写入进程内LRU
+        """
+        if not self.disk_cache.enabled:
+            if self.memory_cache.contains(key):
+                return False
+            await self.get_tile(key, loader)
+            return True
+        if await asyncio.to_thread(self.disk_cache.contains, key):
+            return False
+        tile = await loader()
+        await asyncio.to_thread(self.disk_cache.put, key, tile)
+        return True
+
+    async def warm_object_tile(self, bucket_name: str, object_name: str) -> bool:
+        """预热MinIO对象形式的瓦片，属于预压缩类型时同时预热gzip版本，返回是否读取了对象"""
+        loaded = False
+        if is_precompressible(object_name):
+            variant_name = f"{object_name}{TILE_GZIP_SUFFIX}"
+            loaded = await self.warm_tile(
+                f"{bucket_name}/{variant_name}",
+                lambda: asyncio.to_thread(self._load_object, bucket_name, variant_name, "gzip")
+            )
+        return await self.warm_tile(
+            f"{bucket_name}/{object_name}",
+            lambda: asyncio.to_thread(self._load_object, bucket_name, object_name)
+        ) or loaded
+
+    def invalidate_prefix(self, key_prefix: str):
+        """删除缓存键以key_prefix开头的所有瓦片（瓦片集或图层被删除时调用）"""
+        self.memory_cache.invalidate_prefix(key_prefix)
+        self.disk_cache.invalidate_prefix(key_prefix)
+
+    @staticmethod
+    def _load_object(bucket_name: str, object_name: str, content_encoding: Optional[str] = None) -> CachedTile:
+        """
+        读取MinIO对象。读取预压缩版本（content_encoding不为空）时，对象不存在返回表示不存在的CachedTile，
+        Content-Type按原文件名确定。超过TILE_CACHE_MAX_ITEM_BYTES的对象不读取内容，返回按需读取的数据流
+        """
+        try:
+            response = minio_client.get_object(bucket_name, object_name)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket"):
+                if content_encoding:
+                    return CachedTile(b"", "", "", content_encoding)
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"瓦片不存在: {object_name}")
+            raise
+        if content_encoding:
+            content_type = get_tile_content_type(object_name[:-len(TILE_GZIP_SUFFIX)])
+        else:
+            content_type = get_tile_content_type(object_name)
+        try:
+            etag = response.headers.get("ETag")
+            length = int(response.headers.get("Content-Length") or -1)
+            # 没有Content-Length时按小文件读取
+            if length <= TILE_CACHE_MAX_ITEM_BYTES:
+                # 预压缩版本带有Content-Encoding: gzip，读取原始字节，不由urllib3自动解压
+                content = response.read(decode_content=False)
+                etag = etag or hashlib.md5(content).hexdigest()
+                return CachedTile(content, make_strong_etag(etag), content_type, content_encoding)
+        finally:
+            # 大文件未读取的响应体随连接一起关闭
+            response.close()
+            response.release_conn()
+        etag = etag or f"{length:x}-{response.headers.get('Last-Modified', '')}"
+        return CachedTile(
+            None,
+            make_strong_etag(etag),
+            content_type,
+            content_encoding,
+            length=length,
+            opener=lambda offset, size: stream_object(bucket_name, object_name, offset, size)
+        )
+
+def stream_object(bucket_name: str, object_name: str, offset: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+    """按范围读取MinIO对象，依次产生字节块（读取原始字节，不自动解压）"""
+    response = minio_client.get_object(bucket_name, object_name, offset=offset, length=length or 0)
+    try:
+        for chunk in response.stream(TILE_STREAM_CHUNK_BYTES, decode_content=False):
+            yield chunk
+    finally:
+        response.close()
+        response.release_conn()
+
+def normalize_tile_path(path: str) -> str:
+    """将请求路径规范化为瓦片集目录（或压缩包索引）中的相对路径，路径跳出瓦片集目录时返回400"""
+    normalized = posixpath.normpath(path.replace("\\", "/")).lstrip("/")
+    if normalized == ".." or normalized.startswith("../"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的瓦片路径")
+    return normalized
+
+def get_tile_cache_control(path: str) -> str:
+    """瓦片内容长期缓存，描述文件每次重新验证"""
+    if path.lower().endswith(TILE_REVALIDATE_EXTENSIONS):
+        return TILE_CACHE_CONTROL_REVALIDATE
+    return TILE_CACHE_CONTROL_IMMUTABLE
+
+def accepts_encoding(header: str, encoding: str) -> bool:
+    """Accept-Encoding请求头是否接受指定的编码（q=0表示不接受）"""
+    for item in header.split(","):
+        parts = [part.strip() for part in item.split(";")]
+        if parts[0].lower() not in (encoding, "*"):
+            continue
+        for param in parts[1:]:
+            if param.lower().startswith("q="):
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match/If-Range中的ETag列表是否包含etag（If-None-Match使用弱比较）"""
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate == etag or candidate == f"W/{etag}":
+            return True
+    return False
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段Range请求头，返回[start, end]闭区间；不是可识别的单段字节范围时返回None（返回完整内容），
+    范围无法满足时抛出416
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # 最后N个字节
+        length = int(end)
+        if length == 0:
+            start, end = size, size - 1
+        else:
+            start, end = max(0, size - length), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="请求的范围无效",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+def read_file_range(path: str, offset: int, length: int) -> Iterator[bytes]:
+    """读取文件中的一段字节，依次产生字节块"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while length > 0:
+            chunk = f.read(min(TILE_STREAM_CHUNK_BYTES, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def build_tile_response(request: Request, tile: CachedTile, path: str) -> Response:
+    """
+    根据条件请求头和Range请求头生成瓦片响应（200/206/304），path为瓦片在瓦片集中的路径
+
+    内存中的瓦片直接返回内容；磁盘缓存文件使用FileResponse发送，Range请求只读取文件中的对应范围；
+    数据流形式的瓦片通过StreamingResponse发送，Range请求只从MinIO读取对应范围
+    """
+    headers = {
+        "ETag": tile.etag,
+        "Cache-Control": get_tile_cache_control(path),
+        "Accept-Ranges": "bytes",
+    }
+    if is_precompressible(path):
+        # 同一路径可能返回压缩或未压缩的内容
+        headers["Vary"] = "Accept-Encoding"
+    if tile.content_encoding:
+        headers["Content-Encoding"] = tile.content_encoding
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, tile.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == tile.etag):
+        byte_range = _parse_range(range_header, tile.size)
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            headers["Content-Range"] = f"bytes {start}-{end}/{tile.size}"
+            if tile.content is not None:
+                return Response(
+                    content=tile.content[start:end + 1],
+                    status_code=status.HTTP_206_PARTIAL_CONTENT,
+                    media_type=tile.content_type,
+                    headers=headers
+                )
+            headers["Content-Length"] = str(length)
+            if tile.path:
+                body = read_file_range(tile.path, start, length)
+            else:
+                body = tile.opener(start, length)
+            return StreamingResponse(
+                body,
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=tile.content_type,
+                headers=headers
+            )
+    if tile.content is not None:
+        return Response(content=tile.content, media_type=tile.content_type, headers=headers)
+    if tile.path:
+        return FileResponse(tile.path, media_type=tile.content_type, headers=headers)
+    headers["Content-Length"] = str(tile.size)
+    return StreamingResponse(tile.opener(0, None), media_type=tile.content_type, headers=headers)
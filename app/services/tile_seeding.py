@@ -0,0 +1,354 @@
+import asyncio
+import math
+import os
+import posixpath
+import threading
+from typing import Any, Awaitable, Callable, Iterable, Iterator, List, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+
+from app.core.minio_client import THREEDTILES_BUCKET_NAME
+from app.tasks.task_manager import raise_if_cancelled
+from app.services.object_cleanup import LIVE_RECORD_FILTER
+from app.services.tile_archive import TileArchiveService, get_archive_object_name, get_archive_tile_cache_key
+from app.services.tile_cache import TileCacheService, normalize_tile_path
+from app.services.tileset_revision import TilesetManifestService
+from app.services.threedtiles_service import ThreeDTilesService
+from app.services.wmts_capabilities import get_layer_tile_matrix_set
+from app.services.wmts_service import WMTS_BUCKET_NAME, get_layer_tile_loader
+from app.utils.geodesy import WGS84_A
+
+# 预热速率（每秒读取的瓦片数，0为不限制）和并发读取数，避免预热占满存储带宽影响正常访问
+TILE_SEEDING_RATE = float(os.getenv("TILE_SEEDING_RATE", "50"))
+TILE_SEEDING_CONCURRENCY = int(os.getenv("TILE_SEEDING_CONCURRENCY", "4"))
+# 正在从存储读取的访问请求达到该数量时暂停预热，0为不检查
+TILE_SEEDING_BUSY_REQUESTS = int(os.getenv("TILE_SEEDING_BUSY_REQUESTS", "16"))
+# 一个预热任务最多包含的瓦片数
+TILE_SEEDING_MAX_TILES = int(os.getenv("TILE_SEEDING_MAX_TILES", "100000"))
+# 场景关注区域的默认半径（米）
+TILE_SEEDING_SCENE_RADIUS = float(os.getenv("TILE_SEEDING_SCENE_RADIUS", "2000"))
+# 预热过程中写入任务进度的间隔（秒）
+TILE_SEEDING_PROGRESS_INTERVAL = float(os.getenv("TILE_SEEDING_PROGRESS_INTERVAL", "2"))
+
+# 访问繁忙时暂停的时间（秒）
+TILE_SEEDING_BUSY_DELAY = 0.5
+WORLD_BBOX = [-180.0, -90.0, 180.0, 90.0]
+
+# 预热一个瓦片，返回是否从存储读取了瓦片（已在缓存中时为False）
+SeedTile = Callable[[], Awaitable[bool]]
+
+def split_bbox(bbox: List[float]) -> List[List[float]]:
+    """跨越180度经线（西大于东）的范围拆分为两个"""
+    west, south, east, north = bbox
+    if west <= east:
+        return [bbox]
+    return [[west, south, 180.0, north], [-180.0, south, east, north]]
+
+def get_scene_bbox(origin: dict, radius: float) -> List[float]:
+    """以场景原点为中心、radius（米）为半径的经纬度范围"""
+    longitude = float(origin.get("longitude") or 0)
+    latitude = float(origin.get("latitude") or 0)
+    delta_latitude = math.degrees(radius / WGS84_A)
+    delta_longitude = min(180.0, delta_latitude / max(math.cos(math.radians(latitude)), 0.01))
+    west, east = longitude - delta_longitude, longitude + delta_longitude
+    if east - west >= 360:
+        west, east = -180.0, 180.0
+    else:
+        west = west + 360 if west < -180 else west
+        east = east - 360 if east > 180 else east
+    return [west, max(-90.0, latitude - delta_latitude), east, min(90.0, latitude + delta_latitude)]
+
+class TileSeedingPlan:
+    """预热计划：预热对象的描述、瓦片数和逐个预热瓦片的函数"""
+
+    def __init__(self, target: dict, total_tiles: int, tiles: Iterable[SeedTile]):
+        self.target = target
+        self.total_tiles = total_tiles
+        self.tiles = tiles
+
+class TileSeeder:
+    """
+    瓦片缓存预热
+
+    按每秒rate个瓦片的速率、concurrency个并发读取瓦片写入磁盘缓存（不占用进程内LRU），
+    正在从存储读取的访问请求达到TILE_SEEDING_BUSY_REQUESTS个时暂停，优先保证正常访问。
+    进度记录在processed_tiles/total_tiles中，cancel_event被设置后在下一个瓦片之前停止
+    """
+
+    def __init__(
+        self,
+        cancel_event: Optional[threading.Event] = None,
+        rate: float = TILE_SEEDING_RATE,
+        concurrency: int = TILE_SEEDING_CONCURRENCY
+    ):
+        self.cancel_event = cancel_event
+        self.rate = rate
+        self.concurrency = max(1, concurrency)
+        self.total_tiles = 0
+        self.processed_tiles = 0
+        self.loaded_tiles = 0
+        self.cached_tiles = 0
+        self.missing_tiles = 0
+        self.failed_tiles = 0
+        self._next_time = 0.0
+        self._last_error: Optional[BaseException] = None
+
+    @property
+    def progress(self) -> int:
+        """预热进度百分比"""
+        if not self.total_tiles:
+            return 0
+        return min(100, int(self.processed_tiles * 100 / self.total_tiles))
+
+    def to_dict(self) -> dict:
+        return {
+            "total_tiles": self.total_tiles,
+            "processed_tiles": self.processed_tiles,
+            "loaded_tiles": self.loaded_tiles,
+            "cached_tiles": self.cached_tiles,
+            "missing_tiles": self.missing_tiles,
+            "failed_tiles": self.failed_tiles,
+        }
+
+    async def run(
+        self,
+        plan: TileSeedingPlan,
+        on_progress: Optional[Callable[["TileSeeder"], Awaitable[Any]]] = None
+    ) -> dict:
+        """执行预热计划，执行期间每隔TILE_SEEDING_PROGRESS_INTERVAL秒调用一次on_progress，返回统计信息"""
+        self.total_tiles = plan.total_tiles
+        tiles = iter(plan.tiles)
+        workers = [asyncio.ensure_future(self._work(tiles)) for _ in range(self.concurrency)]
+        try:
+            while True:
+                done, pending = await asyncio.wait(
+                    workers, timeout=TILE_SEEDING_PROGRESS_INTERVAL, return_when=asyncio.FIRST_EXCEPTION
+                )
+                if on_progress:
+                    try:
+                        await on_progress(self)
+                    except Exception as e:
+                        print(f"[WARN] 写入预热进度失败: {str(e)}")
+                # 任一协程出错（如任务被取消）时停止其他协程
+                if not pending or any(worker.exception() for worker in done):
+                    break
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        for worker in done:
+            worker.result()
+        # 全部瓦片都读取失败时（如存储服务不可用）抛出错误，由任务按重试策略处理
+        if self.failed_tiles and self.failed_tiles == self.processed_tiles and self._last_error is not None:
+            raise self._last_error
+        return self.to_dict()
+
+    async def _work(self, tiles: Iterator[SeedTile]):
+        # 各协程共用同一个迭代器，在事件循环中依次取出瓦片
+        for seed_tile in tiles:
+            raise_if_cancelled(self.cancel_event)
+            await self._wait_for_turn()
+            try:
+                if await seed_tile():
+                    self.loaded_tiles += 1
+                else:
+                    self.cached_tiles += 1
+            except HTTPException as e:
+                if e.status_code != status.HTTP_404_NOT_FOUND:
+                    raise
+                self.missing_tiles += 1
+            except Exception as e:
+                if self.failed_tiles == 0:
+                    print(f"[WARN] 预热瓦片失败: {str(e)}")
+                self.failed_tiles += 1
+                self._last_error = e
+            self.processed_tiles += 1
+
+    async def _wait_for_turn(self):
+        """按速率限制等待，访问繁忙时暂停"""
+        while TILE_SEEDING_BUSY_REQUESTS > 0 and len(TileCacheService._inflight) >= TILE_SEEDING_BUSY_REQUESTS:
+            await asyncio.sleep(TILE_SEEDING_BUSY_DELAY)
+            raise_if_cancelled(self.cancel_event)
+        if self.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        wait = self._next_time - now
+        self._next_time = max(now, self._next_time) + 1 / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class TileSeedingService:
+    """
+    生成瓦片缓存预热计划
+
+    WMTS图层按级别和地理范围计算瓦片行列号；3DTiles瓦片集通过空间索引查找与范围相交的瓦片内容；
+    场景以原点为中心、指定半径的范围预热绑定的WMTS图层。瓦片数超过TILE_SEEDING_MAX_TILES时返回400
+    """
+
+    def __init__(self, db: Any):
+        self.db = db
+
+    async def plan(self, request: dict) -> TileSeedingPlan:
+        """按TileSeedingCreate的内容生成预热计划，预热对象不存在时返回404，参数无效时返回400"""
+        target_type = request.get("target_type")
+        target_id = request.get("target_id") or ""
+        if target_type == "wmts":
+            return await self._plan_wmts(target_id, request.get("min_zoom"), request.get("max_zoom"), request.get("bbox"))
+        if target_type == "threedtiles":
+            return await self._plan_threedtiles(target_id, request.get("bbox"), request.get("geometric_error"))
+        if target_type == "scene":
+            return await self._plan_scene(target_id, request.get("min_zoom"), request.get("max_zoom"), request.get("radius"))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"不支持的预热对象类型: {target_type}")
+
+    async def _plan_wmts(
+        self,
+        wmts_id: str,
+        min_zoom: Optional[int],
+        max_zoom: Optional[int],
+        bbox: Optional[List[float]]
+    ) -> TileSeedingPlan:
+        if not ObjectId.is_valid(wmts_id):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的WMTS图层ID")
+        layer = await self.db.wmts_layers.find_one({"_id": ObjectId(wmts_id), **LIVE_RECORD_FILTER})
+        if not layer:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到指定的WMTS图层")
+        if layer.get("source_type") != "file" or not layer.get("tile_url_template"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="只能预热由后端提供瓦片的文件类型图层")
+
+        layer_min_zoom = layer.get("min_zoom") or 0
+        layer_max_zoom = layer.get("max_zoom") if layer.get("max_zoom") is not None else 18
+        min_zoom = max(layer_min_zoom, min_zoom if min_zoom is not None else layer_min_zoom)
+        max_zoom = min(layer_max_zoom, max_zoom if max_zoom is not None else layer_max_zoom)
+        if min_zoom > max_zoom:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="预热级别范围与图层的级别范围不相交")
+
+        matrix_set = get_layer_tile_matrix_set(layer)
+        ranges = []
+        for zoom in range(min_zoom, max_zoom + 1):
+            for part in split_bbox(bbox or WORLD_BBOX):
+                tile_range = matrix_set.get_tile_range(str(zoom), part)
+                if tile_range:
+                    ranges.append((zoom, tile_range))
+        total_tiles = sum(
+            (max_column - min_column + 1) * (max_row - min_row + 1)
+            for _, (min_column, min_row, max_column, max_row) in ranges
+        )
+        self._check_total_tiles(total_tiles)
+
+        storage = layer.get("storage")
+
+        def iter_tiles() -> Iterator[SeedTile]:
+            for zoom, (min_column, min_row, max_column, max_row) in ranges:
+                for row in range(min_row, max_row + 1):
+                    for column in range(min_column, max_column + 1):
+                        yield self._seed_wmts_tile(wmts_id, storage, zoom, column, row)
+
+        target = {"target_type": "wmts", "wmts_id": wmts_id, "min_zoom": min_zoom, "max_zoom": max_zoom, "bbox": bbox}
+        return TileSeedingPlan(target, total_tiles, iter_tiles())
+
+    @staticmethod
+    def _seed_wmts_tile(wmts_id: str, storage: Optional[str], z: int, x: int, y: int) -> SeedTile:
+        if storage in ("bundle", "mbtiles"):
+            key, loader = get_layer_tile_loader(wmts_id, storage, z, x, y)
+            return lambda: TileCacheService().warm_tile(key, loader)
+        return lambda: TileCacheService().warm_object_tile(WMTS_BUCKET_NAME, f"{wmts_id}/{z}/{x}/{y}.png")
+
+    async def _plan_threedtiles(
+        self,
+        tile_id: str,
+        bbox: Optional[List[float]],
+        geometric_error: Optional[float]
+    ) -> TileSeedingPlan:
+        if not ObjectId.is_valid(tile_id):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的3DTiles模型ID")
+        threedtiles_service = ThreeDTilesService(self.db)
+        tile = await threedtiles_service.get_threedtiles(tile_id)
+        index = await threedtiles_service.get_index(tile)
+
+        if index.is_georeferenced:
+            selected = []
+            for part in split_bbox(bbox or WORLD_BBOX):
+                indexes, truncated = await asyncio.to_thread(
+                    index.query_bbox, part, None, None, geometric_error, TILE_SEEDING_MAX_TILES
+                )
+                if truncated:
+                    self._raise_too_many_tiles()
+                selected.extend(indexes)
+        elif bbox is None:
+            # 未进行地理配准的瓦片集没有地理范围，预热全部瓦片内容
+            selected = range(len(index.tiles))
+        else:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="瓦片集未进行地理配准，无法按地理范围预热")
+
+        paths = ["tileset.json"]
+        seen = set(paths)
+        for tile_index in selected:
+            for uri in index.tiles[tile_index][7] or []:
+                path = uri.split("?", 1)[0].split("#", 1)[0]
+                if "://" in path or path.startswith("/") or path.startswith("data:"):
+                    continue
+                try:
+                    path = normalize_tile_path(path)
+                except HTTPException:
+                    continue
+                if path not in seen:
+                    seen.add(path)
+                    paths.append(path)
+        self._check_total_tiles(len(paths))
+
+        storage = tile.get("storage")
+        revision = tile.get("revision") or 0
+
+        def iter_tiles() -> Iterator[SeedTile]:
+            for path in paths:
+                yield self._seed_threedtiles_file(tile_id, storage, revision, path)
+
+        target = {"target_type": "threedtiles", "tile_id": tile_id, "bbox": bbox, "geometric_error": geometric_error}
+        return TileSeedingPlan(target, len(paths), iter_tiles())
+
+    @staticmethod
+    def _seed_threedtiles_file(tile_id: str, storage: Optional[str], revision: int, path: str) -> SeedTile:
+        if storage == "archive":
+            return lambda: TileCacheService().warm_tile(
+                get_archive_tile_cache_key(tile_id, path),
+                lambda: TileArchiveService().load_tile(get_archive_object_name(tile_id), path)
+            )
+        if revision:
+            async def seed_revision_file() -> bool:
+                object_name = await TilesetManifestService().resolve_object_name(tile_id, revision, path)
+                return await TileCacheService().warm_object_tile(THREEDTILES_BUCKET_NAME, object_name)
+            return seed_revision_file
+        return lambda: TileCacheService().warm_object_tile(THREEDTILES_BUCKET_NAME, posixpath.join(tile_id, path))
+
+    async def _plan_scene(
+        self,
+        scene_id: str,
+        min_zoom: Optional[int],
+        max_zoom: Optional[int],
+        radius: Optional[float]
+    ) -> TileSeedingPlan:
+        from app.models.scene import Scene
+        scene = await asyncio.to_thread(Scene.nodes.get_or_none, uid=scene_id)
+        if not scene:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="场景不存在")
+        binding = getattr(scene, "tiles_binding", None) or {}
+        if not binding.get("wmts_id") or binding.get("enabled") is False:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="场景没有绑定启用的WMTS图层")
+        bbox = get_scene_bbox(getattr(scene, "origin", None) or {}, radius or TILE_SEEDING_SCENE_RADIUS)
+        plan = await self._plan_wmts(binding["wmts_id"], min_zoom, max_zoom, bbox)
+        plan.target = {**plan.target, "target_type": "scene", "scene_id": scene_id}
+        return plan
+
+    @classmethod
+    def _check_total_tiles(cls, total_tiles: int):
+        if total_tiles > TILE_SEEDING_MAX_TILES:
+            cls._raise_too_many_tiles()
+
+    @staticmethod
+    def _raise_too_many_tiles():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"预热范围包含的瓦片数超过上限{TILE_SEEDING_MAX_TILES}，请缩小级别或地理范围"
+        )
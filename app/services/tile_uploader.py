@@ -0,0 +1,275 @@
+import asyncio
+import concurrent.futures
+import gzip
+import mimetypes
+import os
+import posixpath
+import shutil
+import tempfile
+import threading
+import zipfile
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from app.core.minio_client import create_minio_client
+from app.tasks.task_manager import raise_if_cancelled
+from app.utils.minio_reader import MINIO_READ_BLOCK_SIZE
+
+# 同时上传的文件数
+TILE_UPLOAD_CONCURRENCY = int(os.getenv("TILE_UPLOAD_CONCURRENCY", "16"))
+# 分片上传的分片大小（字节，不小于5MB），超过该大小的文件使用分片上传
+TILE_UPLOAD_PART_SIZE = max(5 * 1024 * 1024, int(os.getenv("TILE_UPLOAD_PART_SIZE", str(16 * 1024 * 1024))))
+# 上传过程中写入处理进度的间隔（秒）
+TILE_UPLOAD_PROGRESS_INTERVAL = float(os.getenv("TILE_UPLOAD_PROGRESS_INTERVAL", "2"))
+
+# 预压缩：上传时为可压缩的瓦片文件额外保存gzip版本（原文件名加.gz），由瓦片代理按Accept-Encoding选择
+TILE_PRECOMPRESS_ENABLED = os.getenv("TILE_PRECOMPRESS_ENABLED", "true").lower() == "true"
+# 需要预压缩的扩展名，以及参与预压缩的文件大小范围（字节）
+TILE_PRECOMPRESS_EXTENSIONS = tuple(
+    extension.strip().lower()
+    for extension in os.getenv(
+        "TILE_PRECOMPRESS_EXTENSIONS", ".json,.b3dm,.i3dm,.pnts,.cmpt,.gltf,.bin,.subtree"
+    ).split(",")
+    if extension.strip()
+)
+TILE_PRECOMPRESS_MIN_BYTES = int(os.getenv("TILE_PRECOMPRESS_MIN_BYTES", "1024"))
+TILE_PRECOMPRESS_MAX_BYTES = int(os.getenv("TILE_PRECOMPRESS_MAX_BYTES", str(512 * 1024 * 1024)))
+# 压缩后大小超过原大小的该比例时不保存压缩版本（例如已经Draco压缩的模型）
+TILE_PRECOMPRESS_MAX_RATIO = float(os.getenv("TILE_PRECOMPRESS_MAX_RATIO", "0.9"))
+TILE_PRECOMPRESS_LEVEL = int(os.getenv("TILE_PRECOMPRESS_LEVEL", "6"))
+# 压缩版本的对象名后缀
+TILE_GZIP_SUFFIX = ".gz"
+# 压缩时在内存中缓冲的最大字节数，超过后写入临时文件
+TILE_PRECOMPRESS_SPOOL_BYTES = 8 * 1024 * 1024
+
+# 上传使用的MinIO客户端，连接池可同时容纳每个上传线程的上传请求和ZIP条目的范围读取
+tile_upload_client = create_minio_client(max(10, TILE_UPLOAD_CONCURRENCY * 2))
+
+# 瓦片文件的Content-Type，未列出的扩展名按mimetypes猜测
+TILE_CONTENT_TYPES = {
+    ".json": "application/json",
+    ".b3dm": "application/octet-stream",
+    ".i3dm": "application/octet-stream",
+    ".pnts": "application/octet-stream",
+    ".cmpt": "application/octet-stream",
+    ".subtree": "application/octet-stream",
+    ".glb": "model/gltf-binary",
+    ".gltf": "model/gltf+json",
+    ".bin": "application/octet-stream",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".ktx2": "image/ktx2",
+    ".pbf": "application/x-protobuf",
+    ".mvt": "application/vnd.mapbox-vector-tile",
+}
+
+def is_precompressible(path: str) -> bool:
+    """瓦片文件是否属于需要预压缩的类型"""
+    return posixpath.splitext(path)[1].lower() in TILE_PRECOMPRESS_EXTENSIONS
+
+def get_tile_content_type(path: str) -> str:
+    """根据瓦片文件扩展名获取Content-Type"""
+    extension = posixpath.splitext(path)[1].lower()
+    if extension in TILE_CONTENT_TYPES:
+        return TILE_CONTENT_TYPES[extension]
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+class TileUploader:
+    """
+    瓦片批量上传
+
+    在线程池中并发上传大量瓦片文件到 bucket_name 下的 prefix 目录，按扩展名设置Content-Type，
+    超过TILE_UPLOAD_PART_SIZE的文件使用分片上传。上传进度记录在uploaded_files/total_files
+    和uploaded_bytes/total_bytes中，可在上传过程中读取。
+    precompress为True时，可压缩的文件额外上传gzip版本（压缩效果不明显的除外），数量记录在compressed_files中。
+    任一文件上传失败或cancel_event被设置后，其他线程在下一个文件边界停止，并抛出第一个错误
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        prefix: str,
+        cancel_event: Optional[threading.Event] = None,
+        concurrency: int = TILE_UPLOAD_CONCURRENCY,
+        precompress: bool = TILE_PRECOMPRESS_ENABLED
+    ):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.cancel_event = cancel_event
+        # 并发数不超过上传客户端的连接池大小
+        self.concurrency = max(1, min(concurrency, TILE_UPLOAD_CONCURRENCY))
+        self.precompress = precompress
+        self.compressed_files = 0
+        self.total_files = 0
+        self.uploaded_files = 0
+        self.total_bytes = 0
+        self.uploaded_bytes = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def upload_directory(self, local_dir: str) -> int:
+        """上传本地目录中的所有文件（保持目录结构），返回上传的文件数"""
+        batches = []
+        for root, dirs, files in os.walk(local_dir):
+            for file in files:
+                file_path = os.path.join(root, file)
+                relative_path = os.path.relpath(file_path, local_dir).replace(os.sep, "/")
+                batches.append([(relative_path, os.path.getsize(file_path), file_path)])
+        # 本地文件重新打开的开销很小，压缩时再读取一次，不需要缓冲
+        return self._upload_batches(batches, lambda file_path: open(file_path, "rb"), reopenable=True)
+
+    def upload_zip_entries(
+        self,
+        open_zip: Callable[[], zipfile.ZipFile],
+        entries: List[Tuple[zipfile.ZipInfo, str]]
+    ) -> int:
+        """
+        将ZIP条目解压后直接上传，entries为(条目, 相对路径)列表，返回上传的文件数
+
+        每个上传线程通过open_zip打开各自的ZipFile（例如基于MinIO范围读取），
+        条目按在压缩包中的位置分成连续的批次，同一批次由一个线程顺序读取，使范围读取的缓存块被充分利用。
+        需要预压缩的条目只解压一次，缓冲后分别上传原文件和gzip版本
+        """
+        entries = sorted(entries, key=lambda item: item[0].header_offset)
+        batches, batch, batch_bytes = [], [], 0
+        for member, relative_path in entries:
+            batch.append((relative_path, member.file_size, member))
+            batch_bytes += member.compress_size
+            if batch_bytes >= MINIO_READ_BLOCK_SIZE:
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+        if batch:
+            batches.append(batch)
+
+        local = threading.local()
+        opened: List[zipfile.ZipFile] = []
+
+        def open_entry(member: zipfile.ZipInfo):
+            zip_file = getattr(local, "zip_file", None)
+            if zip_file is None:
+                zip_file = local.zip_file = open_zip()
+                with self._lock:
+                    opened.append(zip_file)
+            return zip_file.open(member)
+
+        try:
+            return self._upload_batches(batches, open_entry)
+        finally:
+            for zip_file in opened:
+                zip_file.close()
+
+    async def run(
+        self,
+        func: Callable[..., int],
+        *args,
+        on_progress: Optional[Callable[["TileUploader"], Awaitable[Any]]] = None
+    ) -> int:
+        """在线程中执行上传方法，执行期间每隔TILE_UPLOAD_PROGRESS_INTERVAL秒调用一次on_progress"""
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=TILE_UPLOAD_PROGRESS_INTERVAL)
+            if on_progress:
+                try:
+                    await on_progress(self)
+                except Exception as e:
+                    print(f"[WARN] 写入上传进度失败: {str(e)}")
+            if done:
+                return future.result()
+
+    def _upload_batches(
+        self,
+        batches: List[List[Tuple[str, int, Any]]],
+        open_entry: Callable[[Any], Any],
+        reopenable: bool = False
+    ) -> int:
+        """并发上传各批次，每个批次在一个线程中顺序上传，reopenable表示文件可以低成本地再次打开读取"""
+        with self._lock:
+            self.total_files += sum(len(batch) for batch in batches)
+            self.total_bytes += sum(size for batch in batches for _, size, _ in batch)
+        if not batches:
+            return 0
+
+        uploaded = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as executor:
+            futures = [executor.submit(self._upload_batch, batch, open_entry, reopenable) for batch in batches]
+            first_error = None
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    uploaded += future.result()
+                except BaseException as e:
+                    # 通知其他线程停止，保留第一个错误
+                    self._stopped.set()
+                    if first_error is None:
+                        first_error = e
+        if first_error is not None:
+            raise first_error
+        return uploaded
+
+    def _upload_batch(self, batch: List[Tuple[str, int, Any]], open_entry: Callable[[Any], Any], reopenable: bool) -> int:
+        """
+        顺序上传一个批次中的文件
+
+        需要预压缩且不能低成本地再次读取的文件（如ZIP条目）先读入缓冲（超过TILE_PRECOMPRESS_SPOOL_BYTES时写入临时文件），
+        原文件和gzip版本都从缓冲中上传，避免再次解压和范围读取
+        """
+        uploaded = 0
+        for relative_path, size, source in batch:
+            if self._stopped.is_set():
+                break
+            raise_if_cancelled(self.cancel_event)
+            precompress = self.precompress and self._should_precompress(relative_path, size)
+            if precompress and not reopenable:
+                with tempfile.SpooledTemporaryFile(max_size=TILE_PRECOMPRESS_SPOOL_BYTES) as buffer:
+                    with open_entry(source) as stream:
+                        shutil.copyfileobj(stream, buffer, 1024 * 1024)
+                    buffer.seek(0)
+                    self._put_file(relative_path, size, buffer)
+                    buffer.seek(0)
+                    self._upload_gzip_variant(relative_path, size, buffer)
+            else:
+                with open_entry(source) as stream:
+                    self._put_file(relative_path, size, stream)
+                if precompress:
+                    with open_entry(source) as stream:
+                        self._upload_gzip_variant(relative_path, size, stream)
+            uploaded += 1
+            with self._lock:
+                self.uploaded_files += 1
+                self.uploaded_bytes += size
+        return uploaded
+
+    def _put_file(self, relative_path: str, size: int, stream):
+        tile_upload_client.put_object(
+            self.bucket_name,
+            f"{self.prefix}/{relative_path}",
+            stream,
+            length=size,
+            content_type=get_tile_content_type(relative_path),
+            part_size=TILE_UPLOAD_PART_SIZE
+        )
+
+    def _should_precompress(self, relative_path: str, size: int) -> bool:
+        return TILE_PRECOMPRESS_MIN_BYTES <= size <= TILE_PRECOMPRESS_MAX_BYTES and is_precompressible(relative_path)
+
+    def _upload_gzip_variant(self, relative_path: str, size: int, stream):
+        """流式gzip压缩文件，压缩后明显变小时上传为 原对象名.gz，Content-Type与原文件相同"""
+        with tempfile.SpooledTemporaryFile(max_size=TILE_PRECOMPRESS_SPOOL_BYTES) as buffer:
+            # mtime固定为0，同一文件每次压缩的结果相同
+            with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=TILE_PRECOMPRESS_LEVEL, mtime=0) as compressor:
+                shutil.copyfileobj(stream, compressor, 1024 * 1024)
+            compressed_size = buffer.tell()
+            if compressed_size > size * TILE_PRECOMPRESS_MAX_RATIO:
+                return
+            buffer.seek(0)
+            tile_upload_client.put_object(
+                self.bucket_name,
+                f"{self.prefix}/{relative_path}{TILE_GZIP_SUFFIX}",
+                buffer,
+                length=compressed_size,
+                content_type=get_tile_content_type(relative_path),
+                part_size=TILE_UPLOAD_PART_SIZE,
+                metadata={"Content-Encoding": "gzip"}
+            )
+        with self._lock:
+            self.compressed_files += 1
@@ -0,0 +1,207 @@
+import math
+import os
+import posixpath
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.services.tileset_index import TilesetIndexWriter, get_content_uris
+from app.utils.geodesy import IDENTITY_MATRIX, TilesetExtentBuilder, multiply_matrices
+from app.utils.json_stream import JsonStreamReader
+
+# 瓦片数和层级深度的上限，超过时拒绝入库（异常的tileset.json会占用大量资源且无法正常加载）
+TILESET_MAX_TILES = int(os.getenv("TILESET_MAX_TILES", "2000000"))
+TILESET_MAX_DEPTH = min(int(os.getenv("TILESET_MAX_DEPTH", "128")), 256)
+# 统计信息中最多列出的外部tileset地址数
+TILESET_STATS_MAX_EXTERNAL = 100
+
+TileItem = Tuple[dict, List[float], int, int]
+
+class TilesetTooComplexError(ValueError):
+    """tileset.json的瓦片数或层级深度超过上限"""
+    pass
+
+class TilesetStreamWalker:
+    """
+    流式遍历tileset.json的瓦片层级，返回值与geodesy.walk_tiles相同：
+    按先序依次返回(不含children的瓦片, 累乘后的transform, 深度, 父瓦片序号)
+
+    瓦片对象中children出现在boundingVolume之后时（常见的写法）逐个展开子瓦片，内存占用与文件大小无关；
+    children出现在前面时无法确定之后是否还有transform，该子树整体解析后再遍历。
+    tileset.json中root以外的顶层属性在遍历结束后保存在header中
+    """
+
+    def __init__(self, stream: BinaryIO, max_tiles: int = TILESET_MAX_TILES, max_depth: int = TILESET_MAX_DEPTH):
+        self.reader = JsonStreamReader(stream)
+        self.max_tiles = max_tiles
+        self.max_depth = max_depth
+        self.header: dict = {}
+        self.tile_count = 0
+
+    def __iter__(self) -> Iterator[TileItem]:
+        for key in self.reader.iter_object():
+            if key == "root":
+                yield from self._iter_streamed_tile(IDENTITY_MATRIX, 0, -1)
+            else:
+                self.header[key] = self.reader.read_value()
+
+    def _next_index(self, depth: int) -> int:
+        if depth > self.max_depth:
+            raise TilesetTooComplexError(f"瓦片层级深度超过上限{self.max_depth}")
+        if self.tile_count >= self.max_tiles:
+            raise TilesetTooComplexError(f"瓦片数超过上限{self.max_tiles}")
+        self.tile_count += 1
+        return self.tile_count - 1
+
+    def _iter_streamed_tile(self, parent_transform: List[float], depth: int, parent: int) -> Iterator[TileItem]:
+        reader = self.reader
+        tile: dict = {}
+        index = None
+        transform = parent_transform
+        loaded_children = None
+        for key in reader.iter_object():
+            if key == "children" and index is None and "boundingVolume" in tile:
+                transform = _apply_transform(tile, parent_transform)
+                index = self._next_index(depth)
+                yield tile, transform, depth, parent
+                for _ in reader.iter_array():
+                    yield from self._iter_streamed_tile(transform, depth + 1, index)
+            elif key == "children" and index is None:
+                loaded_children = reader.read_value()
+            elif index is None:
+                tile[key] = reader.read_value()
+            else:
+                # children之后的属性对已展开的子瓦片不再生效
+                reader.read_value()
+                if key == "transform":
+                    print("[WARN] tileset.json中transform出现在children之后，子瓦片的坐标可能不正确")
+        if index is None:
+            transform = _apply_transform(tile, parent_transform)
+            index = self._next_index(depth)
+            yield tile, transform, depth, parent
+            for child in loaded_children or []:
+                yield from self._iter_loaded_tile(child, transform, depth + 1, index)
+
+    def _iter_loaded_tile(self, tile: dict, parent_transform: List[float], depth: int, parent: int) -> Iterator[TileItem]:
+        children = tile.pop("children", None) or []
+        transform = _apply_transform(tile, parent_transform)
+        index = self._next_index(depth)
+        yield tile, transform, depth, parent
+        for child in children:
+            yield from self._iter_loaded_tile(child, transform, depth + 1, index)
+
+def _apply_transform(tile: dict, parent_transform: List[float]) -> List[float]:
+    if tile.get("transform"):
+        return multiply_matrices(parent_transform, tile["transform"])
+    return parent_transform
+
+class TilesetStatistics:
+    """
+    逐个瓦片累计tileset.json的统计信息：各层级的瓦片数和几何误差范围、几何误差分布（按数量级）、
+    内容类型、内容文件总字节数（提供file_sizes时）和引用的外部tileset
+    """
+
+    def __init__(self, file_sizes: Optional[Dict[str, int]] = None):
+        self.file_sizes = file_sizes
+        self.tile_count = 0
+        self.content_count = 0
+        self.content_bytes = 0
+        self.missing_contents = 0
+        self.levels: List[dict] = []
+        self.geometric_error_histogram: Dict[str, int] = {}
+        self.content_types: Dict[str, int] = {}
+        self.external_tileset_count = 0
+        self.external_tilesets: List[str] = []
+
+    def add(self, tile: dict, transform: Sequence[float], depth: int, parent: int):
+        self.tile_count += 1
+        while len(self.levels) <= depth:
+            self.levels.append({
+                "depth": len(self.levels),
+                "tile_count": 0,
+                "content_count": 0,
+                "min_geometric_error": None,
+                "max_geometric_error": None,
+            })
+        level = self.levels[depth]
+        level["tile_count"] += 1
+
+        geometric_error = tile.get("geometricError")
+        if isinstance(geometric_error, (int, float)):
+            if level["min_geometric_error"] is None or geometric_error < level["min_geometric_error"]:
+                level["min_geometric_error"] = geometric_error
+            if level["max_geometric_error"] is None or geometric_error > level["max_geometric_error"]:
+                level["max_geometric_error"] = geometric_error
+            bucket = _get_geometric_error_bucket(geometric_error)
+            self.geometric_error_histogram[bucket] = self.geometric_error_histogram.get(bucket, 0) + 1
+
+        for uri in get_content_uris(tile):
+            self.content_count += 1
+            level["content_count"] += 1
+            path = uri.split("?", 1)[0].split("#", 1)[0]
+            extension = posixpath.splitext(path)[1].lower() or "(none)"
+            self.content_types[extension] = self.content_types.get(extension, 0) + 1
+            if extension == ".json":
+                self.external_tileset_count += 1
+                if len(self.external_tilesets) < TILESET_STATS_MAX_EXTERNAL:
+                    self.external_tilesets.append(uri)
+            if self.file_sizes is not None and "://" not in path and not path.startswith("data:"):
+                self._add_content_size(posixpath.normpath(path.lstrip("/")))
+
+    def _add_content_size(self, path: str):
+        size = self.file_sizes.get(path)
+        if size is None:
+            self.missing_contents += 1
+        else:
+            self.content_bytes += size
+
+    def to_dict(self) -> dict:
+        return {
+            "tile_count": self.tile_count,
+            "max_depth": len(self.levels) - 1 if self.levels else None,
+            "content_count": self.content_count,
+            "content_bytes": self.content_bytes if self.file_sizes is not None else None,
+            "missing_contents": self.missing_contents if self.file_sizes is not None else None,
+            "levels": self.levels,
+            "geometric_error_histogram": self.geometric_error_histogram,
+            "content_types": self.content_types,
+            "external_tileset_count": self.external_tileset_count,
+            "external_tilesets": self.external_tilesets,
+        }
+
+def _get_geometric_error_bucket(geometric_error: float) -> str:
+    """几何误差所在的数量级区间，如 "1e2" 表示[100, 1000)"""
+    if geometric_error <= 0:
+        return "0"
+    return f"1e{math.floor(math.log10(geometric_error))}"
+
+class TilesetAnalysis:
+    """tileset.json的分析结果：顶层属性、地理范围、统计信息和空间索引"""
+
+    def __init__(self, header: dict, extent: Optional[dict], statistics: dict, index: TilesetIndexWriter):
+        self.header = header
+        self.extent = extent
+        self.statistics = statistics
+        self.index = index
+
+def analyze_tileset(stream: BinaryIO, file_sizes: Optional[Dict[str, int]] = None) -> TilesetAnalysis:
+    """
+    流式读取tileset.json，一次遍历同时计算地理范围、统计信息并生成空间索引
+
+    file_sizes为瓦片集目录中 相对路径 -> 字节数，用于统计内容文件总大小。
+    瓦片数或层级深度超过上限时抛出TilesetTooComplexError，JSON格式错误时抛出JsonStreamError
+    """
+    walker = TilesetStreamWalker(stream)
+    extent = TilesetExtentBuilder()
+    statistics = TilesetStatistics(file_sizes)
+    index = TilesetIndexWriter()
+    try:
+        for tile, transform, depth, parent in walker:
+            extent.add(tile, transform, depth, parent)
+            statistics.add(tile, transform, depth, parent)
+            index.add(tile, transform, depth, parent)
+        index.finish(walker.header.get("geometricError"))
+    except BaseException:
+        index.close()
+        raise
+    result = statistics.to_dict()
+    result["tileset_json_bytes"] = walker.reader.bytes_read
+    return TilesetAnalysis(walker.header, extent.result(), result, index)
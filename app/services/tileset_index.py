@@ -0,0 +1,384 @@
+import asyncio
+import json
+import math
+import os
+import posixpath
+import tempfile
+from array import array
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from minio.error import S3Error
+
+from app.core.minio_client import minio_client, THREEDTILES_BUCKET_NAME
+from app.utils.geodesy import (
+    bbox_intersects,
+    get_bounding_volume_extent,
+    get_bounding_volume_sphere,
+    merge_spheres,
+    union_longitude_ranges,
+)
+
+# 本进程内缓存的瓦片集空间索引数量
+TILESET_INDEX_CACHE_SIZE = int(os.getenv("TILESET_INDEX_CACHE_SIZE", "32"))
+# 生成空间索引时在内存中缓冲的最大字节数，超过后写入临时文件
+TILESET_INDEX_SPOOL_BYTES = 16 * 1024 * 1024
+# 单次空间查询最多返回的瓦片数，超过时结果被截断
+TILESET_QUERY_MAX_RESULTS = int(os.getenv("TILESET_QUERY_MAX_RESULTS", "5000"))
+
+# 空间索引在tile_id目录下的对象名（与tileset.json或tileset.3tz保存在一起）
+TILESET_INDEX_OBJECT_NAME = "tileset.index.json"
+TILESET_INDEX_VERSION = 1
+
+# 索引中的细化方式
+REFINE_REPLACE = 0
+REFINE_ADD = 1
+
+# 计算屏幕空间误差时的最小距离（米），避免相机位于包围球内时除以0
+SSE_MIN_DISTANCE = 1e-3
+
+def _round(values: Sequence[float], digits: int) -> List[float]:
+    return [round(value, digits) for value in values]
+
+def get_content_uris(tile: dict) -> List[str]:
+    """瓦片的内容地址：content.uri（旧版本为content.url）或3D Tiles 1.1的contents[].uri"""
+    contents = list(tile.get("contents") or [])
+    if tile.get("content"):
+        contents.insert(0, tile["content"])
+    uris = []
+    for content in contents:
+        uri = content.get("uri") or content.get("url")
+        if uri:
+            uris.append(uri)
+    return uris
+
+def _merge_bbox(a: Optional[list], b: Optional[list]) -> Optional[list]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    west, east = union_longitude_ranges([(a[0], a[2]), (b[0], b[2])])
+    return [west, min(a[1], b[1]), east, max(a[3], b[3])]
+
+class TilesetIndexWriter:
+    """
+    按先序逐个瓦片生成空间索引，写入临时文件（超过TILESET_INDEX_SPOOL_BYTES后落盘），
+    内存占用与瓦片数无关，可用于流式遍历的tileset.json
+
+    每个瓦片记录父瓦片序号、深度、细化方式、几何误差、地理范围（[西, 南, 东, 北]和高度范围）、
+    ECEF外接球和内容地址。tileset.json的瓦片层级本身就是一棵包围体层次树，
+    加载索引时再自底向上合并出各子树的范围用于剪枝，因此不需要另外构建R树
+    """
+
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(max_size=TILESET_INDEX_SPOOL_BYTES)
+        self.tile_count = 0
+        self.size = 0
+        # 各瓦片的细化方式，子瓦片未指定时继承父瓦片
+        self._refines = array("b")
+        self.file.write(b'{"version":%d,"tiles":[' % TILESET_INDEX_VERSION)
+
+    def add(self, tile: dict, transform: Sequence[float], depth: int, parent: int):
+        refine = tile.get("refine")
+        if isinstance(refine, str):
+            refine = REFINE_ADD if refine.upper() == "ADD" else REFINE_REPLACE
+        else:
+            # 未指定时继承父瓦片，根瓦片默认为REPLACE
+            refine = self._refines[parent] if parent >= 0 else REFINE_REPLACE
+        self._refines.append(refine)
+
+        bounding_volume = tile.get("boundingVolume")
+        try:
+            extent = get_bounding_volume_extent(bounding_volume, transform)
+            sphere = get_bounding_volume_sphere(bounding_volume, transform)
+        except (TypeError, ValueError, IndexError):
+            extent, sphere = None, None
+        entry = [
+            parent,
+            depth,
+            refine,
+            float(tile.get("geometricError") or 0.0),
+            _round(extent[0], 8) if extent else None,
+            _round(extent[1:], 3) if extent else None,
+            _round(sphere, 3) if sphere else None,
+            get_content_uris(tile),
+        ]
+        if self.tile_count:
+            self.file.write(b",")
+        self.file.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+        self.tile_count += 1
+
+    def finish(self, geometric_error: Optional[float] = None) -> int:
+        """写入结尾并回到文件开头，返回索引的字节数"""
+        self.file.write(b'],"geometric_error":%s}' % json.dumps(float(geometric_error or 0.0)).encode("ascii"))
+        self.size = self.file.tell()
+        self.file.seek(0)
+        return self.size
+
+    def close(self):
+        self.file.close()
+
+class TilesetIndex:
+    """
+    加载后的瓦片集空间索引
+
+    tiles中每一项为[父瓦片序号, 深度, 细化方式, 几何误差, 地理范围, 高度范围, 外接球, 内容地址列表]，
+    加载时按序号倒序（子瓦片总在父瓦片之后）合并出子树的地理范围、高度范围和外接球，
+    查询时从根瓦片开始，跳过与查询范围不相交的整棵子树
+    """
+
+    def __init__(self, tiles: List[list]):
+        self.tiles = tiles
+        count = len(tiles)
+        self.children: List[List[int]] = [[] for _ in range(count)]
+        self.subtree_bboxes: List[Optional[list]] = [tile[4] for tile in tiles]
+        self.subtree_heights: List[Optional[list]] = [list(tile[5]) if tile[5] else None for tile in tiles]
+        self.subtree_spheres: List[Optional[tuple]] = [tuple(tile[6]) if tile[6] else None for tile in tiles]
+        for index in range(count - 1, 0, -1):
+            parent = tiles[index][0]
+            self.children[parent].append(index)
+            self.subtree_bboxes[parent] = _merge_bbox(self.subtree_bboxes[parent], self.subtree_bboxes[index])
+            heights = self.subtree_heights[index]
+            if heights:
+                parent_heights = self.subtree_heights[parent]
+                self.subtree_heights[parent] = [
+                    min(parent_heights[0], heights[0]), max(parent_heights[1], heights[1])
+                ] if parent_heights else list(heights)
+            sphere = self.subtree_spheres[index]
+            if sphere:
+                parent_sphere = self.subtree_spheres[parent]
+                self.subtree_spheres[parent] = merge_spheres(parent_sphere, sphere) if parent_sphere else sphere
+        for children in self.children:
+            children.reverse()
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "TilesetIndex":
+        payload = json.loads(data)
+        if payload.get("version") != TILESET_INDEX_VERSION:
+            raise ValueError(f"不支持的空间索引版本: {payload.get('version')}")
+        return cls(payload["tiles"])
+
+    @property
+    def is_georeferenced(self) -> bool:
+        return bool(self.tiles) and self.subtree_bboxes[0] is not None
+
+    def query_bbox(
+        self,
+        bbox: Sequence[float],
+        min_height: Optional[float] = None,
+        max_height: Optional[float] = None,
+        geometric_error: Optional[float] = None,
+        limit: int = TILESET_QUERY_MAX_RESULTS
+    ) -> Tuple[List[int], bool]:
+        """
+        查询与地理范围（以及高度范围）相交的瓦片，返回(瓦片序号列表, 是否被截断)
+
+        指定geometric_error时，几何误差不大于该值的瓦片不再细化；
+        否则细化到叶子瓦片。REPLACE方式细化的瓦片不返回自身内容
+        """
+        def intersects(tile_bbox, heights) -> bool:
+            if tile_bbox is None or not bbox_intersects(tile_bbox, bbox):
+                return False
+            if heights is not None:
+                if min_height is not None and heights[1] < min_height:
+                    return False
+                if max_height is not None and heights[0] > max_height:
+                    return False
+            return True
+
+        return self._select(
+            lambda index: intersects(self.subtree_bboxes[index], self.subtree_heights[index]),
+            lambda index: intersects(self.tiles[index][4], self.tiles[index][5]),
+            lambda index: geometric_error is not None and self.tiles[index][3] <= geometric_error,
+            limit
+        )
+
+    def query_frustum(
+        self,
+        planes: Sequence[Sequence[float]],
+        camera_position: Optional[Sequence[float]] = None,
+        max_screen_space_error: float = 16.0,
+        fov: float = math.pi / 3,
+        screen_height: int = 1080,
+        limit: int = TILESET_QUERY_MAX_RESULTS
+    ) -> Tuple[List[int], bool]:
+        """
+        查询与视锥体相交的瓦片，返回(瓦片序号列表, 是否被截断)
+
+        planes为ECEF坐标系中的平面[nx, ny, nz, d]，法向量指向视锥体内部，
+        外接球满足n·c + d < -r时位于视锥体外。指定相机位置时按屏幕空间误差
+        ge * screen_height / (distance * 2 * tan(fov / 2)) 选择细化层级，不大于max_screen_space_error即停止细化
+        """
+        def inside(sphere) -> bool:
+            if sphere is None:
+                return False
+            x, y, z, radius = sphere
+            return all(plane[0] * x + plane[1] * y + plane[2] * z + plane[3] >= -radius for plane in planes)
+
+        sse_factor = screen_height / (2 * math.tan(fov / 2))
+
+        def is_sufficient(index: int) -> bool:
+            if camera_position is None:
+                return False
+            sphere = self.tiles[index][6] or self.subtree_spheres[index]
+            if sphere is None:
+                return False
+            distance = max(math.dist(camera_position, sphere[:3]) - sphere[3], SSE_MIN_DISTANCE)
+            return self.tiles[index][3] * sse_factor / distance <= max_screen_space_error
+
+        return self._select(
+            lambda index: inside(self.subtree_spheres[index]),
+            lambda index: inside(self.tiles[index][6]),
+            is_sufficient,
+            limit
+        )
+
+    def _select(
+        self,
+        subtree_matches: Callable[[int], bool],
+        tile_matches: Callable[[int], bool],
+        is_sufficient: Callable[[int], bool],
+        limit: int
+    ) -> Tuple[List[int], bool]:
+        """按先序遍历选择瓦片：跳过不相交的子树，满足精度要求或没有子瓦片时停止细化"""
+        if not self.tiles:
+            return [], False
+        selected = []
+        stack = [0]
+        while stack:
+            index = stack.pop()
+            if not subtree_matches(index):
+                continue
+            children = self.children[index]
+            refine = bool(children) and not is_sufficient(index)
+            # REPLACE方式细化时子瓦片替代自身内容，ADD方式细化时自身内容仍需加载
+            if self.tiles[index][7] and tile_matches(index) and (not refine or self.tiles[index][2] == REFINE_ADD):
+                if len(selected) >= limit:
+                    return selected, True
+                selected.append(index)
+            if refine:
+                stack.extend(reversed(children))
+        return selected, False
+
+    def describe(self, indexes: List[int], tileset_url: str) -> List[dict]:
+        """查询结果的瓦片信息，内容地址按tileset.json所在目录解析为可访问的URL"""
+        base_url = posixpath.dirname(tileset_url)
+        results = []
+        for index in indexes:
+            parent, depth, refine, geometric_error, bbox, heights, sphere, uris = self.tiles[index]
+            results.append({
+                "index": index,
+                "depth": depth,
+                "geometric_error": geometric_error,
+                "refine": "ADD" if refine == REFINE_ADD else "REPLACE",
+                "bbox": bbox,
+                "min_height": heights[0] if heights else None,
+                "max_height": heights[1] if heights else None,
+                "uris": uris,
+                "urls": [_resolve_content_url(base_url, uri) for uri in uris],
+            })
+        return results
+
+def _resolve_content_url(base_url: str, uri: str) -> str:
+    if "://" in uri or uri.startswith("/"):
+        return uri
+    return posixpath.join(base_url, uri)
+
+def get_index_object_name(tile_id: str) -> str:
+    """空间索引在THREEDTILES_BUCKET_NAME中的对象名"""
+    return f"{tile_id}/{TILESET_INDEX_OBJECT_NAME}"
+
+class TilesetIndexService:
+    """
+    瓦片集空间索引的保存和加载
+
+    索引在入库时生成并保存到瓦片集目录中；旧的瓦片集没有索引时，在第一次查询时生成并保存。
+    加载后的索引按(tile_id, 版本)缓存在本进程内，版本使用记录的updated_at，记录更新后自动重新加载
+    """
+
+    _indexes: "OrderedDict[tuple, TilesetIndex]" = OrderedDict()
+    _locks: Dict[str, asyncio.Lock] = {}
+
+    def save_index(self, tile_id: str, writer: TilesetIndexWriter) -> None:
+        """保存已生成的空间索引（在线程池中调用）"""
+        writer.file.seek(0)
+        minio_client.put_object(
+            THREEDTILES_BUCKET_NAME,
+            get_index_object_name(tile_id),
+            writer.file,
+            writer.size,
+            content_type="application/json"
+        )
+
+    async def try_save_index(self, tile_id: str, writer: Optional[TilesetIndexWriter]) -> None:
+        """入库时保存空间索引并关闭writer，失败不影响入库（第一次查询时会重新生成）"""
+        if writer is None:
+            return
+        try:
+            await asyncio.to_thread(self.save_index, tile_id, writer)
+        except Exception as e:
+            print(f"[WARN] 保存瓦片集空间索引失败 (非致命错误): {str(e)}")
+        finally:
+            writer.close()
+
+    async def get_index(
+        self,
+        tile_id: str,
+        version: str,
+        build_index: Callable[[], Awaitable[TilesetIndexWriter]]
+    ) -> TilesetIndex:
+        """获取空间索引，依次查找本进程缓存和MinIO中保存的索引，都没有时调用build_index重新生成"""
+        key = (tile_id, version)
+        index = self._get_cached_index(key)
+        if index:
+            return index
+
+        lock = self._locks.setdefault(tile_id, asyncio.Lock())
+        async with lock:
+            index = self._get_cached_index(key)
+            if index:
+                return index
+            try:
+                data = await asyncio.to_thread(self._read_index_object, tile_id)
+                index = TilesetIndex.from_json(data)
+            except S3Error as e:
+                if e.code != "NoSuchKey":
+                    raise
+                index = None
+            except ValueError as e:
+                print(f"[WARN] 瓦片集空间索引无效，重新生成: {str(e)}")
+                index = None
+            if index is None:
+                writer = await build_index()
+                try:
+                    await asyncio.to_thread(self.save_index, tile_id, writer)
+                    writer.file.seek(0)
+                    index = TilesetIndex.from_json(writer.file.read())
+                finally:
+                    writer.close()
+
+            self.invalidate(tile_id)
+            self._indexes[key] = index
+            while len(self._indexes) > TILESET_INDEX_CACHE_SIZE:
+                self._indexes.popitem(last=False)
+        self._locks.pop(tile_id, None)
+        return index
+
+    def invalidate(self, tile_id: str):
+        """丢弃瓦片集所有版本的缓存索引"""
+        for key in [key for key in self._indexes if key[0] == tile_id]:
+            self._indexes.pop(key, None)
+
+    def _get_cached_index(self, key: tuple) -> Optional[TilesetIndex]:
+        index = self._indexes.get(key)
+        if index:
+            self._indexes.move_to_end(key)
+        return index
+
+    def _read_index_object(self, tile_id: str) -> bytes:
+        response = minio_client.get_object(THREEDTILES_BUCKET_NAME, get_index_object_name(tile_id))
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
@@ -0,0 +1,263 @@
+import asyncio
+import io
+import json
+import os
+import zipfile
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, status
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+
+from app.core.minio_client import minio_client, THREEDTILES_BUCKET_NAME
+from app.services.object_cleanup import OBJECT_DELETE_BATCH_SIZE
+from app.services.tile_archive import get_tileset_url
+from app.services.tile_uploader import TILE_GZIP_SUFFIX
+from app.services.tileset_index import TILESET_INDEX_OBJECT_NAME
+
+# 本进程内缓存的瓦片集清单数量
+TILESET_MANIFEST_CACHE_SIZE = int(os.getenv("TILESET_MANIFEST_CACHE_SIZE", "64"))
+
+# 清单和增量更新文件在tile_id目录下的子目录
+TILESET_MANIFEST_DIR = ".manifests"
+TILESET_REVISION_DIR = ".revisions"
+TILESET_MANIFEST_VERSION = 1
+
+# 计算本地文件指纹时每次读取的字节数
+FINGERPRINT_READ_SIZE = 1024 * 1024
+
+def get_zip_entry_fingerprint(member: zipfile.ZipInfo) -> str:
+    """压缩包条目的指纹：中央目录中的CRC32和原始大小，不需要读取条目内容"""
+    return f"{member.CRC:08x}:{member.file_size}"
+
+def get_file_fingerprint(file_path: str) -> str:
+    """本地文件的指纹，与压缩包条目的指纹使用相同的格式"""
+    crc, size = 0, 0
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(FINGERPRINT_READ_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return f"{crc:08x}:{size}"
+
+def get_directory_fingerprints(local_dir: str) -> Dict[str, str]:
+    """本地瓦片集目录中所有文件的相对路径 -> 指纹"""
+    fingerprints = {}
+    for root, dirs, files in os.walk(local_dir):
+        for file in files:
+            file_path = os.path.join(root, file)
+            relative_path = os.path.relpath(file_path, local_dir).replace(os.sep, "/")
+            fingerprints[relative_path] = get_file_fingerprint(file_path)
+    return fingerprints
+
+def get_manifest_object_name(tile_id: str, revision: int) -> str:
+    """指定版本的清单在THREEDTILES_BUCKET_NAME中的对象名"""
+    return f"{tile_id}/{TILESET_MANIFEST_DIR}/{revision}.json"
+
+def get_revision_prefix(tile_id: str, revision: int) -> str:
+    """指定版本新增或修改的文件的对象名前缀（不以/结尾），初始版本直接保存在tile_id目录下"""
+    if revision == 0:
+        return tile_id
+    return f"{tile_id}/{TILESET_REVISION_DIR}/{revision}"
+
+def get_revision_tileset_url(tile_id: str, revision: int) -> str:
+    """指定版本的tileset.json地址，增量更新后的版本按清单解析文件所在的对象"""
+    if revision == 0:
+        return get_tileset_url(tile_id)
+    return f"/3dtiles/{tile_id}/revisions/{revision}/tileset.json"
+
+class TilesetManifest:
+    """
+    瓦片集某个版本的文件清单
+
+    entries为 相对路径 -> [指纹, 文件所在的版本]，文件的对象名为 get_revision_prefix(tile_id, 版本)/相对路径。
+    增量更新时未变化的文件沿用原来的对象，新增或修改的文件上传到新版本的目录中
+    """
+
+    def __init__(self, revision: int, entries: Dict[str, list]):
+        self.revision = revision
+        self.entries = entries
+
+    def to_json(self) -> bytes:
+        return json.dumps(
+            {"version": TILESET_MANIFEST_VERSION, "revision": self.revision, "entries": self.entries},
+            separators=(",", ":")
+        ).encode("utf-8")
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "TilesetManifest":
+        payload = json.loads(data)
+        if payload.get("version") != TILESET_MANIFEST_VERSION:
+            raise ValueError(f"不支持的清单版本: {payload.get('version')}")
+        return cls(payload["revision"], payload["entries"])
+
+    @classmethod
+    def initial(cls, fingerprints: Dict[str, str]) -> "TilesetManifest":
+        """入库时生成的初始版本清单"""
+        return cls(0, {path: [fingerprint, 0] for path, fingerprint in fingerprints.items()})
+
+    def get_object_name(self, tile_id: str, path: str) -> Optional[str]:
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        return f"{get_revision_prefix(tile_id, entry[1])}/{path}"
+
+    def get_changed_paths(self, fingerprints: Dict[str, str]) -> List[str]:
+        """新版本中新增或内容变化的文件"""
+        return [
+            path for path, fingerprint in fingerprints.items()
+            if path not in self.entries or self.entries[path][0] != fingerprint
+        ]
+
+    def next_revision(self, fingerprints: Dict[str, str]) -> "TilesetManifest":
+        """按新版本的文件指纹生成下一个版本的清单，未变化的文件沿用原来所在的版本"""
+        revision = self.revision + 1
+        entries = {}
+        for path, fingerprint in fingerprints.items():
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == fingerprint:
+                entries[path] = entry
+            else:
+                entries[path] = [fingerprint, revision]
+        return TilesetManifest(revision, entries)
+
+    def get_obsolete_objects(self, tile_id: str, new_manifest: "TilesetManifest") -> List[str]:
+        """切换到新版本后不再被引用的对象（已删除或已被替换的文件及其gzip版本）"""
+        objects = []
+        for path, entry in self.entries.items():
+            new_entry = new_manifest.entries.get(path)
+            if new_entry is None or new_entry[1] != entry[1]:
+                object_name = f"{get_revision_prefix(tile_id, entry[1])}/{path}"
+                objects.append(object_name)
+                if not path.endswith(TILE_GZIP_SUFFIX):
+                    objects.append(f"{object_name}{TILE_GZIP_SUFFIX}")
+        # 没有清单的旧瓦片集中gzip版本也作为文件列出，去掉重复的对象名
+        return list(dict.fromkeys(objects))
+
+class TilesetManifestService:
+    """
+    瓦片集清单的保存、加载和按清单解析文件
+
+    每个版本的清单在发布后不再修改，按(tile_id, 版本)缓存在本进程内
+    """
+
+    _manifests: "OrderedDict[tuple, TilesetManifest]" = OrderedDict()
+
+    def save_manifest(self, tile_id: str, manifest: TilesetManifest) -> None:
+        """保存清单（在线程池中调用）"""
+        data = manifest.to_json()
+        minio_client.put_object(
+            THREEDTILES_BUCKET_NAME,
+            get_manifest_object_name(tile_id, manifest.revision),
+            io.BytesIO(data),
+            len(data),
+            content_type="application/json"
+        )
+
+    async def try_save_initial_manifest(self, tile_id: str, fingerprints: Dict[str, str]) -> None:
+        """入库时保存初始版本的清单，失败不影响入库（增量更新时按目录中的对象重新生成）"""
+        try:
+            await asyncio.to_thread(self.save_manifest, tile_id, TilesetManifest.initial(fingerprints))
+        except Exception as e:
+            print(f"[WARN] 保存瓦片集清单失败 (非致命错误): {str(e)}")
+
+    async def get_manifest(self, tile_id: str, revision: int) -> Optional[TilesetManifest]:
+        """获取指定版本的清单，不存在时返回None"""
+        key = (tile_id, revision)
+        manifest = self._manifests.get(key)
+        if manifest is not None:
+            self._manifests.move_to_end(key)
+            return manifest
+        try:
+            data = await asyncio.to_thread(self._read_object, get_manifest_object_name(tile_id, revision))
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket"):
+                return None
+            raise
+        manifest = TilesetManifest.from_json(data)
+        self._manifests[key] = manifest
+        while len(self._manifests) > TILESET_MANIFEST_CACHE_SIZE:
+            self._manifests.popitem(last=False)
+        return manifest
+
+    async def get_base_manifest(self, tile_id: str, revision: int) -> TilesetManifest:
+        """
+        获取增量更新的基准清单。入库时没有保存清单的瓦片集按目录中现有的对象生成，
+        这些文件没有指纹，增量更新时会全部重新上传
+        """
+        manifest = await self.get_manifest(tile_id, revision)
+        if manifest is not None:
+            return manifest
+        if revision != 0:
+            raise ValueError(f"瓦片集版本{revision}的清单不存在")
+        return await asyncio.to_thread(self._list_initial_manifest, tile_id)
+
+    async def resolve_object_name(self, tile_id: str, revision: int, path: str) -> str:
+        """按清单解析指定版本中文件的对象名，版本或文件不存在时返回404"""
+        manifest = await self.get_manifest(tile_id, revision)
+        if manifest is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"瓦片集版本不存在: {revision}")
+        object_name = manifest.get_object_name(tile_id, path)
+        if object_name is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"瓦片不存在: {path}")
+        return object_name
+
+    async def get_file_sizes(self, tile_id: str, revision: int) -> Dict[str, int]:
+        """
+        指定版本中各文件的字节数（相对路径 -> 字节数），取自清单中的指纹；
+        入库时没有保存清单的瓦片集按目录中现有的对象统计
+        """
+        manifest = await self.get_manifest(tile_id, revision)
+        if manifest is None:
+            if revision != 0:
+                raise ValueError(f"瓦片集版本{revision}的清单不存在")
+            return await asyncio.to_thread(self._list_file_sizes, tile_id)
+        sizes = {}
+        for path, (fingerprint, _) in manifest.entries.items():
+            size = fingerprint.rpartition(":")[2]
+            if size.isdigit():
+                sizes[path] = int(size)
+        return sizes
+
+    def remove_objects(self, object_names: List[str]) -> int:
+        """批量删除对象（在线程池中调用），返回删除失败的对象数"""
+        failed = 0
+        for start in range(0, len(object_names), OBJECT_DELETE_BATCH_SIZE):
+            batch = [DeleteObject(name) for name in object_names[start:start + OBJECT_DELETE_BATCH_SIZE]]
+            for error in minio_client.remove_objects(THREEDTILES_BUCKET_NAME, batch):
+                print(f"[WARN] 删除对象失败: {error.name}: {error.message}")
+                failed += 1
+        return failed
+
+    def invalidate(self, tile_id: str):
+        """丢弃瓦片集所有版本的缓存清单"""
+        for key in [key for key in self._manifests if key[0] == tile_id]:
+            self._manifests.pop(key, None)
+
+    def _list_initial_manifest(self, tile_id: str) -> TilesetManifest:
+        """按tile_id目录中现有的对象生成没有指纹的初始清单（跳过清单、增量版本和空间索引）"""
+        return TilesetManifest(0, {path: ["", 0] for path in self._list_file_sizes(tile_id)})
+
+    def _list_file_sizes(self, tile_id: str) -> Dict[str, int]:
+        """tile_id目录中现有的瓦片集文件 -> 字节数（跳过清单、增量版本和空间索引）"""
+        prefix = f"{tile_id}/"
+        skipped = (TILESET_MANIFEST_DIR + "/", TILESET_REVISION_DIR + "/")
+        sizes = {}
+        for obj in minio_client.list_objects(THREEDTILES_BUCKET_NAME, prefix=prefix, recursive=True):
+            path = obj.object_name[len(prefix):]
+            if not path or path.startswith(skipped) or path == TILESET_INDEX_OBJECT_NAME:
+                continue
+            sizes[path] = obj.size
+        return sizes
+
+    def _read_object(self, object_name: str) -> bytes:
+        response = minio_client.get_object(THREEDTILES_BUCKET_NAME, object_name)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
@@ -0,0 +1,441 @@
+import math
+import os
+import re
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from bson import ObjectId
+from fastapi import HTTPException, Request, status
+
+from app.services.object_cleanup import LIVE_RECORD_FILTER
+from app.utils.redis import redis_service
+
+# GetCapabilities文档在Redis中的缓存时间（秒），0表示不缓存
+WMTS_CAPABILITIES_TTL = int(os.getenv("WMTS_CAPABILITIES_TTL", "3600"))
+# 本进程内缓存的图层瓦片存储信息数量（KVP方式的GetTile使用）
+WMTS_LAYER_CACHE_SIZE = 1024
+
+WMTS_CAPABILITIES_KEY_PREFIX = "wmts_capabilities:"
+WMTS_CAPABILITIES_ALL = "all"
+
+WMTS_NS = "http://www.opengis.net/wmts/1.0"
+OWS_NS = "http://www.opengis.net/ows/1.1"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+ET.register_namespace("", WMTS_NS)
+ET.register_namespace("ows", OWS_NS)
+ET.register_namespace("xlink", XLINK_NS)
+
+# 文档中本服务的对外地址（如 https://example.com/api），留空时按请求地址和X-Forwarded-Prefix生成
+WMTS_PUBLIC_BASE_URL = os.getenv("WMTS_PUBLIC_BASE_URL", "").rstrip("/")
+
+# 缓存的文档中服务地址的占位符，返回时替换为请求的地址（同一文档可通过不同的域名访问）
+BASE_URL_PLACEHOLDER = "__WMTS_BASE_URL__"
+# 旧图层的瓦片地址模板 /wmts/<id>/{z}/{x}/{y}.png 是MinIO中的对象路径，对外发布为后端的瓦片接口
+LEGACY_TILE_URL_PATTERN = re.compile(r"^/wmts/[^/]+/\{z\}/\{x\}/\{y\}\.png$")
+
+# OGC标准像素大小（米），比例尺分母 = 分辨率（米/像素） / 0.28mm
+OGC_PIXEL_SIZE = 0.00028
+# Esri缓存的比例尺按96 DPI计算，只有比例尺没有分辨率时用于换算
+ESRI_DPI = 96
+INCHES_TO_METERS = 0.0254
+# WGS84椭球赤道上每度的米数，地理坐标系的分辨率单位为度
+METERS_PER_DEGREE = 2 * math.pi * 6378137 / 360
+
+# Web墨卡托（GoogleMapsCompatible）瓦片矩阵集
+WEB_MERCATOR_EXTENT = 20037508.342789244
+WEB_MERCATOR_RESOLUTION = 2 * WEB_MERCATOR_EXTENT / 256
+WEB_MERCATOR_WKIDS = (102100, 102113, 900913, 3857)
+WEB_MERCATOR_MAX_LATITUDE = 85.0511287798066
+GOOGLE_MAPS_COMPATIBLE = "GoogleMapsCompatible"
+GOOGLE_MAPS_SCALE_SET = "urn:ogc:def:wkss:OGC:1.0:GoogleMapsCompatible"
+
+def _child_text(element: ET.Element, name: str) -> Optional[str]:
+    child = element.find(name)
+    return child.text.strip() if child is not None and child.text else None
+
+def get_lod_level(lod: ET.Element) -> int:
+    """conf.xml中LODInfo的级别，兼容level属性和LevelID子元素两种写法"""
+    return int(lod.get("level") or _child_text(lod, "LevelID") or 0)
+
+def parse_conf_xml_tile_matrix(root: ET.Element) -> Optional[dict]:
+    """
+    从tpk的conf.xml（TileCacheInfo）中提取瓦片矩阵定义：
+    坐标系WKID、瓦片原点、瓦片像素大小和各级别的分辨率、比例尺，没有LODInfo时返回None
+    """
+    lods = []
+    for lod in root.findall(".//LODInfo"):
+        resolution = _child_text(lod, "Resolution")
+        scale = _child_text(lod, "Scale")
+        lods.append({
+            "level": get_lod_level(lod),
+            "resolution": float(resolution) if resolution else None,
+            "scale": float(scale) if scale else None,
+        })
+    if not lods:
+        return None
+    origin = root.find(".//TileOrigin")
+    wkid = root.findtext(".//SpatialReference/LatestWKID") or root.findtext(".//SpatialReference/WKID")
+    return {
+        "wkid": int(wkid) if wkid else None,
+        "origin": [float(_child_text(origin, "X")), float(_child_text(origin, "Y"))] if origin is not None else None,
+        "tile_width": int(root.findtext(".//TileCols") or 256),
+        "tile_height": int(root.findtext(".//TileRows") or 256),
+        "lods": sorted(lods, key=lambda lod: lod["level"]),
+    }
+
+def parse_root_json_tile_matrix(tile_info: dict) -> Optional[dict]:
+    """从tpkx的root.json（tileInfo）中提取瓦片矩阵定义，格式与parse_conf_xml_tile_matrix相同"""
+    lods = [
+        {"level": int(lod["level"]), "resolution": lod.get("resolution"), "scale": lod.get("scale")}
+        for lod in tile_info.get("lods") or []
+        if "level" in lod
+    ]
+    if not lods:
+        return None
+    origin = tile_info.get("origin") or {}
+    spatial_reference = tile_info.get("spatialReference") or {}
+    return {
+        "wkid": spatial_reference.get("latestWkid") or spatial_reference.get("wkid"),
+        "origin": [origin["x"], origin["y"]] if "x" in origin and "y" in origin else None,
+        "tile_width": int(tile_info.get("cols") or 256),
+        "tile_height": int(tile_info.get("rows") or 256),
+        "lods": sorted(lods, key=lambda lod: lod["level"]),
+    }
+
+def _get_crs_code(wkid: Optional[int]) -> int:
+    """Esri的WKID转换为EPSG代码，Web墨卡托的各种旧代码统一为3857"""
+    if not wkid or wkid in WEB_MERCATOR_WKIDS:
+        return 3857
+    return int(wkid)
+
+def _get_crs_extent(crs_code: int, origin: List[float]) -> Tuple[float, float]:
+    """坐标系范围的右边界和下边界，用于计算各级别的行列数；未知坐标系按原点对称估算"""
+    if crs_code == 3857:
+        return WEB_MERCATOR_EXTENT, -WEB_MERCATOR_EXTENT
+    if crs_code == 4326:
+        return 180.0, -90.0
+    return -origin[0], -origin[1]
+
+class TileMatrixSet:
+    """GetCapabilities中的一个瓦片矩阵集"""
+
+    def __init__(self, identifier: str, crs_code: int, matrices: List[dict], well_known_scale_set: Optional[str] = None):
+        self.identifier = identifier
+        self.crs_code = crs_code
+        self.matrices = matrices
+        self.well_known_scale_set = well_known_scale_set
+
+    @classmethod
+    def google_maps_compatible(cls, max_zoom: int) -> "TileMatrixSet":
+        """0到max_zoom级的Web墨卡托瓦片矩阵集"""
+        matrices = []
+        for zoom in range(max_zoom + 1):
+            resolution = WEB_MERCATOR_RESOLUTION / (1 << zoom)
+            matrices.append({
+                "identifier": str(zoom),
+                "resolution": resolution,
+                "scale_denominator": resolution / OGC_PIXEL_SIZE,
+                "top_left": (-WEB_MERCATOR_EXTENT, WEB_MERCATOR_EXTENT),
+                "tile_width": 256,
+                "tile_height": 256,
+                "matrix_width": 1 << zoom,
+                "matrix_height": 1 << zoom,
+            })
+        return cls(GOOGLE_MAPS_COMPATIBLE, 3857, matrices, GOOGLE_MAPS_SCALE_SET)
+
+    @classmethod
+    def from_tile_matrix(cls, identifier: str, tile_matrix: dict) -> "TileMatrixSet":
+        """按tpk/tpkx中的LOD（分辨率和比例尺）、瓦片原点和瓦片大小生成瓦片矩阵集"""
+        crs_code = _get_crs_code(tile_matrix.get("wkid"))
+        meters_per_unit = METERS_PER_DEGREE if crs_code == 4326 else 1.0
+        origin = tile_matrix.get("origin") or [-WEB_MERCATOR_EXTENT, WEB_MERCATOR_EXTENT]
+        max_x, min_y = _get_crs_extent(crs_code, origin)
+        tile_width = tile_matrix.get("tile_width") or 256
+        tile_height = tile_matrix.get("tile_height") or 256
+        # 只有比例尺的级别优先按同时有分辨率和比例尺的级别等比换算，与生成缓存时使用的换算一致
+        reference = next((lod for lod in tile_matrix["lods"] if lod.get("resolution") and lod.get("scale")), None)
+        matrices = []
+        for lod in tile_matrix["lods"]:
+            resolution = lod.get("resolution")
+            if not resolution and reference:
+                resolution = reference["resolution"] * lod["scale"] / reference["scale"]
+            elif not resolution:
+                resolution = lod["scale"] * INCHES_TO_METERS / ESRI_DPI / meters_per_unit
+            matrices.append({
+                "identifier": str(lod["level"]),
+                "resolution": resolution,
+                "scale_denominator": resolution * meters_per_unit / OGC_PIXEL_SIZE,
+                "top_left": (origin[0], origin[1]),
+                "tile_width": tile_width,
+                "tile_height": tile_height,
+                "matrix_width": max(1, math.ceil((max_x - origin[0]) / (tile_width * resolution) - 1e-6)),
+                "matrix_height": max(1, math.ceil((origin[1] - min_y) / (tile_height * resolution) - 1e-6)),
+            })
+        return cls(identifier, crs_code, matrices)
+
+    def get_tile_range(self, identifier: str, bbox: Sequence[float]) -> Optional[Tuple[int, int, int, int]]:
+        """
+        与经纬度范围[西, 南, 东, 北]相交的瓦片的(最小列, 最小行, 最大列, 最大行)，
+        级别不存在、范围不相交或坐标系不是Web墨卡托/WGS84时返回None
+        """
+        matrix = next((matrix for matrix in self.matrices if matrix["identifier"] == identifier), None)
+        if matrix is None:
+            return None
+        west, south, east, north = bbox
+        if self.crs_code == 3857:
+            (west, south), (east, north) = _to_web_mercator(west, south), _to_web_mercator(east, north)
+        elif self.crs_code != 4326:
+            return None
+        origin_x, origin_y = matrix["top_left"]
+        tile_span_x = matrix["tile_width"] * matrix["resolution"]
+        tile_span_y = matrix["tile_height"] * matrix["resolution"]
+        # 范围的东边界和南边界正好落在瓦片边界上时不包含下一个瓦片
+        first_column = math.floor((west - origin_x) / tile_span_x)
+        last_column = max(first_column, math.ceil((east - origin_x) / tile_span_x) - 1)
+        first_row = math.floor((origin_y - north) / tile_span_y)
+        last_row = max(first_row, math.ceil((origin_y - south) / tile_span_y) - 1)
+        min_column, max_column = max(0, first_column), min(matrix["matrix_width"] - 1, last_column)
+        min_row, max_row = max(0, first_row), min(matrix["matrix_height"] - 1, last_row)
+        if min_column > max_column or min_row > max_row:
+            return None
+        return min_column, min_row, max_column, max_row
+
+    def to_element(self, parent: ET.Element):
+        element = ET.SubElement(parent, f"{{{WMTS_NS}}}TileMatrixSet")
+        ET.SubElement(element, f"{{{OWS_NS}}}Identifier").text = self.identifier
+        ET.SubElement(element, f"{{{OWS_NS}}}SupportedCRS").text = f"urn:ogc:def:crs:EPSG::{self.crs_code}"
+        if self.well_known_scale_set:
+            ET.SubElement(element, f"{{{WMTS_NS}}}WellKnownScaleSet").text = self.well_known_scale_set
+        for matrix in self.matrices:
+            matrix_element = ET.SubElement(element, f"{{{WMTS_NS}}}TileMatrix")
+            ET.SubElement(matrix_element, f"{{{OWS_NS}}}Identifier").text = matrix["identifier"]
+            ET.SubElement(matrix_element, f"{{{WMTS_NS}}}ScaleDenominator").text = repr(matrix["scale_denominator"])
+            x, y = matrix["top_left"]
+            # EPSG:4326的坐标轴顺序为纬度在前
+            corner = f"{y!r} {x!r}" if self.crs_code == 4326 else f"{x!r} {y!r}"
+            ET.SubElement(matrix_element, f"{{{WMTS_NS}}}TopLeftCorner").text = corner
+            ET.SubElement(matrix_element, f"{{{WMTS_NS}}}TileWidth").text = str(matrix["tile_width"])
+            ET.SubElement(matrix_element, f"{{{WMTS_NS}}}TileHeight").text = str(matrix["tile_height"])
+            ET.SubElement(matrix_element, f"{{{WMTS_NS}}}MatrixWidth").text = str(matrix["matrix_width"])
+            ET.SubElement(matrix_element, f"{{{WMTS_NS}}}MatrixHeight").text = str(matrix["matrix_height"])
+
+def get_layer_tile_matrix_set(layer: dict) -> TileMatrixSet:
+    """图层使用的瓦片矩阵集：带有LOD定义的图层使用自己的瓦片矩阵集，其他图层使用GoogleMapsCompatible"""
+    metadata = layer.get("metadata") or {}
+    if metadata.get("tile_matrix"):
+        return TileMatrixSet.from_tile_matrix(str(layer["_id"]), metadata["tile_matrix"])
+    max_zoom = layer.get("max_zoom") if layer.get("max_zoom") is not None else 18
+    return TileMatrixSet.google_maps_compatible(max_zoom)
+
+def _to_web_mercator(longitude: float, latitude: float) -> Tuple[float, float]:
+    latitude = max(-WEB_MERCATOR_MAX_LATITUDE, min(WEB_MERCATOR_MAX_LATITUDE, latitude))
+    x = longitude * WEB_MERCATOR_EXTENT / 180
+    y = math.log(math.tan(math.pi / 4 + math.radians(latitude) / 2)) * WEB_MERCATOR_EXTENT / math.pi
+    return x, y
+
+def get_service_base_url(request: Request) -> str:
+    """
+    本服务的对外地址
+
+    优先使用WMTS_PUBLIC_BASE_URL；否则为请求地址（含root_path）加上反向代理去掉的路径前缀（X-Forwarded-Prefix），
+    如nginx将 /api/ 转发到后端时为 http://host/api
+    """
+    if WMTS_PUBLIC_BASE_URL:
+        return WMTS_PUBLIC_BASE_URL
+    base_url = str(request.base_url).rstrip("/")
+    prefix = (request.headers.get("x-forwarded-prefix") or "").strip().rstrip("/")
+    if prefix and not base_url.endswith(prefix):
+        if not prefix.startswith("/"):
+            prefix = "/" + prefix
+        base_url += prefix
+    return base_url
+
+def get_resource_url_template(layer: dict) -> str:
+    """
+    图层的瓦片地址模板转换为WMTS的ResourceURL模板（{z}/{x}/{y}对应TileMatrix/TileCol/TileRow），
+    旧图层的MinIO对象路径转换为读取同一对象的 /wmts/<id>/tiles/ 接口
+    """
+    tile_url_template = layer["tile_url_template"]
+    if LEGACY_TILE_URL_PATTERN.match(tile_url_template):
+        tile_url_template = f"/wmts/{layer['_id']}/tiles" + "/{z}/{x}/{y}.png"
+    return (
+        BASE_URL_PLACEHOLDER
+        + tile_url_template.replace("{z}", "{TileMatrix}").replace("{x}", "{TileCol}").replace("{y}", "{TileRow}")
+    )
+
+def _is_geographic_bounds(bounds: Optional[dict]) -> bool:
+    if not bounds:
+        return False
+    try:
+        return (
+            -180 <= float(bounds["west"]) <= 180 and -180 <= float(bounds["east"]) <= 180
+            and -90 <= float(bounds["south"]) <= 90 and -90 <= float(bounds["north"]) <= 90
+        )
+    except (KeyError, TypeError, ValueError):
+        return False
+
+def render_capabilities(layers: List[dict], service_title: str = "WMTS") -> str:
+    """
+    生成WMTS 1.0.0的GetCapabilities文档，layers为数据库中的图层记录
+
+    tpk/tpkx中带有LOD定义的图层各自生成瓦片矩阵集（标识为图层ID），其他图层共用GoogleMapsCompatible。
+    文档中的服务地址为BASE_URL_PLACEHOLDER，返回前替换为实际地址
+    """
+    root = ET.Element(f"{{{WMTS_NS}}}Capabilities", {"version": "1.0.0"})
+    identification = ET.SubElement(root, f"{{{OWS_NS}}}ServiceIdentification")
+    ET.SubElement(identification, f"{{{OWS_NS}}}Title").text = service_title
+    ET.SubElement(identification, f"{{{OWS_NS}}}ServiceType").text = "OGC WMTS"
+    ET.SubElement(identification, f"{{{OWS_NS}}}ServiceTypeVersion").text = "1.0.0"
+
+    kvp_url = f"{BASE_URL_PLACEHOLDER}/wmts/service?"
+    operations = ET.SubElement(root, f"{{{OWS_NS}}}OperationsMetadata")
+    for operation_name in ("GetCapabilities", "GetTile"):
+        operation = ET.SubElement(operations, f"{{{OWS_NS}}}Operation", {"name": operation_name})
+        http = ET.SubElement(ET.SubElement(operation, f"{{{OWS_NS}}}DCP"), f"{{{OWS_NS}}}HTTP")
+        get = ET.SubElement(http, f"{{{OWS_NS}}}Get", {f"{{{XLINK_NS}}}href": kvp_url})
+        constraint = ET.SubElement(get, f"{{{OWS_NS}}}Constraint", {"name": "GetEncoding"})
+        allowed_values = ET.SubElement(constraint, f"{{{OWS_NS}}}AllowedValues")
+        ET.SubElement(allowed_values, f"{{{OWS_NS}}}Value").text = "KVP"
+
+    contents = ET.SubElement(root, f"{{{WMTS_NS}}}Contents")
+    matrix_sets: List[TileMatrixSet] = []
+    google_max_zoom = -1
+    for layer in layers:
+        layer_id = str(layer["_id"])
+        metadata = layer.get("metadata") or {}
+        min_zoom = layer.get("min_zoom") or 0
+        max_zoom = layer.get("max_zoom") if layer.get("max_zoom") is not None else 18
+        if metadata.get("tile_matrix"):
+            matrix_set = TileMatrixSet.from_tile_matrix(layer_id, metadata["tile_matrix"])
+            matrix_sets.append(matrix_set)
+            limits = None
+        else:
+            matrix_set = None
+            google_max_zoom = max(google_max_zoom, max_zoom)
+            limits = (min_zoom, max_zoom)
+
+        element = ET.SubElement(contents, f"{{{WMTS_NS}}}Layer")
+        ET.SubElement(element, f"{{{OWS_NS}}}Title").text = layer.get("name") or layer_id
+        if layer.get("description"):
+            ET.SubElement(element, f"{{{OWS_NS}}}Abstract").text = layer["description"]
+        bounds = layer.get("bounds")
+        if _is_geographic_bounds(bounds):
+            bbox = ET.SubElement(element, f"{{{OWS_NS}}}WGS84BoundingBox")
+            ET.SubElement(bbox, f"{{{OWS_NS}}}LowerCorner").text = f"{float(bounds['west'])!r} {float(bounds['south'])!r}"
+            ET.SubElement(bbox, f"{{{OWS_NS}}}UpperCorner").text = f"{float(bounds['east'])!r} {float(bounds['north'])!r}"
+        ET.SubElement(element, f"{{{OWS_NS}}}Identifier").text = layer_id
+        style = ET.SubElement(element, f"{{{WMTS_NS}}}Style", {"isDefault": "true"})
+        ET.SubElement(style, f"{{{OWS_NS}}}Identifier").text = "default"
+        tile_format = layer.get("format") or "image/png"
+        ET.SubElement(element, f"{{{WMTS_NS}}}Format").text = tile_format
+
+        link = ET.SubElement(element, f"{{{WMTS_NS}}}TileMatrixSetLink")
+        ET.SubElement(link, f"{{{WMTS_NS}}}TileMatrixSet").text = matrix_set.identifier if matrix_set else GOOGLE_MAPS_COMPATIBLE
+        if limits:
+            limits_element = ET.SubElement(link, f"{{{WMTS_NS}}}TileMatrixSetLimits")
+            for zoom in range(limits[0], limits[1] + 1):
+                limit = ET.SubElement(limits_element, f"{{{WMTS_NS}}}TileMatrixLimits")
+                ET.SubElement(limit, f"{{{WMTS_NS}}}TileMatrix").text = str(zoom)
+                ET.SubElement(limit, f"{{{WMTS_NS}}}MinTileRow").text = "0"
+                ET.SubElement(limit, f"{{{WMTS_NS}}}MaxTileRow").text = str((1 << zoom) - 1)
+                ET.SubElement(limit, f"{{{WMTS_NS}}}MinTileCol").text = "0"
+                ET.SubElement(limit, f"{{{WMTS_NS}}}MaxTileCol").text = str((1 << zoom) - 1)
+
+        ET.SubElement(element, f"{{{WMTS_NS}}}ResourceURL", {
+            "format": tile_format,
+            "resourceType": "tile",
+            "template": get_resource_url_template(layer),
+        })
+
+    if google_max_zoom >= 0:
+        TileMatrixSet.google_maps_compatible(google_max_zoom).to_element(contents)
+    for matrix_set in matrix_sets:
+        matrix_set.to_element(contents)
+    ET.SubElement(root, f"{{{WMTS_NS}}}ServiceMetadataURL", {
+        f"{{{XLINK_NS}}}href": f"{BASE_URL_PLACEHOLDER}/wmts/WMTSCapabilities.xml"
+    })
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(root, encoding="unicode")
+
+def render_exception_report(code: str, message: str, locator: Optional[str] = None) -> str:
+    """OWS异常报告，用于KVP请求参数错误"""
+    root = ET.Element(f"{{{OWS_NS}}}ExceptionReport", {"version": "1.1.0"})
+    attributes = {"exceptionCode": code}
+    if locator:
+        attributes["locator"] = locator
+    exception = ET.SubElement(root, f"{{{OWS_NS}}}Exception", attributes)
+    ET.SubElement(exception, f"{{{OWS_NS}}}ExceptionText").text = message
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(root, encoding="unicode")
+
+class WMTSCapabilitiesService:
+    """
+    生成并缓存WMTS的GetCapabilities文档
+
+    只包含由后端提供瓦片的文件类型图层。文档按图层（或全部图层）缓存在Redis中，
+    图层创建、更新、删除或处理完成时删除缓存；KVP方式的GetTile需要的图层存储信息缓存在本进程内
+    """
+
+    _layers: "OrderedDict[str, dict]" = OrderedDict()
+
+    def __init__(self, db: Any):
+        self.collection = db.wmts_layers
+
+    async def get_capabilities(self, base_url: str, wmts_id: Optional[str] = None) -> str:
+        """获取GetCapabilities文档，base_url为本服务的对外地址（get_service_base_url），wmts_id为空时包含全部图层，图层不存在时返回404"""
+        redis_key = f"{WMTS_CAPABILITIES_KEY_PREFIX}{wmts_id or WMTS_CAPABILITIES_ALL}"
+        document = None
+        if WMTS_CAPABILITIES_TTL > 0:
+            try:
+                document = await redis_service.async_redis_client.get(redis_key)
+            except Exception as e:
+                print(f"[WARN] 读取GetCapabilities缓存失败: {str(e)}")
+        if document is None:
+            layers = await self._find_layers(wmts_id)
+            if wmts_id and not layers:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到指定的WMTS图层")
+            document = render_capabilities(layers, layers[0].get("name") if wmts_id else "WMTS")
+            if WMTS_CAPABILITIES_TTL > 0:
+                try:
+                    await redis_service.async_redis_client.set(redis_key, document, ex=WMTS_CAPABILITIES_TTL)
+                except Exception as e:
+                    print(f"[WARN] 写入GetCapabilities缓存失败: {str(e)}")
+        if isinstance(document, bytes):
+            document = document.decode("utf-8")
+        return document.replace(BASE_URL_PLACEHOLDER, escape(base_url.rstrip("/")))
+
+    async def get_tile_layer(self, wmts_id: str) -> dict:
+        """获取图层的瓦片存储方式（storage），供KVP方式的GetTile使用，图层不存在时返回404"""
+        layer = self._layers.get(wmts_id)
+        if layer is not None:
+            self._layers.move_to_end(wmts_id)
+            return layer
+        layers = await self._find_layers(wmts_id)
+        if not layers:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到指定的WMTS图层")
+        layer = {"storage": layers[0].get("storage")}
+        self._layers[wmts_id] = layer
+        while len(self._layers) > WMTS_LAYER_CACHE_SIZE:
+            self._layers.popitem(last=False)
+        return layer
+
+    async def invalidate(self, wmts_id: Optional[str] = None):
+        """删除图层和全部图层的GetCapabilities缓存（图层创建、更新或删除时调用）"""
+        if wmts_id:
+            self._layers.pop(wmts_id, None)
+        keys = [f"{WMTS_CAPABILITIES_KEY_PREFIX}{WMTS_CAPABILITIES_ALL}"]
+        if wmts_id:
+            keys.append(f"{WMTS_CAPABILITIES_KEY_PREFIX}{wmts_id}")
+        try:
+            await redis_service.async_redis_client.delete(*keys)
+        except Exception as e:
+            print(f"[WARN] 删除GetCapabilities缓存失败: {str(e)}")
+
+    async def _find_layers(self, wmts_id: Optional[str] = None) -> List[dict]:
+        """查询由后端提供瓦片的文件类型图层"""
+        query = {"source_type": "file", "tile_url_template": {"$ne": None}, **LIVE_RECORD_FILTER}
+        if wmts_id:
+            if not ObjectId.is_valid(wmts_id):
+                return []
+            query["_id"] = ObjectId(wmts_id)
+        return await self.collection.find(query).sort("created_at", 1).to_list(length=None)
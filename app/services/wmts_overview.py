@@ -0,0 +1,273 @@
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import struct
+import threading
+import zipfile
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple
+
+from PIL import Image
+
+from app.tasks.task_manager import raise_if_cancelled
+from app.services.mbtiles_store import find_directory_tiles
+from app.services.tile_bundle import (
+    BUNDLE_DIMENSION,
+    BUNDLE_HEADER_SIZE,
+    BUNDLE_INDEX_SIZE,
+    BUNDLE_PATH_PATTERN,
+    TileBundleIndex,
+    get_bundle_relative_path,
+    write_bundle
+)
+
+# 是否为缺少低级别（小比例尺）的WMTS图层生成概览瓦片
+WMTS_OVERVIEW_ENABLED = os.getenv("WMTS_OVERVIEW_ENABLED", "true").lower() == "true"
+# 概览瓦片生成到的最低级别
+WMTS_OVERVIEW_MIN_ZOOM = max(int(os.getenv("WMTS_OVERVIEW_MIN_ZOOM", "0")), 0)
+# 生成概览瓦片的进程数，0为CPU核数
+WMTS_OVERVIEW_WORKERS = int(os.getenv("WMTS_OVERVIEW_WORKERS", "0")) or os.cpu_count() or 1
+
+# 每批提交给进程池的父瓦片数，批次之间检查任务是否已取消
+OVERVIEW_BATCH_SIZE = 256
+# 相邻级别分辨率之比与2的允许偏差
+OVERVIEW_RESOLUTION_TOLERANCE = 0.01
+# zip本地文件头的固定长度
+ZIP_LOCAL_HEADER_SIZE = 30
+
+def render_overview_tile(children: List[Optional[bytes]]) -> Optional[bytes]:
+    """
+    将下一级的4个子瓦片（左上、右上、左下、右下，缺失为None）拼接后缩小一半，返回PNG格式的父瓦片，
+    子瓦片全部缺失或结果完全透明时返回None。在子进程中执行
+    """
+    images: List[Optional[Image.Image]] = []
+    for content in children:
+        image = None
+        if content:
+            try:
+                image = Image.open(io.BytesIO(content))
+                image.load()
+            except Exception as e:
+                print(f"[WARN] 无法解码瓦片图片，按空白处理: {str(e)}")
+                image = None
+        images.append(image)
+    sizes = [image.size for image in images if image is not None]
+    if not sizes:
+        return None
+
+    width, height = sizes[0]
+    mosaic = Image.new("RGBA", (width * 2, height * 2), (0, 0, 0, 0))
+    for position, image in enumerate(images):
+        if image is None:
+            continue
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.LANCZOS)
+        mosaic.paste(image.convert("RGBA"), ((position % 2) * width, (position // 2) * height))
+    tile = mosaic.resize((width, height), Image.LANCZOS)
+    if tile.getchannel("A").getbbox() is None:
+        return None
+
+    output = io.BytesIO()
+    tile.save(output, format="PNG")
+    return output.getvalue()
+
+class DirectoryTileSource:
+    """解压后目录中的单个瓦片文件（z/x/y 或 Esri松散格式），只记录最低级别的瓦片"""
+
+    def __init__(self, local_dir: str):
+        self.min_level: Optional[int] = None
+        self.tiles: Dict[Tuple[int, int], str] = {}
+        for z, x, y, file_path in find_directory_tiles(local_dir):
+            if self.min_level is None or z < self.min_level:
+                self.min_level = z
+                self.tiles = {}
+            if z == self.min_level:
+                self.tiles[(x, y)] = file_path
+
+    def read(self, x: int, y: int) -> Optional[bytes]:
+        file_path = self.tiles.get((x, y))
+        if file_path is None:
+            return None
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+class BundleTileSource:
+    """
+    tpkx压缩包中的紧凑型缓存bundle，只记录最低级别的瓦片
+
+    未压缩存储的bundle（tpkx的通常情况）直接按偏移读取压缩包文件，不需要解压
+    """
+
+    def __init__(self, tpkx_path: str, bundle_entries: List[Tuple[zipfile.ZipInfo, str]]):
+        self.min_level: Optional[int] = None
+        # (x, y) -> (bundle条目, 瓦片在bundle中的偏移, 大小)
+        self.tiles: Dict[Tuple[int, int], Tuple[zipfile.ZipInfo, int, int]] = {}
+        self._zip = zipfile.ZipFile(tpkx_path, "r")
+        self._file: BinaryIO = open(tpkx_path, "rb")
+        self._data_offsets: Dict[str, int] = {}
+        try:
+            levels: Dict[int, List[Tuple[zipfile.ZipInfo, int, int]]] = {}
+            for member, relative_path in bundle_entries:
+                match = BUNDLE_PATH_PATTERN.match(relative_path)
+                if match:
+                    level, row, column = int(match.group(2)), int(match.group(3), 16), int(match.group(4), 16)
+                    levels.setdefault(level, []).append((member, row, column))
+            if levels:
+                self.min_level = min(levels)
+                for member, row, column in levels[self.min_level]:
+                    self._add_bundle(member, row, column)
+        except BaseException:
+            self.close()
+            raise
+
+    def _add_bundle(self, member: zipfile.ZipInfo, row: int, column: int):
+        index = TileBundleIndex.parse(member.filename, self._read_member(member, 0, BUNDLE_HEADER_SIZE + BUNDLE_INDEX_SIZE))
+        for tile_row, tile_column in index.iter_tiles():
+            offset, size = index.get_entry(tile_row, tile_column)
+            self.tiles[(column + tile_column, row + tile_row)] = (member, offset, size)
+
+    def _read_member(self, member: zipfile.ZipInfo, offset: int, size: int) -> bytes:
+        if member.compress_type != zipfile.ZIP_STORED:
+            with self._zip.open(member) as f:
+                f.seek(offset)
+                return f.read(size)
+        data_offset = self._data_offsets.get(member.filename)
+        if data_offset is None:
+            # 本地文件头中的文件名和扩展字段长度可能与中央目录中的不同
+            self._file.seek(member.header_offset)
+            header = self._file.read(ZIP_LOCAL_HEADER_SIZE)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            data_offset = member.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length
+            self._data_offsets[member.filename] = data_offset
+        self._file.seek(data_offset + offset)
+        return self._file.read(size)
+
+    def read(self, x: int, y: int) -> Optional[bytes]:
+        entry = self.tiles.get((x, y))
+        if entry is None:
+            return None
+        member, offset, size = entry
+        return self._read_member(member, offset, size)
+
+    def close(self):
+        self._file.close()
+        self._zip.close()
+
+def get_overview_target_level(min_level: int, tile_matrix: Optional[dict]) -> int:
+    """
+    概览瓦片生成到的最低级别
+
+    tile_matrix中已定义的相邻级别分辨率之比不是2时（非标准切片方案），2×2合并得到的瓦片与该级别不对应，在此停止
+    """
+    target = WMTS_OVERVIEW_MIN_ZOOM
+    lods = {lod["level"]: lod for lod in (tile_matrix or {}).get("lods", [])}
+    level = min_level
+    while level > target:
+        lower, current = lods.get(level - 1), lods.get(level)
+        if lower and current and lower.get("resolution") and current.get("resolution"):
+            ratio = lower["resolution"] / current["resolution"]
+            if abs(ratio - 2) > OVERVIEW_RESOLUTION_TOLERANCE * 2:
+                print(f"[WARN] 级别{level - 1}与{level}的分辨率之比为{ratio:.4f}，不生成级别{level - 1}及以下的概览瓦片")
+                return level
+        level -= 1
+    return target
+
+def add_overview_lods(tile_matrix: Optional[dict], levels: List[int]):
+    """为tile_matrix中未定义的概览级别补充LOD，分辨率和比例尺为上一级的2倍"""
+    if not tile_matrix or not tile_matrix.get("lods"):
+        return
+    lods = {lod["level"]: lod for lod in tile_matrix["lods"]}
+    for level in sorted(levels, reverse=True):
+        if level in lods or level + 1 not in lods:
+            continue
+        finer = lods[level + 1]
+        lods[level] = {
+            "level": level,
+            "resolution": finer["resolution"] * 2 if finer.get("resolution") else None,
+            "scale": finer["scale"] * 2 if finer.get("scale") else None,
+        }
+    tile_matrix["lods"] = [lods[level] for level in sorted(lods)]
+
+def generate_overviews(
+    source,
+    output_dir: str,
+    target_level: int,
+    cancel_event: Optional[threading.Event] = None,
+    workers: int = WMTS_OVERVIEW_WORKERS
+) -> List[int]:
+    """
+    从source的最低级别开始逐级向上合并，生成到target_level为止的概览瓦片，
+    结果以 {z}/{x}/{y}.png 保存在output_dir中，返回生成了瓦片的级别（从高到低）
+    """
+    if source.min_level is None or source.min_level <= target_level:
+        return []
+
+    created_levels = []
+    tiles: Set[Tuple[int, int]] = set(source.tiles)
+    read_child = source.read
+    # 任务处理在线程池中执行，使用spawn启动子进程，避免fork复制其他线程持有的锁
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max(1, workers),
+        mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        for level in range(source.min_level - 1, target_level - 1, -1):
+            parents = sorted({(x // 2, y // 2) for x, y in tiles})
+            created: Set[Tuple[int, int]] = set()
+            for start in range(0, len(parents), OVERVIEW_BATCH_SIZE):
+                raise_if_cancelled(cancel_event)
+                batch = parents[start:start + OVERVIEW_BATCH_SIZE]
+                children = [
+                    [
+                        read_child(x * 2 + dx, y * 2 + dy) if (x * 2 + dx, y * 2 + dy) in tiles else None
+                        for dy in (0, 1) for dx in (0, 1)
+                    ]
+                    for x, y in batch
+                ]
+                for (x, y), content in zip(batch, executor.map(render_overview_tile, children)):
+                    if content is None:
+                        continue
+                    tile_dir = os.path.join(output_dir, str(level), str(x))
+                    os.makedirs(tile_dir, exist_ok=True)
+                    with open(os.path.join(tile_dir, f"{y}.png"), "wb") as f:
+                        f.write(content)
+                    created.add((x, y))
+            if not created:
+                break
+            print(f"[INFO] 已生成级别{level}的概览瓦片 {len(created)} 个")
+            created_levels.append(level)
+            tiles = created
+            read_child = _make_level_reader(output_dir, level)
+    return created_levels
+
+def _make_level_reader(output_dir: str, level: int):
+    """读取已生成的概览瓦片，作为上一级的子瓦片"""
+    def read(x: int, y: int) -> Optional[bytes]:
+        file_path = os.path.join(output_dir, str(level), str(x), f"{y}.png")
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "rb") as f:
+            return f.read()
+    return read
+
+def pack_overview_bundles(overview_dir: str, bundle_dir: str, levels: List[int]) -> int:
+    """将生成的概览瓦片按级别写入bundle文件（路径与tpkx中的bundle统一命名后的相同），返回bundle文件数"""
+    bundle_count = 0
+    for level in levels:
+        bundles: Dict[Tuple[int, int], Dict[Tuple[int, int], bytes]] = {}
+        level_dir = os.path.join(overview_dir, str(level))
+        for column_name in os.listdir(level_dir):
+            for file_name in os.listdir(os.path.join(level_dir, column_name)):
+                column, row = int(column_name), int(os.path.splitext(file_name)[0])
+                with open(os.path.join(level_dir, column_name, file_name), "rb") as f:
+                    content = f.read()
+                bundle_key = (row - row % BUNDLE_DIMENSION, column - column % BUNDLE_DIMENSION)
+                bundles.setdefault(bundle_key, {})[(row % BUNDLE_DIMENSION, column % BUNDLE_DIMENSION)] = content
+        for (row, column), tiles in bundles.items():
+            bundle_path = os.path.join(bundle_dir, get_bundle_relative_path(level, row, column))
+            os.makedirs(os.path.dirname(bundle_path), exist_ok=True)
+            write_bundle(bundle_path, tiles)
+            bundle_count += 1
+    return bundle_count
@@ -5,9 +5,9 @@ import shutil
 import tempfile
 import json
 import asyncio
+import threading
 import concurrent.futures
-import sqlite3
-from typing import List, Optional, Any, Tuple
+from typing import List, Optional, Any, Tuple, Set, Callable, Awaitable
 from datetime import datetime
 from fastapi import UploadFile, HTTPException, status
 from bson import ObjectId
@@ -15,13 +15,57 @@ from motor.motor_asyncio import AsyncIOMotorClient
 
 from app.core.minio_client import minio_client
 from app.models.wmts import WMTSCreate, WMTSInDB, WMTSUpdate, WMTSProcessStatus
+from app.tasks.task_manager import TaskCancelledError, raise_if_cancelled, is_retryable_error
+from app.tasks.checkpoint import TaskCheckpoint
+from app.services.tile_uploader import TileUploader
+from app.services.object_cleanup import ObjectCleanupService, LIVE_RECORD_FILTER, remove_prefix
+from app.services.tile_cache import TileCacheService, CachedTile
+from app.services.tile_bundle import TileBundleService, find_bundle_entries
+from app.services.mbtiles_store import MBTilesService, MBTILES_OBJECT_NAME, build_mbtiles
+from app.services.wmts_overview import (
+    WMTS_OVERVIEW_ENABLED,
+    BundleTileSource,
+    DirectoryTileSource,
+    add_overview_lods,
+    generate_overviews,
+    get_overview_target_level,
+    pack_overview_bundles
+)
+from app.services.wmts_capabilities import (
+    WMTSCapabilitiesService,
+    get_lod_level,
+    parse_conf_xml_tile_matrix,
+    parse_root_json_tile_matrix
+)
 
 # WMTS专用存储桶
 WMTS_BUCKET_NAME = "wmts"
+# 单个瓦片文件的存储方式：mbtiles为打包成一个MBTiles文件，objects为每个瓦片保存为一个对象
+WMTS_TILE_STORAGE = os.getenv("WMTS_TILE_STORAGE", "mbtiles").lower()
 
 # 创建线程池执行器
 thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=10)
 
+def get_layer_tile_loader(
+    wmts_id: str,
+    storage: str,
+    z: int,
+    x: int,
+    y: int
+) -> Tuple[str, Callable[[], Awaitable[CachedTile]]]:
+    """以bundle或MBTiles保存的图层中 z/x/y 瓦片的缓存键和读取函数，读取瓦片和预热缓存共用"""
+    if storage == "bundle":
+        bundle_service = TileBundleService(WMTS_BUCKET_NAME)
+        return (
+            bundle_service.get_tile_cache_key(WMTS_BUCKET_NAME, wmts_id, z, x, y),
+            lambda: bundle_service.load_tile(wmts_id, z, x, y)
+        )
+    mbtiles_service = MBTilesService(WMTS_BUCKET_NAME)
+    return (
+        mbtiles_service.get_tile_cache_key(WMTS_BUCKET_NAME, wmts_id, z, x, y),
+        lambda: mbtiles_service.load_tile(wmts_id, z, x, y)
+    )
+
 class WMTSService:
     def __init__(self, db: Any):
         self.db = db
@@ -36,6 +80,7 @@ class WMTSService:
         wmts_dict["updated_at"] = datetime.utcnow()
         
         result = await self.collection.insert_one(wmts_dict)
+        await WMTSCapabilitiesService(self.db).invalidate()
         created_wmts = await self.collection.find_one({"_id": result.inserted_id})
         # 确保_id字段正确转换为id，并删除原始_id
         created_wmts['id'] = str(created_wmts['_id'])
@@ -44,7 +89,7 @@ class WMTSService:
     
     async def get_wmts_list(self, skip: int = 0, limit: int = 20) -> List[WMTSInDB]:
         """获取WMTS图层列表"""
-        cursor = self.collection.find().skip(skip).limit(limit).sort("created_at", -1)
+        cursor = self.collection.find(LIVE_RECORD_FILTER).skip(skip).limit(limit).sort("created_at", -1)
         wmts_list = []
         async for wmts in cursor:
             # 确保_id字段正确转换为id，并删除原始_id
@@ -56,7 +101,7 @@ class WMTSService:
     async def get_wmts_by_id(self, wmts_id: str) -> Optional[WMTSInDB]:
         """根据ID获取WMTS图层"""
         try:
-            wmts = await self.collection.find_one({"_id": ObjectId(wmts_id)})
+            wmts = await self.collection.find_one({"_id": ObjectId(wmts_id), **LIVE_RECORD_FILTER})
             if wmts:
                 # 确保_id字段正确转换为id，并删除原始_id
                 wmts['id'] = str(wmts['_id'])
@@ -76,29 +121,46 @@ class WMTSService:
             update_dict["updated_at"] = datetime.utcnow()
             
             result = await self.collection.update_one(
-                {"_id": ObjectId(wmts_id)},
+                {"_id": ObjectId(wmts_id), **LIVE_RECORD_FILTER},
                 {"$set": update_dict}
             )
             
             if result.modified_count > 0:
+                await WMTSCapabilitiesService(self.db).invalidate(wmts_id)
                 return await self.get_wmts_by_id(wmts_id)
             return None
         except Exception:
             return None
     
-    async def delete_wmts(self, wmts_id: str) -> bool:
-        """删除WMTS图层"""
-        try:
-            # 先获取WMTS信息，如果是文件类型需要清理MinIO文件
-            wmts = await self.get_wmts_by_id(wmts_id)
-            if wmts and wmts.source_type == "file" and wmts.minio_path:
-                # 异步清理MinIO文件
-                await self.run_in_threadpool(self._clean_minio_files, wmts_id)
-            
-            result = await self.collection.delete_one({"_id": ObjectId(wmts_id)})
-            return result.deleted_count > 0
-        except Exception:
-            return False
+    async def delete_wmts(self, wmts_id: str, user_id: str) -> Optional[str]:
+        """
+        删除WMTS图层
+
+        文件类型的图层立即标记为已删除，MinIO中的瓦片由后台任务批量删除，删除完成后物理删除记录，
+        返回删除任务ID；其他类型的图层没有存储的文件，直接删除记录，返回None。
+        图层不存在时抛出404
+        """
+        wmts = await self.get_wmts_by_id(wmts_id)
+        if not wmts:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到指定的WMTS图层")
+        
+        if wmts.source_type == "file" and wmts.minio_path:
+            task = await ObjectCleanupService(self.db).schedule_deletion(
+                "wmts_layers", wmts_id, WMTS_BUCKET_NAME, user_id, wmts.name
+            )
+            if not task:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到指定的WMTS图层")
+            TileCacheService().invalidate_prefix(f"{WMTS_BUCKET_NAME}/{wmts_id}/")
+            TileBundleService(WMTS_BUCKET_NAME).invalidate_prefix(f"{wmts_id}/")
+            MBTilesService(WMTS_BUCKET_NAME).invalidate(wmts_id)
+            await WMTSCapabilitiesService(self.db).invalidate(wmts_id)
+            return task.task_id
+        
+        result = await self.collection.delete_one({"_id": ObjectId(wmts_id), **LIVE_RECORD_FILTER})
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到指定的WMTS图层")
+        await WMTSCapabilitiesService(self.db).invalidate(wmts_id)
+        return None
     
     # 运行同步代码在线程池中的辅助方法
     async def run_in_threadpool(self, func, *args, **kwargs):
@@ -108,8 +170,16 @@ class WMTSService:
             lambda: func(*args, **kwargs)
         )
         
-    async def create_process_status(self, process_id: str, status: str, message: str, wmts_id: str = None) -> WMTSProcessStatus:
-        """创建或更新处理状态记录"""
+    async def create_process_status(
+        self,
+        process_id: str,
+        status: str,
+        message: str,
+        wmts_id: str = None,
+        uploaded_files: Optional[int] = None,
+        total_files: Optional[int] = None
+    ) -> WMTSProcessStatus:
+        """创建或更新处理状态记录，上传阶段同时记录已上传文件数和文件总数"""
         now = datetime.utcnow()
         status_data = {
             "process_id": process_id,
@@ -120,6 +190,10 @@ class WMTSService:
         
         if wmts_id:
             status_data["wmts_id"] = wmts_id
+        if uploaded_files is not None:
+            status_data["uploaded_files"] = uploaded_files
+        if total_files is not None:
+            status_data["total_files"] = total_files
             
         # 检查是否已存在
         existing = await self.process_status_collection.find_one({"process_id": process_id})
@@ -143,10 +217,23 @@ class WMTSService:
             return None
         return WMTSProcessStatus(**status_data)
     
-    async def process_tpkx_file_async(self, object_id: str, filename: str, wmts_data: WMTSCreate, process_id: str) -> dict:
+    async def process_tpkx_file_async(
+        self,
+        object_id: str,
+        filename: str,
+        wmts_data: WMTSCreate,
+        process_id: str,
+        cancel_event: Optional[threading.Event] = None,
+        work_dir: Optional[str] = None
+    ) -> dict:
         """
         异步处理已上传到MinIO的tpkx文件
         此方法会在后台执行，不会阻塞API响应
+        
+        cancel_event被设置后，解压和上传会在下一个文件边界停止，
+        已上传到MinIO的瓦片和已创建的图层记录会被清理。
+        提供work_dir时下载和解压结果保存在其中并记录检查点，重试时从最后完成的阶段继续；
+        失败结果中的retryable表示错误是否为可重试的瞬时错误
         """
         try:
             # 更新状态为处理中
@@ -169,7 +256,13 @@ class WMTSService:
                     status="failed",
                     message=f"MinIO中未找到文件: {str(e)}"
                 )
-                return {"status": "failed", "message": f"MinIO中未找到文件: {str(e)}"}
+                return {
+                    "status": "failed",
+                    "message": f"MinIO中未找到文件: {str(e)}",
+                    "retryable": is_retryable_error(e)
+                }
+            
+            raise_if_cancelled(cancel_event)
             
             # 创建数据库记录获取ID
             wmts_dict = wmts_data.model_dump()
@@ -190,61 +283,105 @@ class WMTSService:
                 wmts_id=wmts_id
             )
             
-            # 创建临时目录
-            temp_dir = tempfile.mkdtemp()
+            # 使用任务工作目录（重试时保留中间产物），没有时创建临时目录
+            temp_dir = work_dir or tempfile.mkdtemp()
+            checkpoint = TaskCheckpoint(work_dir)
             try:
                 # 从MinIO下载文件到临时目录
                 temp_file_path = os.path.join(temp_dir, filename)
                 object_name = f"{object_id}/{filename}"
                 
-                try:
-                    # 在线程池中执行下载操作
-                    await self.run_in_threadpool(
-                        minio_client.fget_object,
-                        WMTS_BUCKET_NAME, 
-                        object_name,
-                        temp_file_path
-                    )
-                    
-                    # 获取文件大小
-                    file_size = await self.run_in_threadpool(
-                        os.path.getsize,
-                        temp_file_path
-                    )
-                except Exception as e:
-                    # 如果下载失败，删除记录
-                    await self.collection.delete_one({"_id": ObjectId(wmts_id)})
-                    await self.create_process_status(
-                        process_id=process_id,
-                        status="failed",
-                        message=f"从MinIO下载文件失败: {str(e)}"
-                    )
-                    return {"status": "failed", "message": f"从MinIO下载文件失败: {str(e)}"}
+                downloaded = checkpoint.get("downloaded")
+                if downloaded and await self.run_in_threadpool(
+                    self._file_has_size, temp_file_path, downloaded.get("file_size")
+                ):
+                    # 上一次尝试已经完整下载，直接复用
+                    file_size = downloaded["file_size"]
+                    print(f"[INFO] 复用已下载的文件: {temp_file_path}")
+                else:
+                    checkpoint.clear("downloaded", "extracted")
+                    try:
+                        # 在线程池中执行下载操作
+                        await self.run_in_threadpool(
+                            minio_client.fget_object,
+                            WMTS_BUCKET_NAME, 
+                            object_name,
+                            temp_file_path
+                        )
+                        
+                        # 获取文件大小
+                        file_size = await self.run_in_threadpool(
+                            os.path.getsize,
+                            temp_file_path
+                        )
+                    except Exception as e:
+                        # 如果下载失败，删除记录
+                        await self.collection.delete_one({"_id": ObjectId(wmts_id)})
+                        await self.create_process_status(
+                            process_id=process_id,
+                            status="failed",
+                            message=f"从MinIO下载文件失败: {str(e)}"
+                        )
+                        return {
+                            "status": "failed",
+                            "message": f"从MinIO下载文件失败: {str(e)}",
+                            "retryable": is_retryable_error(e)
+                        }
+                    checkpoint.save("downloaded", file_size=file_size)
                 
-                # 解压tpkx文件到临时目录下的特定文件夹
-                extract_dir = os.path.join(temp_dir, wmts_id)
-                await self.run_in_threadpool(
-                    os.makedirs,
-                    extract_dir, 
-                    exist_ok=True
+                raise_if_cancelled(cancel_event)
+                
+                # 瓦片以紧凑型缓存bundle保存时，bundle文件直接从tpkx上传，只解压元数据文件
+                bundle_entries = await self.run_in_threadpool(
+                    self._find_tpkx_bundles,
+                    temp_file_path
                 )
                 
-                try:
-                    # 在线程池中执行解压操作 (tpkx实际上是ZIP格式)
+                # 解压tpkx文件到临时目录下的特定文件夹
+                extract_dir = os.path.join(temp_dir, "tiles")
+                
+                if checkpoint.done("extracted") and await self.run_in_threadpool(os.path.isdir, extract_dir):
+                    # 上一次尝试已经完成解压，直接复用
+                    print(f"[INFO] 复用已解压的文件: {extract_dir}")
+                else:
+                    checkpoint.clear("extracted")
+                    # 清除上一次未完成的解压结果
                     await self.run_in_threadpool(
-                        self._extract_tpkx_file,
-                        temp_file_path, 
-                        extract_dir
+                        shutil.rmtree,
+                        extract_dir,
+                        ignore_errors=True
                     )
-                except Exception as e:
-                    # 如果解压失败，删除记录
-                    await self.collection.delete_one({"_id": ObjectId(wmts_id)})
-                    await self.create_process_status(
-                        process_id=process_id,
-                        status="failed",
-                        message=f"解压tpkx文件失败: {str(e)}"
+                    await self.run_in_threadpool(
+                        os.makedirs,
+                        extract_dir, 
+                        exist_ok=True
                     )
-                    return {"status": "failed", "message": f"解压tpkx文件失败: {str(e)}"}
+                    
+                    try:
+                        # 在线程池中执行解压操作 (tpkx实际上是ZIP格式)
+                        await self.run_in_threadpool(
+                            self._extract_tpkx_file,
+                            temp_file_path, 
+                            extract_dir,
+                            cancel_event,
+                            {member.filename for member, _ in bundle_entries}
+                        )
+                    except TaskCancelledError:
+                        raise
+                    except Exception as e:
+                        # 如果解压失败，删除记录
+                        await self.collection.delete_one({"_id": ObjectId(wmts_id)})
+                        await self.create_process_status(
+                            process_id=process_id,
+                            status="failed",
+                            message=f"解压tpkx文件失败: {str(e)}"
+                        )
+                        return {
+                            "status": "failed",
+                            "message": f"解压tpkx文件失败: {str(e)}",
+                            "retryable": is_retryable_error(e)
+                        }
+                    checkpoint.save("extracted")
                 
                 # 更新状态
                 await self.create_process_status(
@@ -269,6 +406,57 @@ class WMTSService:
                     )
                     return {"status": "failed", "message": "无法解析tpkx文件元数据"}
                 
+                # 瓦片缺少低级别（小比例尺）时逐级合并生成概览瓦片，与原有瓦片使用相同的存储方式
+                overview_dir = os.path.join(temp_dir, "overviews")
+                overview_levels = []
+                if WMTS_OVERVIEW_ENABLED:
+                    await self.create_process_status(
+                        process_id=process_id,
+                        status="processing",
+                        message="正在生成缺失级别的概览瓦片",
+                        wmts_id=wmts_id
+                    )
+                    overview_levels = await self.run_in_threadpool(
+                        self._build_overviews,
+                        temp_file_path,
+                        extract_dir,
+                        overview_dir,
+                        bundle_entries,
+                        metadata,
+                        cancel_event
+                    )
+                if overview_levels and bundle_entries:
+                    overview_bundle_dir = os.path.join(temp_dir, "overview_bundles")
+                    await self.run_in_threadpool(shutil.rmtree, overview_bundle_dir, ignore_errors=True)
+                    await self.run_in_threadpool(
+                        pack_overview_bundles,
+                        overview_dir,
+                        overview_bundle_dir,
+                        overview_levels
+                    )
+                    overview_dir = overview_bundle_dir
+                
+                # 单个瓦片文件打包成一个MBTiles文件上传，目录中没有可识别的 z/x/y 瓦片时仍逐个上传
+                mbtiles_path = None
+                if not bundle_entries and WMTS_TILE_STORAGE == "mbtiles":
+                    await self.create_process_status(
+                        process_id=process_id,
+                        status="processing",
+                        message="正在将瓦片打包为MBTiles文件",
+                        wmts_id=wmts_id
+                    )
+                    mbtiles_path = os.path.join(temp_dir, MBTILES_OBJECT_NAME)
+                    tile_count = await self.run_in_threadpool(
+                        build_mbtiles,
+                        [extract_dir, overview_dir] if overview_levels else [extract_dir],
+                        mbtiles_path,
+                        metadata,
+                        cancel_event
+                    )
+                    if tile_count == 0:
+                        print("[WARN] tpkx中没有可识别的 z/x/y 瓦片文件，按原目录结构上传")
+                        mbtiles_path = None
+                
                 # 更新状态
                 await self.create_process_status(
                     process_id=process_id,
@@ -277,15 +465,50 @@ class WMTSService:
                     wmts_id=wmts_id
                 )
                 
-                # 将解压后的文件上传到MinIO
-                uploaded_files = await self.run_in_threadpool(
-                    self._upload_tiles_to_minio,
-                    extract_dir,
-                    wmts_id
-                )
+                # 将解压后的文件并发上传到MinIO
+                async def report_upload_progress(uploader: TileUploader):
+                    await self.create_process_status(
+                        process_id=process_id,
+                        status="processing",
+                        message=f"正在上传瓦片文件到MinIO ({uploader.uploaded_files}/{uploader.total_files})",
+                        wmts_id=wmts_id,
+                        uploaded_files=uploader.uploaded_files,
+                        total_files=uploader.total_files
+                    )
                 
-                if not uploaded_files:
-                    # 如果上传失败
+                try:
+                    uploader = TileUploader(WMTS_BUCKET_NAME, wmts_id, cancel_event)
+                    if bundle_entries:
+                        await uploader.run(
+                            uploader.upload_zip_entries,
+                            lambda: zipfile.ZipFile(temp_file_path, "r"),
+                            bundle_entries,
+                            on_progress=report_upload_progress
+                        )
+                    elif mbtiles_path:
+                        await self.run_in_threadpool(
+                            MBTilesService(WMTS_BUCKET_NAME).upload,
+                            wmts_id,
+                            mbtiles_path
+                        )
+                    else:
+                        await uploader.run(
+                            uploader.upload_directory,
+                            extract_dir,
+                            on_progress=report_upload_progress
+                        )
+                    # 概览瓦片已写入MBTiles时不再单独上传
+                    if overview_levels and not mbtiles_path:
+                        await uploader.run(
+                            uploader.upload_directory,
+                            overview_dir,
+                            on_progress=report_upload_progress
+                        )
+                except TaskCancelledError:
+                    raise
+                except Exception as e:
+                    # 如果上传失败，清理已上传的部分瓦片（解压结果保留在工作目录中供重试使用）
+                    print(f"上传瓦片文件到MinIO失败: {str(e)}")
                     await self.run_in_threadpool(
                         self._clean_minio_files,
                         wmts_id
@@ -294,9 +517,15 @@ class WMTSService:
                     await self.create_process_status(
                         process_id=process_id,
                         status="failed",
-                        message="上传瓦片文件到MinIO失败"
+                        message=f"上传瓦片文件到MinIO失败: {str(e)}"
                     )
-                    return {"status": "failed", "message": "上传瓦片文件到MinIO失败"}
+                    return {
+                        "status": "failed",
+                        "message": f"上传瓦片文件到MinIO失败: {str(e)}",
+                        "retryable": is_retryable_error(e)
+                    }
+                
+                raise_if_cancelled(cancel_event)
                 
                 # 删除原始上传的tpkx文件
                 try:
@@ -308,8 +537,18 @@ class WMTSService:
                 except Exception as e:
                     print(f"删除原始tpkx文件失败 (非致命错误): {str(e)}")
                 
-                # 构建瓦片服务的URL模板 - 使用相对路径
-                tile_url_template = f"/{WMTS_BUCKET_NAME}/{wmts_id}" + "/{z}/{x}/{y}.png"
+                # 构建瓦片服务的URL模板 - 使用相对路径，通过后端的瓦片缓存代理访问
+                # bundle和MBTiles中的瓦片由后端按 z/x/y 读取
+                extension = "jpg" if metadata.get("format") == "image/jpeg" else "png"
+                if bundle_entries:
+                    storage = "bundle"
+                    tile_url_template = f"/wmts/{wmts_id}/bundles" + "/{z}/{x}/{y}." + extension
+                elif mbtiles_path:
+                    storage = "mbtiles"
+                    tile_url_template = f"/wmts/{wmts_id}/mbtiles" + "/{z}/{x}/{y}." + extension
+                else:
+                    storage = None
+                    tile_url_template = f"/wmts/{wmts_id}/tiles" + "/{z}/{x}/{y}.png"
                 minio_path = f"{WMTS_BUCKET_NAME}/{wmts_id}"
                 
                 # 更新数据库记录
@@ -321,13 +560,15 @@ class WMTSService:
                     "min_zoom": metadata.get("min_zoom", 0),
                     "max_zoom": metadata.get("max_zoom", 18),
                     "bounds": metadata.get("bounds"),
-                    "format": metadata.get("format", "image/png")
+                    "format": metadata.get("format", "image/png"),
+                    "storage": storage
                 }
                 
                 await self.collection.update_one(
                     {"_id": ObjectId(wmts_id)},
                     {"$set": update_data}
                 )
+                await WMTSCapabilitiesService(self.db).invalidate(wmts_id)
                 
                 # 更新状态为完成
                 await self.create_process_status(
@@ -348,15 +589,31 @@ class WMTSService:
                 }
                 
             finally:
-                # 清理临时目录
-                try:
-                    await self.run_in_threadpool(
-                        shutil.rmtree,
-                        temp_dir
-                    )
-                except Exception as e:
-                    print(f"清理临时目录失败: {str(e)}")
+                # 清理临时目录（任务工作目录由任务管理器在任务结束后清理）
+                if not work_dir:
+                    try:
+                        await self.run_in_threadpool(
+                            shutil.rmtree,
+                            temp_dir
+                        )
+                    except Exception as e:
+                        print(f"清理临时目录失败: {str(e)}")
                     
+        except TaskCancelledError as e:
+            # 任务被取消，清理已上传的部分瓦片和已创建的记录，保留原始上传文件
+            print(f"[INFO] WMTS处理已取消: {process_id}")
+            if 'wmts_id' in locals():
+                await self.run_in_threadpool(
+                    self._clean_minio_files,
+                    wmts_id
+                )
+                await self.collection.delete_one({"_id": ObjectId(wmts_id)})
+            await self.create_process_status(
+                process_id=process_id,
+                status="cancelled",
+                message=str(e)
+            )
+            return {"status": "cancelled", "message": str(e)}
         except Exception as e:
             import traceback
             error_detail = f"{str(e)}\n{traceback.format_exc()}"
@@ -368,13 +625,74 @@ class WMTSService:
                 status="failed",
                 message=f"处理tpkx文件失败: {str(e)}"
             )
-            return {"status": "failed", "message": f"处理tpkx文件失败: {str(e)}"}
+            # 如果已创建了图层记录，清理已上传的瓦片并删除记录
+            if 'wmts_id' in locals():
+                try:
+                    await self.run_in_threadpool(
+                        self._clean_minio_files,
+                        wmts_id
+                    )
+                    await self.collection.delete_one({"_id": ObjectId(wmts_id)})
+                except Exception:
+                    pass
+            return {
+                "status": "failed",
+                "message": f"处理tpkx文件失败: {str(e)}",
+                "retryable": is_retryable_error(e)
+            }
     
     # 同步方法 - 在线程池中运行
-    def _extract_tpkx_file(self, tpkx_path: str, extract_dir: str):
-        """解压tpkx文件 (实际上是ZIP格式)"""
+    def _extract_tpkx_file(
+        self,
+        tpkx_path: str,
+        extract_dir: str,
+        cancel_event: Optional[threading.Event] = None,
+        skipped_names: Optional[Set[str]] = None
+    ):
+        """解压tpkx文件 (实际上是ZIP格式)，跳过skipped_names中的条目，每个文件解压前检查取消信号"""
+        with zipfile.ZipFile(tpkx_path, 'r') as zip_ref:
+            for member in zip_ref.infolist():
+                raise_if_cancelled(cancel_event)
+                if skipped_names and member.filename in skipped_names:
+                    continue
+                zip_ref.extract(member, extract_dir)
+    
+    def _find_tpkx_bundles(self, tpkx_path: str) -> List[Tuple[zipfile.ZipInfo, str]]:
+        """查找tpkx中的紧凑型缓存bundle文件，返回(条目, 上传后的相对路径)列表，瓦片不是bundle格式时返回空列表"""
         with zipfile.ZipFile(tpkx_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
+            return find_bundle_entries(zip_ref)
+    
+    def _build_overviews(
+        self,
+        tpkx_path: str,
+        extract_dir: str,
+        overview_dir: str,
+        bundle_entries: List[Tuple[zipfile.ZipInfo, str]],
+        metadata: dict,
+        cancel_event: Optional[threading.Event] = None
+    ) -> List[int]:
+        """
+        为缺少低级别的图层生成概览瓦片，以 {z}/{x}/{y}.png 保存在overview_dir中，
+        同时更新metadata中的最低级别和切片方案，返回生成了瓦片的级别
+        """
+        # 清除上一次尝试生成的结果
+        shutil.rmtree(overview_dir, ignore_errors=True)
+        if bundle_entries:
+            source = BundleTileSource(tpkx_path, bundle_entries)
+        else:
+            source = DirectoryTileSource(extract_dir)
+        try:
+            if source.min_level is None:
+                return []
+            target_level = get_overview_target_level(source.min_level, metadata.get("tile_matrix"))
+            levels = generate_overviews(source, overview_dir, target_level, cancel_event)
+        finally:
+            source.close()
+        if levels:
+            metadata["min_zoom"] = min(metadata.get("min_zoom", levels[-1]), levels[-1])
+            metadata["overview_levels"] = sorted(levels)
+            add_overview_lods(metadata.get("tile_matrix"), levels)
+        return levels
     
     def _parse_tpkx_metadata(self, extract_dir: str) -> Optional[dict]:
         """解析tpkx文件的元数据"""
@@ -396,13 +714,16 @@ class WMTSService:
                 # 查找LOD信息来确定缩放级别
                 lod_infos = root.findall(".//LODInfo")
                 if lod_infos:
-                    levels = [int(lod.get("level", 0)) for lod in lod_infos]
+                    levels = [get_lod_level(lod) for lod in lod_infos]
                     metadata["min_zoom"] = min(levels)
                     metadata["max_zoom"] = max(levels)
                 else:
                     metadata["min_zoom"] = 0
                     metadata["max_zoom"] = 18
                 
+                # 瓦片矩阵定义（各级别的分辨率和比例尺、瓦片原点），用于生成GetCapabilities
+                metadata["tile_matrix"] = parse_conf_xml_tile_matrix(root)
+                
                 # 提取边界框信息
                 extent = root.find(".//Extent")
                 if extent is not None:
@@ -413,6 +734,31 @@ class WMTSService:
                         "north": float(extent.get("ymax", 90))
                     }
             
+            # tpkx（紧凑型缓存V2）的元数据保存在root.json中
+            root_json_path = os.path.join(extract_dir, "root.json")
+            if not metadata and os.path.exists(root_json_path):
+                with open(root_json_path, "r", encoding="utf-8-sig") as f:
+                    root_info = json.load(f)
+                tile_info = root_info.get("tileInfo") or {}
+                metadata["layer_name"] = root_info.get("name") or "WMTS Layer"
+                # JPEG格式的瓦片为image/jpeg，PNG和MIXED（PNG与JPEG混合）按image/png处理
+                tile_format = str(tile_info.get("format") or "PNG").upper()
+                metadata["format"] = "image/jpeg" if tile_format in ("JPEG", "JPG") else "image/png"
+                levels = [int(lod["level"]) for lod in tile_info.get("lods") or [] if "level" in lod]
+                metadata["min_zoom"] = min(levels) if levels else 0
+                metadata["max_zoom"] = max(levels) if levels else 18
+                metadata["tile_matrix"] = parse_root_json_tile_matrix(tile_info)
+                # 只有地理坐标系的范围可以直接作为经纬度边界
+                extent = root_info.get("fullExtent") or {}
+                spatial_reference = extent.get("spatialReference") or {}
+                if spatial_reference.get("latestWkid", spatial_reference.get("wkid")) == 4326:
+                    metadata["bounds"] = {
+                        "west": float(extent.get("xmin", -180)),
+                        "south": float(extent.get("ymin", -90)),
+                        "east": float(extent.get("xmax", 180)),
+                        "north": float(extent.get("ymax", 90))
+                    }
+            
             # 如果没有conf.xml，设置默认值
             if not metadata:
                 metadata = {
@@ -429,31 +775,13 @@ class WMTSService:
             print(f"解析tpkx元数据失败: {str(e)}")
             return None
     
-    def _upload_tiles_to_minio(self, extract_dir: str, wmts_id: str) -> bool:
-        """将瓦片文件上传到MinIO"""
-        try:
-            for root, dirs, files in os.walk(extract_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    # 保持目录结构
-                    object_name = f"{wmts_id}/{os.path.relpath(file_path, extract_dir)}"
-                    
-                    minio_client.fput_object(
-                        WMTS_BUCKET_NAME, 
-                        object_name, 
-                        file_path
-                    )
-            return True
-        except Exception as e:
-            print(f"上传瓦片文件到MinIO失败: {str(e)}")
-            return False
+    def _file_has_size(self, file_path: str, file_size: Optional[int]) -> bool:
+        """检查文件是否存在且大小与记录一致（用于判断上一次下载是否完整）"""
+        return os.path.exists(file_path) and os.path.getsize(file_path) == file_size
     
     def _clean_minio_files(self, wmts_id: str):
-        """清理MinIO中的文件"""
+        """批量清理MinIO中的文件，清理失败留下的目录由对账任务删除"""
         try:
-            # 列出所有相关的对象
-            objects = minio_client.list_objects(WMTS_BUCKET_NAME, prefix=f"{wmts_id}/", recursive=True)
-            for obj in objects:
-                minio_client.remove_object(WMTS_BUCKET_NAME, obj.object_name)
+            remove_prefix(WMTS_BUCKET_NAME, f"{wmts_id}/")
         except Exception as e:
             print(f"清理MinIO文件失败: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,54 @@
+import os
+import json
+from typing import Optional, Dict, Any
+
+# 检查点文件名，保存在任务工作目录中
+CHECKPOINT_FILENAME = "checkpoint.json"
+
+class TaskCheckpoint:
+    """
+    任务处理检查点
+
+    在任务工作目录中记录已完成的处理阶段及其数据。任务失败后重试时，
+    如果中间产物仍然存在，可以从最后完成的阶段继续，而不必重新下载和解压。
+    没有工作目录时检查点只保存在内存中，相当于每次都从头处理
+    """
+
+    def __init__(self, work_dir: Optional[str]):
+        self.path = os.path.join(work_dir, CHECKPOINT_FILENAME) if work_dir else None
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.stages = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"读取任务检查点失败，将从头开始处理: {str(e)}")
+                self.stages = {}
+
+    def done(self, stage: str) -> bool:
+        """阶段是否已完成"""
+        return stage in self.stages
+
+    def get(self, stage: str) -> Optional[Dict[str, Any]]:
+        """获取已完成阶段记录的数据，阶段未完成时返回None"""
+        return self.stages.get(stage)
+
+    def save(self, stage: str, **data):
+        """记录阶段已完成"""
+        self.stages[stage] = data
+        self._write()
+
+    def clear(self, *stages: str):
+        """清除阶段记录（中间产物需要重新生成时调用）"""
+        for stage in stages:
+            self.stages.pop(stage, None)
+        self._write()
+
+    def _write(self):
+        if not self.path:
+            return
+        # 先写临时文件再替换，避免进程中断时留下不完整的检查点
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.stages, f)
+        os.replace(tmp_path, self.path)
@@ -1,9 +1,13 @@
 import os
+import re
+import json
 import tempfile
 import asyncio
 import shlex
+import threading
+import contextlib
 from datetime import datetime
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Callable, Awaitable
 import subprocess
 import xml.etree.ElementTree as ET
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -12,10 +16,35 @@ from dotenv import load_dotenv
 from app.core.minio_client import minio_client, SOURCE_BUCKET_NAME, CONVERTED_BUCKET_NAME
 from app.models.metadata import ProductOccurrenceMetadata
 from app.utils.mongo_init import get_mongo_url
+from app.tasks.task_manager import ConversionStep, TaskCancelledError, raise_if_cancelled, is_retryable_error
+from app.tasks.checkpoint import TaskCheckpoint
 
 # 加载 .env 文件
 load_dotenv()
 
+# 转换程序默认超时时间（秒），超时后转换进程会被强制结束
+CONVERTER_TIMEOUT = int(os.getenv("CONVERTER_TIMEOUT", "3600"))
+# 按输入格式（扩展名，大写）单独配置的超时时间，JSON格式，如 {"IFC": 7200}
+CONVERTER_FORMAT_TIMEOUTS = {
+    ext.upper(): int(seconds)
+    for ext, seconds in json.loads(os.getenv("CONVERTER_FORMAT_TIMEOUTS") or "{}").items()
+}
+
+# 转换程序输出中的进度和阶段标记，例如 "PROGRESS: 45" 或 "STAGE: converting"
+CONVERTER_PROGRESS_PATTERN = re.compile(
+    os.getenv("CONVERTER_PROGRESS_PATTERN", r"(?i)\bprogress\b\s*[:=]?\s*(\d{1,3})(?:\.\d+)?\s*%?")
+)
+CONVERTER_STAGE_PATTERN = re.compile(
+    os.getenv("CONVERTER_STAGE_PATTERN", r"(?i)\b(?:stage|step)\b\s*[:=]\s*([\w\-]+)")
+)
+
+# 整体任务进度中各阶段所占区间：下载 0-10，转换 10-90，上传 90-100
+CONVERT_PROGRESS_START = 10
+CONVERT_PROGRESS_END = 90
+
+# 进度回调：(当前步骤, 整体进度, 转换程序报告的阶段名称)
+ProgressCallback = Callable[[ConversionStep, int, Optional[str]], Awaitable[None]]
+
 class FileConverter:
     """文件转换器，负责处理文件转换任务"""
     
@@ -113,54 +142,233 @@ class FileConverter:
         return True
     
     @staticmethod
-    async def convert_file(task) -> Tuple[bool, Optional[str], Optional[str]]:
+    def get_program_path() -> str:
+        """获取转换程序的完整路径"""
+        converter_path = os.getenv("CONVERTER_PATH", "")
+        program_name = os.getenv("CONVERTER_PROGRAM_NAME", "")
+        if os.name == 'nt':  # Windows系统
+            return os.path.join(converter_path, f"{program_name}.exe")
+        return os.path.join(converter_path, program_name)
+
+    @staticmethod
+    def get_converter_version() -> str:
+        """
+        获取转换程序版本标识，作为转换结果缓存键的一部分
+
+        优先使用CONVERTER_VERSION配置；未配置时使用程序文件的大小和修改时间，
+        替换转换程序后旧的缓存结果不会再被复用
+        """
+        version = os.getenv("CONVERTER_VERSION")
+        if version:
+            return version
+        try:
+            stat = os.stat(FileConverter.get_program_path())
+            return f"{stat.st_size}-{int(stat.st_mtime)}"
+        except OSError:
+            return "unknown"
+
+    @staticmethod
+    def _get_timeout(input_filename: str) -> int:
+        """获取输入格式对应的转换超时时间"""
+        extension = os.path.splitext(input_filename)[1][1:].upper()
+        return CONVERTER_FORMAT_TIMEOUTS.get(extension, CONVERTER_TIMEOUT)
+
+    @staticmethod
+    def _parse_output_line(line: str) -> Tuple[Optional[int], Optional[str]]:
+        """从转换程序的一行输出中解析进度百分比和阶段名称"""
+        progress = None
+        stage = None
+        progress_match = CONVERTER_PROGRESS_PATTERN.search(line)
+        if progress_match:
+            progress = max(0, min(100, int(progress_match.group(1))))
+        stage_match = CONVERTER_STAGE_PATTERN.search(line)
+        if stage_match:
+            stage = stage_match.group(1).lower()
+        return progress, stage
+
+    @staticmethod
+    async def _run_converter_process(
+        args: List[str],
+        cwd: str,
+        shell: bool,
+        timeout: int,
+        on_line: Callable[[str, str], Awaitable[None]],
+        cancel_event: Optional[threading.Event] = None
+    ) -> Tuple[Optional[int], str]:
+        """
+        启动转换进程并逐行读取stdout/stderr
+
+        Args:
+            args: 命令参数
+            cwd: 工作目录
+            shell: 是否通过shell执行（Windows）
+            timeout: 超时时间（秒），超时后强制结束进程
+            on_line: 每读取一行输出时调用，参数为 (流名称, 行内容)
+            cancel_event: 可选的取消信号，设置后强制结束进程并抛出TaskCancelledError
+
+        Returns:
+            Tuple[Optional[int], str]: (返回码，超时时为None, stderr末尾内容)
+        """
+        loop = asyncio.get_running_loop()
+        lines: asyncio.Queue = asyncio.Queue()
+        
+        try:
+            if shell:
+                process = await asyncio.create_subprocess_shell(
+                    ' '.join(args), cwd=cwd,
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                )
+            else:
+                process = await asyncio.create_subprocess_exec(
+                    *args, cwd=cwd,
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                )
+
+            async def pump(stream, name):
+                while True:
+                    raw = await stream.readline()
+                    if not raw:
+                        break
+                    await lines.put((name, raw))
+                await lines.put((name, None))
+
+            pumps = [
+                asyncio.create_task(pump(process.stdout, "stdout")),
+                asyncio.create_task(pump(process.stderr, "stderr")),
+            ]
+            kill = process.kill
+            wait = process.wait
+        except NotImplementedError:
+            # Windows下使用SelectorEventLoop时不支持asyncio子进程，改用线程读取输出
+            process = subprocess.Popen(
+                ' '.join(args) if shell else args, cwd=cwd, shell=shell,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+
+            def pump_thread(stream, name):
+                for raw in iter(stream.readline, b''):
+                    loop.call_soon_threadsafe(lines.put_nowait, (name, raw))
+                loop.call_soon_threadsafe(lines.put_nowait, (name, None))
+
+            pumps = []
+            for stream, name in ((process.stdout, "stdout"), (process.stderr, "stderr")):
+                threading.Thread(target=pump_thread, args=(stream, name), daemon=True).start()
+            kill = process.kill
+            wait = lambda: asyncio.to_thread(process.wait)
+
+        stderr_tail: List[str] = []
+        open_streams = 2
+        deadline = loop.time() + timeout
+        try:
+            while open_streams:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                raise_if_cancelled(cancel_event)
+                try:
+                    # 转换程序长时间没有输出时也要定期检查取消信号
+                    name, raw = await asyncio.wait_for(lines.get(), timeout=min(remaining, 1))
+                except asyncio.TimeoutError:
+                    continue
+                if raw is None:
+                    open_streams -= 1
+                    continue
+                line = raw.decode(errors="replace").rstrip()
+                if name == "stderr":
+                    stderr_tail = (stderr_tail + [line])[-50:]
+                await on_line(name, line)
+            return_code = await asyncio.wait_for(wait(), timeout=max(1, deadline - loop.time()))
+            return return_code, "\n".join(stderr_tail)
+        except asyncio.TimeoutError:
+            print(f"转换超时（{timeout}秒），强制结束转换进程")
+            kill()
+            await wait()
+            return None, "\n".join(stderr_tail)
+        except TaskCancelledError:
+            print("任务已取消，强制结束转换进程")
+            kill()
+            await wait()
+            raise
+        except asyncio.CancelledError:
+            kill()
+            raise
+        finally:
+            for pump_task in pumps:
+                pump_task.cancel()
+    
+    @staticmethod
+    async def convert_file(
+        task,
+        progress_callback: Optional[ProgressCallback] = None,
+        cancel_event: Optional[threading.Event] = None,
+        work_dir: Optional[str] = None
+    ) -> Tuple[bool, Optional[str], Optional[str]]:
         """
         转换文件
         
+        提供work_dir时下载的源文件和转换结果保存在其中并记录检查点，
+        重试时跳过已完成的下载和转换阶段。
+        可重试的瞬时错误（如MinIO连接中断）会直接抛出，由任务管理器按重试策略处理
+        
         Args:
             task: 转换任务
+            progress_callback: 可选的进度回调，转换程序输出进度或阶段标记时调用
+            cancel_event: 可选的取消信号，设置后结束转换进程且不再上传结果
+            work_dir: 可选的任务工作目录，由任务管理器在任务结束后清理
             
         Returns:
             Tuple[bool, Optional[str], Optional[str]]: (是否成功, 错误信息, 输出文件路径)
         """
+        async def report(step: ConversionStep, progress: int, stage: Optional[str] = None):
+            if progress_callback:
+                await progress_callback(step, progress, stage)
+
         try:
             # 从环境变量中获取转换程序配置
             converter_path = os.getenv("CONVERTER_PATH")
             program_name = os.getenv("CONVERTER_PROGRAM_NAME")
             
-            # 使用自动删除的临时目录
-            with tempfile.TemporaryDirectory(prefix="file_conversion_") as temp_dir:
+            # 使用任务工作目录，没有时使用自动删除的临时目录
+            if work_dir:
+                directory = contextlib.nullcontext(work_dir)
+            else:
+                directory = tempfile.TemporaryDirectory(prefix="file_conversion_")
+            with directory as temp_dir:
                 print(f"DEBUG - 临时目录创建于: {temp_dir}")
+                checkpoint = TaskCheckpoint(work_dir)
 
                 # 下载文件
                 input_filename = os.path.basename(task.input_file_path)
                 input_file_path = os.path.join(temp_dir, input_filename)
                 
                 # 从MinIO下载文件
-                minio_client.fget_object(
-                    SOURCE_BUCKET_NAME,
-                    task.input_file_path,
-                    input_file_path
-                )
+                await report(ConversionStep.DOWNLOADING, 0)
+                downloaded = checkpoint.get("downloaded")
+                if downloaded and os.path.exists(input_file_path) \
+                        and os.path.getsize(input_file_path) == downloaded.get("file_size"):
+                    print(f"复用已下载的文件: {input_file_path}")
+                else:
+                    checkpoint.clear("downloaded", "converted")
+                    await asyncio.to_thread(
+                        minio_client.fget_object,
+                        SOURCE_BUCKET_NAME,
+                        task.input_file_path,
+                        input_file_path
+                    )
+                    checkpoint.save("downloaded", file_size=os.path.getsize(input_file_path))
                 
                 # 设置输出文件路径
                 output_filename = f"{os.path.splitext(input_filename)[0]}.{task.output_format.lower()}"
                 output_file_path = os.path.join(temp_dir, output_filename)
                 
-                # 使用完整路径执行程序
-                if os.name == 'nt':  # Windows系统
-                    program_path = os.path.join(converter_path, f"{program_name}.exe")
-                else:
-                    program_path = os.path.join(converter_path, program_name)
-                
-                # 输入输出路径直接使用原始路径（后续由双引号包裹）
-                input_file_path_quoted = input_file_path
-                output_file_path_quoted = output_file_path
+                if checkpoint.done("converted") and os.path.exists(output_file_path):
+                    # 上一次尝试已经转换完成（上传失败），直接上传
+                    print(f"复用已转换的文件: {output_file_path}")
+                    raise_if_cancelled(cancel_event)
+                    return await FileConverter._upload_converted_file(task, temp_dir, output_filename, output_file_path, report)
                 
-                # 在执行cmd前添加
-                print(f"输入文件存在: {os.path.exists(input_file_path)}")
-                print(f"输出目录可写: {os.access(os.path.dirname(output_file_path), os.W_OK)}")
-                print(f"转换工具存在: {os.path.exists(os.path.join(converter_path, f'{program_name}.exe'))}")
+                # 使用完整路径执行程序
+                program_path = FileConverter.get_program_path()
                 
                 # 区分操作系统处理
                 if os.name == 'nt':
@@ -182,61 +390,71 @@ class FileConverter:
                     cwd = converter_path
                     shell = False
 
-                print(f"执行参数: {' '.join(args)}")
-
-                def run_subprocess():
-                    if shell:
-                        return subprocess.run(
-                            ' '.join(args),
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            cwd=cwd,
-                            shell=shell,
-                            universal_newlines=True,
-                            text=True
-                        )
-                    else:
-                        return subprocess.run(
-                            args,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            cwd=cwd,
-                            shell=shell,
-                            universal_newlines=True,
-                            text=True
-                        )
-                print(f"converter_path: {converter_path}")
-                print(f"program_name: {program_name}")
-                print(f"program_path: {program_path}")
-                print(f"目录下文件: {os.listdir(converter_path)}")
-                print(f"args: {args}")
-                process = await asyncio.to_thread(run_subprocess)
+                raise_if_cancelled(cancel_event)
+                timeout = FileConverter._get_timeout(input_filename)
+                print(f"执行参数: {' '.join(args)}，超时时间: {timeout}秒")
                 
-                return_code = process.returncode
+                await report(ConversionStep.CONVERTING, CONVERT_PROGRESS_START)
+                
+                async def on_line(stream_name: str, line: str):
+                    print(f"[converter:{stream_name}] {line}")
+                    progress, stage = FileConverter._parse_output_line(line)
+                    if progress is None and stage is None:
+                        return
+                    overall = None
+                    if progress is not None:
+                        overall = CONVERT_PROGRESS_START + (CONVERT_PROGRESS_END - CONVERT_PROGRESS_START) * progress // 100
+                    await report(ConversionStep.CONVERTING, overall, stage)
+                
+                return_code, error_output = await FileConverter._run_converter_process(
+                    args, cwd, shell, timeout, on_line, cancel_event
+                )
+                
+                if return_code is None:
+                    return False, f"转换超时: 超过{timeout}秒未完成", None
                 
                 if return_code != 0:
-                    error_output = process.stderr
                     print(f"转换失败，错误代码: {return_code}")
                     print(f"完整错误输出:\n{error_output}")
                     return False, f"转换失败: {error_output[:200]}", None
                 
-                # 上传转换后的文件到MinIO
-                converted_file_path = f"{task.user_id}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{output_filename}"
-                minio_client.fput_object(
-                    CONVERTED_BUCKET_NAME,
-                    converted_file_path,
-                    output_file_path
-                )
-                
-                # 搜索并解析转换目录中的XML文件
-                for file in os.listdir(temp_dir):
-                    if file.lower().endswith('.xml'):
-                        xml_file_path = os.path.join(temp_dir, file)
-                        await FileConverter._parse_and_store_metadata(xml_file_path, task.file_id)
+                checkpoint.save("converted")
                 
-                return True, None, converted_file_path
+                # 上传转换后的文件到MinIO
+                raise_if_cancelled(cancel_event)
+                return await FileConverter._upload_converted_file(task, temp_dir, output_filename, output_file_path, report)
                 
+        except TaskCancelledError as e:
+            return False, str(e), None
         except Exception as e:
             import traceback
             traceback.print_exc()
-            return False, f"系统错误: {str(e)}", None 
\ No newline at end of file
+            if is_retryable_error(e):
+                raise
+            return False, f"系统错误: {str(e)}", None
+
+    @staticmethod
+    async def _upload_converted_file(
+        task,
+        temp_dir: str,
+        output_filename: str,
+        output_file_path: str,
+        report: Callable[..., Awaitable[None]]
+    ) -> Tuple[bool, Optional[str], Optional[str]]:
+        """上传转换结果到MinIO并解析转换程序生成的XML元数据"""
+        await report(ConversionStep.UPLOADING, CONVERT_PROGRESS_END)
+        converted_file_path = f"{task.user_id}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{output_filename}"
+        await asyncio.to_thread(
+            minio_client.fput_object,
+            CONVERTED_BUCKET_NAME,
+            converted_file_path,
+            output_file_path
+        )
+        
+        # 搜索并解析转换目录中的XML文件
+        for file in os.listdir(temp_dir):
+            if file.lower().endswith('.xml'):
+                xml_file_path = os.path.join(temp_dir, file)
+                await FileConverter._parse_and_store_metadata(xml_file_path, task.file_id)
+        
+        return True, None, converted_file_path
\ No newline at end of file
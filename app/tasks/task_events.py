@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import redis.exceptions
+
+from app.utils.redis import RedisService
+
+# 任务事件流：任务状态变化以增量的形式写入一个Redis Stream，
+# 推送连接按事件ID断点续传，Stream只保留最近TASK_EVENT_STREAM_MAXLEN条事件
+TASK_EVENT_STREAM_KEY = "task_events"
+TASK_EVENT_STREAM_MAXLEN = int(os.getenv("TASK_EVENT_STREAM_MAXLEN", "10000"))
+
+# 每个推送连接最多缓存的未发送事件数，超过时连接需要重新同步
+TASK_EVENT_QUEUE_SIZE = int(os.getenv("TASK_EVENT_QUEUE_SIZE", "1000"))
+
+# 读取事件流时的阻塞超时（毫秒）
+TASK_EVENT_BLOCK_TIMEOUT = 5000
+
+def parse_event_id(event_id: str) -> Tuple[int, int]:
+    """将Stream事件ID（毫秒时间戳-序号）转换为可比较的元组"""
+    millis, _, sequence = event_id.partition("-")
+    return int(millis), int(sequence or 0)
+
+class TaskEventSubscription:
+    """一个推送连接订阅的任务集合及其待发送的事件"""
+
+    def __init__(self, task_ids: Iterable[str]):
+        self.task_ids: Set[str] = set(task_ids)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=TASK_EVENT_QUEUE_SIZE)
+        # 事件积压超过队列容量时置位，连接应结束并由客户端带上次事件ID重连
+        self.overflowed = False
+
+    def deliver(self, event: Dict[str, Any]):
+        """投递一条事件（只投递订阅的任务）"""
+        if event["task_id"] not in self.task_ids or self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+class TaskEventHub:
+    """
+    任务事件发布与分发
+
+    TaskManager.update_task 将每次实际发生变化的字段作为事件写入Redis Stream。
+    每个进程只运行一个读取协程阻塞读取事件流，再分发给本进程中订阅了对应任务的连接，
+    因此连接数量增加不会增加Redis的读取次数。多个API副本各自读取同一个事件流
+    """
+
+    def __init__(self, redis_service: RedisService):
+        self.redis = redis_service
+        self._subscriptions: Set[TaskEventSubscription] = set()
+        self._reader_task: Optional[asyncio.Task] = None
+        self._reader_lock = asyncio.Lock()
+
+    async def publish(self, task_id: str, event: str, data: Dict[str, Any]) -> Optional[str]:
+        """发布任务事件，返回事件ID；发布失败不影响任务本身的更新"""
+        try:
+            return await self.redis.async_redis_client.xadd(
+                TASK_EVENT_STREAM_KEY,
+                {"task_id": task_id, "event": event, "data": json.dumps(data, default=str)},
+                maxlen=TASK_EVENT_STREAM_MAXLEN,
+                approximate=True
+            )
+        except redis.exceptions.RedisError as e:
+            print(f"[WARN] 发布任务 {task_id} 事件失败: {str(e)}")
+            return None
+
+    async def get_last_event_id(self) -> str:
+        """获取事件流中最新的事件ID，事件流为空时返回0-0"""
+        entries = await self.redis.async_redis_client.xrevrange(TASK_EVENT_STREAM_KEY, count=1)
+        return entries[0][0] if entries else "0-0"
+
+    async def can_resume(self, last_event_id: str) -> bool:
+        """判断能否从指定事件之后继续推送（之后的事件尚未被事件流裁剪掉）"""
+        try:
+            last = parse_event_id(last_event_id)
+        except ValueError:
+            return False
+        entries = await self.redis.async_redis_client.xrange(TASK_EVENT_STREAM_KEY, count=1)
+        if not entries:
+            return True
+        # 事件流中最早的事件不晚于上次收到的事件时，之后的事件都还保留着
+        return last >= parse_event_id(entries[0][0])
+
+    async def replay(self, task_ids: Set[str], after_id: str) -> List[Dict[str, Any]]:
+        """读取指定事件之后订阅任务的历史事件，用于断线重连后补发"""
+        events = []
+        start = f"({after_id}"
+        while True:
+            entries = await self.redis.async_redis_client.xrange(TASK_EVENT_STREAM_KEY, min=start, count=500)
+            if not entries:
+                return events
+            for entry_id, fields in entries:
+                event = self._parse_entry(entry_id, fields)
+                if event["task_id"] in task_ids:
+                    events.append(event)
+            start = f"({entries[-1][0]}"
+
+    async def subscribe(self, task_ids: Iterable[str]) -> TaskEventSubscription:
+        """
+        订阅任务事件
+
+        返回时读取协程已经确定了读取起点，之后发布的事件都会投递给该订阅，
+        调用方再用 replay 补发订阅之前的事件并按事件ID去重
+        """
+        subscription = TaskEventSubscription(task_ids)
+        self._subscriptions.add(subscription)
+        async with self._reader_lock:
+            if self._reader_task is None or self._reader_task.done():
+                start_id = await self.get_last_event_id()
+                self._reader_task = asyncio.create_task(self._read_loop(start_id))
+        return subscription
+
+    def unsubscribe(self, subscription: TaskEventSubscription):
+        """取消订阅，没有订阅时读取协程在下一次阻塞读取超时后退出"""
+        self._subscriptions.discard(subscription)
+
+    def _parse_entry(self, entry_id: str, fields: Dict[str, str]) -> Dict[str, Any]:
+        """将事件流条目转换为推送给客户端的事件"""
+        return {
+            "id": entry_id,
+            "task_id": fields.get("task_id"),
+            "event": fields.get("event"),
+            "data": json.loads(fields.get("data") or "{}"),
+        }
+
+    async def _read_loop(self, last_id: str):
+        """读取协程：阻塞读取事件流并分发给订阅者"""
+        while self._subscriptions:
+            try:
+                response = await self.redis.async_redis_client.xread(
+                    {TASK_EVENT_STREAM_KEY: last_id}, count=500, block=TASK_EVENT_BLOCK_TIMEOUT
+                )
+            except asyncio.CancelledError:
+                raise
+            except redis.exceptions.RedisError as e:
+                print(f"读取任务事件流时Redis错误: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    event = self._parse_entry(entry_id, fields)
+                    for subscription in list(self._subscriptions):
+                        subscription.deliver(event)
@@ -1,5 +1,10 @@
 import asyncio
+import time
 import uuid
+import random
+import shutil
+import tempfile
+from collections import deque
 from datetime import datetime, timedelta
 from enum import Enum
 from typing import Dict, Optional, List, Callable, Any
@@ -7,11 +12,17 @@ from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import json
+import socket
+import threading
 import redis.exceptions
+import pymongo.errors
+import urllib3.exceptions
+from minio.error import S3Error, ServerError
 from dotenv import load_dotenv
 
 from app.core.minio_client import minio_client
 from app.utils.redis import RedisService
+from app.tasks.task_events import TaskEventHub
 from app.utils.mongo_init import get_mongo_url
 from app.models.file import ConversionStatus, FileConversion
 
@@ -39,6 +50,7 @@ class TaskStatus(str, Enum):
     PROCESSING = "processing"  # 处理中
     COMPLETED = "completed"  # 已完成
     FAILED = "failed"  # 失败
+    CANCELLED = "cancelled"  # 已取消
 
 # 定义转换步骤枚举
 class ConversionStep(str, Enum):
@@ -53,14 +65,279 @@ class TaskType(str, Enum):
     FILE_CONVERSION = "file_conversion"  # 文件转换
     THREEDTILES_PROCESSING = "threedtiles_processing"  # 3DTiles处理
     WMTS_PROCESSING = "wmts_processing"  # WMTS瓦片处理
+    PREFIX_DELETION = "prefix_deletion"  # 删除资源在存储桶中的目录
+    TILE_SEEDING = "tile_seeding"  # 瓦片缓存预热
+
+# 定义任务优先级枚举
+class TaskPriority(str, Enum):
+    INTERACTIVE = "interactive"  # 交互式任务，用户正在等待结果
+    NORMAL = "normal"  # 普通任务
+    BATCH = "batch"  # 批量任务，如大批量瓦片入库
+
+# 出队时按此顺序检查各优先级通道，高优先级通道有任务时低优先级任务不会被领取
+TASK_PRIORITY_ORDER = [TaskPriority.INTERACTIVE, TaskPriority.NORMAL, TaskPriority.BATCH]
+
+# 创建任务时未指定优先级时使用的默认值
+DEFAULT_TASK_PRIORITIES = {
+    TaskType.FILE_CONVERSION: TaskPriority.INTERACTIVE,
+    TaskType.THREEDTILES_PROCESSING: TaskPriority.BATCH,
+    TaskType.WMTS_PROCESSING: TaskPriority.BATCH,
+    TaskType.PREFIX_DELETION: TaskPriority.BATCH,
+    TaskType.TILE_SEEDING: TaskPriority.BATCH,
+}
 
 # 任务过期时间（秒）
 TASK_EXPIRE_TIME = 7 * 24 * 60 * 60  # 7天
 
+# 每种任务类型的并发工作协程数量（即同时运行的任务上限）
+TASK_WORKER_CONCURRENCY = {
+    TaskType.FILE_CONVERSION: int(os.getenv("TASK_WORKERS_FILE_CONVERSION", "2")),
+    TaskType.THREEDTILES_PROCESSING: int(os.getenv("TASK_WORKERS_THREEDTILES", "2")),
+    TaskType.WMTS_PROCESSING: int(os.getenv("TASK_WORKERS_WMTS", "2")),
+    TaskType.PREFIX_DELETION: int(os.getenv("TASK_WORKERS_PREFIX_DELETION", "1")),
+    TaskType.TILE_SEEDING: int(os.getenv("TASK_WORKERS_TILE_SEEDING", "1")),
+}
+
+# 每种任务类型额外保留的工作协程数量，只处理交互式任务，
+# 保证批量任务占满工作池时新提交的交互式任务也能立即开始
+TASK_INTERACTIVE_WORKERS = int(os.getenv("TASK_INTERACTIVE_WORKERS", "1"))
+
+# 同一优先级内按用户加权轮转：每个用户每轮最多连续领取“权重”个任务，
+# 未配置的用户使用默认权重，例如 {"<user_id>": 3}
+TASK_USER_DEFAULT_WEIGHT = int(os.getenv("TASK_USER_DEFAULT_WEIGHT", "1"))
+TASK_USER_WEIGHTS = {
+    user_id: int(weight)
+    for user_id, weight in json.loads(os.getenv("TASK_USER_WEIGHTS") or "{}").items()
+}
+
+# 阻塞出队的超时时间（秒），超时后工作协程会重新检查运行状态和队列
+TASK_QUEUE_BLOCK_TIMEOUT = int(os.getenv("TASK_QUEUE_BLOCK_TIMEOUT", "5"))
+
+# 任务租约配置（秒）：工作协程领取任务后持有租约并定期续期，
+# 租约过期（进程崩溃或重启）的任务会被回收并重新入队
+TASK_LEASE_TIMEOUT = int(os.getenv("TASK_LEASE_TIMEOUT", "60"))
+TASK_LEASE_HEARTBEAT_INTERVAL = int(os.getenv("TASK_LEASE_HEARTBEAT_INTERVAL", "15"))
+TASK_LEASE_REAP_INTERVAL = int(os.getenv("TASK_LEASE_REAP_INTERVAL", "30"))
+
+# 进度写入合并间隔（秒）：仅包含进度/步骤变化的更新，同一任务在该间隔内最多写入一次
+TASK_PROGRESS_FLUSH_INTERVAL = float(os.getenv("TASK_PROGRESS_FLUSH_INTERVAL", "2"))
+
+# 可以合并写入的字段，其他字段（状态、错误信息、结果）变化时立即写入
+COALESCIBLE_TASK_FIELDS = {"progress", "current_step"}
+
+# 任务取消配置：执行中的任务每隔TASK_CANCEL_POLL_INTERVAL秒检查一次取消标记，
+# 收到取消请求后处理逻辑在下一个检查点（如文件边界）自行停止并清理，
+# 超过TASK_CANCEL_GRACE_PERIOD秒仍未停止的任务会被强制中断
+TASK_CANCEL_POLL_INTERVAL = float(os.getenv("TASK_CANCEL_POLL_INTERVAL", "1"))
+TASK_CANCEL_GRACE_PERIOD = int(os.getenv("TASK_CANCEL_GRACE_PERIOD", "30"))
+
+# 已结束的任务状态
+FINISHED_TASK_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED)
+
+# 任务重试策略：可重试的瞬时错误（网络中断、超时、存储服务暂时不可用等）按指数退避加随机抖动
+# 重新执行，第n次重试前等待 min(max_delay, base_delay * 2^(n-1)) 的50%-100%；
+# 重试次数用完或遇到不可重试的错误时任务失败并进入死信队列
+TASK_RETRY_BASE_DELAY = float(os.getenv("TASK_RETRY_BASE_DELAY", "10"))
+TASK_RETRY_MAX_DELAY = float(os.getenv("TASK_RETRY_MAX_DELAY", "600"))
+TASK_RETRY_POLICIES = {
+    TaskType.FILE_CONVERSION: {
+        "max_retries": int(os.getenv("TASK_RETRIES_FILE_CONVERSION", "3")),
+        "base_delay": TASK_RETRY_BASE_DELAY,
+        "max_delay": TASK_RETRY_MAX_DELAY,
+    },
+    TaskType.THREEDTILES_PROCESSING: {
+        "max_retries": int(os.getenv("TASK_RETRIES_THREEDTILES", "3")),
+        "base_delay": TASK_RETRY_BASE_DELAY,
+        "max_delay": TASK_RETRY_MAX_DELAY,
+    },
+    TaskType.WMTS_PROCESSING: {
+        "max_retries": int(os.getenv("TASK_RETRIES_WMTS", "3")),
+        "base_delay": TASK_RETRY_BASE_DELAY,
+        "max_delay": TASK_RETRY_MAX_DELAY,
+    },
+    TaskType.PREFIX_DELETION: {
+        "max_retries": int(os.getenv("TASK_RETRIES_PREFIX_DELETION", "5")),
+        "base_delay": TASK_RETRY_BASE_DELAY,
+        "max_delay": TASK_RETRY_MAX_DELAY,
+    },
+    TaskType.TILE_SEEDING: {
+        "max_retries": int(os.getenv("TASK_RETRIES_TILE_SEEDING", "3")),
+        "base_delay": TASK_RETRY_BASE_DELAY,
+        "max_delay": TASK_RETRY_MAX_DELAY,
+    },
+}
+
+# 检查延迟重试任务是否到期的间隔（秒）
+TASK_RETRY_POLL_INTERVAL = float(os.getenv("TASK_RETRY_POLL_INTERVAL", "1"))
+
+# 任务归档：结束超过TASK_ARCHIVE_AFTER_DAYS天的任务移入精简的归档集合，保持tasks集合较小；
+# 设置为0时不归档。归档协程每TASK_ARCHIVE_INTERVAL秒检查一次，每批最多移动TASK_ARCHIVE_BATCH_SIZE个任务
+TASK_ARCHIVE_AFTER_DAYS = int(os.getenv("TASK_ARCHIVE_AFTER_DAYS", "30"))
+TASK_ARCHIVE_INTERVAL = int(os.getenv("TASK_ARCHIVE_INTERVAL", "3600"))
+TASK_ARCHIVE_BATCH_SIZE = int(os.getenv("TASK_ARCHIVE_BATCH_SIZE", "500"))
+
+# 归档记录保留的任务字段（不保留输入路径、当前步骤等只对执行有用的字段）
+ARCHIVED_TASK_FIELDS = (
+    "task_id", "task_type", "user_id", "file_id", "status", "progress",
+    "error_message", "retry_count", "priority", "created_at", "updated_at",
+)
+
+# 任务工作目录：保存下载和解压等中间产物，重试时可以从最后完成的阶段继续；
+# 任务结束后删除，启动时清理超过TASK_EXPIRE_TIME未更新的残留目录
+TASK_WORK_DIR = os.getenv("TASK_WORK_DIR") or os.path.join(tempfile.gettempdir(), "virtualsite_tasks")
+
+# MinIO返回这些错误码时表示服务暂时不可用，可以重试
+RETRYABLE_S3_ERROR_CODES = {"InternalError", "ServiceUnavailable", "SlowDown", "RequestTimeout", "XMinioServerNotInitialized"}
+
+# 仅当租约仍由当前持有者持有时才续期/释放，避免误操作其他工作协程的租约
+RENEW_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+# 取出到期的延迟重试任务，多个副本同时执行时每个任务只会被一个副本取出并重新入队
+PROMOTE_DELAYED_SCRIPT = """
+local ids = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, id in ipairs(ids) do
+    redis.call('zrem', KEYS[1], id)
+end
+return ids
+"""
+# 将任务加入用户在对应优先级通道中的队列，用户不在轮转列表中时加入列表末尾，
+# 并向等待该通道的工作协程发送唤醒信号（信号数量不超过工作协程数量）
+# KEYS: 用户队列、轮转列表、唤醒信号列表...；ARGV: 任务ID、用户ID、是否插入队首、信号上限
+ENQUEUE_TASK_SCRIPT = """
+if ARGV[3] == '1' then
+    redis.call('lpush', KEYS[1], ARGV[1])
+else
+    redis.call('rpush', KEYS[1], ARGV[1])
+end
+if not redis.call('lpos', KEYS[2], ARGV[2]) then
+    redis.call('rpush', KEYS[2], ARGV[2])
+end
+for i = 3, #KEYS do
+    redis.call('rpush', KEYS[i], '1')
+    redis.call('ltrim', KEYS[i], -tonumber(ARGV[4]), -1)
+end
+return 1
+"""
+# 按优先级顺序检查各通道，通道内按用户加权轮转取出一个任务并移入处理中列表。
+# 轮转列表头部的用户在本轮还有剩余额度时继续领取，额度用完后移到列表末尾，
+# 队列为空的用户从列表中移除。用户队列的键名由通道前缀和用户ID拼接，
+# 同一任务类型的队列相关键名使用相同的哈希标签（{task_queue:<类型>}），在Redis Cluster中位于同一个槽
+# KEYS: 处理中列表，然后每个通道依次为轮转列表、剩余额度哈希；
+# ARGV: 用户权重JSON、默认权重，然后每个通道的用户队列键名前缀
+DEQUEUE_TASK_SCRIPT = """
+local weights = cjson.decode(ARGV[1])
+local default_weight = tonumber(ARGV[2])
+for lane = 1, #ARGV - 2 do
+    local ring_key = KEYS[2 * lane]
+    local credits_key = KEYS[2 * lane + 1]
+    local prefix = ARGV[lane + 2]
+    for _ = 1, redis.call('llen', ring_key) do
+        local user = redis.call('lindex', ring_key, 0)
+        local queue_key = prefix .. ':' .. user
+        local task_id = redis.call('lpop', queue_key)
+        if not task_id then
+            redis.call('lpop', ring_key)
+            redis.call('hdel', credits_key, user)
+        else
+            local credit = tonumber(redis.call('hget', credits_key, user))
+                or tonumber(weights[user]) or default_weight
+            credit = credit - 1
+            if redis.call('llen', queue_key) == 0 then
+                redis.call('lpop', ring_key)
+                redis.call('hdel', credits_key, user)
+            elseif credit <= 0 then
+                redis.call('lmove', ring_key, ring_key, 'LEFT', 'RIGHT')
+                redis.call('hdel', credits_key, user)
+            else
+                redis.call('hset', credits_key, user, credit)
+            end
+            redis.call('rpush', KEYS[1], task_id)
+            return task_id
+        end
+    end
+end
+return false
+"""
+
 class TaskError(Exception):
     """任务相关错误"""
     pass
 
+class TaskCancelledError(TaskError):
+    """任务已被取消"""
+    pass
+
+class TaskRetryableError(TaskError):
+    """可重试的任务错误，处理逻辑已将底层的瞬时错误转换为失败结果时使用"""
+    pass
+
+# 可重试的异常类型：网络连接、超时和数据库/缓存暂时不可用
+RETRYABLE_EXCEPTIONS = (
+    TaskRetryableError,
+    ConnectionError,
+    TimeoutError,
+    redis.exceptions.ConnectionError,
+    redis.exceptions.TimeoutError,
+    pymongo.errors.AutoReconnect,
+    pymongo.errors.ServerSelectionTimeoutError,
+    urllib3.exceptions.MaxRetryError,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.TimeoutError,
+    urllib3.exceptions.NewConnectionError,
+    ServerError,
+)
+
+def is_retryable_error(error: BaseException) -> bool:
+    """判断错误是否为可重试的瞬时错误，文件损坏、格式错误等确定性错误不重试"""
+    if isinstance(error, TaskCancelledError):
+        return False
+    if isinstance(error, RETRYABLE_EXCEPTIONS):
+        return True
+    if isinstance(error, S3Error):
+        return error.code in RETRYABLE_S3_ERROR_CODES
+    # 通过raise ... from包装过的异常按原始原因判断
+    if error.__cause__ is not None:
+        return is_retryable_error(error.__cause__)
+    return False
+
+def raise_if_cancelled(cancel_event: Optional[threading.Event]):
+    """取消检查点：任务已被请求取消时抛出TaskCancelledError，供处理逻辑在安全的位置停止"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise TaskCancelledError("任务已取消")
+
+def build_archived_task(task_data: Dict) -> Dict:
+    """
+    构建任务的归档记录：只保留列表展示需要的字段，结果中只保留标量值（例如tile_id、filename），
+    丢弃嵌套的大字段
+    """
+    record = {field: task_data.get(field) for field in ARCHIVED_TASK_FIELDS}
+    result = {}
+    for key, value in (task_data.get("result") or {}).items():
+        if isinstance(value, ObjectId):
+            result[key] = str(value)
+        elif value is None or isinstance(value, (str, int, float, bool)):
+            result[key] = value
+    record["result"] = result
+    record["archived_at"] = datetime.now().isoformat()
+    return record
+
+def get_default_priority(task_type: TaskType) -> TaskPriority:
+    """获取任务类型的默认优先级（也用于没有优先级字段的旧任务）"""
+    try:
+        return DEFAULT_TASK_PRIORITIES.get(TaskType(task_type), TaskPriority.NORMAL)
+    except ValueError:
+        return TaskPriority.NORMAL
+
 class Task:
     def __init__(
         self,
@@ -75,6 +352,8 @@ class Task:
         current_step: ConversionStep = ConversionStep.INITIALIZED,
         error_message: Optional[str] = None,
         result: Optional[Dict] = None,
+        retry_count: int = 0,
+        priority: Optional[TaskPriority] = None,
         created_at: datetime = None,
         updated_at: datetime = None
     ):
@@ -89,6 +368,8 @@ class Task:
         self.current_step = current_step
         self.error_message = error_message
         self.result = result or {}
+        self.retry_count = retry_count
+        self.priority = TaskPriority(priority) if priority else get_default_priority(task_type)
         self.created_at = created_at or datetime.now()
         self.updated_at = updated_at or datetime.now()
 
@@ -106,6 +387,8 @@ class Task:
             "current_step": self.current_step,
             "error_message": self.error_message,
             "result": self.result,
+            "retry_count": self.retry_count,
+            "priority": self.priority,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat()
         }
@@ -141,6 +424,8 @@ class Task:
             current_step=data.get("current_step"),
             error_message=data.get("error_message"),
             result=data.get("result"),
+            retry_count=data.get("retry_count", 0),
+            priority=data.get("priority"),
             created_at=created_at,
             updated_at=updated_at
         )
@@ -149,42 +434,311 @@ class TaskManager:
     def __init__(self):
         self.db = AsyncIOMotorClient(MONGO_URL).get_database()
         self.redis = RedisService()
+        # 任务状态变化的推送：update_task 发布增量事件，推送连接订阅后实时接收
+        self.events = TaskEventHub(self.redis)
         self.is_running = False
-        self.worker_task = None
+        self.worker_tasks: List[asyncio.Task] = []
+        self.reaper_task: Optional[asyncio.Task] = None
+        self.retry_task: Optional[asyncio.Task] = None
+        self.archive_task: Optional[asyncio.Task] = None
+        # 工作协程标识前缀，用于区分多个API副本持有的租约
+        self.worker_id_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        # 上一轮回收检查中发现没有租约的任务，连续两轮无租约才会被回收
+        self._orphan_candidates: set = set()
+        # 进度写入合并：处理中任务的内存状态、尚未写入的字段变化、上次写入时间和延迟写入协程
+        self._task_cache: Dict[str, Task] = {}
+        self._pending_updates: Dict[str, Dict[str, Any]] = {}
+        self._last_flush: Dict[str, float] = {}
+        self._flush_handles: Dict[str, asyncio.Task] = {}
+        self._flush_locks: Dict[str, asyncio.Lock] = {}
+        # 本进程正在执行的任务的取消信号，处理逻辑（包括线程池中的同步代码）通过它感知取消请求
+        self._cancel_events: Dict[str, threading.Event] = {}
+        # 本进程中已决定重试的任务及其计划执行时间，租约释放后再放入延迟队列
+        self._scheduled_retries: Dict[str, float] = {}
+        # 死信队列：重试次数用完或遇到不可重试错误而失败的任务（任务ID -> 失败信息）
+        self.dead_letter_key = "task_dead_letter"
+        # 旧版本使用的单一队列，启动时会迁移到按任务类型划分的队列
         self.task_queue_key = "task_queue"
+        # 每种任务类型当前正在执行任务的工作协程数量
+        self.active_workers: Dict[TaskType, int] = {task_type: 0 for task_type in TaskType}
 
     async def start(self):
         """启动任务管理器"""
         if not self.is_running:
             self.is_running = True
-            self.worker_task = asyncio.create_task(self._process_tasks())
-            print("任务管理器已启动")
+            await self._migrate_legacy_queue()
+            await self._migrate_unslotted_queue_keys()
+            await asyncio.to_thread(self._clean_stale_work_dirs)
+            for task_type, concurrency in TASK_WORKER_CONCURRENCY.items():
+                for worker_index in range(max(1, concurrency)):
+                    self.worker_tasks.append(
+                        asyncio.create_task(self._worker_loop(task_type, worker_index))
+                    )
+                for worker_index in range(TASK_INTERACTIVE_WORKERS):
+                    self.worker_tasks.append(
+                        asyncio.create_task(self._worker_loop(task_type, worker_index, interactive_only=True))
+                    )
+            self.reaper_task = asyncio.create_task(self._reap_expired_leases())
+            self.retry_task = asyncio.create_task(self._promote_delayed_tasks())
+            if TASK_ARCHIVE_AFTER_DAYS > 0:
+                self.archive_task = asyncio.create_task(self._archive_loop())
+            print(f"任务管理器已启动，工作协程数: {len(self.worker_tasks)}")
 
     async def stop(self):
         """停止任务管理器"""
         if self.is_running:
             self.is_running = False
-            if self.worker_task:
-                self.worker_task.cancel()
-                try:
-                    await self.worker_task
-                except asyncio.CancelledError:
-                    pass
+            background_tasks = list(self.worker_tasks)
+            for background_task in (self.reaper_task, self.retry_task, self.archive_task):
+                if background_task:
+                    background_tasks.append(background_task)
+            for background_task in background_tasks:
+                background_task.cancel()
+            await asyncio.gather(*background_tasks, return_exceptions=True)
+            self.worker_tasks = []
+            self.reaper_task = None
+            self.retry_task = None
+            self.archive_task = None
+            await self.flush_pending_updates()
             print("任务管理器已停止")
 
     def _get_task_key(self, task_id: str) -> str:
         """获取任务在Redis中的键名"""
         return f"task:{task_id}"
 
+    def _get_queue_slot(self, task_type: TaskType) -> str:
+        """
+        任务类型的队列键名前缀（哈希标签）
+
+        入队、出队脚本一次访问同一任务类型的用户队列、轮转列表、额度、唤醒信号和处理中列表，
+        使用相同的哈希标签使它们在Redis Cluster中位于同一个槽
+        """
+        return f"{{{self.task_queue_key}:{TaskType(task_type).value}}}"
+
+    def _get_lane_key(self, task_type: TaskType, priority: TaskPriority) -> str:
+        """获取任务类型在某个优先级通道中的用户队列键名前缀"""
+        return f"{self._get_queue_slot(task_type)}:{TaskPriority(priority).value}"
+
+    def _get_queue_key(self, task_type: TaskType, priority: TaskPriority, user_id: str) -> str:
+        """获取用户在任务类型的某个优先级通道中的队列键名"""
+        return f"{self._get_lane_key(task_type, priority)}:{user_id}"
+
+    def _get_ring_key(self, task_type: TaskType, priority: TaskPriority) -> str:
+        """获取优先级通道的用户轮转列表键名，列表中是队列里有任务的用户"""
+        return f"{self._get_queue_slot(task_type)}:users:{TaskPriority(priority).value}"
+
+    def _get_credits_key(self, task_type: TaskType, priority: TaskPriority) -> str:
+        """获取优先级通道中各用户本轮剩余领取额度的哈希键名"""
+        return f"{self._get_queue_slot(task_type)}:credits:{TaskPriority(priority).value}"
+
+    def _get_signal_key(self, task_type: TaskType, interactive_only: bool = False) -> str:
+        """获取工作协程等待新任务时阻塞监听的唤醒信号列表键名"""
+        suffix = ":interactive" if interactive_only else ""
+        return f"{self._get_queue_slot(task_type)}:signal{suffix}"
+
+    def _get_processing_key(self, task_type: TaskType) -> str:
+        """获取任务类型对应的处理中列表键名，已领取但未完成的任务保存在这里"""
+        return f"{self._get_queue_slot(task_type)}:processing"
+
+    def _get_lease_key(self, task_id: str) -> str:
+        """获取任务租约的键名"""
+        return f"task_lease:{task_id}"
+
+    def _get_delayed_key(self, task_type: TaskType) -> str:
+        """获取任务类型对应的延迟重试队列键名（有序集合，分数为计划执行时间）"""
+        return f"task_delayed:{TaskType(task_type).value}"
+
+    def get_task_work_dir(self, task_id: str) -> str:
+        """获取任务工作目录（不存在时创建），重试时其中的中间产物可以复用"""
+        work_dir = os.path.join(TASK_WORK_DIR, task_id)
+        os.makedirs(work_dir, exist_ok=True)
+        return work_dir
+
+    async def _remove_work_dir(self, task_id: str):
+        """删除任务工作目录"""
+        work_dir = os.path.join(TASK_WORK_DIR, task_id)
+        await asyncio.to_thread(shutil.rmtree, work_dir, True)
+
+    def _clean_stale_work_dirs(self):
+        """清理长时间未更新的任务工作目录（进程崩溃后任务在其他副本完成时会残留）"""
+        if not os.path.isdir(TASK_WORK_DIR):
+            return
+        expire_before = time.time() - TASK_EXPIRE_TIME
+        for name in os.listdir(TASK_WORK_DIR):
+            path = os.path.join(TASK_WORK_DIR, name)
+            try:
+                if os.path.getmtime(path) < expire_before:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError as e:
+                print(f"清理任务工作目录失败: {str(e)}")
+
+    def _get_cancel_key(self, task_id: str) -> str:
+        """获取任务取消标记的键名，标记保存在Redis中以便所有副本的工作协程都能看到"""
+        return f"task_cancel:{task_id}"
+
+    def get_cancel_event(self, task_id: str) -> Optional[threading.Event]:
+        """获取本进程中正在执行的任务的取消信号"""
+        return self._cancel_events.get(task_id)
+
+    async def _is_cancel_requested(self, task_id: str) -> bool:
+        """检查任务是否已被请求取消"""
+        try:
+            return bool(await self.redis.async_redis_client.exists(self._get_cancel_key(task_id)))
+        except redis.exceptions.RedisError as e:
+            print(f"[WARN] 检查任务 {task_id} 取消标记失败: {str(e)}")
+            return False
+
+    async def cancel_task(self, task_id: str) -> Optional[Task]:
+        """
+        取消任务
+
+        排队中的任务直接从队列移除并标记为已取消；执行中的任务设置取消标记，
+        由持有该任务的工作协程停止处理、清理已写入的部分数据后标记为已取消。
+        已结束的任务原样返回
+        """
+        try:
+            task = await self.get_task(task_id)
+            if not task or task.status in FINISHED_TASK_STATUSES:
+                return task
+            
+            await self.redis.async_redis_client.setex(self._get_cancel_key(task_id), TASK_EXPIRE_TIME, "1")
+            # 本进程正在执行该任务时立即通知，不必等待下一次轮询
+            cancel_event = self._cancel_events.get(task_id)
+            if cancel_event:
+                cancel_event.set()
+            
+            await self.redis.async_redis_client.lrem(
+                self._get_queue_key(task.task_type, task.priority, task.user_id), 0, task_id
+            )
+            await self.redis.async_redis_client.zrem(self._get_delayed_key(task.task_type), task_id)
+            if task.status == TaskStatus.PENDING:
+                # 尚未开始执行；如果恰好已被工作协程取出，工作协程会看到取消标记并跳过
+                task = await self.update_task(
+                    task_id,
+                    status=TaskStatus.CANCELLED,
+                    error_message="任务已取消"
+                )
+            print(f"[INFO] 已请求取消任务: {task_id}")
+            return task
+        except redis.exceptions.RedisError as e:
+            raise TaskError(f"Redis错误: {str(e)}")
+
+    async def get_worker_stats(self) -> Dict[str, Dict[str, int]]:
+        """获取各任务类型工作池的占用情况"""
+        stats = {}
+        for task_type, concurrency in TASK_WORKER_CONCURRENCY.items():
+            try:
+                queued_by_priority = {}
+                for priority in TASK_PRIORITY_ORDER:
+                    queues = await self._get_lane_queues(task_type, priority)
+                    queued_by_priority[priority.value] = sum(len(queue) for queue in queues.values())
+                queued = sum(queued_by_priority.values())
+                leased = await self.redis.async_redis_client.llen(self._get_processing_key(task_type))
+            except redis.exceptions.RedisError:
+                queued_by_priority = {}
+                queued = -1
+                leased = -1
+            max_workers = max(1, concurrency) + TASK_INTERACTIVE_WORKERS
+            active = self.active_workers.get(task_type, 0)
+            stats[task_type.value] = {
+                "max_workers": max_workers,
+                "interactive_workers": TASK_INTERACTIVE_WORKERS,
+                "active": active,
+                "idle": max_workers - active,
+                "queued": queued,
+                "queued_by_priority": queued_by_priority,
+                "leased": leased,
+            }
+        return stats
+
+    async def _enqueue_task(self, task: Task, head: bool = False):
+        """
+        将任务加入其用户在对应优先级通道中的队列，并唤醒等待的工作协程
+
+        head为True时插入队首（例如进程停止后放回的任务），否则排在该用户已有任务之后
+        """
+        signal_keys = [self._get_signal_key(task.task_type)]
+        if task.priority == TaskPriority.INTERACTIVE and TASK_INTERACTIVE_WORKERS > 0:
+            signal_keys.append(self._get_signal_key(task.task_type, interactive_only=True))
+        max_signals = max(1, TASK_WORKER_CONCURRENCY.get(TaskType(task.task_type), 1), TASK_INTERACTIVE_WORKERS)
+        await self.redis.async_redis_client.eval(
+            ENQUEUE_TASK_SCRIPT, 2 + len(signal_keys),
+            self._get_queue_key(task.task_type, task.priority, task.user_id),
+            self._get_ring_key(task.task_type, task.priority),
+            *signal_keys,
+            task.task_id, task.user_id, "1" if head else "0", max_signals
+        )
+
+    async def _dequeue_task(self, task_type: TaskType, interactive_only: bool = False) -> Optional[str]:
+        """按优先级和用户加权轮转取出下一个任务并移入处理中列表，没有任务时返回None"""
+        priorities = [TaskPriority.INTERACTIVE] if interactive_only else TASK_PRIORITY_ORDER
+        keys = [self._get_processing_key(task_type)]
+        for priority in priorities:
+            keys.append(self._get_ring_key(task_type, priority))
+            keys.append(self._get_credits_key(task_type, priority))
+        args = [json.dumps(TASK_USER_WEIGHTS), TASK_USER_DEFAULT_WEIGHT]
+        args.extend(self._get_lane_key(task_type, priority) for priority in priorities)
+        return await self.redis.async_redis_client.eval(DEQUEUE_TASK_SCRIPT, len(keys), *keys, *args)
+
+    async def _get_lane_queues(self, task_type: TaskType, priority: TaskPriority) -> Dict[str, List[str]]:
+        """读取优先级通道中按轮转顺序排列的各用户队列"""
+        users = await self.redis.async_redis_client.lrange(self._get_ring_key(task_type, priority), 0, -1)
+        if not users:
+            return {}
+        pipe = self.redis.async_redis_client.pipeline(transaction=False)
+        for user_id in users:
+            pipe.lrange(self._get_queue_key(task_type, priority, user_id), 0, -1)
+        return dict(zip(users, await pipe.execute()))
+
+    async def get_queue_positions(self, task_type: TaskType) -> Dict[str, int]:
+        """
+        获取任务类型中排队任务的预计执行顺序（任务ID -> 从1开始的排队位置）
+
+        按出队脚本相同的优先级和用户加权轮转规则模拟出队，不考虑之后新提交的任务
+        """
+        positions = {}
+        for priority in TASK_PRIORITY_ORDER:
+            queues = {
+                user_id: deque(queue)
+                for user_id, queue in (await self._get_lane_queues(task_type, priority)).items()
+            }
+            credits = await self.redis.async_redis_client.hgetall(self._get_credits_key(task_type, priority))
+            ring = deque(queues)
+            while ring:
+                user_id = ring[0]
+                queue = queues[user_id]
+                if not queue:
+                    ring.popleft()
+                    continue
+                positions.setdefault(queue.popleft(), len(positions) + 1)
+                credit = int(credits.get(user_id) or TASK_USER_WEIGHTS.get(user_id, TASK_USER_DEFAULT_WEIGHT)) - 1
+                if not queue:
+                    ring.popleft()
+                    credits.pop(user_id, None)
+                elif credit <= 0:
+                    ring.rotate(-1)
+                    credits.pop(user_id, None)
+                else:
+                    credits[user_id] = credit
+        return positions
+
     async def create_task(
         self,
         task_type: TaskType,
         user_id: str,
         file_id: str,
         input_file_path: str,
-        output_format: str
+        output_format: str,
+        result: Optional[Dict] = None,
+        priority: Optional[TaskPriority] = None
     ) -> Task:
-        """创建新任务"""
+        """
+        创建新任务
+
+        result 用于在入队前附带处理任务所需的数据（如object_id、filename），
+        保证工作协程取到任务时数据已经完整。
+        priority 未指定时使用任务类型的默认优先级
+        """
         try:
             task_id = str(uuid.uuid4())
             task = Task(
@@ -193,7 +747,9 @@ class TaskManager:
                 user_id=user_id,
                 file_id=file_id,
                 input_file_path=input_file_path,
-                output_format=output_format
+                output_format=output_format,
+                result=result,
+                priority=priority
             )
             
             # 保存任务到Redis和数据库
@@ -202,7 +758,7 @@ class TaskManager:
             task_data = json.dumps(task_dict)
             
             # 保存任务详情到Redis
-            self.redis.redis_client.setex(
+            await self.redis.async_redis_client.setex(
                 task_key, 
                 TASK_EXPIRE_TIME, 
                 task_data
@@ -213,10 +769,9 @@ class TaskManager:
             
             # 将任务添加到Redis队列
             try:
-                # 使用rpush添加到队列末尾
-                # 注意：这里直接使用task_data确保队列中的任务数据与Redis中一致
-                self.redis.redis_client.rpush(self.task_queue_key, task_data)
-                print(f"任务 {task_id} 已添加到队列")
+                # 队列中只保存任务ID，工作协程出队后再读取完整的任务数据
+                await self._enqueue_task(task)
+                print(f"任务 {task_id} 已添加到队列，优先级: {task.priority.value}")
             except redis.exceptions.RedisError as e:
                 print(f"添加任务到Redis队列失败: {str(e)}")
                 # 这里我们继续执行，因为任务数据已经保存到Redis和MongoDB
@@ -232,7 +787,7 @@ class TaskManager:
         try:
             # 从Redis获取
             task_key = self._get_task_key(task_id)
-            task_data = self.redis.redis_client.get(task_key)
+            task_data = await self.redis.async_redis_client.get(task_key)
             
             if task_data:
                 return Task.from_dict(json.loads(task_data))
@@ -242,19 +797,23 @@ class TaskManager:
             if task_data:
                 task = Task.from_dict(task_data)
                 # 保存到Redis
-                self.redis.redis_client.setex(
+                await self.redis.async_redis_client.setex(
                     task_key, 
                     TASK_EXPIRE_TIME, 
                     json.dumps(task.to_dict())
                 )
                 return task
             
-            return None
+            # 已归档的任务只读返回，不写入Redis缓存
+            return await self.get_archived_task(task_id)
         except redis.exceptions.RedisError as e:
             # Redis错误时，尝试从数据库获取
             task_data = await self.db.tasks.find_one({"task_id": task_id})
             if task_data:
                 return Task.from_dict(task_data)
+            task = await self.get_archived_task(task_id)
+            if task:
+                return task
             raise TaskError(f"Redis错误: {str(e)}")
         except Exception as e:
             raise TaskError(f"获取任务失败: {str(e)}")
@@ -266,96 +825,183 @@ class TaskManager:
         progress: Optional[int] = None,
         current_step: Optional[ConversionStep] = None,
         error_message: Optional[str] = None,
-        result: Optional[Dict] = None
+        result: Optional[Dict] = None,
+        retry_count: Optional[int] = None
     ) -> Optional[Task]:
-        """更新任务状态"""
+        """
+        更新任务状态
+
+        只有发生变化的字段才会以$set写入MongoDB。仅包含进度/步骤的更新会被合并，
+        同一任务在TASK_PROGRESS_FLUSH_INTERVAL内最多写入一次；
+        状态、错误信息和结果的变化（包括完成/失败）会连同积压的进度立即写入
+        """
         try:
-            print(f"[DEBUG] 开始更新任务 {task_id}")
-            print(f"[DEBUG] 更新参数: status={status}, progress={progress}, current_step={current_step}")
-            if result:
-                print(f"[DEBUG] 更新result参数: {result}")
-                
-            task = await self.get_task(task_id)
+            task = self._task_cache.get(task_id) or await self.get_task(task_id)
             if not task:
                 print(f"[ERROR] 未找到任务: {task_id}")
                 return None
             
-            # 打印任务当前状态
-            print(f"[DEBUG] 任务当前状态: {task.status}, 进度: {task.progress}")
-            print(f"[DEBUG] 任务当前result: {task.result}")
-            
-            # 更新任务属性
-            if status is not None:
+            # 更新任务属性，并记录实际发生变化的字段
+            changes = {}
+            if status is not None and status != task.status:
                 task.status = status
-            if progress is not None:
+                changes["status"] = status
+            if progress is not None and progress != task.progress:
                 task.progress = progress
-            if current_step is not None:
+                changes["progress"] = progress
+            if current_step is not None and current_step != task.current_step:
                 task.current_step = current_step
-            if error_message is not None:
+                changes["current_step"] = current_step
+            if error_message is not None and error_message != task.error_message:
                 task.error_message = error_message
+                changes["error_message"] = error_message
+            if retry_count is not None and retry_count != task.retry_count:
+                task.retry_count = retry_count
+                changes["retry_count"] = retry_count
             if result is not None:
-                # 如果是要完全替换result
-                if isinstance(result, dict) and not task.result:
-                    task.result = result
-                # 如果是要更新已有result
-                elif isinstance(result, dict) and isinstance(task.result, dict):
-                    task.result.update(result)
-                else:
+                # 如果是要更新已有result，只写入变化的键
+                if isinstance(result, dict) and isinstance(task.result, dict) and task.result:
+                    for key, value in result.items():
+                        if task.result.get(key) != value:
+                            task.result[key] = value
+                            changes[f"result.{key}"] = value
+                # 否则完全替换result
+                elif result != task.result:
                     task.result = result
+                    changes["result"] = result
             
-            task.updated_at = datetime.now()
-            
-            # 打印更新后的状态
-            print(f"[DEBUG] 更新后的任务状态: {task.status}, 进度: {task.progress}")
-            print(f"[DEBUG] 更新后的任务result: {task.result}")
+            if not changes:
+                return task
             
-            # 更新Redis和数据库
-            task_key = self._get_task_key(task_id)
-            task_dict = task.to_dict()
-            task_json = json.dumps(task_dict)
+            task.updated_at = datetime.now()
+            pending = self._pending_updates.setdefault(task_id, {})
+            pending.update(changes)
+            pending["updated_at"] = task.updated_at.isoformat()
             
-            print(f"[DEBUG] 将更新写入Redis，键: {task_key}")
-            self.redis.redis_client.setex(
-                task_key, 
-                TASK_EXPIRE_TIME, 
-                task_json
-            )
+            # 立即推送增量，进度写入数据库的合并不影响推送的实时性
+            await self.events.publish(task_id, "update", self._build_event_delta(changes, task.updated_at))
             
-            print(f"[DEBUG] 将更新写入MongoDB")
-            await self.db.tasks.update_one(
-                {"task_id": task_id},
-                {"$set": task_dict}
-            )
+            since_last_flush = time.monotonic() - self._last_flush.get(task_id, 0)
+            if set(changes) <= COALESCIBLE_TASK_FIELDS and since_last_flush < TASK_PROGRESS_FLUSH_INTERVAL:
+                self._task_cache[task_id] = task
+                self._schedule_flush(task_id, TASK_PROGRESS_FLUSH_INTERVAL - since_last_flush)
+                return task
             
-            print(f"[DEBUG] 任务 {task_id} 更新完成")
+            await self._flush_task(task)
+            if task.status in FINISHED_TASK_STATUSES:
+                self._forget_task(task_id)
+            else:
+                self._task_cache[task_id] = task
             return task
         except redis.exceptions.RedisError as e:
-            # Redis错误时，只更新数据库
             print(f"[ERROR] Redis错误: {str(e)}")
-            if task:
-                await self.db.tasks.update_one(
-                    {"task_id": task_id},
-                    {"$set": task.to_dict()}
-                )
             raise TaskError(f"Redis错误: {str(e)}")
         except Exception as e:
             print(f"[ERROR] 更新任务失败: {str(e)}")
             raise TaskError(f"更新任务失败: {str(e)}")
 
+    def _build_event_delta(self, changes: Dict[str, Any], updated_at: datetime) -> Dict[str, Any]:
+        """将写入数据库的字段变化转换为推送给客户端的增量（result.xxx 还原为嵌套结构）"""
+        delta = {}
+        for key, value in changes.items():
+            if key.startswith("result."):
+                delta.setdefault("result", {})[key[len("result."):]] = value
+            else:
+                delta[key] = value
+        delta["updated_at"] = updated_at.isoformat()
+        return delta
+
+    async def _flush_task(self, task: Task):
+        """将任务积压的字段变化写入MongoDB，并刷新Redis中的任务快照"""
+        handle = self._flush_handles.pop(task.task_id, None)
+        if handle:
+            handle.cancel()
+        # 同一任务的写入串行执行，避免较早的进度覆盖较新的进度
+        lock = self._flush_locks.setdefault(task.task_id, asyncio.Lock())
+        async with lock:
+            changes = self._pending_updates.pop(task.task_id, None)
+            if not changes:
+                return
+            self._last_flush[task.task_id] = time.monotonic()
+            
+            # MongoDB是任务状态的最终来源，先写入
+            update_result = await self.db.tasks.update_one(
+                {"task_id": task.task_id},
+                {"$set": changes}
+            )
+            if update_result.matched_count == 0:
+                # 任务在执行期间已被删除（例如删除时取消），不再写回Redis缓存
+                await self.redis.async_redis_client.delete(self._get_task_key(task.task_id))
+                return
+            await self.redis.async_redis_client.setex(
+                self._get_task_key(task.task_id),
+                TASK_EXPIRE_TIME,
+                json.dumps(task.to_dict())
+            )
+
+    def _schedule_flush(self, task_id: str, delay: float):
+        """安排一次延迟写入，保证合并后的最后一次进度最终会被写入"""
+        if task_id not in self._flush_handles:
+            self._flush_handles[task_id] = asyncio.create_task(self._delayed_flush(task_id, delay))
+
+    async def _delayed_flush(self, task_id: str, delay: float):
+        """延迟写入协程"""
+        await asyncio.sleep(delay)
+        self._flush_handles.pop(task_id, None)
+        task = self._task_cache.get(task_id)
+        if not task:
+            return
+        try:
+            await self._flush_task(task)
+        except Exception as e:
+            print(f"[ERROR] 写入任务 {task_id} 进度失败: {str(e)}")
+
+    async def flush_pending_updates(self):
+        """立即写入所有积压的进度更新"""
+        for task_id in list(self._pending_updates):
+            task = self._task_cache.get(task_id)
+            if not task:
+                self._pending_updates.pop(task_id, None)
+                continue
+            try:
+                await self._flush_task(task)
+            except Exception as e:
+                print(f"[ERROR] 写入任务 {task_id} 进度失败: {str(e)}")
+
+    def _forget_task(self, task_id: str):
+        """丢弃任务的内存状态（任务结束、租约释放或任务删除时调用）"""
+        handle = self._flush_handles.pop(task_id, None)
+        if handle:
+            handle.cancel()
+        self._task_cache.pop(task_id, None)
+        self._pending_updates.pop(task_id, None)
+        self._last_flush.pop(task_id, None)
+        self._flush_locks.pop(task_id, None)
+
     async def delete_task(self, task_id: str) -> bool:
         """删除任务"""
         try:
-            # 从Redis删除
+            self._forget_task(task_id)
+            
+            # 从Redis删除（包括延迟重试队列和死信队列中的记录）
             task_key = self._get_task_key(task_id)
-            self.redis.redis_client.delete(task_key)
+            await self.redis.async_redis_client.delete(task_key)
+            for task_type in TASK_WORKER_CONCURRENCY:
+                await self.redis.async_redis_client.zrem(self._get_delayed_key(task_type), task_id)
+            await self.redis.async_redis_client.hdel(self.dead_letter_key, task_id)
             
-            # 从数据库删除
+            # 从数据库删除（包括归档集合）
             result = await self.db.tasks.delete_one({"task_id": task_id})
+            archived_result = await self.db.tasks_archive.delete_one({"task_id": task_id})
             
-            return result.deleted_count > 0
+            deleted = result.deleted_count > 0 or archived_result.deleted_count > 0
+            if deleted:
+                await self.events.publish(task_id, "deleted", {})
+            return deleted
         except redis.exceptions.RedisError as e:
             # Redis错误时，只删除数据库中的任务
-            result = await self.db.tasks.delete_one({"task_id": task_id})
+            await self.db.tasks.delete_one({"task_id": task_id})
+            await self.db.tasks_archive.delete_one({"task_id": task_id})
             raise TaskError(f"Redis错误: {str(e)}")
         except Exception as e:
             raise TaskError(f"删除任务失败: {str(e)}")
@@ -366,6 +1012,7 @@ class TaskManager:
             # 从数据库获取所有任务
             task_data_list = await self.db.tasks.find({"user_id": user_id}).to_list(length=None)
             tasks = []
+            pipe = self.redis.async_redis_client.pipeline(transaction=False)
             
             for task_data in task_data_list:
                 # 确保日期时间字段格式正确
@@ -375,14 +1022,17 @@ class TaskManager:
                     task_data["updated_at"] = task_data["updated_at"].isoformat()
                 
                 task = Task.from_dict(task_data)
-                # 更新Redis缓存
+                # 更新Redis缓存（通过管道一次性写入）
                 task_key = self._get_task_key(task.task_id)
-                self.redis.redis_client.setex(
+                pipe.setex(
                     task_key, 
                     TASK_EXPIRE_TIME, 
                     json.dumps(task.to_dict())
                 )
                 tasks.append(task)
+            
+            if tasks:
+                await pipe.execute()
                 
             return tasks
         except redis.exceptions.RedisError as e:
@@ -392,64 +1042,464 @@ class TaskManager:
         except Exception as e:
             raise TaskError(f"获取用户任务失败: {str(e)}")
 
-    async def _process_tasks(self):
-        """处理队列中的任务"""
+    async def get_archived_task(self, task_id: str) -> Optional[Task]:
+        """从归档集合获取任务，任务未归档时返回None"""
+        task_data = await self.db.tasks_archive.find_one({"task_id": task_id})
+        if task_data:
+            return Task.from_dict(task_data)
+        return None
+
+    async def archive_finished_tasks(self) -> int:
+        """
+        将结束超过TASK_ARCHIVE_AFTER_DAYS天的任务移入归档集合，返回归档的任务数
+
+        先写入归档集合再从tasks集合删除，归档集合的task_id唯一索引保证多个副本同时归档时不会重复。
+        死信队列中的任务保留在tasks集合中，以便重放
+        """
+        cutoff = (datetime.now() - timedelta(days=TASK_ARCHIVE_AFTER_DAYS)).isoformat()
+        dead_letter_ids = await self.redis.async_redis_client.hkeys(self.dead_letter_key)
+        query = {
+            "status": {"$in": [status.value for status in FINISHED_TASK_STATUSES]},
+            "updated_at": {"$lt": cutoff},
+        }
+        if dead_letter_ids:
+            query["task_id"] = {"$nin": dead_letter_ids}
+
+        archived_count = 0
         while self.is_running:
+            task_data_list = await self.db.tasks.find(query).limit(TASK_ARCHIVE_BATCH_SIZE).to_list(length=None)
+            if not task_data_list:
+                break
             try:
-                # 采用非阻塞方式检查任务队列
-                # 使用lpop而不是blpop，避免阻塞主线程
-                task_data = self.redis.redis_client.lpop(self.task_queue_key)
-                
-                if not task_data:
-                    # 队列为空，等待5秒后再检查
-                    await asyncio.sleep(5)
+                await self.db.tasks_archive.insert_many(
+                    [build_archived_task(task_data) for task_data in task_data_list], ordered=False
+                )
+            except pymongo.errors.BulkWriteError as e:
+                # 其他副本已归档的任务会违反唯一索引，忽略；其他写入错误则停止本轮归档
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+
+            task_ids = [task_data["task_id"] for task_data in task_data_list]
+            # 只删除仍满足归档条件的任务，归档期间被重放或更新的任务保留在tasks集合中
+            await self.db.tasks.delete_many({**query, "task_id": {"$in": task_ids}})
+            remaining = set(await self.db.tasks.distinct("task_id", {"task_id": {"$in": task_ids}}))
+            if remaining:
+                await self.db.tasks_archive.delete_many({"task_id": {"$in": list(remaining)}})
+            archived_ids = [task_id for task_id in task_ids if task_id not in remaining]
+            if archived_ids:
+                await self.redis.async_redis_client.delete(
+                    *[self._get_task_key(task_id) for task_id in archived_ids]
+                )
+            archived_count += len(archived_ids)
+            if len(task_data_list) < TASK_ARCHIVE_BATCH_SIZE or not archived_ids:
+                break
+        return archived_count
+
+    async def _archive_loop(self):
+        """归档协程：定期将长期结束的任务移入归档集合"""
+        while self.is_running:
+            try:
+                archived_count = await self.archive_finished_tasks()
+                if archived_count:
+                    print(f"[INFO] 已归档{archived_count}个结束超过{TASK_ARCHIVE_AFTER_DAYS}天的任务")
+            except asyncio.CancelledError:
+                raise
+            except redis.exceptions.RedisError as e:
+                print(f"归档任务时Redis错误: {str(e)}")
+            except Exception as e:
+                print(f"归档任务时出错: {str(e)}")
+            await asyncio.sleep(TASK_ARCHIVE_INTERVAL)
+
+    def _parse_queue_entry(self, entry: str) -> Optional[str]:
+        """解析队列中的条目，兼容旧版本保存完整任务JSON的格式"""
+        if entry.startswith("{"):
+            try:
+                return json.loads(entry).get("task_id")
+            except json.JSONDecodeError as e:
+                print(f"JSON解析错误: {str(e)}, 原始数据: {entry}")
+                return None
+        return entry
+
+    async def _migrate_legacy_queue(self):
+        """将旧版单一队列和按任务类型划分的队列中的任务迁移到按优先级和用户划分的队列"""
+        legacy_keys = [self.task_queue_key]
+        legacy_keys.extend(f"{self.task_queue_key}:{task_type.value}" for task_type in TASK_WORKER_CONCURRENCY)
+        try:
+            for legacy_key in legacy_keys:
+                while True:
+                    entry = await self.redis.async_redis_client.lpop(legacy_key)
+                    if not entry:
+                        break
+                    task_id = self._parse_queue_entry(entry)
+                    if not task_id:
+                        continue
+                    task = await self.get_task(task_id)
+                    if not task or task.task_type not in list(TASK_WORKER_CONCURRENCY):
+                        print(f"[WARN] 跳过无法迁移的旧队列任务: {task_id}")
+                        continue
+                    await self._enqueue_task(task)
+                    print(f"[INFO] 已将旧队列任务 {task_id} 迁移到 {self._get_lane_key(task.task_type, task.priority)}")
+        except redis.exceptions.RedisError as e:
+            print(f"迁移旧任务队列失败: {str(e)}")
+
+    async def _migrate_unslotted_queue_keys(self):
+        """
+        将未使用哈希标签的旧键名中的排队任务和处理中任务迁移到 {task_queue:<类型>} 下的键名
+
+        排队任务按原顺序重新入队；处理中的任务移到新的处理中列表，租约过期后照常由回收协程重新入队
+        """
+        client = self.redis.async_redis_client
+        try:
+            for task_type in TaskType:
+                type_value = task_type.value
+                for priority in TASK_PRIORITY_ORDER:
+                    ring_key = f"task_queue_users:{type_value}:{priority.value}"
+                    for user_id in await client.lrange(ring_key, 0, -1):
+                        queue_key = f"{self.task_queue_key}:{type_value}:{priority.value}:{user_id}"
+                        while True:
+                            task_id = await client.lpop(queue_key)
+                            if not task_id:
+                                break
+                            task = await self.get_task(task_id)
+                            if not task:
+                                print(f"[WARN] 跳过无法迁移的排队任务: {task_id}")
+                                continue
+                            await self._enqueue_task(task)
+                            print(f"[INFO] 已将排队任务 {task_id} 迁移到 {self._get_lane_key(task.task_type, task.priority)}")
+                    await client.delete(ring_key, f"task_queue_credits:{type_value}:{priority.value}")
+                processing_key = f"task_processing:{type_value}"
+                while True:
+                    task_id = await client.lpop(processing_key)
+                    if not task_id:
+                        break
+                    await client.rpush(self._get_processing_key(task_type), task_id)
+                    print(f"[INFO] 已将处理中任务 {task_id} 迁移到 {self._get_processing_key(task_type)}")
+                await client.delete(f"task_queue_signal:{type_value}", f"task_queue_signal:{type_value}:interactive")
+        except redis.exceptions.RedisError as e:
+            print(f"迁移任务队列键名失败: {str(e)}")
+
+    def _get_task_handler(self, task_type: TaskType) -> Optional[Callable]:
+        """获取任务类型对应的处理函数"""
+        handlers = {
+            TaskType.FILE_CONVERSION: self._process_file_conversion_task,
+            TaskType.THREEDTILES_PROCESSING: self._process_threedtiles_task,
+            TaskType.WMTS_PROCESSING: self._process_wmts_task,
+            TaskType.PREFIX_DELETION: self._process_prefix_deletion_task,
+            TaskType.TILE_SEEDING: self._process_tile_seeding_task,
+        }
+        return handlers.get(task_type)
+
+    async def _claim_task(self, task_id: str, worker_id: str) -> bool:
+        """为任务设置租约，返回是否领取成功"""
+        claimed = await self.redis.async_redis_client.set(
+            self._get_lease_key(task_id), worker_id, ex=TASK_LEASE_TIMEOUT, nx=True
+        )
+        return bool(claimed)
+
+    async def _renew_lease(self, task_id: str, worker_id: str) -> bool:
+        """续期任务租约，租约已被回收时返回False"""
+        renewed = await self.redis.async_redis_client.eval(
+            RENEW_LEASE_SCRIPT, 1, self._get_lease_key(task_id), worker_id, TASK_LEASE_TIMEOUT
+        )
+        return bool(renewed)
+
+    async def _release_task(self, task_type: TaskType, task_id: str, worker_id: str):
+        """任务执行结束后释放租约并从处理中列表移除"""
+        task = self._task_cache.get(task_id)
+        if task:
+            try:
+                await self._flush_task(task)
+            except Exception as e:
+                print(f"[ERROR] 写入任务 {task_id} 进度失败: {str(e)}")
+        self._forget_task(task_id)
+        self._cancel_events.pop(task_id, None)
+        await self.redis.async_redis_client.lrem(self._get_processing_key(task_type), 1, task_id)
+        await self.redis.async_redis_client.delete(self._get_cancel_key(task_id))
+        await self.redis.async_redis_client.eval(
+            RELEASE_LEASE_SCRIPT, 1, self._get_lease_key(task_id), worker_id
+        )
+
+    async def _mark_cancelled(self, task_id: str):
+        """将被取消的任务标记为已取消（取消请求到达前已经完成的任务保持完成状态）"""
+        try:
+            task = await self.get_task(task_id)
+            if task and task.status != TaskStatus.COMPLETED:
+                await self.update_task(task_id, status=TaskStatus.CANCELLED, error_message="任务已取消")
+                print(f"[INFO] 任务 {task_id} 已取消")
+        except TaskError as e:
+            print(f"[ERROR] 标记任务 {task_id} 为已取消失败: {str(e)}")
+
+    def _get_retry_delay(self, task_type: TaskType, attempt: int) -> float:
+        """计算第attempt次重试前的等待时间：指数退避，并加入随机抖动避免大量任务同时重试"""
+        policy = TASK_RETRY_POLICIES[TaskType(task_type)]
+        delay = min(policy["max_delay"], policy["base_delay"] * (2 ** (attempt - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _fail_task(self, task: Task, error_message: str, retryable: bool = False):
+        """
+        处理任务失败
+
+        可重试的错误在重试次数未用完时把任务重置为等待状态，租约释放后放入延迟重试队列；
+        否则将任务标记为失败并放入死信队列
+        """
+        current = self._task_cache.get(task.task_id) or await self.get_task(task.task_id)
+        if not current:
+            return
+        policy = TASK_RETRY_POLICIES.get(TaskType(current.task_type))
+        if retryable and policy and current.retry_count < policy["max_retries"]:
+            attempt = current.retry_count + 1
+            delay = self._get_retry_delay(current.task_type, attempt)
+            self._scheduled_retries[task.task_id] = time.time() + delay
+            await self.update_task(
+                task.task_id,
+                status=TaskStatus.PENDING,
+                retry_count=attempt,
+                error_message=f"{error_message}（{delay:.0f}秒后进行第{attempt}次重试）"
+            )
+            print(f"[WARN] 任务 {task.task_id} 失败，{delay:.0f}秒后进行第{attempt}次重试: {error_message}")
+            return
+        
+        await self.update_task(
+            task.task_id,
+            status=TaskStatus.FAILED,
+            error_message=error_message
+        )
+        entry = {
+            "task_id": current.task_id,
+            "task_type": current.task_type,
+            "user_id": current.user_id,
+            "error_message": error_message,
+            "retry_count": current.retry_count,
+            "retryable": retryable,
+            "failed_at": datetime.now().isoformat(),
+        }
+        try:
+            await self.redis.async_redis_client.hset(self.dead_letter_key, current.task_id, json.dumps(entry))
+            print(f"[ERROR] 任务 {current.task_id} 失败，已放入死信队列: {error_message}")
+        except redis.exceptions.RedisError as e:
+            print(f"[ERROR] 任务 {current.task_id} 放入死信队列失败: {str(e)}")
+
+    async def list_dead_letters(self, task_type: Optional[TaskType] = None) -> List[Dict]:
+        """获取死信队列中的任务，按失败时间倒序排列"""
+        try:
+            entries = await self.redis.async_redis_client.hvals(self.dead_letter_key)
+        except redis.exceptions.RedisError as e:
+            raise TaskError(f"Redis错误: {str(e)}")
+        dead_letters = [json.loads(entry) for entry in entries]
+        if task_type:
+            dead_letters = [item for item in dead_letters if item.get("task_type") == TaskType(task_type).value]
+        dead_letters.sort(key=lambda item: item.get("failed_at", ""), reverse=True)
+        return dead_letters
+
+    async def replay_dead_letter(self, task_id: str) -> Optional[Task]:
+        """将死信队列中的任务重置重试次数后重新入队，任务不在死信队列中时返回None"""
+        try:
+            removed = await self.redis.async_redis_client.hdel(self.dead_letter_key, task_id)
+            if not removed:
+                return None
+            task = await self.update_task(
+                task_id,
+                status=TaskStatus.PENDING,
+                progress=0,
+                current_step=ConversionStep.INITIALIZED,
+                error_message="",
+                retry_count=0
+            )
+            if not task:
+                return None
+            await self._enqueue_task(task)
+            print(f"[INFO] 死信任务 {task_id} 已重新入队")
+            return task
+        except redis.exceptions.RedisError as e:
+            raise TaskError(f"Redis错误: {str(e)}")
+
+    async def _promote_delayed_tasks(self):
+        """重试调度协程：定期将到期的延迟重试任务移回对应的任务队列"""
+        while self.is_running:
+            try:
+                for task_type in TASK_WORKER_CONCURRENCY:
+                    task_ids = await self.redis.async_redis_client.eval(
+                        PROMOTE_DELAYED_SCRIPT, 1, self._get_delayed_key(task_type), time.time()
+                    )
+                    for task_id in task_ids:
+                        task = await self.get_task(task_id)
+                        if task and task.status == TaskStatus.PENDING:
+                            await self._enqueue_task(task)
+                    if task_ids:
+                        print(f"[INFO] {len(task_ids)}个重试任务已重新入队: {task_type.value}")
+            except asyncio.CancelledError:
+                raise
+            except redis.exceptions.RedisError as e:
+                print(f"调度重试任务时Redis错误: {str(e)}")
+            except Exception as e:
+                print(f"调度重试任务时出错: {str(e)}")
+            await asyncio.sleep(TASK_RETRY_POLL_INTERVAL)
+
+    async def _requeue_task(self, task_type: TaskType, task_id: str, reason: str) -> bool:
+        """
+        将处理中列表里的任务放回队列头部重新执行
+
+        lrem是原子操作，多个副本同时回收同一任务时只有一个会成功。
+        工作协程在写入完成/失败状态后、释放任务前崩溃时，任务已经结束，只删除处理中条目和租约
+        """
+        removed = await self.redis.async_redis_client.lrem(self._get_processing_key(task_type), 1, task_id)
+        if not removed:
+            return False
+        await self.redis.async_redis_client.delete(self._get_lease_key(task_id))
+        # 从Redis或数据库读取任务状态，本地缓存可能早于其他副本写入的结束状态
+        stored_task = await self.get_task(task_id)
+        if not stored_task:
+            print(f"[WARN] 任务 {task_id} 已不存在，不再重新入队")
+            self._forget_task(task_id)
+            return True
+        if stored_task.status in FINISHED_TASK_STATUSES:
+            print(f"[INFO] 任务 {task_id} 已结束（{stored_task.status.value}），不再重新入队")
+            self._forget_task(task_id)
+            return True
+        task = self._task_cache.get(task_id) or stored_task
+        # 先写入等待状态并丢弃内存状态再入队，入队后其他副本可能立即领取并开始处理
+        try:
+            task = await self.update_task(task_id, status=TaskStatus.PENDING) or task
+        except TaskError as e:
+            print(f"[ERROR] 重置任务 {task_id} 状态失败: {str(e)}")
+        self._forget_task(task_id)
+        await self._enqueue_task(task, head=True)
+        print(f"[WARN] 任务 {task_id} 已重新入队: {reason}")
+        return True
+
+    async def _run_with_lease(self, task_type: TaskType, task: Task, worker_id: str, handler: Callable):
+        """
+        执行任务并在执行期间定期续期租约、检查取消标记
+
+        如果租约丢失（例如心跳长时间中断后已被其他副本回收），取消本地执行，
+        避免同一任务被重复处理。
+        收到取消请求时先设置取消信号，让处理逻辑在下一个检查点停止并清理部分数据，
+        超过TASK_CANCEL_GRACE_PERIOD仍未停止时强制中断
+        """
+        cancel_event = self._cancel_events.setdefault(task.task_id, threading.Event())
+        handler_task = asyncio.create_task(handler(task))
+        last_heartbeat = time.monotonic()
+        cancel_deadline = None
+        try:
+            while True:
+                done, _ = await asyncio.wait({handler_task}, timeout=TASK_CANCEL_POLL_INTERVAL)
+                if done:
+                    break
+                now = time.monotonic()
+                if cancel_deadline is None:
+                    if cancel_event.is_set() or await self._is_cancel_requested(task.task_id):
+                        print(f"[INFO] 任务 {task.task_id} 收到取消请求，等待处理逻辑停止")
+                        cancel_event.set()
+                        cancel_deadline = now + TASK_CANCEL_GRACE_PERIOD
+                elif now >= cancel_deadline:
+                    print(f"[WARN] 任务 {task.task_id} 未在{TASK_CANCEL_GRACE_PERIOD}秒内停止，强制中断")
+                    handler_task.cancel()
+                    await asyncio.gather(handler_task, return_exceptions=True)
+                    break
+                if now - last_heartbeat < TASK_LEASE_HEARTBEAT_INTERVAL:
                     continue
-                
-                # 解析任务数据
+                last_heartbeat = now
                 try:
-                    print(f"[INFO] 从队列获取到新任务，开始处理...")
-                    task_dict = json.loads(task_data)
-                    queue_task = Task.from_dict(task_dict)
-                    
-                    # 重要：从Redis或数据库获取完整的任务数据
-                    # 而不是直接使用队列中可能不完整的数据
-                    print(f"[DEBUG] 从队列获取任务ID: {queue_task.task_id}，正在获取完整任务数据")
-                    task = await self.get_task(queue_task.task_id)
-                    
-                    if not task:
-                        print(f"[ERROR] 无法获取完整任务数据，ID: {queue_task.task_id}")
-                        continue
-                    
-                    print(f"开始处理任务: {task.task_id}, 类型: {task.task_type}")
-                    print(f"[DEBUG] 完整任务数据: result={task.result}")
-                    
-                    # 使用create_task创建新协程，不等待完成
-                    # 这样可以避免阻塞主事件循环
-                    if task.task_type == TaskType.FILE_CONVERSION:
-                        print(f"[INFO] 创建文件转换任务协程，任务ID: {task.task_id}")
-                        asyncio.create_task(
-                            self._process_file_conversion_task(task)
-                        )
-                    elif task.task_type == TaskType.THREEDTILES_PROCESSING:
-                        print(f"[INFO] 创建3DTiles处理任务协程，任务ID: {task.task_id}")
-                        asyncio.create_task(
-                            self._process_threedtiles_task(task)
-                        )
-                    elif task.task_type == TaskType.WMTS_PROCESSING:
-                        print(f"[INFO] 创建WMTS处理任务协程，任务ID: {task.task_id}")
-                        asyncio.create_task(
-                            self._process_wmts_task(task)
-                        )
-                    else:
-                        print(f"未知任务类型: {task.task_type}")
-                    
-                    # 主循环继续检查下一个任务，不等待当前任务完成
-                    await asyncio.sleep(0.1)  # 短暂休眠，让出CPU给其他协程
-                        
-                except json.JSONDecodeError as e:
-                    print(f"JSON解析错误: {str(e)}, 原始数据: {task_data}")
+                    renewed = await self._renew_lease(task.task_id, worker_id)
+                except redis.exceptions.RedisError as e:
+                    # Redis短暂不可用时继续执行，下一次心跳再尝试续期
+                    print(f"[WARN] 任务 {task.task_id} 租约续期失败: {str(e)}")
+                    continue
+                if not renewed:
+                    print(f"[WARN] 任务 {task.task_id} 的租约已丢失，停止本地执行")
+                    handler_task.cancel()
+                    await asyncio.gather(handler_task, return_exceptions=True)
+                    self._forget_task(task.task_id)
+                    self._cancel_events.pop(task.task_id, None)
+                    self._scheduled_retries.pop(task.task_id, None)
+                    return
+            if not handler_task.cancelled():
+                await handler_task
+        except asyncio.CancelledError:
+            # 任务管理器停止时立即把任务放回队列，而不是等待租约过期
+            handler_task.cancel()
+            await asyncio.gather(handler_task, return_exceptions=True)
+            await self._requeue_task(task_type, task.task_id, "任务管理器停止")
+            self._cancel_events.pop(task.task_id, None)
+            self._scheduled_retries.pop(task.task_id, None)
+            raise
+        except Exception as e:
+            print(f"[ERROR] 任务 {task.task_id} 执行异常: {str(e)}")
+            import traceback
+            traceback.print_exc()
+        if cancel_event.is_set():
+            self._scheduled_retries.pop(task.task_id, None)
+            await self._mark_cancelled(task.task_id)
+        await self._release_task(task_type, task.task_id, worker_id)
+        retry_at = self._scheduled_retries.pop(task.task_id, None)
+        if retry_at is not None:
+            # 租约释放后再放入延迟队列，避免任务到期被领取时租约仍未释放；工作目录保留供重试复用
+            await self.redis.async_redis_client.zadd(self._get_delayed_key(task_type), {task.task_id: retry_at})
+        else:
+            await self._remove_work_dir(task.task_id)
+
+    async def _worker_loop(self, task_type: TaskType, worker_index: int, interactive_only: bool = False):
+        """
+        工作协程：按优先级和用户加权轮转从对应任务类型的队列中领取任务，逐个执行
+
+        每种任务类型启动固定数量的工作协程，因此同一时间运行的任务数量有上限，
+        且某一类任务积压不会占用其他类型的执行名额；interactive_only的工作协程
+        只领取交互式任务，批量任务占满工作池时交互式任务仍能立即开始。
+        出队时任务被原子地移入处理中列表并设置租约，进程崩溃后由回收协程重新入队，
+        保证任务至少被执行一次
+        """
+        processing_key = self._get_processing_key(task_type)
+        signal_key = self._get_signal_key(task_type, interactive_only)
+        worker_name = f"interactive{worker_index}" if interactive_only else str(worker_index)
+        worker_id = f"{self.worker_id_prefix}:{task_type.value}#{worker_name}"
+        handler = self._get_task_handler(task_type)
+        while self.is_running:
+            try:
+                # 出队并移入处理中列表；队列为空时阻塞等待唤醒信号，超时后再检查一次队列
+                entry = await self._dequeue_task(task_type, interactive_only)
+                if not entry:
+                    await self.redis.async_redis_client.blpop(signal_key, TASK_QUEUE_BLOCK_TIMEOUT)
+                    continue
+
+                # 按类型划分的队列中只保存任务ID
+                task_id = entry
+                if not await self._claim_task(task_id, worker_id):
+                    # 已被其他工作协程持有（重复入队），丢弃该条目
+                    print(f"[WARN] 任务 {task_id} 已被其他工作协程领取，跳过")
+                    await self.redis.async_redis_client.lrem(processing_key, 1, task_id)
+                    continue
+
+                # 从Redis或数据库获取完整的任务数据（丢弃可能过期的内存状态）
+                self._forget_task(task_id)
+                task = await self.get_task(task_id)
+                if not task:
+                    print(f"[ERROR] 无法获取完整任务数据，ID: {task_id}")
+                    await self._release_task(task_type, task_id, worker_id)
+                    continue
+
+                # 已经结束的任务（如重复入队的条目）直接跳过
+                if task.status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+                    print(f"[INFO] 任务 {task_id} 已结束（{task.status.value}），跳过")
+                    await self._release_task(task_type, task_id, worker_id)
                     continue
-                    
+
+                # 排队期间已被取消的任务直接跳过
+                if task.status == TaskStatus.CANCELLED or await self._is_cancel_requested(task_id):
+                    print(f"[INFO] 任务 {task_id} 已取消，跳过")
+                    await self._mark_cancelled(task_id)
+                    await self._release_task(task_type, task_id, worker_id)
+                    await self._remove_work_dir(task_id)
+                    continue
+
+                print(f"[INFO] 工作协程 {worker_id} 开始处理任务: {task.task_id}")
+                self.active_workers[task_type] += 1
+                try:
+                    await self._run_with_lease(task_type, task, worker_id, handler)
+                finally:
+                    self.active_workers[task_type] -= 1
+
+            except asyncio.CancelledError:
+                raise
             except redis.exceptions.RedisError as e:
                 # Redis连接错误，输出日志并等待一段时间
                 print(f"Redis错误: {str(e)}")
@@ -462,6 +1512,36 @@ class TaskManager:
                 # 等待一段时间后继续
                 await asyncio.sleep(5)
 
+    async def _reap_expired_leases(self):
+        """
+        回收协程：定期检查处理中列表，将租约已过期的任务重新入队
+
+        工作协程在出队和设置租约之间存在极短的时间窗口，
+        因此只有连续两轮检查都没有租约的任务才会被回收
+        """
+        while self.is_running:
+            try:
+                orphans = set()
+                for task_type in TASK_WORKER_CONCURRENCY:
+                    processing_key = self._get_processing_key(task_type)
+                    task_ids = await self.redis.async_redis_client.lrange(processing_key, 0, -1)
+                    for task_id in task_ids:
+                        if await self.redis.async_redis_client.exists(self._get_lease_key(task_id)):
+                            continue
+                        candidate = (task_type, task_id)
+                        if candidate in self._orphan_candidates:
+                            await self._requeue_task(task_type, task_id, "租约已过期")
+                        else:
+                            orphans.add(candidate)
+                self._orphan_candidates = orphans
+            except asyncio.CancelledError:
+                raise
+            except redis.exceptions.RedisError as e:
+                print(f"回收过期任务租约时Redis错误: {str(e)}")
+            except Exception as e:
+                print(f"回收过期任务租约时出错: {str(e)}")
+            await asyncio.sleep(TASK_LEASE_REAP_INTERVAL)
+
     async def _process_file_conversion_task(self, task: Task):
         """处理文件转换任务"""
         try:
@@ -470,28 +1550,35 @@ class TaskManager:
                 task.task_id,
                 status=TaskStatus.PROCESSING,
                 current_step=ConversionStep.DOWNLOADING,
-                progress=10
+                progress=0
             )
             
-            # 更新任务状态为转换中
-            await self.update_task(
-                task.task_id,
-                current_step=ConversionStep.CONVERTING,
-                progress=30
-            )
-            
-            # 更新任务状态为上传中
-            await self.update_task(
-                task.task_id,
-                current_step=ConversionStep.UPLOADING,
-                progress=70
-            )
+            async def on_progress(step: ConversionStep, progress: Optional[int], stage: Optional[str]):
+                # 转换程序报告的阶段名称如果与转换步骤一致则直接使用，否则记录到结果中
+                if stage:
+                    if stage in (ConversionStep.CONVERTING, ConversionStep.UPLOADING):
+                        step = ConversionStep(stage)
+                    else:
+                        await self.update_task(task.task_id, result={"converter_stage": stage})
+                await self.update_task(task.task_id, current_step=step, progress=progress)
             
-            # 使用文件转换器转换文件
+            # 使用文件转换器转换文件，进度由转换进程的输出实时驱动
             from app.tasks.file_converter import FileConverter
-            success, error_message, output_file_path = await FileConverter.convert_file(task)
+            cancel_event = self.get_cancel_event(task.task_id)
+            work_dir = self.get_task_work_dir(task.task_id)
+            success, error_message, output_file_path = await FileConverter.convert_file(
+                task, on_progress, cancel_event, work_dir
+            )
             
             if success:
+                # 登记到转换结果缓存，相同内容的文件已先完成转换时改用已有的结果
+                cache_key = task.result.get("cache_key")
+                if cache_key:
+                    from app.services.conversion_cache import ConversionCacheService
+                    output_file_path = await ConversionCacheService(self.db).register(
+                        cache_key, task.file_id, output_file_path
+                    )
+                
                 # 更新任务状态为完成
                 await self.update_task(
                     task.task_id,
@@ -503,21 +1590,16 @@ class TaskManager:
                 
                 # 更新文件元数据
                 await self._update_file_metadata(task, output_file_path)
+            elif cancel_event and cancel_event.is_set():
+                # 已取消的任务由工作协程统一标记状态
+                return
             else:
                 # 更新任务状态为失败
-                await self.update_task(
-                    task.task_id,
-                    status=TaskStatus.FAILED,
-                    error_message=error_message
-                )
+                await self._fail_task(task, error_message)
             
         except Exception as e:
-            # 更新任务状态为失败
-            await self.update_task(
-                task.task_id,
-                status=TaskStatus.FAILED,
-                error_message=str(e)
-            )
+            # 可重试的错误按重试策略重新调度，否则任务失败并进入死信队列
+            await self._fail_task(task, str(e), is_retryable_error(e))
             raise e
             
     async def _update_file_metadata(self, task: Task, output_file_path: str):
@@ -575,27 +1657,23 @@ class TaskManager:
             if not task.result.get("object_id") or not task.result.get("filename"):
                 error_msg = "任务缺少必要数据: object_id 或 filename"
                 print(f"[ERROR] {error_msg}")
-                await self.update_task(
-                    task.task_id, 
-                    status=TaskStatus.FAILED,
-                    error_message=error_msg
-                )
+                await self._fail_task(task, error_msg)
                 return
                 
             if task.result.get("threedtiles_data") is None:
                 error_msg = "任务缺少必要数据: threedtiles_data"
                 print(f"[ERROR] {error_msg}")
-                await self.update_task(
-                    task.task_id, 
-                    status=TaskStatus.FAILED,
-                    error_message=error_msg
-                )
+                await self._fail_task(task, error_msg)
                 return
             
             # 使用3DTiles处理器处理任务
             from app.tasks.threedtiles_processor import ThreeDTilesProcessor
             print(f"[DEBUG] 调用ThreeDTilesProcessor.process_threedtiles处理任务")
-            success, error_message, result = await ThreeDTilesProcessor.process_threedtiles(task, self.db)
+            cancel_event = self.get_cancel_event(task.task_id)
+            work_dir = self.get_task_work_dir(task.task_id)
+            success, error_message, result = await ThreeDTilesProcessor.process_threedtiles(
+                task, self.db, cancel_event, work_dir
+            )
             
             if success:
                 # 更新任务状态为完成
@@ -616,25 +1694,20 @@ class TaskManager:
                     current_step=ConversionStep.COMPLETED,
                     result=updated_result
                 )
+            elif cancel_event and cancel_event.is_set():
+                # 已取消的任务由工作协程统一标记状态
+                print(f"[INFO] 任务处理已取消: {task.task_id}")
             else:
                 # 更新任务状态为失败
                 print(f"[ERROR] 任务处理失败，错误信息: {error_message}")
-                await self.update_task(
-                    task.task_id,
-                    status=TaskStatus.FAILED,
-                    error_message=error_message
-                )
+                await self._fail_task(task, error_message)
         except Exception as e:
-            # 更新任务状态为失败
+            # 可重试的错误按重试策略重新调度，否则任务失败并进入死信队列
             import traceback
             error_detail = f"{str(e)}\n{traceback.format_exc()}"
             print(f"[ERROR] 处理3DTiles任务失败: {error_detail}")
             
-            await self.update_task(
-                task.task_id,
-                status=TaskStatus.FAILED,
-                error_message=str(e)
-            )
+            await self._fail_task(task, str(e), is_retryable_error(e))
     
     async def _process_wmts_task(self, task: Task):
         """处理WMTS瓦片任务"""
@@ -663,28 +1736,22 @@ class TaskManager:
             if not task.result.get("object_id") or not task.result.get("filename"):
                 error_msg = "任务缺少必要数据: object_id 或 filename"
                 print(f"[ERROR] {error_msg}")
-                await self.update_task(
-                    task.task_id, 
-                    status=TaskStatus.FAILED,
-                    error_message=error_msg
-                )
+                await self._fail_task(task, error_msg)
                 return
                 
             # 检查WMTS特定的数据
             if task.result.get("wmts_data") is None:
                 error_msg = "任务缺少必要数据: wmts_data"
                 print(f"[ERROR] {error_msg}")
-                await self.update_task(
-                    task.task_id, 
-                    status=TaskStatus.FAILED,
-                    error_message=error_msg
-                )
+                await self._fail_task(task, error_msg)
                 return
             
             # 使用WMTS处理器处理任务
             from app.tasks.wmts_processor import WMTSProcessor
             print(f"[DEBUG] 调用WMTSProcessor.process_wmts处理任务")
-            success, error_message, result = await WMTSProcessor.process_wmts(task, self.db)
+            cancel_event = self.get_cancel_event(task.task_id)
+            work_dir = self.get_task_work_dir(task.task_id)
+            success, error_message, result = await WMTSProcessor.process_wmts(task, self.db, cancel_event, work_dir)
             
             if success:
                 # 更新任务状态为完成
@@ -705,22 +1772,120 @@ class TaskManager:
                     current_step=ConversionStep.COMPLETED,
                     result=updated_result
                 )
+            elif cancel_event and cancel_event.is_set():
+                # 已取消的任务由工作协程统一标记状态
+                print(f"[INFO] 任务处理已取消: {task.task_id}")
             else:
                 # 更新任务状态为失败
                 print(f"[ERROR] 任务处理失败，错误信息: {error_message}")
-                await self.update_task(
-                    task.task_id,
-                    status=TaskStatus.FAILED,
-                    error_message=error_message
-                )
+                await self._fail_task(task, error_message)
         except Exception as e:
-            # 更新任务状态为失败
+            # 可重试的错误按重试策略重新调度，否则任务失败并进入死信队列
             import traceback
             error_detail = f"{str(e)}\n{traceback.format_exc()}"
             print(f"[ERROR] 处理WMTS任务失败: {error_detail}")
             
+            await self._fail_task(task, str(e), is_retryable_error(e)) 
+
+    async def _process_prefix_deletion_task(self, task: Task):
+        """处理前缀删除任务：批量删除资源目录中的对象，完成后物理删除已标记删除的记录"""
+        from app.services.object_cleanup import PrefixDeleter, ObjectDeletionError
+        try:
+            bucket_name = task.result.get("bucket")
+            prefix = task.result.get("prefix")
+            if not bucket_name or not prefix:
+                await self._fail_task(task, "任务缺少必要数据: bucket 或 prefix")
+                return
+            
             await self.update_task(
                 task.task_id,
-                status=TaskStatus.FAILED,
-                error_message=str(e)
-            ) 
\ No newline at end of file
+                status=TaskStatus.PROCESSING,
+                current_step=ConversionStep.INITIALIZED,
+                progress=0
+            )
+            
+            cancel_event = self.get_cancel_event(task.task_id)
+            deleter = PrefixDeleter(bucket_name, prefix, cancel_event)
+            
+            async def report_progress(current: PrefixDeleter):
+                await self.update_task(
+                    task.task_id,
+                    progress=current.progress,
+                    result={"deleted_objects": current.deleted_objects, "total_objects": current.total_objects}
+                )
+            
+            try:
+                deleted_objects = await deleter.run(on_progress=report_progress)
+            except TaskCancelledError:
+                # 已取消的任务由工作协程统一标记状态，记录保持删除标记，可通过对账重新删除
+                print(f"[INFO] 前缀删除已取消: {task.task_id}")
+                return
+            
+            # 对象删除完成后物理删除标记记录
+            collection_name = task.result.get("collection")
+            record_id = task.result.get("record_id")
+            if collection_name and record_id:
+                await self.db[collection_name].delete_one({"_id": ObjectId(record_id)})
+            
+            await self.update_task(
+                task.task_id,
+                status=TaskStatus.COMPLETED,
+                progress=100,
+                current_step=ConversionStep.COMPLETED,
+                result={"deleted_objects": deleted_objects, "total_objects": deleter.total_objects}
+            )
+            print(f"[INFO] 已删除 {bucket_name}/{prefix} 下的{deleted_objects}个对象")
+        except Exception as e:
+            # 删除操作是幂等的，部分对象删除失败时重试会继续删除剩余的对象
+            print(f"[ERROR] 处理前缀删除任务失败: {str(e)}")
+            await self._fail_task(task, str(e), isinstance(e, ObjectDeletionError) or is_retryable_error(e))
+
+    async def _process_tile_seeding_task(self, task: Task):
+        """处理瓦片缓存预热任务：按预热计划逐个读取瓦片写入缓存，已在缓存中的瓦片跳过"""
+        from fastapi import HTTPException
+        from app.services.tile_seeding import TileSeeder, TileSeedingService
+        try:
+            await self.update_task(
+                task.task_id,
+                status=TaskStatus.PROCESSING,
+                current_step=ConversionStep.INITIALIZED,
+                progress=0
+            )
+            
+            try:
+                plan = await TileSeedingService(self.db).plan(task.result or {})
+            except HTTPException as e:
+                # 预热对象不存在或参数无效，重试也不会成功
+                await self._fail_task(task, str(e.detail))
+                return
+            
+            cancel_event = self.get_cancel_event(task.task_id)
+            seeder = TileSeeder(cancel_event)
+            
+            async def report_progress(current: TileSeeder):
+                await self.update_task(
+                    task.task_id,
+                    progress=current.progress,
+                    current_step=ConversionStep.CONVERTING,
+                    result=current.to_dict()
+                )
+            
+            try:
+                statistics = await seeder.run(plan, on_progress=report_progress)
+            except TaskCancelledError:
+                # 已取消的任务由工作协程统一标记状态，已写入的缓存保留
+                print(f"[INFO] 瓦片缓存预热已取消: {task.task_id}")
+                return
+            
+            await self.update_task(
+                task.task_id,
+                status=TaskStatus.COMPLETED,
+                progress=100,
+                current_step=ConversionStep.COMPLETED,
+                result=statistics
+            )
+            print(f"[INFO] 瓦片缓存预热完成: {plan.target}, {statistics}")
+        except Exception as e:
+            # 已在缓存中的瓦片会被跳过，重试时只读取剩余的瓦片
+            print(f"[ERROR] 处理瓦片缓存预热任务失败: {str(e)}")
+            await self._fail_task(task, str(e), is_retryable_error(e))
@@ -1,23 +1,31 @@
 import asyncio
+import threading
 from datetime import datetime
 from typing import Tuple, Dict, Any, Optional
 
 from app.services.threedtiles_service import ThreeDTilesService
 from app.models.threedtiles import ThreeDTilesCreate
 from pydantic import parse_obj_as
-from app.tasks.task_manager import Task, TaskStatus, ConversionStep
+from app.tasks.task_manager import Task, TaskStatus, ConversionStep, TaskRetryableError, is_retryable_error
 
 class ThreeDTilesProcessor:
     """3DTiles处理器，用于处理3DTiles转换任务"""
     
     @staticmethod
-    async def process_threedtiles(task: Task, db) -> Tuple[bool, Optional[str], Optional[Dict[str, Any]]]:
+    async def process_threedtiles(
+        task: Task,
+        db,
+        cancel_event: Optional[threading.Event] = None,
+        work_dir: Optional[str] = None
+    ) -> Tuple[bool, Optional[str], Optional[Dict[str, Any]]]:
         """
         处理3DTiles任务
         
         Args:
             task: 任务对象
             db: 数据库对象
+            cancel_event: 可选的取消信号，设置后在下一个文件边界停止处理并清理已上传的文件
+            work_dir: 可选的任务工作目录，保存中间产物以便重试时从最后完成的阶段继续
             
         Returns:
             Tuple[bool, Optional[str], Optional[Dict[str, Any]]]: 
@@ -47,6 +55,22 @@ class ThreeDTilesProcessor:
                 print(f"[ERROR] {error_msg}")
                 return False, error_msg, None
                 
+            # 获取服务实例
+            threedtiles_service = ThreeDTilesService(db)
+            
+            # 增量更新已有的瓦片集
+            update_tile_id = task.result.get("update_tile_id")
+            if update_tile_id:
+                print(f"[DEBUG] 开始增量更新瓦片集: {update_tile_id}")
+                result = await threedtiles_service.update_tileset_async(
+                    tile_id=update_tile_id,
+                    object_id=object_id,
+                    filename=filename,
+                    process_id=process_id,
+                    cancel_event=cancel_event
+                )
+                return ThreeDTilesProcessor._to_task_result(result)
+            
             # 检查threedtiles_data_dict是否为None
             if threedtiles_data_dict is None:
                 error_msg = "threedtiles_data 不能为空"
@@ -65,22 +89,34 @@ class ThreeDTilesProcessor:
                 print(f"[ERROR] {error_msg}")
                 return False, error_msg, None
             
-            # 获取服务实例
-            threedtiles_service = ThreeDTilesService(db)
-            
             # 调用处理函数
             print(f"[DEBUG] 开始调用process_minio_file_async处理文件")
             result = await threedtiles_service.process_minio_file_async(
                 object_id=object_id,
                 filename=filename,
                 threedtiles_data=threedtiles_data,
-                process_id=process_id
+                process_id=process_id,
+                cancel_event=cancel_event,
+                work_dir=work_dir
             )
             
             print(f"[DEBUG] 处理完成，结果: {result}")
-            return True, None, result
+            return ThreeDTilesProcessor._to_task_result(result)
         except Exception as e:
+            if is_retryable_error(e):
+                raise
             import traceback
             error_detail = f"{str(e)}\n{traceback.format_exc()}"
             print(f"[ERROR] 处理3DTiles任务失败: {error_detail}")
-            return False, str(e), None 
\ No newline at end of file
+            return False, str(e), None 
+    
+    @staticmethod
+    def _to_task_result(result: Dict[str, Any]) -> Tuple[bool, Optional[str], Optional[Dict[str, Any]]]:
+        """将服务返回的处理结果转换为任务结果"""
+        # 服务在失败或取消时返回对应状态，不能当作成功处理
+        if result.get("status") != "completed":
+            if result.get("retryable"):
+                # 瞬时错误交给任务管理器按重试策略重新执行
+                raise TaskRetryableError(result.get("message"))
+            return False, result.get("message"), None
+        return True, None, result
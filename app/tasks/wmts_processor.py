@@ -1,23 +1,31 @@
 import asyncio
+import threading
 from datetime import datetime
 from typing import Tuple, Dict, Any, Optional
 
 from app.services.wmts_service import WMTSService
 from app.models.wmts import WMTSCreate
 from pydantic import parse_obj_as
-from app.tasks.task_manager import Task, TaskStatus, ConversionStep
+from app.tasks.task_manager import Task, TaskStatus, ConversionStep, TaskRetryableError, is_retryable_error
 
 class WMTSProcessor:
     """WMTS处理器，用于处理WMTS转换任务"""
     
     @staticmethod
-    async def process_wmts(task: Task, db) -> Tuple[bool, Optional[str], Optional[Dict[str, Any]]]:
+    async def process_wmts(
+        task: Task,
+        db,
+        cancel_event: Optional[threading.Event] = None,
+        work_dir: Optional[str] = None
+    ) -> Tuple[bool, Optional[str], Optional[Dict[str, Any]]]:
         """
         处理WMTS任务
         
         Args:
             task: 任务对象
             db: 数据库对象
+            cancel_event: 可选的取消信号，设置后在下一个文件边界停止处理并清理已上传的文件
+            work_dir: 可选的任务工作目录，保存中间产物以便重试时从最后完成的阶段继续
             
         Returns:
             Tuple[bool, Optional[str], Optional[Dict[str, Any]]]: 
@@ -74,12 +82,22 @@ class WMTSProcessor:
                 object_id=object_id,
                 filename=filename,
                 wmts_data=wmts_data,
-                process_id=process_id
+                process_id=process_id,
+                cancel_event=cancel_event,
+                work_dir=work_dir
             )
             
             print(f"[DEBUG] 处理完成，结果: {result}")
+            # 服务在失败或取消时返回对应状态，不能当作成功处理
+            if result.get("status") != "completed":
+                if result.get("retryable"):
+                    # 瞬时错误交给任务管理器按重试策略重新执行
+                    raise TaskRetryableError(result.get("message"))
+                return False, result.get("message"), None
             return True, None, result
         except Exception as e:
+            if is_retryable_error(e):
+                raise
             import traceback
             error_detail = f"{str(e)}\n{traceback.format_exc()}"
             print(f"[ERROR] 处理WMTS任务失败: {error_detail}")
@@ -0,0 +1,373 @@
+import math
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# WGS84椭球体参数
+WGS84_A = 6378137.0  # 长半轴
+WGS84_F = 1 / 298.257223563  # 扁率
+WGS84_B = WGS84_A * (1 - WGS84_F)  # 短半轴
+WGS84_E2 = WGS84_F * (2 - WGS84_F)  # 第一偏心率平方
+
+# ECEF转经纬度迭代的收敛阈值（弧度，约0.006毫米）和最大迭代次数
+GEODETIC_TOLERANCE = 1e-15
+GEODETIC_MAX_ITERATIONS = 10
+
+# 低于该椭球高的点视为未进行地理配准（局部坐标系中的模型坐标），不参与地理范围计算
+GEOREFERENCED_MIN_HEIGHT = -100000.0
+
+# 4x4单位矩阵（按列存储，与3D Tiles的transform一致）
+IDENTITY_MATRIX = [
+    1.0, 0.0, 0.0, 0.0,
+    0.0, 1.0, 0.0, 0.0,
+    0.0, 0.0, 1.0, 0.0,
+    0.0, 0.0, 0.0, 1.0,
+]
+
+Point3 = Tuple[float, float, float]
+
+def geodetic_to_ecef(longitude: float, latitude: float, height: float = 0.0) -> Point3:
+    """WGS84经纬度（度）和椭球高（米）转换为ECEF坐标（米）"""
+    lon = math.radians(longitude)
+    lat = math.radians(latitude)
+    sin_lat = math.sin(lat)
+    cos_lat = math.cos(lat)
+    n = WGS84_A / math.sqrt(1 - WGS84_E2 * sin_lat * sin_lat)
+    return (
+        (n + height) * cos_lat * math.cos(lon),
+        (n + height) * cos_lat * math.sin(lon),
+        (n * (1 - WGS84_E2) + height) * sin_lat,
+    )
+
+def ecef_to_geodetic(x: float, y: float, z: float) -> Point3:
+    """
+    ECEF坐标（米）转换为WGS84经度、纬度（度）和椭球高（米）
+
+    纬度按 tanφ = (z + e²N·sinφ) / p 迭代至收敛，椭球高使用
+    h = p·cosφ + z·sinφ - a·sqrt(1 - e²sin²φ)，在两极附近同样稳定
+    """
+    p = math.hypot(x, y)
+    longitude = math.atan2(y, x)
+    if p == 0.0 and z == 0.0:
+        # 地心，经纬度无定义
+        return 0.0, 0.0, -WGS84_A
+    latitude = math.atan2(z, p * (1 - WGS84_E2))
+    for _ in range(GEODETIC_MAX_ITERATIONS):
+        sin_lat = math.sin(latitude)
+        n = WGS84_A / math.sqrt(1 - WGS84_E2 * sin_lat * sin_lat)
+        next_latitude = math.atan2(z + WGS84_E2 * n * sin_lat, p)
+        converged = abs(next_latitude - latitude) < GEODETIC_TOLERANCE
+        latitude = next_latitude
+        if converged:
+            break
+    sin_lat = math.sin(latitude)
+    height = p * math.cos(latitude) + z * sin_lat - WGS84_A * math.sqrt(1 - WGS84_E2 * sin_lat * sin_lat)
+    return math.degrees(longitude), math.degrees(latitude), height
+
+def ecef_points_to_geodetic(points: Iterable[Sequence[float]]) -> List[Point3]:
+    """批量将ECEF坐标转换为经纬度和椭球高"""
+    return [ecef_to_geodetic(point[0], point[1], point[2]) for point in points]
+
+def geodetic_points_to_ecef(points: Iterable[Sequence[float]]) -> List[Point3]:
+    """批量将经纬度（度）和椭球高转换为ECEF坐标"""
+    return [geodetic_to_ecef(point[0], point[1], point[2] if len(point) > 2 else 0.0) for point in points]
+
+def multiply_matrices(a: Sequence[float], b: Sequence[float]) -> List[float]:
+    """两个按列存储的4x4矩阵相乘（a·b）"""
+    result = [0.0] * 16
+    for column in range(4):
+        for row in range(4):
+            result[column * 4 + row] = sum(a[k * 4 + row] * b[column * 4 + k] for k in range(4))
+    return result
+
+def transform_point(matrix: Sequence[float], point: Sequence[float]) -> Point3:
+    """用按列存储的4x4矩阵变换一个点"""
+    x, y, z = point[0], point[1], point[2]
+    return (
+        matrix[0] * x + matrix[4] * y + matrix[8] * z + matrix[12],
+        matrix[1] * x + matrix[5] * y + matrix[9] * z + matrix[13],
+        matrix[2] * x + matrix[6] * y + matrix[10] * z + matrix[14],
+    )
+
+def get_box_corners(box: Sequence[float]) -> List[Point3]:
+    """3D Tiles的box包围体（中心点+三个半轴向量）的8个角点"""
+    center = box[0:3]
+    axes = (box[3:6], box[6:9], box[9:12])
+    corners = []
+    for sx in (-1, 1):
+        for sy in (-1, 1):
+            for sz in (-1, 1):
+                corners.append(tuple(
+                    center[i] + sx * axes[0][i] + sy * axes[1][i] + sz * axes[2][i]
+                    for i in range(3)
+                ))
+    return corners
+
+def get_sphere_corners(sphere: Sequence[float]) -> List[Point3]:
+    """3D Tiles的sphere包围体（中心点+半径）的外接立方体的8个角点"""
+    radius = sphere[3]
+    return get_box_corners([
+        sphere[0], sphere[1], sphere[2],
+        radius, 0, 0,
+        0, radius, 0,
+        0, 0, radius,
+    ])
+
+def get_bounding_volume_extent(
+    bounding_volume: dict,
+    transform: Sequence[float] = IDENTITY_MATRIX
+) -> Optional[Tuple[List[float], float, float]]:
+    """
+    计算包围体的地理范围，返回([西, 南, 东, 北]（度）, 最低椭球高, 最高椭球高)
+
+    region已经是经纬度范围（弧度），不受transform影响；box和sphere取角点经transform变换后转换为经纬度。
+    包围体不可识别或未进行地理配准时返回None
+    """
+    if not bounding_volume:
+        return None
+    if "region" in bounding_volume:
+        west, south, east, north, min_height, max_height = bounding_volume["region"][:6]
+        return [math.degrees(west), math.degrees(south), math.degrees(east), math.degrees(north)], min_height, max_height
+    if "box" in bounding_volume:
+        corners = get_box_corners(bounding_volume["box"])
+    elif "sphere" in bounding_volume:
+        corners = get_sphere_corners(bounding_volume["sphere"])
+    else:
+        return None
+    points = ecef_points_to_geodetic(transform_point(transform, corner) for corner in corners)
+    if any(height < GEOREFERENCED_MIN_HEIGHT for _, _, height in points):
+        return None
+    west, east = union_longitude_ranges([(lon, lon) for lon, _, _ in points])
+    return (
+        [west, min(lat for _, lat, _ in points), east, max(lat for _, lat, _ in points)],
+        min(height for _, _, height in points),
+        max(height for _, _, height in points),
+    )
+
+def get_bounding_volume_sphere(
+    bounding_volume: dict,
+    transform: Sequence[float] = IDENTITY_MATRIX
+) -> Optional[Tuple[float, float, float, float]]:
+    """
+    计算包围体在ECEF坐标系中的外接球(x, y, z, 半径)，用于视锥体裁剪
+
+    box取变换后8个角点的外接球；sphere按transform中最大的缩放放大半径；
+    region在底面和顶面上各取5x5个采样点计算外接球。未进行地理配准时返回None
+    """
+    if not bounding_volume:
+        return None
+    if "region" in bounding_volume:
+        west, south, east, north, min_height, max_height = bounding_volume["region"][:6]
+        if west > east:
+            east += 2 * math.pi
+        points = []
+        for i in range(5):
+            for j in range(5):
+                lon = math.degrees(west + (east - west) * i / 4)
+                lat = math.degrees(south + (north - south) * j / 4)
+                points.append(geodetic_to_ecef(lon, lat, min_height))
+                points.append(geodetic_to_ecef(lon, lat, max_height))
+        center = tuple(sum(point[k] for point in points) / len(points) for k in range(3))
+        return (*center, max(math.dist(center, point) for point in points))
+    if "box" in bounding_volume:
+        box = bounding_volume["box"]
+        center = transform_point(transform, box[0:3])
+        radius = max(math.dist(center, transform_point(transform, corner)) for corner in get_box_corners(box))
+    elif "sphere" in bounding_volume:
+        sphere = bounding_volume["sphere"]
+        center = transform_point(transform, sphere[0:3])
+        radius = max(
+            math.dist(center, transform_point(transform, [sphere[0] + axis[0], sphere[1] + axis[1], sphere[2] + axis[2]]))
+            for axis in ((sphere[3], 0, 0), (0, sphere[3], 0), (0, 0, sphere[3]))
+        )
+    else:
+        return None
+    if ecef_to_geodetic(*center)[2] < GEOREFERENCED_MIN_HEIGHT - radius:
+        return None
+    return (*center, radius)
+
+def merge_spheres(
+    a: Tuple[float, float, float, float],
+    b: Tuple[float, float, float, float]
+) -> Tuple[float, float, float, float]:
+    """两个外接球的最小外接球"""
+    distance = math.dist(a[:3], b[:3])
+    if distance + b[3] <= a[3]:
+        return a
+    if distance + a[3] <= b[3]:
+        return b
+    radius = (distance + a[3] + b[3]) / 2
+    ratio = (radius - a[3]) / distance
+    return (
+        a[0] + (b[0] - a[0]) * ratio,
+        a[1] + (b[1] - a[1]) * ratio,
+        a[2] + (b[2] - a[2]) * ratio,
+        radius,
+    )
+
+def bbox_intersects(a: Sequence[float], b: Sequence[float]) -> bool:
+    """两个[西, 南, 东, 北]范围是否相交（西大于东表示跨越180度经线）"""
+    if a[1] > b[3] or b[1] > a[3]:
+        return False
+    return any(
+        west_a <= east_b and west_b <= east_a
+        for west_a, east_a in _split_longitude_range(a[0], a[2])
+        for west_b, east_b in _split_longitude_range(b[0], b[2])
+    )
+
+def _split_longitude_range(west: float, east: float) -> List[Tuple[float, float]]:
+    """将跨越180度经线的经度范围拆分为两段"""
+    if west > east:
+        return [(west, 180.0), (-180.0, east)]
+    return [(west, east)]
+
+def union_longitude_ranges(ranges: List[Tuple[float, float]]) -> Tuple[float, float]:
+    """
+    多个经度范围(西, 东)（度）的最小覆盖范围
+
+    西边界大于东边界表示跨越180度经线（与3D Tiles的region约定一致），结果同样使用该约定
+    """
+    west = min(w for w, _ in ranges)
+    east = max(e for _, e in ranges)
+    crossing = any(w > e for w, e in ranges)
+    if not crossing and east - west <= 180:
+        return west, east
+    # 在[0, 360)区间中重新计算，取跨度较小的一种
+    starts = [w % 360 for w, _ in ranges]
+    ends = [w % 360 + (e - w) % 360 for w, e in ranges]
+    shifted_west, shifted_east = min(starts), max(ends)
+    if shifted_east - shifted_west >= 360:
+        return -180.0, 180.0
+    if crossing or shifted_east - shifted_west < east - west:
+        return _normalize_longitude(shifted_west), _normalize_longitude(shifted_east)
+    return west, east
+
+def _normalize_longitude(longitude: float) -> float:
+    """将经度归一化到[-180, 180]"""
+    longitude = (longitude + 180) % 360 - 180
+    return 180.0 if longitude == -180.0 else longitude
+
+def walk_tiles(tileset_data: dict) -> Iterator[Tuple[dict, List[float], int, int]]:
+    """
+    按先序遍历tileset.json的瓦片层级（不使用递归，层级很深时也不会栈溢出），
+    依次返回(瓦片, 累乘后的transform, 深度, 父瓦片序号)，根瓦片的父瓦片序号为-1，
+    瓦片序号即返回的顺序，父瓦片总是先于子瓦片返回
+    """
+    root = (tileset_data or {}).get("root")
+    if not root:
+        return
+    stack = [(root, IDENTITY_MATRIX, 0, -1)]
+    index = 0
+    while stack:
+        tile, parent_transform, depth, parent = stack.pop()
+        transform = parent_transform
+        if tile.get("transform"):
+            transform = multiply_matrices(parent_transform, tile["transform"])
+        yield tile, transform, depth, parent
+        for child in reversed(tile.get("children") or []):
+            stack.append((child, transform, depth + 1, index))
+        index += 1
+
+# 累计的经度范围超过该数量时先合并，使内存占用与瓦片数无关
+LONGITUDE_RANGE_MERGE_SIZE = 1024
+
+class TilesetExtentBuilder:
+    """
+    逐个瓦片累计整个瓦片集的地理范围，瓦片按walk_tiles的顺序（根瓦片最先）和参数传入，
+    可用于流式遍历的tileset.json
+    """
+
+    def __init__(self):
+        self.origin: Optional[Point3] = None
+        self.ranges: List[Tuple[float, float]] = []
+        self.south: Optional[float] = None
+        self.north: Optional[float] = None
+        self.min_height: Optional[float] = None
+        self.max_height: Optional[float] = None
+
+    def add(self, tile: dict, transform: Sequence[float], depth: int = 0, parent: int = -1):
+        if parent < 0:
+            self.origin = _get_tileset_origin(tile, transform)
+        try:
+            extent = get_bounding_volume_extent(tile.get("boundingVolume"), transform)
+        except (TypeError, ValueError, IndexError):
+            extent = None
+        if not extent:
+            return
+        (w, s, e, n), low, high = extent
+        self.ranges.append((w, e))
+        if len(self.ranges) >= LONGITUDE_RANGE_MERGE_SIZE:
+            self.ranges = [union_longitude_ranges(self.ranges)]
+        self.south = s if self.south is None else min(self.south, s)
+        self.north = n if self.north is None else max(self.north, n)
+        self.min_height = low if self.min_height is None else min(self.min_height, low)
+        self.max_height = high if self.max_height is None else max(self.max_height, high)
+
+    def result(self) -> Optional[dict]:
+        """返回与get_tileset_extent相同格式的结果，无法确定地理位置时返回None"""
+        if not self.ranges and self.origin is None:
+            return None
+        extent = {
+            "origin": list(self.origin) if self.origin else None,
+            "bbox": None,
+            "min_height": self.min_height,
+            "max_height": self.max_height,
+        }
+        if self.ranges:
+            west, east = union_longitude_ranges(self.ranges)
+            extent["bbox"] = [west, self.south, east, self.north]
+        return extent
+
+def get_tileset_extent(tileset_data: dict) -> Optional[dict]:
+    """
+    遍历tileset.json的瓦片层级（逐级累乘transform），计算整个瓦片集的地理范围
+
+    返回origin（根瓦片transform的原点，没有时为根包围体中心，均为[经度, 纬度, 椭球高]）、
+    bbox（[西, 南, 东, 北]，度）、min_height/max_height（椭球高，米）；无法确定地理位置时返回None
+    """
+    builder = TilesetExtentBuilder()
+    for tile, transform, depth, parent in walk_tiles(tileset_data):
+        builder.add(tile, transform, depth, parent)
+    return builder.result()
+
+def _get_tileset_origin(root: dict, root_transform: Sequence[float]) -> Optional[Point3]:
+    """根瓦片transform的原点，没有transform或未进行地理配准时为根包围体中心"""
+    origin = None
+    if root.get("transform"):
+        origin = ecef_to_geodetic(root_transform[12], root_transform[13], root_transform[14])
+        if origin[2] < GEOREFERENCED_MIN_HEIGHT:
+            origin = None
+    if origin is None:
+        origin = _get_bounding_volume_center(root.get("boundingVolume"), root_transform)
+    return origin
+
+def _get_bounding_volume_center(bounding_volume: Optional[dict], transform: Sequence[float]) -> Optional[Point3]:
+    """包围体中心的经纬度和椭球高（region取底面中心）"""
+    if not bounding_volume:
+        return None
+    if "region" in bounding_volume:
+        west, south, east, north, min_height = bounding_volume["region"][:5]
+        if west > east:
+            east += 2 * math.pi
+        return _normalize_longitude(math.degrees((west + east) / 2)), math.degrees((south + north) / 2), min_height
+    center = bounding_volume.get("box") or bounding_volume.get("sphere")
+    if not center:
+        return None
+    point = ecef_to_geodetic(*transform_point(transform, center[0:3]))
+    if point[2] < GEOREFERENCED_MIN_HEIGHT:
+        return None
+    return point
+
+def bbox_to_polygon(bbox: Sequence[float]) -> Optional[dict]:
+    """
+    将[西, 南, 东, 北]范围转换为GeoJSON面（跨越180度经线时拆分为两个多边形的MultiPolygon），
+    范围退化为点或线时返回None
+    """
+    west, south, east, north = bbox
+    if north == south or east == west:
+        return None
+
+    def ring(w: float, e: float) -> List[List[float]]:
+        return [[w, south], [e, south], [e, north], [w, north], [w, south]]
+
+    if west > east:
+        return {"type": "MultiPolygon", "coordinates": [[ring(west, 180.0)], [ring(-180.0, east)]]}
+    return {"type": "Polygon", "coordinates": [ring(west, east)]}
@@ -0,0 +1,135 @@
+import codecs
+import json
+import os
+import re
+from typing import Any, BinaryIO, Iterator
+
+# 每次从输入流读取的字节数
+JSON_STREAM_CHUNK_SIZE = int(os.getenv("JSON_STREAM_CHUNK_SIZE", str(1024 * 1024)))
+# 整体解析的单个值的最大字符数，超过时视为格式错误或异常文件，避免把整个文件读入内存
+JSON_STREAM_MAX_VALUE_CHARS = int(os.getenv("JSON_STREAM_MAX_VALUE_CHARS", str(64 * 1024 * 1024)))
+
+# 解析出的值距缓冲区末尾不足该字符数时，先读取更多内容再确认
+_NUMBER_LOOKAHEAD = 64
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+class JsonStreamError(ValueError):
+    """JSON格式错误或单个值过大"""
+    pass
+
+class JsonStreamReader:
+    """
+    增量读取JSON文本
+
+    按块读取并解码UTF-8，调用方通过iter_object/iter_array逐个读取对象的键和数组的元素，
+    不需要逐层展开的值用read_value交给C实现的json解码器整体解析。
+    内存占用只与读取块和当前整体解析的值的大小有关，与文件大小无关
+    """
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = JSON_STREAM_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self._started = False
+
+    def peek(self) -> str:
+        """跳过空白，返回下一个字符（不消耗），已到结尾时返回空字符串"""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        """消耗下一个非空白字符，不是char时抛出JsonStreamError"""
+        found = self.peek()
+        if found != char:
+            raise JsonStreamError(f"第{self.bytes_read}字节附近应为'{char}'，实际为'{found}'")
+        self._pos += 1
+
+    def read_value(self) -> Any:
+        """整体解析下一个值（对象、数组、字符串、数字或字面量）"""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                # 值可能只读入了一部分，继续读取后重试
+                if len(self._buffer) - self._pos > JSON_STREAM_MAX_VALUE_CHARS:
+                    raise JsonStreamError(f"JSON格式错误或单个值过大: {str(e)}") from e
+                if self._fill(max(self.chunk_size, len(self._buffer) - self._pos)):
+                    continue
+                raise JsonStreamError(f"JSON格式错误: {str(e)}") from e
+            # 靠近缓冲区末尾的数字可能被截断（如"1.5"只读入了"1."），读取更多内容后重新解析
+            if end + _NUMBER_LOOKAHEAD >= len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def iter_object(self) -> Iterator[str]:
+        """
+        逐个读取对象的键。每次返回一个键后，调用方必须读取（或展开）对应的值，再继续迭代
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise JsonStreamError(f"第{self.bytes_read}字节附近应为对象的键")
+            key = self.read_value()
+            self.expect(":")
+            yield key
+            separator = self.peek()
+            self._pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise JsonStreamError(f"第{self.bytes_read}字节附近应为','或'}}'")
+
+    def iter_array(self) -> Iterator[int]:
+        """
+        逐个读取数组的元素，返回元素序号。每次返回后调用方必须读取（或展开）该元素，再继续迭代
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            separator = self.peek()
+            self._pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise JsonStreamError(f"第{self.bytes_read}字节附近应为','或']'")
+
+    def _fill(self, size: int = 0) -> bool:
+        """读取下一块内容追加到缓冲区，已到结尾时返回False"""
+        if self._eof:
+            return False
+        data = self.stream.read(size or self.chunk_size)
+        if not data:
+            self._eof = True
+            text = self._decoder.decode(b"", final=True)
+        else:
+            text = self._decoder.decode(data)
+            self.bytes_read += len(data)
+        if text and not self._started:
+            # 去掉开头的UTF-8 BOM
+            self._started = True
+            if text.startswith("\ufeff"):
+                text = text[1:]
+        # 丢弃已消耗的内容
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return True
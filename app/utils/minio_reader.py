@@ -0,0 +1,86 @@
+import io
+import os
+from typing import Optional
+
+from minio import Minio
+
+# 每次范围读取的字节数，也是读取器占用的最大内存
+MINIO_READ_BLOCK_SIZE = int(os.getenv("MINIO_READ_BLOCK_SIZE", str(8 * 1024 * 1024)))
+
+class MinioRangeReader(io.RawIOBase):
+    """
+    MinIO对象的可定位只读文件对象
+
+    通过HTTP Range请求按块读取对象内容，只在内存中缓存当前块，
+    可直接交给zipfile.ZipFile读取中央目录和按需读取单个条目，而不必先下载整个对象。
+    不是线程安全的，多个线程读取同一对象时每个线程应使用各自的读取器
+    """
+
+    def __init__(
+        self,
+        client: Minio,
+        bucket_name: str,
+        object_name: str,
+        size: Optional[int] = None,
+        block_size: int = MINIO_READ_BLOCK_SIZE
+    ):
+        super().__init__()
+        self.client = client
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.size = size if size is not None else client.stat_object(bucket_name, object_name).size
+        self.block_size = block_size
+        self._position = 0
+        self._buffer = b""
+        self._buffer_start = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"不支持的whence: {whence}")
+        if position < 0:
+            raise ValueError("定位位置不能为负数")
+        self._position = position
+        return position
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self.size or len(buffer) == 0:
+            return 0
+        offset = self._position - self._buffer_start
+        if offset < 0 or offset >= len(self._buffer):
+            # 当前位置不在缓存块中，从当前位置开始读取新的一块（大于块大小的读取一次读完）
+            self._fetch(max(len(buffer), self.block_size))
+            offset = 0
+        count = min(len(buffer), len(self._buffer) - offset)
+        buffer[:count] = self._buffer[offset:offset + count]
+        self._position += count
+        return count
+
+    def _fetch(self, length: int):
+        """从当前位置读取指定长度（不超过对象末尾）的数据到缓存块"""
+        length = min(length, self.size - self._position)
+        response = self.client.get_object(
+            self.bucket_name, self.object_name, offset=self._position, length=length
+        )
+        try:
+            self._buffer = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+        self._buffer_start = self._position
+        if not self._buffer:
+            raise EOFError(f"读取MinIO对象时意外结束: {self.object_name}")
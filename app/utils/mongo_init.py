@@ -25,6 +25,19 @@ async def init_mongodb_indexes():
         # 为metadata集合创建file_id索引
         await db.metadata.create_index("file_id")
         
+        # 为转换结果缓存创建引用文件索引（删除文件时按文件ID查找引用）
+        await db.conversion_cache.create_index("file_ids")
+        
+        # 为任务集合创建索引
+        await db.tasks.create_index("task_id")  # 任务ID索引
+        await db.tasks.create_index([("user_id", 1), ("created_at", -1), ("task_id", -1)])  # 用户任务列表分页索引
+        await db.tasks.create_index([("status", 1), ("task_type", 1)])  # 状态+类型复合索引
+        await db.tasks.create_index([("status", 1), ("updated_at", 1)])  # 归档查询索引
+
+        # 为任务归档集合创建索引（task_id唯一，多个副本同时归档时不会重复）
+        await db.tasks_archive.create_index("task_id", unique=True)
+        await db.tasks_archive.create_index([("user_id", 1), ("created_at", -1), ("task_id", -1)])
+
         # 为公共模型集合创建索引
         await db.public_models.create_index("tags")  # 标签索引
         await db.public_models.create_index("category")  # 分类索引
@@ -41,6 +54,10 @@ async def init_mongodb_indexes():
         await db.threedtiles.create_index("is_public")  # 公开状态索引
         await db.threedtiles.create_index("created_at")  # 创建时间索引
         await db.threedtiles.create_index([("name", "text"), ("description", "text")])  # 全文索引
+        await db.threedtiles.create_index("deleted_at", sparse=True)  # 删除标记索引（对账时查找删除中的记录）
+        
+        # 为WMTS图层集合创建删除标记索引
+        await db.wmts_layers.create_index("deleted_at", sparse=True)
         
         print("MongoDB索引初始化成功")
         
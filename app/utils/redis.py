@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio as aioredis
 from dotenv import load_dotenv
 import os
 
@@ -14,6 +15,14 @@ class RedisService:
             password=os.getenv('REDIS_PASSWORD'),
             decode_responses=True
         )
+        # 异步客户端，用于任务队列的阻塞出队等需要长时间等待的操作，避免阻塞事件循环
+        self.async_redis_client = aioredis.Redis(
+            host=os.getenv('REDIS_HOST'),
+            port=int(os.getenv('REDIS_PORT')),
+            db=int(os.getenv('REDIS_DB')),
+            password=os.getenv('REDIS_PASSWORD'),
+            decode_responses=True
+        )
         self.verification_code_expire = int(os.getenv('REDIS_VERIFICATION_CODE_EXPIRE'))
 
     def store_verification_code(self, phone: str, code: str) -> None:
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+模拟转换程序，用于在本地调试文件转换任务的进度上报
+
+用法（.env中配置）:
+    CONVERTER_PATH=<项目目录>/test
+    CONVERTER_PROGRAM_NAME=fake_converter.py
+
+程序以 `./fake_converter.py <输入文件> <输出文件>` 方式被调用，
+按阶段输出 "STAGE: xxx" 和 "PROGRESS: nn" 标记，最后把输入文件复制为输出文件。
+
+可通过环境变量调整行为:
+    FAKE_CONVERTER_DURATION  模拟转换总耗时（秒），默认10
+    FAKE_CONVERTER_FAIL      设为1时在50%处失败退出
+    FAKE_CONVERTER_HANG      设为1时在50%处挂起，用于验证超时处理
+"""
+import os
+import shutil
+import sys
+import time
+
+STAGES = ["loading", "tessellating", "writing"]
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("用法: fake_converter.py <输入文件> <输出文件>", file=sys.stderr)
+        return 2
+
+    input_path, output_path = sys.argv[1], sys.argv[2]
+    if not os.path.exists(input_path):
+        print(f"输入文件不存在: {input_path}", file=sys.stderr)
+        return 1
+
+    duration = float(os.getenv("FAKE_CONVERTER_DURATION", "10"))
+    steps = 20
+    for i in range(steps + 1):
+        progress = i * 100 // steps
+        if i % (steps // len(STAGES)) == 0 and i // (steps // len(STAGES)) < len(STAGES):
+            print(f"STAGE: {STAGES[i // (steps // len(STAGES))]}", flush=True)
+        print(f"PROGRESS: {progress}%", flush=True)
+
+        if progress >= 50 and os.getenv("FAKE_CONVERTER_FAIL") == "1":
+            print("模拟转换失败", file=sys.stderr, flush=True)
+            return 1
+        if progress >= 50 and os.getenv("FAKE_CONVERTER_HANG") == "1":
+            while True:
+                time.sleep(60)
+
+        time.sleep(duration / steps)
+
+    shutil.copyfile(input_path, output_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
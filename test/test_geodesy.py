@@ -0,0 +1,205 @@
+"""
+app.utils.geodesy 的参考点测试（纯Python，不依赖数据库和存储服务）
+
+运行: python -m pytest test/test_geodesy.py
+"""
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.geodesy import (
+    WGS84_A,
+    WGS84_B,
+    bbox_to_polygon,
+    ecef_to_geodetic,
+    geodetic_to_ecef,
+    get_bounding_volume_extent,
+    get_tileset_extent,
+)
+
+# 经纬度比较精度（度，约0.01毫米）和距离比较精度（米）
+DEGREE_TOLERANCE = 1e-9
+METER_TOLERANCE = 1e-6
+
+
+def translation(x: float, y: float, z: float):
+    """按列存储的平移矩阵"""
+    return [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, x, y, z, 1]
+
+
+def region(west: float, south: float, east: float, north: float, min_height: float, max_height: float) -> dict:
+    """以度表示的region包围体（3D Tiles中为弧度）"""
+    return {"region": [math.radians(west), math.radians(south), math.radians(east), math.radians(north), min_height, max_height]}
+
+
+class GeodeticToEcefTest(unittest.TestCase):
+    """经纬度转ECEF的参考点"""
+
+    def assert_point(self, actual, expected, tolerance=METER_TOLERANCE):
+        for a, e in zip(actual, expected):
+            self.assertAlmostEqual(a, e, delta=tolerance)
+
+    def test_equator(self):
+        self.assert_point(geodetic_to_ecef(0, 0, 0), (WGS84_A, 0, 0))
+        self.assert_point(geodetic_to_ecef(90, 0, 0), (0, WGS84_A, 0))
+        self.assert_point(geodetic_to_ecef(-90, 0, 100), (0, -WGS84_A - 100, 0))
+
+    def test_poles(self):
+        self.assert_point(geodetic_to_ecef(0, 90, 0), (0, 0, WGS84_B))
+        self.assert_point(geodetic_to_ecef(0, -90, 1000), (0, 0, -WGS84_B - 1000))
+
+    def test_mid_latitude_with_height(self):
+        # GeographicLib CartConvert 文档中的示例：27.99N 86.93E 8820m
+        self.assert_point(geodetic_to_ecef(86.93, 27.99, 8820), (302271, 5635928, 2979666), tolerance=1)
+
+    def test_antimeridian(self):
+        self.assert_point(geodetic_to_ecef(180, 0, 0), (-WGS84_A, 0, 0))
+        self.assert_point(geodetic_to_ecef(-180, 0, 0), (-WGS84_A, 0, 0))
+
+
+class EcefToGeodeticTest(unittest.TestCase):
+    """ECEF转经纬度的参考点和往返精度"""
+
+    def assert_geodetic(self, actual, expected):
+        self.assertAlmostEqual(actual[0], expected[0], delta=DEGREE_TOLERANCE)
+        self.assertAlmostEqual(actual[1], expected[1], delta=DEGREE_TOLERANCE)
+        self.assertAlmostEqual(actual[2], expected[2], delta=METER_TOLERANCE)
+
+    def test_equator(self):
+        self.assert_geodetic(ecef_to_geodetic(WGS84_A, 0, 0), (0, 0, 0))
+        self.assert_geodetic(ecef_to_geodetic(0, WGS84_A + 500, 0), (90, 0, 500))
+
+    def test_poles(self):
+        _, latitude, height = ecef_to_geodetic(0, 0, WGS84_B)
+        self.assertAlmostEqual(latitude, 90, delta=DEGREE_TOLERANCE)
+        self.assertAlmostEqual(height, 0, delta=METER_TOLERANCE)
+        _, latitude, height = ecef_to_geodetic(0, 0, -WGS84_B - 1000)
+        self.assertAlmostEqual(latitude, -90, delta=DEGREE_TOLERANCE)
+        self.assertAlmostEqual(height, 1000, delta=METER_TOLERANCE)
+
+    def test_mid_latitude_with_height(self):
+        longitude, latitude, height = ecef_to_geodetic(302271, 5635928, 2979666)
+        self.assertAlmostEqual(longitude, 86.93, delta=1e-5)
+        self.assertAlmostEqual(latitude, 27.99, delta=1e-5)
+        self.assertAlmostEqual(height, 8820, delta=1)
+
+    def test_antimeridian(self):
+        self.assertAlmostEqual(ecef_to_geodetic(-WGS84_A, 0, 0)[0], 180, delta=DEGREE_TOLERANCE)
+        self.assertAlmostEqual(ecef_to_geodetic(*geodetic_to_ecef(179.9999, 10, 0))[0], 179.9999, delta=DEGREE_TOLERANCE)
+        self.assertAlmostEqual(ecef_to_geodetic(*geodetic_to_ecef(-179.9999, 10, 0))[0], -179.9999, delta=DEGREE_TOLERANCE)
+
+    def test_round_trip(self):
+        for point in [
+            (0, 0, 0),
+            (116.3912757, 39.906217, 50),
+            (-73.985656, 40.748433, 443),
+            (151.2153, -33.8568, -30),
+            (179.9999, -45, 8000),
+            (-179.9999, 60, 0),
+            (12.5, 89.9999, 2000),
+            (-60, -89.9999, 100),
+        ]:
+            self.assert_geodetic(ecef_to_geodetic(*geodetic_to_ecef(*point)), point)
+
+
+class BoundingVolumeExtentTest(unittest.TestCase):
+    """region、box、sphere包围体的地理范围"""
+
+    def assert_bbox(self, actual, expected, tolerance=DEGREE_TOLERANCE):
+        self.assertEqual(len(actual), 4)
+        for a, e in zip(actual, expected):
+            self.assertAlmostEqual(a, e, delta=tolerance)
+
+    def test_region(self):
+        bbox, min_height, max_height = get_bounding_volume_extent(region(10, 20, 30, 40, -5, 100))
+        self.assert_bbox(bbox, [10, 20, 30, 40])
+        self.assertEqual((min_height, max_height), (-5, 100))
+
+    def test_region_crossing_antimeridian(self):
+        bbox, _, _ = get_bounding_volume_extent(region(170, -10, -170, 10, 0, 0))
+        self.assert_bbox(bbox, [170, -10, -170, 10])
+        polygon = bbox_to_polygon(bbox)
+        self.assertEqual(polygon["type"], "MultiPolygon")
+        self.assertEqual(len(polygon["coordinates"]), 2)
+
+    def test_box(self):
+        # 北京附近，中心在椭球面上，半轴沿ECEF坐标轴各100米
+        center = geodetic_to_ecef(116.3912757, 39.906217, 0)
+        box = {"box": [0, 0, 0, 100, 0, 0, 0, 100, 0, 0, 0, 100]}
+        bbox, min_height, max_height = get_bounding_volume_extent(box, translation(*center))
+        west, south, east, north = bbox
+        self.assertTrue(west < 116.3912757 < east and south < 39.906217 < north)
+        self.assertLess(east - west, 0.01)
+        self.assertLess(north - south, 0.01)
+        self.assertTrue(-200 < min_height < 0 < max_height < 200)
+
+    def test_box_crossing_antimeridian(self):
+        box = {"box": [-WGS84_A, 0, 0, 1000, 0, 0, 0, 1000, 0, 0, 0, 1000]}
+        (west, south, east, north), _, _ = get_bounding_volume_extent(box)
+        self.assertGreater(west, east)
+        self.assertTrue(179.9 < west < 180 and -180 < east < -179.9)
+        self.assertAlmostEqual(south, -north, delta=DEGREE_TOLERANCE)
+
+    def test_sphere(self):
+        sphere = {"sphere": [WGS84_A, 0, 0, 1000]}
+        bbox, min_height, max_height = get_bounding_volume_extent(sphere)
+        delta = math.degrees(1000 / WGS84_A)
+        self.assert_bbox(bbox, [-delta, -delta, delta, delta], tolerance=1e-4)
+        self.assertAlmostEqual(min_height, -1000, delta=1)
+        self.assertAlmostEqual(max_height, 1000, delta=1)
+
+    def test_not_georeferenced(self):
+        # 局部坐标系中的模型（中心在地心附近）没有地理范围
+        box = {"box": [0, 0, 10, 50, 0, 0, 0, 50, 0, 0, 0, 10]}
+        self.assertIsNone(get_bounding_volume_extent(box))
+        self.assertIsNone(get_bounding_volume_extent({}))
+
+
+class TilesetExtentTest(unittest.TestCase):
+    """整个瓦片集的原点和地理范围"""
+
+    def test_transform_origin(self):
+        center = geodetic_to_ecef(-73.985656, 40.748433, 10)
+        tileset = {
+            "root": {
+                "transform": translation(*center),
+                "boundingVolume": {"box": [0, 0, 0, 50, 0, 0, 0, 50, 0, 0, 0, 50]},
+                "children": [{"boundingVolume": {"sphere": [0, 0, 0, 20]}}],
+            }
+        }
+        extent = get_tileset_extent(tileset)
+        longitude, latitude, height = extent["origin"]
+        self.assertAlmostEqual(longitude, -73.985656, delta=DEGREE_TOLERANCE)
+        self.assertAlmostEqual(latitude, 40.748433, delta=DEGREE_TOLERANCE)
+        self.assertAlmostEqual(height, 10, delta=METER_TOLERANCE)
+        west, south, east, north = extent["bbox"]
+        self.assertTrue(west < longitude < east and south < latitude < north)
+
+    def test_regions_crossing_antimeridian(self):
+        tileset = {
+            "root": {
+                "boundingVolume": region(175, -5, -175, 5, 0, 50),
+                "children": [
+                    {"boundingVolume": region(175, -5, 180, 5, 0, 20)},
+                    {"boundingVolume": region(-180, -5, -175, 5, 10, 50)},
+                ],
+            }
+        }
+        extent = get_tileset_extent(tileset)
+        self.assertEqual(len(extent["bbox"]), 4)
+        for actual, expected in zip(extent["bbox"], [175, -5, -175, 5]):
+            self.assertAlmostEqual(actual, expected, delta=DEGREE_TOLERANCE)
+        self.assertAlmostEqual(extent["origin"][0], 180, delta=DEGREE_TOLERANCE)
+        self.assertEqual((extent["min_height"], extent["max_height"]), (0, 50))
+
+    def test_not_georeferenced(self):
+        tileset = {"root": {"boundingVolume": {"box": [0, 0, 0, 10, 0, 0, 0, 10, 0, 0, 0, 10]}}}
+        self.assertIsNone(get_tileset_extent(tileset))
+        self.assertIsNone(get_tileset_extent({}))
+
+
+if __name__ == "__main__":
+    unittest.main()
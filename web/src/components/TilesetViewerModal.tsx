@@ -1,5 +1,6 @@
 import React, { useRef, useEffect } from 'react';
 import * as Cesium from 'cesium';
+import { resolveTileUrl } from '../utils/tileUrl';
 
 interface TilesetViewerProps {
   tileset_url: string;
@@ -56,12 +57,8 @@ const TilesetViewer: React.FC<TilesetViewerProps> = ({
         tilesetRef.current = null;
       }
 
-      // 处理URL，如果是相对路径则添加VITE_MINIO_URL前缀
-      let fullTilesetUrl = tileset_url;
-      if (tileset_url.startsWith('/')) {
-        const minioUrl = import.meta.env.VITE_MINIO_URL || '';
-        fullTilesetUrl = `${minioUrl}${tileset_url}`;
-      }
+      // 处理URL，相对路径添加后端接口或VITE_MINIO_URL前缀
+      const fullTilesetUrl = resolveTileUrl(tileset_url);
 
       // 加载新的tileset
       tilesetRef.current = await Cesium.Cesium3DTileset.fromUrl(fullTilesetUrl);
@@ -7,6 +7,7 @@ import { downloadPublicModel } from '../services/publicModels'; // 导入公共
 import { ModelAsset } from './useModelAssets'; // 引入模型类型
 import { PublicModelMetadata } from '../services/publicModels'; // 引入公共模型类型
 import { createSceneInstance } from '../services/sceneApi'; // 导入创建实例的API
+import { resolveTileUrl } from '../utils/tileUrl';
 
 export interface MaterialDefinition {
   id: string;
@@ -357,11 +358,7 @@ export const useCesiumDragAndDrop = (
         }
         const { instanceId } = result;
         // 3. Cesium加载3DTiles
-        let fullTilesetUrl = tilesetUrl;
-        if (tilesetUrl.startsWith('/')) {
-          const minioUrl = (import.meta as any).env?.VITE_MINIO_URL || '';
-          fullTilesetUrl = `${minioUrl}${tilesetUrl}`;
-        }
+        const fullTilesetUrl = resolveTileUrl(tilesetUrl);
         console.log('[3DTiles] 加载Cesium3DTileset，fullTilesetUrl:', fullTilesetUrl);
         const Cesium3DTileset = Cesium.Cesium3DTileset;
         try {
@@ -6,6 +6,7 @@ import { getSceneInstances } from '../services/sceneApi';
 import modelAPI from '../services/modelApi'; // 导入模型API
 import { downloadPublicModel } from '../services/publicModels'; // 导入公共模型API
 import api from '../services/axiosConfig';
+import { resolveTileUrl } from '../utils/tileUrl';
 
 // 确保 Cesium 全局 Token 设置 (如果需要)
 // Cesium.Ion.defaultAccessToken = 'YOUR_CESIUM_ION_TOKEN';
@@ -173,11 +174,7 @@ export const useCesiumViewer = (
               continue;
             }
             // 处理URL前缀
-            let fullTilesetUrl = tilesetUrl;
-            if (tilesetUrl.startsWith('/')) {
-              const minioUrl = (import.meta as any).env?.VITE_MINIO_URL || '';
-              fullTilesetUrl = `${minioUrl}${tilesetUrl}`;
-            }
+            const fullTilesetUrl = resolveTileUrl(tilesetUrl);
             try {
               const Cesium3DTileset = Cesium.Cesium3DTileset;
               const tileset = await Cesium3DTileset.fromUrl(fullTilesetUrl);
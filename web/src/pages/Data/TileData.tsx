@@ -414,7 +414,12 @@ const TpkxUploadModal: React.FC<{
             <div>
               <div style={{ marginBottom: '8px' }}>状态: {processStatus.message}</div>
               {processStatus.status === 'processing' && (
-                <Progress percent={50} status="active" />
+                <Progress
+                  percent={processStatus.total_files
+                    ? Math.floor((processStatus.uploaded_files || 0) / processStatus.total_files * 100)
+                    : 50}
+                  status="active"
+                />
               )}
             </div>
           </Form.Item>
@@ -475,8 +480,9 @@ const TileData: React.FC = () => {
       content: `确定要删除WMTS图层"${wmts.name}"吗？此操作不可恢复。`,
       onOk: async () => {
         try {
-          await wmtsAPI.deleteWMTS(wmtsId);
-          message.success('删除成功');
+          const response = await wmtsAPI.deleteWMTS(wmtsId);
+          // 文件类型的图层在后台批量删除瓦片，可在任务列表中查看删除进度
+          message.success(response.data?.task_id ? '图层已删除，瓦片正在后台清理，可在任务列表中查看进度' : '删除成功');
           loadWmtsList();
         } catch (error: any) {
           message.error('删除失败');
@@ -228,6 +228,12 @@ const ModelList: React.FC = () => {
       // setConverting(true);
       const response = await modelAPI.convertModel(model._id, 'GLB');
       const taskId = response.data.task_id;
+      if (response.data.cached) {
+        // 相同文件已经转换过，直接复用转换结果，刷新列表获取最新的转换信息
+        fetchModels();
+        message.success('已复用相同文件的转换结果');
+        return;
+      }
       if (taskId) {
         // 更新当前模型的转换状态
         const updatedModels = models.map(m => {
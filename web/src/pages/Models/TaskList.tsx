@@ -1,42 +1,49 @@
-import { Table, Button, Space, Tag, Typography, Card, Progress, Select, Modal, App } from 'antd';
-import {  DeleteOutlined, ExclamationCircleOutlined, ReloadOutlined, FileOutlined, GlobalOutlined } from '@ant-design/icons';
+import { Table, Button, Space, Tag, Typography, Card, Progress, Select, Modal, App, DatePicker, Switch } from 'antd';
+import {  DeleteOutlined, StopOutlined, ExclamationCircleOutlined, ReloadOutlined, FileOutlined, GlobalOutlined } from '@ant-design/icons';
 import { useState, useEffect, useCallback } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
-import taskAPI, { Task, TaskStatus, TaskType } from '../../services/taskApi';
+import type { Dayjs } from 'dayjs';
+import taskAPI, { Task, TaskEvent, TaskListQuery, TaskStatus, TaskType } from '../../services/taskApi';
 
 const { Title } = Typography;
 const { Option } = Select;
 const { confirm } = Modal;
+const { RangePicker } = DatePicker;
+
+// 每次从服务器加载的任务数
+const TASK_PAGE_SIZE = 50;
 
 const TaskList: React.FC = () => {
   const [tasks, setTasks] = useState<Task[]>([]);
   const [loading, setLoading] = useState<boolean>(false);
   const [statusFilter, setStatusFilter] = useState<TaskStatus | undefined>(undefined);
   const [typeFilter, setTypeFilter] = useState<string | undefined>(undefined);
+  const [dateRange, setDateRange] = useState<[Dayjs | null, Dayjs | null] | null>(null);
+  const [archived, setArchived] = useState<boolean>(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
   const { message: messageApi } = App.useApp();
   const navigate = useNavigate();
   const location = useLocation();
 
-  // 获取任务列表
+  // 当前筛选条件对应的查询参数
+  const buildQuery = useCallback((cursor?: string): TaskListQuery => ({
+    status: statusFilter,
+    taskType: typeFilter as TaskType | undefined,
+    createdAfter: dateRange?.[0]?.startOf('day').toISOString(),
+    createdBefore: dateRange?.[1]?.endOf('day').toISOString(),
+    cursor,
+    limit: TASK_PAGE_SIZE,
+    archived,
+  }), [statusFilter, typeFilter, dateRange, archived]);
+
+  // 获取任务列表（第一页）
   const fetchTasks = useCallback(async () => {
     setLoading(true);
     try {
-      const data = await taskAPI.getTasks(statusFilter, typeFilter as any);
-      console.log('获取到的任务数据:', data);
-      
-      // 添加调试信息，检查任务类型
-      if (data && data.length > 0) {
-        console.log('TaskType值:', TaskType);
-        
-        data.forEach((task: Task) => {
-          console.log(`任务ID: ${task.task_id}, 类型: ${task.task_type}`);
-          console.log('任务对象:', task);
-        });
-      } else {
-        console.log('没有获取到任务数据');
-      }
-      
-      setTasks(data);
+      const data = await taskAPI.getTasks(buildQuery());
+      setTasks(data.items);
+      setNextCursor(data.next_cursor);
       
       // 检查是否有需要高亮的任务ID
       const { state } = location;
@@ -52,20 +59,66 @@ const TaskList: React.FC = () => {
     } finally {
       setLoading(false);
     }
-  }, [statusFilter, typeFilter, location, navigate, messageApi]);
+  }, [buildQuery, location, navigate, messageApi]);
+
+  // 加载更早的任务
+  const handleLoadMore = async () => {
+    if (!nextCursor) {
+      return;
+    }
+    setLoadingMore(true);
+    try {
+      const data = await taskAPI.getTasks(buildQuery(nextCursor));
+      setTasks(prev => [
+        ...prev,
+        ...data.items.filter(item => !prev.some(task => task.task_id === item.task_id))
+      ]);
+      setNextCursor(data.next_cursor);
+    } catch (error) {
+      messageApi.error('加载更多任务失败: ' + (error instanceof Error ? error.message : '未知错误'));
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   // 组件加载时获取任务列表
   useEffect(() => {
     fetchTasks();
     
-    // 设置定时刷新
+    // 设置定时刷新，用于发现新创建的任务；进行中任务的状态通过推送实时更新
     const timer = setInterval(() => {
       fetchTasks();
-    }, 10000); // 每10秒刷新一次
+    }, 60000); // 每60秒刷新一次
     
     return () => clearInterval(timer);
   }, [fetchTasks]);
 
+  // 订阅进行中任务的状态推送
+  const activeTaskIds = tasks
+    .filter(task => task.status === TaskStatus.PENDING || task.status === TaskStatus.PROCESSING)
+    .map(task => task.task_id)
+    .sort()
+    .join(',');
+
+  useEffect(() => {
+    if (!activeTaskIds) {
+      return;
+    }
+    const unsubscribe = taskAPI.subscribeTaskEvents(activeTaskIds.split(','), (event: TaskEvent) => {
+      setTasks(prev => {
+        if (event.type === 'deleted') {
+          return prev.filter(task => task.task_id !== event.data.task_id);
+        }
+        return prev.map(task => task.task_id === event.data.task_id ? {
+          ...task,
+          ...event.data,
+          result: event.data.result ? { ...task.result, ...event.data.result } : task.result
+        } : task);
+      });
+    });
+    return unsubscribe;
+  }, [activeTaskIds]);
+
   // 删除任务
   const handleDeleteTask = (taskId: string) => {
     confirm({
@@ -86,6 +139,26 @@ const TaskList: React.FC = () => {
     });
   };
 
+  // 取消任务
+  const handleCancelTask = (taskId: string) => {
+    confirm({
+      title: '确认取消',
+      icon: <ExclamationCircleOutlined />,
+      content: '确定要取消这个任务吗？已处理的部分数据将被清理。',
+      okText: '确认',
+      cancelText: '返回',
+      onOk: async () => {
+        try {
+          const data = await taskAPI.cancelTask(taskId);
+          messageApi.success(data?.message || '任务已取消');
+          fetchTasks();
+        } catch (error) {
+          messageApi.error('取消任务失败: ' + (error instanceof Error ? error.message : '未知错误'));
+        }
+      },
+    });
+  };
+
   // 刷新任务列表
   const handleRefresh = () => {
     fetchTasks();
@@ -102,6 +175,8 @@ const TaskList: React.FC = () => {
         return 'red';
       case TaskStatus.PENDING:
         return 'default';
+      case TaskStatus.CANCELLED:
+        return 'orange';
       default:
         return 'default';
     }
@@ -125,6 +200,9 @@ const TaskList: React.FC = () => {
     if (is3DTilesTask(type)) {
       return '3DTiles处理';
     }
+    if (type === TaskType.PREFIX_DELETION) {
+      return '删除资源文件';
+    }
     return type;
   };
 
@@ -180,6 +258,11 @@ const TaskList: React.FC = () => {
       return task.resource_name;
     }
     
+    // 删除任务记录了被删除资源的名称
+    if (task.result && task.result.resource_name) {
+      return task.result.resource_name;
+    }
+    
     // 根据任务类型从结果中提取名称
     if (is3DTilesTask(task.task_type) && task.result) {
       if (task.result.filename) {
@@ -236,6 +319,7 @@ const TaskList: React.FC = () => {
         return (
           <Tag color={getStatusColor(status)}>
             {status}
+            {status === TaskStatus.PENDING && record.queue_position ? `（排队第${record.queue_position}位）` : ''}
           </Tag>
         );
       },
@@ -271,6 +355,15 @@ const TaskList: React.FC = () => {
           >
             查看
           </Button>
+          {(record.status === TaskStatus.PENDING || record.status === TaskStatus.PROCESSING) && (
+            <Button 
+              type="link" 
+              icon={<StopOutlined />} 
+              onClick={() => handleCancelTask(record.task_id)}
+            >
+              取消
+            </Button>
+          )}
           <Button 
             type="link" 
             danger 
@@ -309,6 +402,7 @@ const TaskList: React.FC = () => {
               <Option value={TaskStatus.PROCESSING}>处理中</Option>
               <Option value={TaskStatus.COMPLETED}>已完成</Option>
               <Option value={TaskStatus.FAILED}>失败</Option>
+              <Option value={TaskStatus.CANCELLED}>已取消</Option>
             </Select>
             
             <Select
@@ -320,7 +414,19 @@ const TaskList: React.FC = () => {
             >
               <Option value={TaskType.FILE_CONVERSION}>文件转换</Option>
               <Option value={TaskType.THREEDTILES_PROCESSING}>3DTiles处理</Option>
+              <Option value={TaskType.PREFIX_DELETION}>删除资源文件</Option>
             </Select>
+            
+            <RangePicker
+              placeholder={['创建开始日期', '创建结束日期']}
+              value={dateRange}
+              onChange={(range) => setDateRange(range as [Dayjs | null, Dayjs | null] | null)}
+            />
+            
+            <Space>
+              <Switch checked={archived} onChange={setArchived} />
+              历史归档
+            </Space>
           </Space>
         </div>
         
@@ -333,7 +439,7 @@ const TaskList: React.FC = () => {
             defaultPageSize: 10,
             showSizeChanger: true,
             showQuickJumper: true,
-            showTotal: (total) => `共 ${total} 条记录`
+            showTotal: (total) => `已加载 ${total} 条记录`
           }}
           // 添加行高亮条件
           rowClassName={(record) => {
@@ -345,6 +451,14 @@ const TaskList: React.FC = () => {
             return '';
           }}
         />
+        
+        {nextCursor && (
+          <div style={{ textAlign: 'center', marginTop: 16 }}>
+            <Button onClick={handleLoadMore} loading={loadingMore}>
+              加载更早的任务
+            </Button>
+          </div>
+        )}
       </Card>
 
       {/* 添加高亮样式 */}
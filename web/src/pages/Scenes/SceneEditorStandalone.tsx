@@ -22,6 +22,7 @@ import { LayerDrawer, LayerInfo } from '../../components/LayerDrawer';
 import { MenuOutlined, EyeOutlined, ArrowLeftOutlined } from '@ant-design/icons';
 import { getSceneDetail } from '../../services/sceneApi';
 import { wmtsAPI } from '../../services/wmtsApi';
+import { resolveTileUrl } from '../../utils/tileUrl';
 
 // 新组件
 import SceneSidebar from '../../components/scenes/SceneSidebar';
@@ -122,8 +123,7 @@ const SceneEditorStandalone: React.FC = () => {
         
         if (wmtsData.source_type === 'file' && wmtsData.tile_url_template) {
           // 对于文件类型的WMTS (tpkx)
-          const minioUrl = import.meta.env.VITE_MINIO_URL || '';
-          const tileUrl = `${minioUrl}${wmtsData.tile_url_template}`;
+          const tileUrl = resolveTileUrl(wmtsData.tile_url_template);
           
           imageryProvider = new Cesium.UrlTemplateImageryProvider({
             url: tileUrl,
@@ -4,6 +4,7 @@ import { Spin, Alert, Button, Typography } from 'antd';
 import { ArrowLeftOutlined } from '@ant-design/icons';
 import * as Cesium from 'cesium';
 import { wmtsAPI, WMTSLayer } from '../services/wmtsApi';
+import { resolveTileUrl } from '../utils/tileUrl';
 
 const { Title } = Typography;
 
@@ -79,8 +80,7 @@ const TilePreview: React.FC = () => {
 
       if (wmtsLayer.source_type === 'file' && wmtsLayer.tile_url_template) {
         // 文件类型的WMTS (tpkx)
-        const minioUrl = import.meta.env.VITE_MINIO_URL || '';
-        const tileUrl = `${minioUrl}${wmtsLayer.tile_url_template}`;
+        const tileUrl = resolveTileUrl(wmtsLayer.tile_url_template);
 
         imageryProvider = new Cesium.UrlTemplateImageryProvider({
           url: tileUrl,
@@ -1,6 +1,7 @@
 import React, { useEffect, useRef, useState } from 'react';
 import { useLocation } from 'react-router-dom';
 import * as Cesium from 'cesium';
+import { resolveTileUrl } from '../utils/tileUrl';
 
 // 定义图层类型接口
 interface TileLayerInfo {
@@ -181,10 +182,9 @@ const TilesetViewer: React.FC = () => {
     const latitude = parseFloat(params.get('latitude') || '0');
     const height = parseFloat(params.get('height') || '0');
     
-    // 如果tilesetUrl是相对路径，则添加VITE_MINIO_URL前缀
-    if (tilesetUrl && tilesetUrl.startsWith('/')) {
-      const minioUrl = import.meta.env.VITE_MINIO_URL || '';
-      tilesetUrl = `${minioUrl}${tilesetUrl}`;
+    // 如果tilesetUrl是相对路径，则添加后端接口或VITE_MINIO_URL前缀
+    if (tilesetUrl) {
+      tilesetUrl = resolveTileUrl(tilesetUrl);
     }
 
     console.log('解析URL参数:', {
@@ -5,7 +5,8 @@ export enum TaskStatus {
   PENDING = "pending",  // 等待处理
   PROCESSING = "processing",  // 处理中
   COMPLETED = "completed",  // 已完成
-  FAILED = "failed"  // 失败
+  FAILED = "failed",  // 失败
+  CANCELLED = "cancelled"  // 已取消
 }
 
 // 转换步骤枚举
@@ -20,7 +21,8 @@ export enum ConversionStep {
 // 任务类型 - 使用const而不是enum以便更灵活处理字符串值
 export const TaskType = {
   FILE_CONVERSION: "file_conversion",  // 文件转换
-  THREEDTILES_PROCESSING: "threedtiles_processing"  // 3DTiles处理
+  THREEDTILES_PROCESSING: "threedtiles_processing",  // 3DTiles处理
+  PREFIX_DELETION: "prefix_deletion"  // 删除资源文件
 } as const;
 
 // TaskType类型
@@ -31,6 +33,8 @@ export interface ProcessStatus {
   status: string;
   message: string;
   tile_id?: string;
+  uploaded_files?: number;  // 上传阶段已上传的文件数
+  total_files?: number;     // 上传阶段需要上传的文件总数
 }
 
 // 任务接口
@@ -46,6 +50,9 @@ export interface Task {
   current_step: ConversionStep;
   error_message?: string;
   result?: any;
+  retry_count?: number;  // 已自动重试次数
+  priority?: 'interactive' | 'normal' | 'batch';  // 任务优先级
+  queue_position?: number | null;  // 排队中任务的预计排队位置，1表示下一个执行
   created_at: string;
   updated_at: string;
   resource_name?: string;  // 关联资源名称
@@ -57,6 +64,30 @@ export interface Task {
   };
 }
 
+// 任务列表查询条件
+export interface TaskListQuery {
+  status?: TaskStatus;
+  taskType?: TaskType;
+  createdAfter?: string;   // 创建时间范围（ISO时间字符串）
+  createdBefore?: string;
+  cursor?: string;         // 上一页返回的next_cursor
+  limit?: number;
+  archived?: boolean;      // 查询已归档的历史任务
+}
+
+// 任务列表分页结果，next_cursor为空表示没有更多任务
+export interface TaskListPage {
+  items: Task[];
+  next_cursor: string | null;
+}
+
+// 任务推送事件：snapshot为当前状态，update只包含发生变化的字段，deleted表示任务已删除
+export interface TaskEvent {
+  type: 'snapshot' | 'update' | 'deleted';
+  id: string;
+  data: Partial<Task> & { task_id: string };
+}
+
 // 错误处理函数
 const handleError = (error: any) => {
   console.error('API错误:', error);
@@ -80,17 +111,37 @@ const handleError = (error: any) => {
 // 任务相关API
 export const taskAPI = {
   // 获取任务列表
-  getTasks: async (status?: TaskStatus, taskType?: TaskType) => {
+  getTasks: async (query: TaskListQuery = {}): Promise<TaskListPage> => {
     try {
       let url = '/tasks/list';
       const params = new URLSearchParams();
       
-      if (status) {
-        params.append('status', status);
+      if (query.status) {
+        params.append('status', query.status);
+      }
+      
+      if (query.taskType) {
+        params.append('task_type', query.taskType);
+      }
+      
+      if (query.createdAfter) {
+        params.append('created_after', query.createdAfter);
+      }
+      
+      if (query.createdBefore) {
+        params.append('created_before', query.createdBefore);
+      }
+      
+      if (query.cursor) {
+        params.append('cursor', query.cursor);
+      }
+      
+      if (query.limit) {
+        params.append('limit', String(query.limit));
       }
       
-      if (taskType) {
-        params.append('task_type', taskType);
+      if (query.archived) {
+        params.append('archived', 'true');
       }
       
       if (params.toString()) {
@@ -134,6 +185,16 @@ export const taskAPI = {
     }
   },
   
+  // 取消任务
+  cancelTask: async (taskId: string) => {
+    try {
+      const response = await api.post(`/tasks/${taskId}/cancel`);
+      return response.data;
+    } catch (error) {
+      return handleError(error);
+    }
+  },
+  
   // 删除任务
   deleteTask: async (taskId: string) => {
     try {
@@ -142,6 +203,42 @@ export const taskAPI = {
     } catch (error) {
       return handleError(error);
     }
+  },
+
+  // 订阅任务状态推送（Server-Sent Events），一个连接可订阅多个任务，返回关闭连接的函数
+  subscribeTaskEvents: (taskIds: string[], onEvent: (event: TaskEvent) => void) => {
+    let source: EventSource | null = null;
+    let lastEventId = '';
+
+    const connect = () => {
+      const params = new URLSearchParams();
+      params.append('task_ids', taskIds.join(','));
+      const token = localStorage.getItem('token');
+      if (token) {
+        params.append('token', token);
+      }
+      if (lastEventId) {
+        params.append('last_event_id', lastEventId);
+      }
+      source = new EventSource(`/api/tasks/events?${params.toString()}`);
+
+      (['snapshot', 'update', 'deleted'] as const).forEach(type => {
+        source?.addEventListener(type, (e: MessageEvent) => {
+          lastEventId = e.lastEventId;
+          onEvent({ type, id: e.lastEventId, data: JSON.parse(e.data) });
+        });
+      });
+      // 所有任务都已结束
+      source.addEventListener('end', () => source?.close());
+      // 服务端积压过多，从上次收到的事件继续
+      source.addEventListener('resync', () => {
+        source?.close();
+        connect();
+      });
+    };
+
+    connect();
+    return () => source?.close();
   }
 };
 
@@ -48,6 +48,8 @@ export interface WMTSProcessStatus {
   status: string;
   message: string;
   wmts_id?: string;
+  uploaded_files?: number;  // 上传阶段已上传的文件数
+  total_files?: number;     // 上传阶段需要上传的文件总数
   created_at: string;
   updated_at: string;
 }
@@ -185,6 +187,8 @@ export const wmtsAPI = {
             resolve(status);
           } else if (status.status === 'failed') {
             reject(new Error(status.message || '处理失败'));
+          } else if (status.status === 'cancelled') {
+            reject(new Error(status.message || '处理已取消'));
           } else if (attempts >= maxAttempts) {
             reject(new Error('处理超时'));
           } else {
@@ -0,0 +1,21 @@
+// 由后端接口提供的瓦片路径（经过瓦片缓存代理，或从.3tz压缩包、bundle、MBTiles中读取）
+// 旧图层的 /wmts/<id>/{z}/{x}/{y}.png 是MinIO中wmts存储桶的对象路径，不能匹配
+const API_TILE_PATH_PATTERNS = [/^\/3dtiles\//, /^\/wmts\/[^/]+\/(tiles|bundles|mbtiles)\//];
+
+/**
+ * 将后端返回的tileset_url或tile_url_template转换为可加载的完整地址
+ * - /3dtiles/、/wmts/<id>/(tiles|bundles|mbtiles)/ 开头：由后端接口提供，添加 /api 前缀
+ * - 其他 / 开头的相对路径：MinIO中的对象，添加VITE_MINIO_URL前缀
+ * @param url 后端返回的地址
+ * @returns 完整的地址
+ */
+export const resolveTileUrl = (url: string): string => {
+  if (API_TILE_PATH_PATTERNS.some(pattern => pattern.test(url))) {
+    return `/api${url}`;
+  }
+  if (url.startsWith('/')) {
+    const minioUrl = (import.meta as any).env?.VITE_MINIO_URL || '';
+    return `${minioUrl}${url}`;
+  }
+  return url;
+};